@@ -151,6 +151,153 @@ BOSS_VERSION = 'v1'
 # Maximum number of bytes in an uncompressed matrix supported by the Cutout Service
 CUTOUT_MAX_SIZE = 520 * 1048576
 
+# Maximum number of bytes in an uncompressed matrix supported by a framed (application/blosc-framed) cutout POST.
+# Each frame is still limited to CUTOUT_MAX_SIZE. Must agree with client_max_body_size in boss_nginx.conf.
+CUTOUT_FRAMED_MAX_SIZE = 8 * 1024 * 1048576
+
+# Batch cutouts. The total size of all regions in a batch is limited by CUTOUT_MAX_SIZE. Regions that share cuboids
+# are read with one cutout of their bounding box unless it would fetch more than BATCH_CUTOUT_MERGE_RATIO times the
+# cuboids the regions need.
+BATCH_CUTOUT_MAX_REGIONS = 10000
+BATCH_CUTOUT_MERGE_RATIO = 2
+
+# Number of threads per worker process used to compress and write the cuboids of a cutout POST in parallel
+CUTOUT_WRITE_THREADS = 4
+
+# Asynchronous cutout POSTs (?async=true). The decoded payload is spilled to CUTOUT_ASYNC_SPOOL_DIR on the worker that
+# accepted it and written by CUTOUT_ASYNC_WORKERS background threads of that worker. Job status is kept in the
+# WRITE_JOB_CACHE_ALIAS cache for WRITE_JOB_TIMEOUT seconds. Jobs are lost if their worker exits first (uwsgi reload,
+# max-requests or a crash). They are reported as FAILED once the worker has not sent a heartbeat for
+# WRITE_JOB_HEARTBEAT_TIMEOUT seconds. Spooled payloads on a host are limited to CUTOUT_ASYNC_SPOOL_MAX_SIZE bytes
+# (429 when full), and a write is rejected with a 507 if it would leave less than CUTOUT_ASYNC_SPOOL_MIN_FREE bytes
+# free on the spool disk.
+CUTOUT_ASYNC_SPOOL_DIR = os.path.join('/tmp', 'boss_write_jobs')
+CUTOUT_ASYNC_SPOOL_MAX_SIZE = 16 * 1024 * 1048576
+CUTOUT_ASYNC_SPOOL_MIN_FREE = 1024 * 1048576
+CUTOUT_ASYNC_WORKERS = 2
+WRITE_JOB_CACHE_ALIAS = 'default'
+WRITE_JOB_TIMEOUT = 7 * 24 * 60 * 60
+WRITE_JOB_HEARTBEAT_INTERVAL = 30  # seconds
+WRITE_JOB_HEARTBEAT_TIMEOUT = 120  # seconds
+
+# Admission control for the data services. Uncompressed bytes in flight are tracked per user and across all workers
+# in the ADMISSION_CACHE_ALIAS cache. A request over the user budget is rejected immediately with a 429, and a request
+# over the global budget with a 503, both with a Retry-After header. Counters expire after ADMISSION_KEY_TIMEOUT
+# seconds so bytes held by a killed worker are eventually returned. Requires a cache shared by all workers, so it is
+# only enabled in production.
+ADMISSION_CONTROL_ENABLED = False
+ADMISSION_CACHE_ALIAS = 'default'
+ADMISSION_USER_MAX_BYTES = 2 * CUTOUT_MAX_SIZE
+ADMISSION_MAX_BYTES = 8 * CUTOUT_MAX_SIZE
+ADMISSION_RETRY_AFTER = 5  # seconds, sent in the Retry-After header of a rejected request
+ADMISSION_KEY_TIMEOUT = 900  # seconds
+
+# On-the-fly downsampling of cutout and tile reads above the base resolution of channels that are not downsampled yet.
+# Regions that would read more than CUTOUT_DOWNSAMPLE_FALLBACK_MAX_SIZE bytes at the base resolution are read
+# normally. Downsampled regions are cached if they compress to under CUTOUT_DOWNSAMPLE_FALLBACK_MAX_ENTRY_SIZE.
+CUTOUT_DOWNSAMPLE_FALLBACK_ENABLED = False
+CUTOUT_DOWNSAMPLE_FALLBACK_MAX_SIZE = 4 * CUTOUT_MAX_SIZE
+CUTOUT_DOWNSAMPLE_FALLBACK_CACHE_ALIAS = 'default'
+CUTOUT_DOWNSAMPLE_FALLBACK_CACHE_TIMEOUT = 3600  # seconds
+CUTOUT_DOWNSAMPLE_FALLBACK_MAX_ENTRY_SIZE = 16 * 1048576
+
+# Filtered annotation cutouts (?filter=) only read the cuboids listed for the ids in the id index. Requests for more than
+# CUTOUT_FILTER_INDEX_MAX_IDS ids read and filter every cuboid of the region. CUTOUT_FILTER_INDEX_DELAY is the longest
+# a write may take to be flushed and indexed. The index is not used until the write versions have been kept that long.
+CUTOUT_FILTER_INDEX_ENABLED = False
+CUTOUT_FILTER_INDEX_MAX_IDS = 100
+CUTOUT_FILTER_INDEX_DELAY = 3600  # seconds
+
+# Read-ahead for users scrolling or panning through a channel. The next layer of cuboids in the direction of their
+# last two reads is paged into the cache by PREFETCH_THREADS background threads per worker, with at most
+# PREFETCH_MAX_INFLIGHT prefetches per worker and PREFETCH_USER_RATE prefetches per second per user. Access history
+# and the hit/miss counters are kept in the PREFETCH_CACHE_ALIAS cache.
+PREFETCH_ENABLED = False
+PREFETCH_CACHE_ALIAS = 'default'
+PREFETCH_THREADS = 2
+PREFETCH_MAX_INFLIGHT = 4
+PREFETCH_USER_RATE = 10
+PREFETCH_MAX_SIZE = 64 * 1048576
+PREFETCH_HISTORY_TIMEOUT = 300  # seconds
+
+# Coalescing of identical concurrent cutout and tile reads. The first request computes the response while identical
+# requests poll for its rendered bytes every SINGLE_FLIGHT_POLL_INTERVAL seconds for up to SINGLE_FLIGHT_WAIT_TIMEOUT
+# seconds. At most SINGLE_FLIGHT_MAX_WAITERS requests wait for a response and later ones compute it, so a hot response
+# never holds every worker. Responses larger than SINGLE_FLIGHT_MAX_RESULT_SIZE are not shared, and waiting requests
+# compute them.
+SINGLE_FLIGHT_ENABLED = False
+SINGLE_FLIGHT_CACHE_ALIAS = 'default'
+SINGLE_FLIGHT_LOCK_TIMEOUT = 60  # seconds
+SINGLE_FLIGHT_WAIT_TIMEOUT = 3  # seconds
+SINGLE_FLIGHT_MAX_WAITERS = 4
+SINGLE_FLIGHT_POLL_INTERVAL = 0.05  # seconds
+SINGLE_FLIGHT_RESULT_TIMEOUT = 30  # seconds
+SINGLE_FLIGHT_MAX_RESULT_SIZE = 64 * 1048576
+
+# Default blosc settings used to encode cutouts. Requests may override the codec, clevel and shuffle mode, and
+# request up to BLOSC_MAX_NTHREADS threads.
+BLOSC_CNAME = 'blosclz'
+BLOSC_CLEVEL = 9
+BLOSC_SHUFFLE = 'byte'
+BLOSC_NTHREADS = 1
+BLOSC_MAX_NTHREADS = 4
+
+# Cache alias used to store per-cuboid write versions. Keys are stored without a timeout, one per cuboid and time
+# sample written through the API, so the cache should not be shared with sessions and must never evict keys (a redis
+# noeviction maxmemory policy). On redis, evictions are still detected every WRITE_VERSION_EVICTION_CHECK_INTERVAL
+# seconds per process and invalidate everything derived from the write versions.
+WRITE_VERSION_CACHE_ALIAS = 'default'
+WRITE_VERSION_EVICTION_CHECK_INTERVAL = 5  # seconds
+
+# Optional cache of rendered cutout responses, invalidated by writes to overlapping regions
+CUTOUT_CACHE_ENABLED = False
+CUTOUT_CACHE_ALIAS = 'default'
+CUTOUT_CACHE_TIMEOUT = 300  # seconds
+CUTOUT_CACHE_MAX_ENTRY_SIZE = 16 * 1048576
+
+# Store of rendered tiles for the tile service, invalidated by writes to overlapping regions. Tiles are stored as
+# they are served and by pre-render jobs, which run on TILE_PRERENDER_WORKERS background threads per worker and read
+# blocks of at most TILE_PRERENDER_MAX_BLOCK_SIZE bytes. A job renders at most TILE_PRERENDER_MAX_TILES tiles, counting
+# each time sample of a tile separately. Set TILE_STORE_CACHE_ALIAS to a redis or file based cache to
+# keep tiles in redis or on local disk.
+TILE_STORE_ENABLED = False
+TILE_STORE_CACHE_ALIAS = 'default'
+TILE_STORE_TIMEOUT = 7 * 86400  # seconds
+TILE_STORE_MAX_ENTRY_SIZE = 4 * 1048576
+TILE_PRERENDER_WORKERS = 1
+TILE_PRERENDER_MAX_BLOCK_SIZE = 64 * 1048576
+TILE_PRERENDER_MAX_TILES = 1000000
+TILE_PRERENDER_JOB_TIMEOUT = 86400  # seconds
+
+# Batch tile requests return at most TILE_BATCH_MAX_TILES tiles, encoded by TILE_BATCH_RENDER_THREADS threads per
+# worker process
+TILE_BATCH_MAX_TILES = 256
+TILE_BATCH_RENDER_THREADS = 4
+
+# Per-process cache of the cuboid-aligned slabs read for yz and xz tile and image slices. Cuboids are decompressed
+# whole, so a slice is read as the slab of cuboids around it and neighbouring slices are served from the cached slab.
+# PLANE_CACHE_MAX_SIZE bytes are kept per host, split evenly between the uwsgi worker processes. Slabs over
+# PLANE_CACHE_MAX_ENTRY_SIZE bytes, or over the share of a process, are not cached.
+PLANE_CACHE_ENABLED = False
+PLANE_CACHE_MAX_SIZE = 512 * 1048576
+PLANE_CACHE_MAX_ENTRY_SIZE = 32 * 1048576
+
+# Cache of the collection, experiment, channel and coordinate frame rows and lookup key resolved for the names in a
+# request. Each worker keeps at most RESOURCE_CACHE_MAX_ENTRIES resolved requests and shares them with the other
+# workers through the RESOURCE_CACHE_ALIAS cache for RESOURCE_CACHE_TIMEOUT seconds. Saving or deleting a resource
+# invalidates every entry, so the cache must be shared by all workers and is only enabled in production.
+RESOURCE_CACHE_ENABLED = False
+RESOURCE_CACHE_ALIAS = 'default'
+RESOURCE_CACHE_TIMEOUT = 3600  # seconds
+RESOURCE_CACHE_MAX_ENTRIES = 1024
+
+# Cache of the permissions of a user on a resource, kept in the PERMISSION_CACHE_ALIAS cache for
+# PERMISSION_CACHE_TIMEOUT seconds. Changing the permissions of a group on a resource or the members of a group
+# invalidates the affected entries, so the cache must be shared by all workers and is only enabled in production.
+PERMISSION_CACHE_ENABLED = False
+PERMISSION_CACHE_ALIAS = 'default'
+PERMISSION_CACHE_TIMEOUT = 300  # seconds
+
 # Allow all cross site origins
 CORS_ORIGIN_ALLOW_ALL = True
 
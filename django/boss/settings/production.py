@@ -48,9 +48,70 @@ CACHES = {
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
         }
+    },
+    # Rendered cutout responses. Every entry has a timeout so a volatile-lru maxmemory policy can evict them.
+    "cutout": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://{}:6379/4".format(config['aws']['cache']),
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        }
+    },
+    # Rendered tiles. Every entry has a timeout so a volatile-lru maxmemory policy can evict them.
+    "tiles": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://{}:6379/5".format(config['aws']['cache']),
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        }
+    },
+    # Per-cuboid write versions. Kept on the cache state redis, which holds spdb's write and page-in state and must
+    # run with a noeviction maxmemory policy, instead of the cuboid cache, which evicts.
+    "write_versions": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://{}:6379/6".format(config['aws']['cache-state']),
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        }
     }
 }
 
+WRITE_VERSION_CACHE_ALIAS = 'write_versions'
+
+# Serve repeat reads of unchanged regions from rendered responses shared by all workers through redis
+CUTOUT_CACHE_ENABLED = True
+CUTOUT_CACHE_ALIAS = 'cutout'
+
+# In-flight byte counters are shared by all workers through redis
+ADMISSION_CONTROL_ENABLED = True
+
+# Serve reads above the base resolution before a channel has been downsampled. Results share the cutout cache.
+CUTOUT_DOWNSAMPLE_FALLBACK_ENABLED = True
+CUTOUT_DOWNSAMPLE_FALLBACK_CACHE_ALIAS = 'cutout'
+
+# Filtered cutouts use the id index of the object store
+CUTOUT_FILTER_INDEX_ENABLED = True
+
+# Page in the cuboids interactive users are about to read. History is shared by all workers through redis.
+PREFETCH_ENABLED = True
+
+# Coalesce identical concurrent reads across workers. Results share the cutout cache.
+SINGLE_FLIGHT_ENABLED = True
+SINGLE_FLIGHT_CACHE_ALIAS = 'cutout'
+
+# Serve tiles from the rendered tile store shared by all workers
+TILE_STORE_ENABLED = True
+TILE_STORE_CACHE_ALIAS = 'tiles'
+
+# Read tile and image slices from slabs of cuboids cached in each worker
+PLANE_CACHE_ENABLED = True
+
+# Resolve request resource names from rows cached in each worker and shared by all workers through redis
+RESOURCE_CACHE_ENABLED = True
+
+# Check permissions against decisions shared by all workers through redis
+PERMISSION_CACHE_ENABLED = True
+
 # DP ???: Are these needed, it looks like they just ensure that the default cache is used
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 SESSION_CACHE_ALIAS = 'default'
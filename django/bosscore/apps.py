@@ -17,3 +17,8 @@ from django.apps import AppConfig
 
 class BosscoreConfig(AppConfig):
     name = 'bosscore'
+
+    def ready(self):
+        from . import permission_cache, resource_cache
+        resource_cache.connect_signals()
+        permission_cache.connect_signals()
@@ -40,6 +40,9 @@ class ErrorCodes(IntEnum):
     INVALID_REQUEST = 2004
     UNSUPPORTED_4D = 2005
     INVALID_STATE = 2006
+    TOO_MANY_REQUESTS = 2007
+    INSUFFICIENT_STORAGE = 2008
+    SERVER_BUSY = 2009
 
     # Unauthorized
     MISSING_ROLE = 3000
@@ -93,6 +96,9 @@ RESP_CODES = {
     ErrorCodes.DATATYPE_NOT_SUPPORTED: 400,
     ErrorCodes.UNSUPPORTED_4D: 400,
     ErrorCodes.INVALID_STATE: 409,
+    ErrorCodes.TOO_MANY_REQUESTS: 429,
+    ErrorCodes.INSUFFICIENT_STORAGE: 507,
+    ErrorCodes.SERVER_BUSY: 503,
     ErrorCodes.INVALID_REQUEST: 404,
     ErrorCodes.MISSING_ROLE: 403,
     ErrorCodes.MISSING_PERMISSION: 403,
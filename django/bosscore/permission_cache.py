@@ -0,0 +1,231 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Cached guardian permissions of a user on a resource. Looking them up reads every permission of the user and the
+# user's groups, which dominated the cost of permission checks during tile storms.
+
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+
+from guardian.shortcuts import get_perms
+
+PERMISSION_CACHE_PREFIX = "PERMISSION"
+PERMISSION_OBJECT_VERSION_PREFIX = "PERMISSION-OBJECT-VERSION"
+PERMISSION_USER_VERSION_PREFIX = "PERMISSION-USER-VERSION"
+
+def get_object_version_key(content_type_id, object_id):
+    """Method to get the version key of the permissions granted on an object
+
+    Args:
+        content_type_id (int): Id of the content type of the object
+        object_id (int): Primary key of the object
+
+    Returns:
+        (str): Cache key
+    """
+    return "{}&{}&{}".format(PERMISSION_OBJECT_VERSION_PREFIX, content_type_id, object_id)
+
+
+def get_user_version_key(user_id):
+    """Method to get the version key of the group membership of a user
+
+    Args:
+        user_id (int): Primary key of the user
+
+    Returns:
+        (str): Cache key
+    """
+    return "{}&{}".format(PERMISSION_USER_VERSION_PREFIX, user_id)
+
+
+class PermissionCache:
+    """
+    Class to cache the permissions of a user on an object
+
+    Entries are keyed by (user id, content type id, object id) and hold the permissions with the version of the
+    object's permissions and of the user's group membership they were read under. Changing the permissions of any
+    group on the object or the groups of the user replaces the version, so the entry is read again on the next check.
+    A missing version is replaced by a new random one rather than a default, so entries read before a version was
+    evicted from the cache are never used again. Entries also expire after PERMISSION_CACHE_TIMEOUT seconds.
+    """
+
+    def __init__(self, user, obj):
+        """
+
+        Args:
+            user (django.contrib.auth.models.User): User being checked
+            obj (django.db.models.Model): Object the permissions are checked on
+        """
+        self.user = user
+        self.obj = obj
+        self.cache = caches[settings.PERMISSION_CACHE_ALIAS]
+
+        content_type_id = ContentType.objects.get_for_model(obj).pk
+        self.key = "{}&{}&{}&{}".format(PERMISSION_CACHE_PREFIX, user.pk, content_type_id, obj.pk)
+        self.object_key = get_object_version_key(content_type_id, obj.pk)
+        self.user_key = get_user_version_key(user.pk)
+
+    @staticmethod
+    def is_enabled():
+        """Method to check if the permission cache is enabled
+
+        Returns:
+            bool
+        """
+        return settings.PERMISSION_CACHE_ENABLED
+
+    @staticmethod
+    def invalidate_object(obj):
+        """Method to invalidate the cached permissions of every user on an object
+
+        Args:
+            obj (django.db.models.Model): Object whose permissions changed
+
+        Returns:
+            None
+        """
+        key = get_object_version_key(ContentType.objects.get_for_model(obj).pk, obj.pk)
+        caches[settings.PERMISSION_CACHE_ALIAS].set(key, uuid.uuid4().hex, timeout=None)
+
+    @staticmethod
+    def invalidate_users(user_ids):
+        """Method to invalidate the cached permissions of users on every object
+
+        Args:
+            user_ids (iterable(int)): Primary keys of the users whose groups changed
+
+        Returns:
+            None
+        """
+        token = uuid.uuid4().hex
+        caches[settings.PERMISSION_CACHE_ALIAS].set_many({get_user_version_key(user_id): token
+                                                          for user_id in user_ids}, timeout=None)
+
+    def get_version(self, key, entries):
+        """Method to get a version, creating a new one if it is missing
+
+        Args:
+            key (str): Version key
+            entries (dict): Values already read from the cache
+
+        Returns:
+            (str|None): None if the version could not be stored
+        """
+        version = entries.get(key)
+        if version is None:
+            self.cache.add(key, uuid.uuid4().hex, timeout=None)
+            version = self.cache.get(key)
+        return version
+
+    def get_perms(self):
+        """Method to get the permissions of the user on the object
+
+        Returns:
+            (list(str)): Permission codenames
+        """
+        entries = self.cache.get_many([self.key, self.object_key, self.user_key])
+        versions = (self.get_version(self.object_key, entries), self.get_version(self.user_key, entries))
+        if None in versions:
+            return get_perms(self.user, self.obj)
+
+        entry = entries.get(self.key)
+        if entry is not None and entry[0] == versions:
+            return entry[1]
+
+        perms = get_perms(self.user, self.obj)
+        self.cache.set(self.key, (versions, perms), timeout=settings.PERMISSION_CACHE_TIMEOUT)
+        return perms
+
+
+def get_cached_perms(user, obj):
+    """Method to get the permissions of a user on an object, from the permission cache when it is enabled
+
+    Args:
+        user (django.contrib.auth.models.User): User being checked
+        obj (django.db.models.Model): Object the permissions are checked on
+
+    Returns:
+        (list(str)): Permission codenames
+    """
+    if PermissionCache.is_enabled() and user.pk is not None:
+        return PermissionCache(user, obj).get_perms()
+    return get_perms(user, obj)
+
+
+def invalidate_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    """Signal receiver that invalidates the cached permissions of users whose groups changed
+
+    Args:
+        sender (django.db.models.Model): Through model of User.groups
+        instance (django.db.models.Model): User whose groups changed, or group whose users changed if reverse
+        action (str): Type of change
+        reverse (bool): Flag indicating the change was made through Group.user_set
+        pk_set (set(int)): Primary keys of the groups or users added or removed
+
+    Returns:
+        None
+    """
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        PermissionCache.invalidate_users([instance.pk])
+    elif reverse and action in ('post_add', 'post_remove'):
+        PermissionCache.invalidate_users(pk_set)
+    elif reverse and action == 'pre_clear':
+        PermissionCache.invalidate_users(list(instance.user_set.values_list('id', flat=True)))
+
+
+def invalidate_group_members(sender, instance, **kwargs):
+    """Signal receiver that invalidates the cached permissions of the members of a group being deleted
+
+    Args:
+        sender (django.db.models.Model): Group model
+        instance (django.contrib.auth.models.Group): Group being deleted
+
+    Returns:
+        None
+    """
+    PermissionCache.invalidate_users(list(instance.user_set.values_list('id', flat=True)))
+
+
+def invalidate_user(sender, instance, **kwargs):
+    """Signal receiver that invalidates the cached permissions of a user that was saved or deleted
+
+    Saving a user can change is_superuser or is_active, which both change the permissions guardian reports.
+
+    Args:
+        sender (django.db.models.Model): User model
+        instance (django.contrib.auth.models.User): User that was saved or deleted
+
+    Returns:
+        None
+    """
+    PermissionCache.invalidate_users([instance.pk])
+
+
+def connect_signals():
+    """Method to invalidate cached permissions when a user or group membership changes or a group is deleted
+
+    Called when the bosscore app is ready.
+
+    Returns:
+        None
+    """
+    m2m_changed.connect(invalidate_membership, sender=User.groups.through, dispatch_uid="invalidate_membership")
+    pre_delete.connect(invalidate_group_members, sender=Group, dispatch_uid="invalidate_group_members")
+    post_save.connect(invalidate_user, sender=User, dispatch_uid="invalidate_user_save")
+    post_delete.connect(invalidate_user, sender=User, dispatch_uid="invalidate_user_delete")
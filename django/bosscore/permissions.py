@@ -18,6 +18,7 @@ from django.contrib.contenttypes.models import ContentType
 from guardian.shortcuts import assign_perm, get_perms, remove_perm, get_perms_for_model
 from .error import BossHTTPError, ErrorCodes, BossError
 from bosscore.models import BossGroup
+from .permission_cache import PermissionCache, get_cached_perms
 
 def check_is_member_or_maintainer(user, group_name):
     """
@@ -78,7 +79,7 @@ class BossPermissionManager:
             assign_perm('add_volumetric_data', user_primary_group, obj)
             assign_perm('read_volumetric_data', user_primary_group, obj)
             assign_perm('delete_volumetric_data', user_primary_group, obj)
-
+        PermissionCache.invalidate_object(obj)
 
 
     @staticmethod
@@ -104,6 +105,7 @@ class BossPermissionManager:
         group = Group.objects.get(name=group_name)
         for perm in perm_list:
             assign_perm(perm, group, obj)
+        PermissionCache.invalidate_object(obj)
 
     @staticmethod
     def get_permissions_group(group_name, obj):
@@ -137,6 +139,7 @@ class BossPermissionManager:
         group = Group.objects.get(name=group_name)
         for perm in perm_list:
             remove_perm(perm, group, obj)
+        PermissionCache.invalidate_object(obj)
 
     @staticmethod
     def delete_all_permissions_group(group_name, obj):
@@ -155,6 +158,7 @@ class BossPermissionManager:
         perm_list = get_perms(group, obj)
         for perm in perm_list:
             remove_perm(perm, group, obj)
+        PermissionCache.invalidate_object(obj)
 
     @staticmethod
     def add_permissions_admin_group(obj):
@@ -185,6 +189,7 @@ class BossPermissionManager:
                 assign_perm('add_volumetric_data', admin_group, obj)
                 assign_perm('read_volumetric_data', admin_group, obj)
                 assign_perm('delete_volumetric_data', admin_group, obj)
+            PermissionCache.invalidate_object(obj)
 
         except Group.DoesNotExist:
             raise BossError("Cannot assign permissions to the admin group because the group does not exist",
@@ -214,7 +219,7 @@ class BossPermissionManager:
         else:
             raise BossError("Unable to get permissions for this request", ErrorCodes.INVALID_POST_ARGUMENT)
 
-        if permission in get_perms(user, obj):
+        if permission in get_cached_perms(user, obj):
             return True
         else:
             return False
@@ -241,7 +246,7 @@ class BossPermissionManager:
         else:
             raise BossError("Unable to get permissions for this request", ErrorCodes.INVALID_POST_ARGUMENT)
 
-        if permission in get_perms(user, obj):
+        if permission in get_cached_perms(user, obj):
             return True
         else:
             return False
@@ -264,7 +269,7 @@ class BossPermissionManager:
         else:
             raise BossError("Invalid method type. This query only supports a GET", ErrorCodes.INVALID_POST_ARGUMENT)
 
-        if permission in get_perms(user, obj):
+        if permission in get_cached_perms(user, obj):
             return True
         else:
             return False
\ No newline at end of file
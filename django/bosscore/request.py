@@ -12,16 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import re
 import numpy as np
 
-from .models import Collection, Experiment, Channel
 from .lookup import LookUpKey
+from .resolver import META_CONNECTOR, resolve_resource
+from .resource_cache import ResourceCache
 from .error import BossHTTPError, BossError, ErrorCodes, BossRestArgsError
 from .permissions import BossPermissionManager
 
-META_CONNECTOR = "&"
-
 
 class BossRequest:
     """
@@ -47,6 +47,7 @@ class BossRequest:
 
         self.default_time = None
         self.coord_frame = None
+        self.lookup_key = None
 
         # Endpoint service and version number from the request
         self.service = None
@@ -110,6 +111,12 @@ class BossRequest:
         elif self.service == 'downsample':
             self.validate_downsample_service()
 
+        elif self.service == 'batch':
+            self.validate_batch_service()
+
+        elif self.service == 'prerender':
+            self.validate_prerender_service()
+
         else:
             self.validate_cutout_service()
 
@@ -144,6 +151,91 @@ class BossRequest:
         self.initialize_request(self.bossrequest['collection_name'], self.bossrequest['experiment_name'],
                                 self.bossrequest['channel_name'])
 
+    def validate_batch_service(self):
+        """
+        "Validate batch cutout requests. Only the datamodel and permissions are validated here. Each region is
+        validated by get_region_request.
+
+        Args:
+            webargs:
+
+        Returns:
+
+        """
+        self.initialize_request(self.bossrequest['collection_name'], self.bossrequest['experiment_name'],
+                                self.bossrequest['channel_name'])
+
+    def validate_prerender_service(self):
+        """
+        "Validate tile pre-render requests. If no region is given the whole coordinate frame is pre-rendered.
+
+        Args:
+            webargs:
+
+        Returns:
+
+        """
+        self.initialize_request(self.bossrequest['collection_name'], self.bossrequest['experiment_name'],
+                                self.bossrequest['channel_name'])
+
+        time = self.bossrequest['time_args']
+        if not time:
+            # get default time
+            self.time_start = self.channel.default_time_sample
+            self.time_stop = self.channel.default_time_sample + 1
+            self.time_request = False
+        else:
+            self.set_time(time)
+            self.time_request = True
+
+        x_args = self.bossrequest['x_args']
+        y_args = self.bossrequest['y_args']
+        z_args = self.bossrequest['z_args']
+        if not x_args:
+            x_args = "{}:{}".format(self.coord_frame.x_start, self.coord_frame.x_stop)
+            y_args = "{}:{}".format(self.coord_frame.y_start, self.coord_frame.y_stop)
+            z_args = "{}:{}".format(self.coord_frame.z_start, self.coord_frame.z_stop)
+
+        self.set_cutoutargs(int(self.bossrequest['resolution']), x_args, y_args, z_args)
+
+    def get_region_request(self, resolution, x_args, y_args, z_args, time_args=None):
+        """
+        Get a cutout request for a single region of a validated batch request
+
+        The datamodel objects and permission check of the batch request are reused, so no queries are made.
+
+        Args:
+            resolution: Integer indicating the level in the resolution hierarchy (0 = native)
+            x_args: Python style range indicating the X coordinates  (eg. 100:200)
+            y_args: Python style range indicating the Y coordinates (eg. 100:200)
+            z_args: Python style range indicating the Z coordinates (eg. 100:200)
+            time_args: Optional python style range indicating the time samples (eg. 0:2)
+
+        Returns:
+            (BossRequest): Validated cutout request for the region
+
+        Raises:
+            BossError: For invalid regions
+        """
+        if self.service != 'batch':
+            raise BossError("Region requests can only be created from a batch request", ErrorCodes.UNABLE_TO_VALIDATE)
+
+        region = copy.copy(self)
+        region.service = 'cutout'
+        region.filter_ids = None
+
+        if not time_args:
+            # get default time
+            region.time_start = self.channel.default_time_sample
+            region.time_stop = self.channel.default_time_sample + 1
+            region.time_request = False
+        else:
+            region.set_time(time_args)
+            region.time_request = True
+
+        region.set_cutoutargs(resolution, x_args, y_args, z_args)
+        return region
+
     def validate_cutout_service(self):
         """
 
@@ -324,15 +416,34 @@ class BossRequest:
 
         """
         if collection_name:
-            colstatus = self.set_collection(collection_name)
-            if experiment_name and colstatus:
-                expstatus = self.set_experiment(experiment_name)
-                if channel_name and expstatus:
-                    self.set_channel(channel_name)
+            resource_cache = ResourceCache(collection_name, experiment_name, channel_name) \
+                if ResourceCache.is_enabled() else None
+            resolved = resource_cache.get() if resource_cache else None
+            if resolved is None:
+                resolved = resolve_resource(collection_name, experiment_name, channel_name)
+                if resource_cache:
+                    resource_cache.put(resolved)
+            self.set_resolved(resolved)
 
         self.check_permissions()
         self.set_boss_key()
 
+    def set_resolved(self, resolved):
+        """
+        Set the datamodel objects and lookup key from the resolved resources of the request
+
+        Args:
+            resolved (bosscore.resolver.ResolvedResource): Resolved resources
+
+        Returns:
+            None
+        """
+        self.collection = resolved.collection
+        self.experiment = resolved.experiment
+        self.channel = resolved.channel
+        self.coord_frame = resolved.coord_frame
+        self.lookup_key = resolved.lookup_key
+
     def set_cutoutargs(self, resolution, x_range, y_range, z_range):
         """
         Validate and initialize cutout arguments in the request
@@ -525,28 +636,6 @@ class BossRequest:
         """
         self.service = service
 
-    def set_collection(self, collection_name):
-        """
-        Validate the collection and set collection object for a valid collection.
-        Args:
-            collection_name: Collection name from the request
-
-        Returns:
-            Bool : True
-
-        Raises : BossError is the collection is not found.
-
-        """
-        if Collection.objects.filter(name=str(collection_name)).exists():
-            self.collection = Collection.objects.get(name=collection_name)
-            if self.collection.to_be_deleted is not None:
-                raise BossError("Invalid Request. This resource {} has been marked for deletion"
-                                .format(collection_name),ErrorCodes.RESOURCE_MARKED_FOR_DELETION)
-
-            return True
-        else:
-            raise BossError("Collection {} not found".format(collection_name), ErrorCodes.RESOURCE_NOT_FOUND)
-
     def get_collection(self):
         """
         Get the collection name for the current collection
@@ -558,26 +647,6 @@ class BossRequest:
         if self.collection:
             return self.collection.name
 
-    def set_experiment(self, experiment_name):
-        """
-        Validate and set the experiment
-        Args:
-            experiment_name: Experiment name from the request
-
-        Returns: BossError is the experiment with the matching name is not found in the db
-
-        """
-        if Experiment.objects.filter(name=experiment_name, collection=self.collection).exists():
-            self.experiment = Experiment.objects.get(name=experiment_name, collection=self.collection)
-            if self.experiment.to_be_deleted is not None:
-                raise BossError("Invalid Request. This resource {} has been marked for deletion"
-                                .format(experiment_name),ErrorCodes.RESOURCE_MARKED_FOR_DELETION)
-            self.coord_frame = self.experiment.coord_frame
-        else:
-            raise BossError("Experiment {} not found".format(experiment_name), ErrorCodes.RESOURCE_NOT_FOUND)
-
-        return True
-
     def get_experiment(self):
         """
         Return the experiment name for the current experiment
@@ -589,24 +658,6 @@ class BossRequest:
         if self.experiment:
             return self.experiment.name
 
-    def set_channel(self, channel_name):
-        """
-        Validate and set the channel
-        Args:
-            channel_name: Channel name specified in the request
-
-        Returns:
-
-        """
-        if Channel.objects.filter(name=channel_name, experiment=self.experiment).exists():
-            self.channel = Channel.objects.get(name=channel_name, experiment=self.experiment)
-            if self.channel.to_be_deleted is not None:
-                raise BossError("Invalid Request. This resource {} has been marked for deletion"
-                                .format(channel_name),ErrorCodes.RESOURCE_MARKED_FOR_DELETION)
-            return True
-        else:
-            raise BossError("Channel {} not found".format(channel_name), ErrorCodes.RESOURCE_NOT_FOUND)
-
     def get_channel(self):
         """
         Return the channel name for the channel
@@ -788,7 +839,7 @@ class BossRequest:
             self.bosskey(str) : String that represents the boss key for the current request
         """
         if self.service == 'cutout' or self.service == 'image' or self.service == 'tile' or self.service == 'ids'\
-                or self.service == 'boundingbox' or self.service == 'downsample':
+                or self.service == 'boundingbox' or self.service == 'downsample' or self.service == 'prerender':
             perm = BossPermissionManager.check_data_permissions(self.user, self.channel, self.method)
 
         elif self.service == 'meta':
@@ -804,6 +855,9 @@ class BossRequest:
             perm = BossPermissionManager.check_resource_permissions(self.user, obj, self.method)
         elif self.service == 'reserve':
             perm = BossPermissionManager.check_object_permissions(self.user, self.channel, self.method)
+        elif self.service == 'batch':
+            # Batch cutouts POST a list of regions but only read data
+            perm = BossPermissionManager.check_data_permissions(self.user, self.channel, 'GET')
 
         if not perm:
             raise BossError("This user does not have the required permissions", ErrorCodes.MISSING_PERMISSION)
@@ -831,7 +885,9 @@ class BossRequest:
             lookup (str) : The base lookup key that correspond to the request
 
         """
-        return LookUpKey.get_lookup_key(self.base_boss_key).lookup_key
+        if self.lookup_key is None:
+            self.lookup_key = LookUpKey.get_lookup_key(self.base_boss_key).lookup_key
+        return self.lookup_key
 
     def set_time(self, time):
         """
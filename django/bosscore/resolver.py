@@ -0,0 +1,150 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Resolution of collection, experiment and channel names to their rows. The whole chain, the coordinate frame of the
+# experiment and the lookup key of the deepest resource are read with a single query. Lookups that miss are probed
+# level by level, so callers see the same errors as resolving each level separately.
+
+from django.core.exceptions import ObjectDoesNotExist
+
+from .error import BossError, ErrorCodes
+from .models import Collection, Experiment, Channel, BossLookup
+
+META_CONNECTOR = "&"
+
+
+class ResolvedResource:
+    """
+    Rows of the resources named in a request and the lookup key of the deepest resource
+    """
+
+    def __init__(self, collection, experiment=None, channel=None, coord_frame=None, lookup_key=None):
+        """
+
+        Args:
+            collection (bosscore.models.Collection): Collection row
+            experiment (bosscore.models.Experiment): Experiment row, if an experiment was named
+            channel (bosscore.models.Channel): Channel row, if a channel was named
+            coord_frame (bosscore.models.CoordinateFrame): Coordinate frame of the experiment
+            lookup_key (str): Lookup key of the deepest resource, or None if it has no lookup row
+        """
+        self.collection = collection
+        self.experiment = experiment
+        self.channel = channel
+        self.coord_frame = coord_frame
+        self.lookup_key = lookup_key
+
+
+def with_lookup_key(queryset, boss_key):
+    """Method to select the lookup key of a boss key as the lookup_key attribute of each row of a queryset
+
+    Args:
+        queryset (django.db.models.QuerySet): Query for the deepest resource
+        boss_key (str): Boss key of the resource
+
+    Returns:
+        (django.db.models.QuerySet)
+    """
+    lookup_sql = "SELECT lookup_key FROM {} WHERE boss_key = %s LIMIT 1".format(BossLookup._meta.db_table)
+    return queryset.extra(select={'lookup_key': lookup_sql}, select_params=(boss_key,))
+
+
+def get_resource_chain(collection_name, experiment_name=None, channel_name=None):
+    """Method to get the rows for a collection and optionally an experiment and channel with a single query
+
+    Args:
+        collection_name (str): Collection name
+        experiment_name (str): Experiment name. Required if channel_name is given
+        channel_name (str): Channel name
+
+    Returns:
+        (ResolvedResource)
+
+    Raises:
+        (Collection.DoesNotExist|Experiment.DoesNotExist|Channel.DoesNotExist): For the first level that is not found
+    """
+    try:
+        if channel_name:
+            boss_key = META_CONNECTOR.join([collection_name, experiment_name, channel_name])
+            queryset = Channel.objects.select_related('experiment__collection', 'experiment__coord_frame')
+            channel = with_lookup_key(queryset, boss_key).get(name=channel_name, experiment__name=experiment_name,
+                                                              experiment__collection__name=collection_name)
+            experiment = channel.experiment
+            return ResolvedResource(experiment.collection, experiment, channel, experiment.coord_frame,
+                                    channel.lookup_key)
+
+        elif experiment_name:
+            boss_key = META_CONNECTOR.join([collection_name, experiment_name])
+            queryset = Experiment.objects.select_related('collection', 'coord_frame')
+            experiment = with_lookup_key(queryset, boss_key).get(name=experiment_name,
+                                                                 collection__name=collection_name)
+            return ResolvedResource(experiment.collection, experiment, None, experiment.coord_frame,
+                                    experiment.lookup_key)
+
+        else:
+            collection = with_lookup_key(Collection.objects.all(), collection_name).get(name=collection_name)
+            return ResolvedResource(collection, lookup_key=collection.lookup_key)
+
+    except ObjectDoesNotExist:
+        # Find the level that is missing
+        if not Collection.objects.filter(name=collection_name).exists():
+            raise Collection.DoesNotExist()
+        if experiment_name and not Experiment.objects.filter(name=experiment_name,
+                                                             collection__name=collection_name).exists():
+            raise Experiment.DoesNotExist()
+        raise
+
+
+def resolve_resource(collection_name, experiment_name=None, channel_name=None):
+    """Method to resolve the resources named in a request
+
+    Raises the same errors as validating each level of the request in turn.
+
+    Args:
+        collection_name (str): Collection name from the request
+        experiment_name (str): Experiment name from the request. Ignored if it is not given
+        channel_name (str): Channel name from the request. Ignored if experiment_name is not given
+
+    Returns:
+        (ResolvedResource)
+
+    Raises:
+        BossError: If a resource is not found or has been marked for deletion
+    """
+    names = [collection_name, experiment_name, channel_name if experiment_name else None]
+    try:
+        resolved = get_resource_chain(*names)
+        rows = [resolved.collection, resolved.experiment, resolved.channel]
+    except ObjectDoesNotExist:
+        # Walk the chain to report the first resource that is missing or marked for deletion
+        rows = [Collection.objects.filter(name=collection_name).first()]
+        if rows[0] is not None and rows[0].to_be_deleted is None and names[1]:
+            rows.append(Experiment.objects.filter(name=names[1], collection=rows[0]).first())
+            if rows[1] is not None and rows[1].to_be_deleted is None and names[2]:
+                rows.append(Channel.objects.filter(name=names[2], experiment=rows[1]).first())
+        resolved = None
+
+    for level, name, row in zip(["Collection", "Experiment", "Channel"], names, rows):
+        if not name:
+            break
+        if row is None:
+            raise BossError("{} {} not found".format(level, name), ErrorCodes.RESOURCE_NOT_FOUND)
+        if row.to_be_deleted is not None:
+            raise BossError("Invalid Request. This resource {} has been marked for deletion".format(name),
+                            ErrorCodes.RESOURCE_MARKED_FOR_DELETION)
+
+    if resolved is None:
+        # The chain was created between the two reads
+        return get_resource_chain(*names)
+    return resolved
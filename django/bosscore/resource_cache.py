@@ -0,0 +1,158 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Resolved collection, experiment and channel rows for the names in a request. Each worker process keeps the rows it
+# has resolved and the RESOURCE_CACHE_ALIAS cache holds them for every worker. All entries are tagged with a shared
+# generation that is replaced whenever a resource or lookup row is saved or deleted (including marking a resource
+# for deletion), so a change is seen by every worker on its next request.
+
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_save, post_delete
+
+from .models import Collection, Experiment, Channel, CoordinateFrame, BossLookup
+
+RESOURCE_CACHE_PREFIX = "RESOURCE"
+RESOURCE_GENERATION_KEY = "RESOURCE-GENERATION"
+
+# Generation reported before any resource has been changed since the generation key was created
+INITIAL_GENERATION = "0"
+
+_lock = threading.Lock()
+_resolved = {'pid': None, 'generation': None, 'entries': OrderedDict()}
+
+
+class ResourceCache:
+    """
+    Class to cache the resolved resources for the collection, experiment and channel names of a request
+
+    The generation is read once per request. Entries of this worker are used while the generation is unchanged and
+    entries of the shared cache are keyed by generation, so stale entries are unreachable and age out through
+    RESOURCE_CACHE_TIMEOUT.
+    """
+
+    def __init__(self, collection_name, experiment_name=None, channel_name=None):
+        """
+
+        Args:
+            collection_name (str): Collection name from the request
+            experiment_name (str): Experiment name from the request
+            channel_name (str): Channel name from the request
+        """
+        self.cache = caches[settings.RESOURCE_CACHE_ALIAS]
+        self.generation = self.cache.get(RESOURCE_GENERATION_KEY, INITIAL_GENERATION)
+        self.key = "{}&{}&{}&{}&{}".format(RESOURCE_CACHE_PREFIX, self.generation, collection_name,
+                                           experiment_name, channel_name)
+
+    @staticmethod
+    def is_enabled():
+        """Method to check if the resource cache is enabled
+
+        Returns:
+            bool
+        """
+        return settings.RESOURCE_CACHE_ENABLED
+
+    @staticmethod
+    def invalidate():
+        """Method to replace the generation, invalidating every resolved resource in every worker
+
+        Returns:
+            None
+        """
+        caches[settings.RESOURCE_CACHE_ALIAS].set(RESOURCE_GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+
+    def get(self):
+        """Method to get the resolved resources for the names of the request
+
+        Returns:
+            (bosscore.resolver.ResolvedResource): The resolved resources or None on a miss
+        """
+        with _lock:
+            if _resolved['pid'] != os.getpid() or _resolved['generation'] != self.generation:
+                # Entries of a parent process or an older generation are never used
+                _resolved['pid'] = os.getpid()
+                _resolved['generation'] = self.generation
+                _resolved['entries'] = OrderedDict()
+
+            resolved = _resolved['entries'].get(self.key)
+            if resolved is not None:
+                _resolved['entries'].move_to_end(self.key)
+                return resolved
+
+        resolved = self.cache.get(self.key)
+        if resolved is not None:
+            self._put_local(resolved)
+        return resolved
+
+    def put(self, resolved):
+        """Method to store the resolved resources for the names of the request
+
+        Args:
+            resolved (bosscore.resolver.ResolvedResource): Resources resolved from the database
+
+        Returns:
+            None
+        """
+        self.cache.set(self.key, resolved, timeout=settings.RESOURCE_CACHE_TIMEOUT)
+        self._put_local(resolved)
+
+    def _put_local(self, resolved):
+        """Method to keep resolved resources in this worker, evicting the least recently used over
+        RESOURCE_CACHE_MAX_ENTRIES
+
+        Args:
+            resolved (bosscore.resolver.ResolvedResource): Resolved resources
+
+        Returns:
+            None
+        """
+        with _lock:
+            if _resolved['pid'] != os.getpid() or _resolved['generation'] != self.generation:
+                return
+            _resolved['entries'][self.key] = resolved
+            while len(_resolved['entries']) > settings.RESOURCE_CACHE_MAX_ENTRIES:
+                _resolved['entries'].popitem(last=False)
+
+
+def invalidate_resources(sender, **kwargs):
+    """Signal receiver that invalidates the resolved resources when a resource or lookup row changes
+
+    Args:
+        sender (django.db.models.Model): Model class of the changed row
+
+    Returns:
+        None
+    """
+    ResourceCache.invalidate()
+
+
+def connect_signals():
+    """Method to invalidate the resolved resources on every save and delete of a resource or lookup row
+
+    Called when the bosscore app is ready.
+
+    Returns:
+        None
+    """
+    for model in (Collection, Experiment, Channel, CoordinateFrame, BossLookup):
+        post_save.connect(invalidate_resources, sender=model,
+                          dispatch_uid="invalidate_resources_save_{}".format(model.__name__))
+        post_delete.connect(invalidate_resources, sender=model,
+                            dispatch_uid="invalidate_resources_delete_{}".format(model.__name__))
@@ -0,0 +1,247 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Query and cache round trip budgets for the hot endpoints. A request is driven with the spatialdb and metadata
+# store replaced by in-memory stand ins, and every SQL query and Django cache call is attributed to the stage of the
+# request that made it.
+
+import functools
+import inspect
+import threading
+from collections import OrderedDict
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from spdb.spatialdb import Cube
+
+STAGES = ('validation', 'permission', 'lookup', 'data')
+
+# Functions that start a stage, as (target, stage). Anything not made inside one of them is part of the data stage.
+STAGE_TARGETS = (
+    ('bosscore.request.resolve_resource', 'validation'),
+    ('bosscore.request.ResourceCache.__init__', 'validation'),
+    ('bosscore.request.ResourceCache.get', 'validation'),
+    ('bosscore.request.ResourceCache.put', 'validation'),
+    ('bosscore.views.views_resource.get_resource_chain', 'validation'),
+    ('bosscore.permissions.BossPermissionManager.check_data_permissions', 'permission'),
+    ('bosscore.permissions.BossPermissionManager.check_resource_permissions', 'permission'),
+    ('bosscore.permissions.BossPermissionManager.check_object_permissions', 'permission'),
+    ('bosscore.views.views_resource.get_objects_for_user', 'permission'),
+    ('django.contrib.auth.models.User.has_perm', 'permission'),
+    ('bosscore.request.BossRequest.get_lookup_key', 'lookup'),
+    ('spdb.project.BossResourceDjango.__init__', 'lookup'),
+)
+
+# Cache backend methods that make a round trip
+CACHE_METHODS = ('add', 'get', 'set', 'touch', 'delete', 'get_many', 'has_key', 'incr', 'decr', 'set_many',
+                 'delete_many', 'clear')
+
+# Views that read through the spatialdb pool
+SPATIALDB_TARGETS = ('bossspatialdb.views.get_spatialdb', 'bosstiles.views.get_spatialdb',
+                     'bossobject.views.get_spatialdb')
+
+
+class BudgetSpatialDB:
+    """
+    Stand in for the spatialdb that returns empty data without any I/O
+    """
+
+    def cutout(self, resource, corner, extent, resolution, time_range, filter_ids=None, iso=False, no_cache=False):
+        cube = Cube.create_cube(resource, list(extent), time_range)
+        cube.data = np.zeros((time_range[1] - time_range[0], extent[2], extent[1], extent[0]),
+                             dtype=resource.get_numpy_data_type())
+        return cube
+
+    def get_ids_in_region(self, resource, resolution, corner, extent):
+        return {'ids': []}
+
+    def get_bounding_box(self, resource, resolution, id, bb_type='loose'):
+        return {'x_range': [0, 512], 'y_range': [0, 512], 'z_range': [0, 16], 't_range': [0, 1]}
+
+
+class QueryBudget:
+    """
+    Context manager that counts the SQL queries and cache round trips of each stage of a request
+
+    Stages are entered by calling one of STAGE_TARGETS and nest, so a query is counted once against the innermost
+    stage it was made in. Querysets that are evaluated lazily are counted where they are evaluated. Only calls made on
+    the calling thread are counted.
+    """
+
+    def __init__(self):
+        self.queries = OrderedDict((stage, 0) for stage in STAGES)
+        self.cache_calls = OrderedDict((stage, 0) for stage in STAGES)
+        self._stages = ['data']
+        self._counted = 0
+        self._thread = None
+        self._in_cache_call = False
+        self._capture = CaptureQueriesContext(connection)
+        self._patchers = []
+
+    def __enter__(self):
+        self._thread = threading.current_thread()
+        self._capture.__enter__()
+        self._counted = len(self._capture.captured_queries)
+
+        for target, stage in STAGE_TARGETS:
+            module_name, attr = target.rsplit('.', 1)
+            patcher = patch(target, self._stage_wrapper(_resolve(module_name), attr, stage))
+            self._patchers.append(patcher)
+
+        backends = {type(caches[alias]) for alias in settings.CACHES}
+        for backend in backends:
+            for name in CACHE_METHODS:
+                if hasattr(backend, name):
+                    self._patchers.append(patch.object(backend, name, self._cache_wrapper(getattr(backend, name))))
+
+        for patcher in self._patchers:
+            patcher.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for patcher in reversed(self._patchers):
+            patcher.stop()
+        self._patchers = []
+        self._count_queries()
+        self._capture.__exit__(exc_type, exc_value, traceback)
+        return False
+
+    def _count_queries(self):
+        """Method to attribute the queries made since the last stage change to the current stage"""
+        captured = len(self._capture.captured_queries)
+        self.queries[self._stages[-1]] += captured - self._counted
+        self._counted = captured
+
+    def _stage_wrapper(self, owner, attr, stage):
+        original = inspect.getattr_static(owner, attr)
+        if isinstance(original, staticmethod):
+            original = original.__func__
+            wrap_static = True
+        else:
+            wrap_static = False
+
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            if threading.current_thread() is not self._thread:
+                return original(*args, **kwargs)
+            self._count_queries()
+            self._stages.append(stage)
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self._count_queries()
+                self._stages.pop()
+
+        return staticmethod(wrapper) if wrap_static else wrapper
+
+    def _cache_wrapper(self, original):
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            if self._in_cache_call or threading.current_thread() is not self._thread:
+                # Backends may implement one call with others (e.g. get_many with get)
+                return original(*args, **kwargs)
+            self.cache_calls[self._stages[-1]] += 1
+            self._in_cache_call = True
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self._in_cache_call = False
+
+        return wrapper
+
+    def get_total_queries(self):
+        """Method to get the number of SQL queries made in every stage
+
+        Returns:
+            (int)
+        """
+        return sum(self.queries.values())
+
+    def get_total_cache_calls(self):
+        """Method to get the number of cache round trips made in every stage
+
+        Returns:
+            (int)
+        """
+        return sum(self.cache_calls.values())
+
+    def report(self):
+        """Method to get a table of the counts of each stage
+
+        Returns:
+            (str)
+        """
+        lines = ["{:<12}{:>10}{:>10}".format("stage", "queries", "cache")]
+        for stage in STAGES:
+            lines.append("{:<12}{:>10}{:>10}".format(stage, self.queries[stage], self.cache_calls[stage]))
+        lines.append("{:<12}{:>10}{:>10}".format("total", self.get_total_queries(), self.get_total_cache_calls()))
+        return "\n".join(lines)
+
+
+def _resolve(name):
+    """Method to import a module, or get a class from a module, from its dotted name"""
+    try:
+        return __import__(name, fromlist=['_'])
+    except ImportError:
+        module_name, attr = name.rsplit('.', 1)
+        return getattr(__import__(module_name, fromlist=['_']), attr)
+
+
+class QueryBudgetTestMixin(object):
+    """
+    Mixin for view tests that asserts the query and cache round trip budget of a request
+
+    Call setUpQueryBudget() from setUp() to replace the spatialdb and metadata store for the test.
+    """
+
+    def setUpQueryBudget(self):
+        self.spatialdb = BudgetSpatialDB()
+        self.metadb = MagicMock()
+        self.metadb.get_meta_list.return_value = [{'key': 'key1'}]
+        self.metadb.get_meta.return_value = {'key': 'key1', 'metavalue': 'value1'}
+
+        patchers = [patch(target, return_value=self.spatialdb) for target in SPATIALDB_TARGETS]
+        patchers.append(patch('bossmeta.views.metadb.MetaDB', return_value=self.metadb))
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def assertWithinBudget(self, request, max_queries, max_cache_calls, status_code=200):
+        """Method to make a request and assert its budget
+
+        Args:
+            request (callable): Makes the request and returns the response
+            max_queries (int): Maximum number of SQL queries
+            max_cache_calls (int): Maximum number of cache round trips
+            status_code (int): Expected status code of the response
+
+        Returns:
+            (QueryBudget): Counts of each stage of the request
+        """
+        with QueryBudget() as budget:
+            response = request()
+            if hasattr(response, 'render'):
+                response.render()
+
+        self.assertEqual(response.status_code, status_code, budget.report())
+        self.assertLessEqual(budget.get_total_queries(), max_queries,
+                             "Query budget exceeded\n{}".format(budget.report()))
+        self.assertLessEqual(budget.get_total_cache_calls(), max_cache_calls,
+                             "Cache round trip budget exceeded\n{}".format(budget.report()))
+        return budget
@@ -0,0 +1,103 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest.mock import patch
+
+from django.contrib.auth.models import Group, User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from guardian.shortcuts import get_perms
+
+from ..models import Channel
+from ..permission_cache import get_object_version_key, get_user_version_key
+from ..permissions import BossPermissionManager
+from .setup_db import SetupTestDB
+
+
+@override_settings(PERMISSION_CACHE_ENABLED=True, PERMISSION_CACHE_ALIAS='default', PERMISSION_CACHE_TIMEOUT=60)
+class PermissionCacheTests(TestCase):
+    """
+    Class to test checking permissions against cached decisions
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+        dbsetup = SetupTestDB()
+        dbsetup.create_user('testuser')
+        dbsetup.insert_test_data()
+
+        self.reader = User.objects.create_user(username='reader', email='reader@test.com', password='reader')
+        self.group = Group.objects.create(name='readers')
+        self.group.user_set.add(self.reader)
+        self.channel = Channel.objects.get(name='channel1', experiment__name='exp1')
+
+    def test_cached(self):
+        """Test that repeated checks read the permissions once"""
+        with patch('bosscore.permission_cache.get_perms', side_effect=get_perms) as mock_get_perms:
+            for _ in range(3):
+                self.assertFalse(BossPermissionManager.check_data_permissions(self.reader, self.channel, 'GET'))
+            self.assertEqual(mock_get_perms.call_count, 1)
+
+    def test_version_evicted(self):
+        """Test that a decision is read again once the versions it was cached under are evicted"""
+        with patch('bosscore.permission_cache.get_perms', side_effect=get_perms) as mock_get_perms:
+            self.assertFalse(BossPermissionManager.check_data_permissions(self.reader, self.channel, 'GET'))
+            content_type_id = ContentType.objects.get_for_model(self.channel).pk
+            caches['default'].delete_many([get_object_version_key(content_type_id, self.channel.pk),
+                                           get_user_version_key(self.reader.pk)])
+            self.assertFalse(BossPermissionManager.check_data_permissions(self.reader, self.channel, 'GET'))
+            self.assertEqual(mock_get_perms.call_count, 2)
+
+    def test_group_permissions_change(self):
+        """Test that adding and removing group permissions on the resource invalidates the decision"""
+        self.assertFalse(BossPermissionManager.check_data_permissions(self.reader, self.channel, 'GET'))
+
+        BossPermissionManager.add_permissions_group('readers', self.channel, ['read', 'read_volumetric_data'])
+        self.assertTrue(BossPermissionManager.check_data_permissions(self.reader, self.channel, 'GET'))
+        self.assertTrue(BossPermissionManager.check_resource_permissions(self.reader, self.channel, 'GET'))
+
+        BossPermissionManager.delete_permissions_group('readers', self.channel, ['read_volumetric_data'])
+        self.assertFalse(BossPermissionManager.check_data_permissions(self.reader, self.channel, 'GET'))
+        self.assertTrue(BossPermissionManager.check_resource_permissions(self.reader, self.channel, 'GET'))
+
+        BossPermissionManager.delete_all_permissions_group('readers', self.channel)
+        self.assertFalse(BossPermissionManager.check_resource_permissions(self.reader, self.channel, 'GET'))
+
+    def test_membership_change(self):
+        """Test that removing a user from a group invalidates the decision"""
+        BossPermissionManager.add_permissions_group('readers', self.channel, ['read_volumetric_data'])
+        self.assertTrue(BossPermissionManager.check_data_permissions(self.reader, self.channel, 'GET'))
+
+        self.group.user_set.remove(self.reader)
+        self.assertFalse(BossPermissionManager.check_data_permissions(self.reader, self.channel, 'GET'))
+
+        self.reader.groups.add(self.group)
+        self.assertTrue(BossPermissionManager.check_data_permissions(self.reader, self.channel, 'GET'))
+
+        self.group.delete()
+        self.assertFalse(BossPermissionManager.check_data_permissions(self.reader, self.channel, 'GET'))
+
+    def test_user_change(self):
+        """Test that changing is_superuser or is_active on a user invalidates the decision"""
+        self.assertFalse(BossPermissionManager.check_data_permissions(self.reader, self.channel, 'GET'))
+
+        self.reader.is_superuser = True
+        self.reader.save()
+        self.assertTrue(BossPermissionManager.check_data_permissions(self.reader, self.channel, 'GET'))
+
+        self.reader.is_active = False
+        self.reader.save()
+        self.assertFalse(BossPermissionManager.check_data_permissions(self.reader, self.channel, 'GET'))
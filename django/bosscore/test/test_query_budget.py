@@ -0,0 +1,135 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import override_settings
+
+from rest_framework.test import APITestCase, APIRequestFactory
+from rest_framework.test import force_authenticate
+
+from unittest.mock import patch
+from mockredis import mock_strict_redis_client
+
+from bossspatialdb.views import Cutout
+from bosstiles.views import Tile, CutoutTile
+from bossobject.views import Ids, BoundingBox
+from bossmeta.views import BossMeta
+from bosscore.views.views_resource import CollectionList, ExperimentList, ChannelList
+
+from .query_budget import QueryBudgetTestMixin
+from .setup_db import SetupTestDB
+
+version = settings.BOSS_VERSION
+
+# Maximum SQL queries and cache round trips of a single uncached request
+DATA_MAX_QUERIES = 10
+DATA_MAX_CACHE_CALLS = 4
+META_MAX_QUERIES = 8
+META_MAX_CACHE_CALLS = 1
+LIST_MAX_QUERIES = 10
+LIST_MAX_CACHE_CALLS = 1
+
+
+@patch('redis.StrictRedis', mock_strict_redis_client)
+class QueryBudgetTests(QueryBudgetTestMixin, APITestCase):
+    """
+    Class to test the query and cache round trip budget of the hot endpoints
+    """
+
+    def setUp(self):
+        """
+        Initialize the database
+        :return:
+        """
+        caches['default'].clear()
+        dbsetup = SetupTestDB()
+        self.user = dbsetup.create_user('testuser')
+        dbsetup.insert_spatialdb_test_data()
+        self.factory = APIRequestFactory()
+        self.setUpQueryBudget()
+
+    def get(self, view, url, accept=None, **kwargs):
+        """Method to get a callable that makes a GET request to a view"""
+        def request():
+            if accept:
+                req = self.factory.get('/' + version + url, HTTP_ACCEPT=accept)
+            else:
+                req = self.factory.get('/' + version + url)
+            force_authenticate(req, user=self.user)
+            return view.as_view()(req, **kwargs)
+        return request
+
+    def cutout(self):
+        return self.get(Cutout, '/cutout/col1/exp1/channel1/0/0:128/0:128/0:16/', 'application/blosc',
+                        collection='col1', experiment='exp1', channel='channel1', resolution='0', x_range='0:128',
+                        y_range='0:128', z_range='0:16', t_range=None)
+
+    def test_cutout(self):
+        """Test the budget of a cutout"""
+        self.assertWithinBudget(self.cutout(), DATA_MAX_QUERIES, DATA_MAX_CACHE_CALLS)
+
+    def test_tile(self):
+        """Test the budget of a tile"""
+        request = self.get(Tile, '/tile/col1/exp1/channel1/xy/512/0/0/0/5/', 'image/png',
+                           collection='col1', experiment='exp1', channel='channel1', orientation='xy',
+                           tile_size='512', resolution='0', x_idx='0', y_idx='0', z_idx='5')
+        self.assertWithinBudget(request, DATA_MAX_QUERIES, DATA_MAX_CACHE_CALLS)
+
+    def test_cutout_tile(self):
+        """Test the budget of an image"""
+        request = self.get(CutoutTile, '/image/col1/exp1/channel1/xy/0/0:128/0:128/1/', 'image/png',
+                           collection='col1', experiment='exp1', channel='channel1', orientation='xy',
+                           resolution='0', x_args='0:128', y_args='0:128', z_args='1')
+        self.assertWithinBudget(request, DATA_MAX_QUERIES, DATA_MAX_CACHE_CALLS)
+
+    def test_ids(self):
+        """Test the budget of an ids request"""
+        request = self.get(Ids, '/ids/col1/exp1/layer1/0/0:128/0:128/0:16/',
+                           collection='col1', experiment='exp1', channel='layer1', resolution='0',
+                           x_range='0:128', y_range='0:128', z_range='0:16', t_range=None)
+        self.assertWithinBudget(request, DATA_MAX_QUERIES, DATA_MAX_CACHE_CALLS)
+
+    def test_bounding_box(self):
+        """Test the budget of a bounding box request"""
+        request = self.get(BoundingBox, '/boundingbox/col1/exp1/bbchan1/0/1',
+                           collection='col1', experiment='exp1', channel='bbchan1', resolution='0', id='1')
+        self.assertWithinBudget(request, DATA_MAX_QUERIES, DATA_MAX_CACHE_CALLS)
+
+    def test_meta(self):
+        """Test the budget of a metadata request"""
+        request = self.get(BossMeta, '/meta/col1/exp1/channel1/?key=key1',
+                           collection='col1', experiment='exp1', channel='channel1')
+        self.assertWithinBudget(request, META_MAX_QUERIES, META_MAX_CACHE_CALLS)
+
+    def test_resource_lists(self):
+        """Test the budget of the collection, experiment and channel lists"""
+        self.assertWithinBudget(self.get(CollectionList, '/collection/'), LIST_MAX_QUERIES, LIST_MAX_CACHE_CALLS)
+        self.assertWithinBudget(self.get(ExperimentList, '/collection/col1/experiment/', collection='col1'),
+                                LIST_MAX_QUERIES, LIST_MAX_CACHE_CALLS)
+        self.assertWithinBudget(self.get(ChannelList, '/collection/col1/experiment/exp1/channel/',
+                                         collection='col1', experiment='exp1'),
+                                LIST_MAX_QUERIES, LIST_MAX_CACHE_CALLS)
+
+    @override_settings(RESOURCE_CACHE_ENABLED=True, RESOURCE_CACHE_ALIAS='default',
+                       PERMISSION_CACHE_ENABLED=True, PERMISSION_CACHE_ALIAS='default')
+    def test_cutout_warm(self):
+        """Test that a repeated cutout validates the request and checks permissions without any queries"""
+        self.assertWithinBudget(self.cutout(), DATA_MAX_QUERIES, 2 * DATA_MAX_CACHE_CALLS)
+        budget = self.assertWithinBudget(self.cutout(), DATA_MAX_QUERIES, 2 * DATA_MAX_CACHE_CALLS)
+
+        self.assertEqual(budget.queries['validation'], 0, budget.report())
+        self.assertEqual(budget.queries['permission'], 0, budget.report())
+        self.assertEqual(budget.cache_calls['validation'], 1, budget.report())
+        self.assertEqual(budget.cache_calls['permission'], 1, budget.report())
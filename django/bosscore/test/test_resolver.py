@@ -0,0 +1,70 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from datetime import datetime
+
+from django.test import TestCase
+
+from ..error import BossError, ErrorCodes
+from ..models import Collection, Experiment, Channel
+from ..resolver import get_resource_chain, resolve_resource
+from .setup_db import SetupTestDB
+
+
+class ResolverTests(TestCase):
+    """
+    Class to test resolving the collection, experiment and channel of a request
+    """
+
+    def setUp(self):
+        dbsetup = SetupTestDB()
+        dbsetup.create_user('testuser')
+        dbsetup.insert_test_data()
+
+    def test_single_query(self):
+        """Test that the chain, coordinate frame and lookup key are read with one query"""
+        channel = Channel.objects.get(name='channel1', experiment__name='exp1')
+        with self.assertNumQueries(1):
+            resolved = resolve_resource('col1', 'exp1', 'channel1')
+            self.assertEqual(resolved.collection.name, 'col1')
+            self.assertEqual(resolved.experiment.name, 'exp1')
+            self.assertEqual(resolved.channel, channel)
+            self.assertEqual(resolved.coord_frame.name, 'cf1')
+
+        lookup_key = "{}&{}&{}".format(resolved.collection.pk, resolved.experiment.pk, channel.pk)
+        self.assertEqual(resolved.lookup_key, lookup_key)
+        self.assertEqual(resolve_resource('col1', 'exp1').lookup_key,
+                         "{}&{}".format(resolved.collection.pk, resolved.experiment.pk))
+        self.assertIsNone(resolve_resource('col1').experiment)
+
+    def test_not_found(self):
+        """Test that the first missing level is reported"""
+        for names, model in ((('col9', 'exp1', 'channel1'), Collection), (('col1', 'exp9', 'channel1'), Experiment),
+                             (('col1', 'exp1', 'channel9'), Channel)):
+            with self.assertRaises(model.DoesNotExist):
+                get_resource_chain(*names)
+            with self.assertRaises(BossError) as err:
+                resolve_resource(*names)
+            self.assertEqual(err.exception.error_code, ErrorCodes.RESOURCE_NOT_FOUND)
+
+    def test_marked_for_deletion(self):
+        """Test that a resource marked for deletion is rejected before missing resources below it"""
+        experiment = Experiment.objects.get(name='exp1', collection__name='col1')
+        experiment.to_be_deleted = datetime.now()
+        experiment.save()
+
+        for names in (('col1', 'exp1', 'channel1'), ('col1', 'exp1', 'channel9')):
+            with self.assertRaises(BossError) as err:
+                resolve_resource(*names)
+            self.assertEqual(err.exception.error_code, ErrorCodes.RESOURCE_MARKED_FOR_DELETION)
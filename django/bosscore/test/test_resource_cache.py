@@ -0,0 +1,107 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from datetime import datetime
+from unittest.mock import patch
+
+from rest_framework.test import APITestCase
+from rest_framework.test import force_authenticate
+from rest_framework.test import APIRequestFactory
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import override_settings
+
+from ..request import BossRequest
+from ..models import Channel
+from ..resource_cache import ResourceCache
+from bosscore.error import BossError, ErrorCodes
+from .setup_db import SetupTestDB
+from bossspatialdb.views import Cutout
+
+version = settings.BOSS_VERSION
+
+
+@override_settings(RESOURCE_CACHE_ENABLED=True, RESOURCE_CACHE_ALIAS='default', RESOURCE_CACHE_TIMEOUT=60,
+                   RESOURCE_CACHE_MAX_ENTRIES=16)
+class ResourceCacheTests(APITestCase):
+    """
+    Class to test resolving the resources of a request from the resource cache
+    """
+
+    def setUp(self):
+        """
+            Initialize the database
+            :return:
+        """
+        self.rf = APIRequestFactory()
+        user = User.objects.create_superuser(username='testuser', email='test@test.com', password='testuser')
+        dbsetup = SetupTestDB()
+        dbsetup.set_user(user)
+        self.user = user
+        dbsetup.insert_test_data()
+
+    def get_request(self, channel='channel1'):
+        url = '/' + version + '/cutout/col1/exp1/{}/2/0:5/0:6/0:2/'.format(channel)
+        request = self.rf.get(url)
+        force_authenticate(request, user=self.user)
+        drfrequest = Cutout().initialize_request(request)
+        drfrequest.version = version
+
+        request_args = {
+            "service": "cutout",
+            "version": version,
+            "collection_name": 'col1',
+            "experiment_name": 'exp1',
+            "channel_name": channel,
+            "resolution": 2,
+            "x_args": "0:5",
+            "y_args": "0:6",
+            "z_args": "0:2",
+            "time_args": None
+        }
+        return BossRequest(drfrequest, request_args)
+
+    def test_cached(self):
+        """Test that a second request for the same resources is not resolved from the database"""
+        first = self.get_request()
+        with patch('bosscore.request.resolve_resource') as mock_resolve:
+            second = self.get_request()
+            mock_resolve.assert_not_called()
+
+        self.assertEqual(second.get_boss_key(), 'col1&exp1&channel1')
+        self.assertEqual(second.channel.pk, first.channel.pk)
+        self.assertEqual(second.coord_frame.pk, first.coord_frame.pk)
+        self.assertEqual(second.get_lookup_key(), first.get_lookup_key())
+        self.assertIsNotNone(ResourceCache('col1', 'exp1', 'channel1').get())
+
+    def test_marked_for_deletion(self):
+        """Test that marking a resource for deletion invalidates the resolved resources"""
+        self.get_request()
+        channel = Channel.objects.get(name='channel1', experiment__name='exp1')
+        channel.to_be_deleted = datetime.now()
+        channel.save()
+
+        with self.assertRaises(BossError) as err:
+            self.get_request()
+        self.assertEqual(err.exception.error_code, ErrorCodes.RESOURCE_MARKED_FOR_DELETION)
+
+    def test_deleted(self):
+        """Test that deleting a resource invalidates the resolved resources"""
+        self.get_request('layer1')
+        Channel.objects.get(name='layer1', experiment__name='exp1').delete()
+
+        with self.assertRaises(BossError) as err:
+            self.get_request('layer1')
+        self.assertEqual(err.exception.error_code, ErrorCodes.RESOURCE_NOT_FOUND)
@@ -27,6 +27,7 @@ from bosscore.permissions import BossPermissionManager, check_is_member_or_maint
 from bosscore.error import BossHTTPError, BossError, ErrorCodes, BossResourceNotFoundError,\
     BossGroupNotFoundError, BossPermissionError
 from bosscore.privileges import check_role
+from bosscore.resolver import get_resource_chain
 
 
 class ResourceUserPermission(APIView):
@@ -51,14 +52,11 @@ class ResourceUserPermission(APIView):
         try:
             if collection and experiment and channel:
                 # Channel specified
-                collection_obj = Collection.objects.get(name=collection)
-                experiment_obj = Experiment.objects.get(name=experiment, collection=collection_obj)
-                obj = Channel.objects.get(name=channel, experiment=experiment_obj)
+                obj = get_resource_chain(collection, experiment, channel).channel
                 resource_type = 'channel'
             elif collection and experiment:
                 # Experiment
-                collection_obj = Collection.objects.get(name=collection)
-                obj = Experiment.objects.get(name=experiment, collection=collection_obj)
+                obj = get_resource_chain(collection, experiment).experiment
                 resource_type = 'experiment'
             elif collection:
                 obj = Collection.objects.get(name=collection)
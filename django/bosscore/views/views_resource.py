@@ -27,6 +27,7 @@ from bosscore.error import BossError, BossHTTPError, BossPermissionError, BossRe
 from bosscore.lookup import LookUpKey
 from bosscore.permissions import BossPermissionManager
 from bosscore.privileges import check_role
+from bosscore.resolver import get_resource_chain
 
 from bosscore.serializers import CollectionSerializer, ExperimentSerializer, ChannelSerializer, \
     CoordinateFrameSerializer, CoordinateFrameUpdateSerializer, ExperimentReadSerializer, ChannelReadSerializer, \
@@ -314,8 +315,9 @@ class ExperimentDetail(APIView):
             Experiment
         """
         try:
-            collection_obj = Collection.objects.get(name=collection)
-            experiment_obj = Experiment.objects.get(name=experiment, collection=collection_obj)
+            resolved = get_resource_chain(collection, experiment)
+            collection_obj = resolved.collection
+            experiment_obj = resolved.experiment
             # Check for permissions
             if request.user.has_perm("read", experiment_obj):
                 if experiment_obj.to_be_deleted is not None:
@@ -405,8 +407,9 @@ class ExperimentDetail(APIView):
         """
         try:
             # Check if the object exists
-            collection_obj = Collection.objects.get(name=collection)
-            experiment_obj = Experiment.objects.get(name=experiment, collection=collection_obj)
+            resolved = get_resource_chain(collection, experiment)
+            collection_obj = resolved.collection
+            experiment_obj = resolved.experiment
             if request.user.has_perm("update", experiment_obj):
                 serializer = ExperimentUpdateSerializer(experiment_obj, data=request.data, partial=True)
                 if serializer.is_valid():
@@ -448,8 +451,9 @@ class ExperimentDetail(APIView):
             Http status
         """
         try:
-            collection_obj = Collection.objects.get(name=collection)
-            experiment_obj = Experiment.objects.get(name=experiment, collection=collection_obj)
+            resolved = get_resource_chain(collection, experiment)
+            collection_obj = resolved.collection
+            experiment_obj = resolved.experiment
             if request.user.has_perm("delete", experiment_obj):
                 # Are there channels that reference it
                 serializer = ExperimentReadSerializer(experiment_obj)
@@ -596,9 +600,10 @@ class ChannelDetail(APIView):
             Channel
         """
         try:
-            collection_obj = Collection.objects.get(name=collection)
-            experiment_obj = Experiment.objects.get(name=experiment, collection=collection_obj)
-            channel_obj = Channel.objects.get(name=channel, experiment=experiment_obj)
+            resolved = get_resource_chain(collection, experiment, channel)
+            collection_obj = resolved.collection
+            experiment_obj = resolved.experiment
+            channel_obj = resolved.channel
 
             # Check for permissions
             if request.user.has_perm("read", channel_obj):
@@ -639,8 +644,9 @@ class ChannelDetail(APIView):
 
         try:
             # Get the collection and experiment
-            collection_obj = Collection.objects.get(name=collection)
-            experiment_obj = Experiment.objects.get(name=experiment, collection=collection_obj)
+            resolved = get_resource_chain(collection, experiment)
+            collection_obj = resolved.collection
+            experiment_obj = resolved.experiment
 
             # Check for add permissions
             if request.user.has_perm("add", experiment_obj):
@@ -716,9 +722,10 @@ class ChannelDetail(APIView):
             channel_name = channel
         try:
             # Check if the object exists
-            collection_obj = Collection.objects.get(name=collection)
-            experiment_obj = Experiment.objects.get(name=experiment, collection=collection_obj)
-            channel_obj = Channel.objects.get(name=channel, experiment=experiment_obj)
+            resolved = get_resource_chain(collection, experiment, channel)
+            collection_obj = resolved.collection
+            experiment_obj = resolved.experiment
+            channel_obj = resolved.channel
 
             if request.user.has_perm("update", channel_obj):
 
@@ -780,9 +787,10 @@ class ChannelDetail(APIView):
             Http status
         """
         try:
-            collection_obj = Collection.objects.get(name=collection)
-            experiment_obj = Experiment.objects.get(name=experiment, collection=collection_obj)
-            channel_obj = Channel.objects.get(name=channel, experiment=experiment_obj)
+            resolved = get_resource_chain(collection, experiment, channel)
+            collection_obj = resolved.collection
+            experiment_obj = resolved.experiment
+            channel_obj = resolved.channel
 
             if request.user.has_perm("delete", channel_obj):
 
@@ -882,8 +890,9 @@ class ChannelList(generics.ListAPIView):
         Returns: Channel that user has view permissions on
 
         """
-        collection_obj = Collection.objects.get(name=collection)
-        experiment_obj = Experiment.objects.get(name=experiment, collection=collection_obj)
+        resolved = get_resource_chain(collection, experiment)
+        collection_obj = resolved.collection
+        experiment_obj = resolved.experiment
         channels = get_objects_for_user(request.user, 'read', klass=Channel).filter(experiment=experiment_obj)
         channels= channels.exclude(to_be_deleted__isnull=False)
         data = {"channels": [channel.name for channel in channels]}
@@ -28,6 +28,8 @@ from bossingest.models import IngestJob
 from bosscore.error import BossError, ErrorCodes, BossResourceNotFoundError
 from bosscore.models import Collection, Experiment, Channel
 from bosscore.lookup import LookUpKey
+from bosscore.resolver import get_resource_chain
+from bossspatialdb.write_state import WriteVersions
 
 from ndingest.ndqueue.uploadqueue import UploadQueue
 from ndingest.ndqueue.ingestqueue import IngestQueue
@@ -115,11 +117,12 @@ class IngestManager:
         """
         # Verify Collection, Experiment and channel
         try:
-            self.collection = Collection.objects.get(name=self.config.config_data["database"]["collection"])
-            self.experiment = Experiment.objects.get(name=self.config.config_data["database"]["experiment"],
-                                                     collection=self.collection)
-            self.channel = Channel.objects.get(name=self.config.config_data["database"]["channel"],
-                                               experiment=self.experiment)
+            resolved = get_resource_chain(self.config.config_data["database"]["collection"],
+                                          self.config.config_data["database"]["experiment"],
+                                          self.config.config_data["database"]["channel"])
+            self.collection = resolved.collection
+            self.experiment = resolved.experiment
+            self.channel = resolved.channel
             self.resolution = self.channel.base_resolution
 
         except Collection.DoesNotExist:
@@ -321,6 +324,10 @@ class IngestManager:
             ingest_job.end_date = timezone.now()
             ingest_job.save()
 
+            # Ingested data bypasses the cutout service, so invalidate everything derived from the channel
+            bosskey = ingest_job.collection + CONNECTER + ingest_job.experiment + CONNECTER + ingest_job.channel
+            WriteVersions(LookUpKey.get_lookup_key(bosskey).lookup_key).bump_channel()
+
             # Remove ingest credentials for a job
             self.remove_ingest_credentials(ingest_job.id)
 
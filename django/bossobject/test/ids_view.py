@@ -21,6 +21,7 @@ from rest_framework import status
 
 from bossspatialdb.views import Cutout
 from bossobject.views import Ids
+from bossspatialdb.pool import reset_spatialdb_pool
 
 from bosscore.test.setup_db import SetupTestDB
 
@@ -100,6 +101,9 @@ class TestCutoutInterfaceView(IdsMixin, APITestCase):
         Initialize the database
         :return:
         """
+        # Drop SpatialDB instances bound to the mocks of earlier tests
+        reset_spatialdb_pool()
+
         # Create a user
         dbsetup = SetupTestDB()
         self.user = dbsetup.create_user('testuser')
@@ -18,11 +18,10 @@ from rest_framework.response import Response
 from bosscore.request import BossRequest
 from bosscore.error import BossError, BossHTTPError, ErrorCodes
 
-from spdb.spatialdb.spatialdb import SpatialDB
+from bossspatialdb.pool import get_spatialdb
+from bossspatialdb.admission import AdmissionMixin, get_region_bytes
 from spdb import project
 
-from django.conf import settings
-
 
 class Reserve(APIView):
     """
@@ -66,7 +65,7 @@ class Reserve(APIView):
         resource = project.BossResourceDjango(req)
         try:
             # Reserve ids
-            spdb = SpatialDB(settings.KVIO_SETTINGS, settings.STATEIO_CONFIG, settings.OBJECTIO_CONFIG)
+            spdb = get_spatialdb()
             start_id = spdb.reserve_ids(resource, int(num_ids))
             data = {'start_id': start_id[0], 'count': num_ids}
             return Response(data, status=200)
@@ -74,7 +73,7 @@ class Reserve(APIView):
             return BossHTTPError("Type error in the reserve id view. {}".format(e), ErrorCodes.TYPE_ERROR)
 
 
-class Ids(APIView):
+class Ids(AdmissionMixin, APIView):
     """
         View to get the ids of all the annotation objects in a spatial region
 
@@ -118,13 +117,22 @@ class Ids(APIView):
         # create a resource
         resource = project.BossResourceDjango(req)
 
+        # Reserve the uncompressed size of the region while it is read
+        try:
+            bit_depth = resource.get_bit_depth()
+        except ValueError:
+            return BossHTTPError("Unsupported data type: {}".format(resource.get_data_type()), ErrorCodes.TYPE_ERROR)
+        admission_error = self.admit(request, get_region_bytes(req, bit_depth))
+        if admission_error:
+            return admission_error
+
         # Get the params to pull data out of the cache
         corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
         extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
 
         try:
             # Reserve ids
-            spdb = SpatialDB(settings.KVIO_SETTINGS, settings.STATEIO_CONFIG, settings.OBJECTIO_CONFIG)
+            spdb = get_spatialdb()
             ids = spdb.get_ids_in_region(resource, int(resolution), corner, extent)
             return Response(ids, status=200)
         except (TypeError, ValueError) as e:
@@ -184,7 +192,7 @@ class BoundingBox(APIView):
 
         try:
             # Get interface to SPDB cache
-            spdb = SpatialDB(settings.KVIO_SETTINGS, settings.STATEIO_CONFIG, settings.OBJECTIO_CONFIG)
+            spdb = get_spatialdb()
             data = spdb.get_bounding_box(resource, int(resolution), int(id), bb_type=bb_type)
             if data is None:
                 return BossHTTPError("The id does not exist. {}".format(id), ErrorCodes.OBJECT_NOT_FOUND)
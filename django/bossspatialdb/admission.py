@@ -0,0 +1,314 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Admission control for the data services based on the uncompressed bytes in flight per user and across all workers
+
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import request_finished
+
+from bosscore.error import BossError, ErrorCodes
+
+from .parsers import READ_CHUNK_SIZE
+
+ADMISSION_PREFIX = "ADMISSION"
+GLOBAL_KEY = "{}&GLOBAL".format(ADMISSION_PREFIX)
+
+# Reservations of the responses being sent by each thread, released when the response is closed
+_pending = threading.local()
+
+
+def get_region_bytes(req, bit_depth):
+    """Method to get the uncompressed size of the region of a request
+
+    Unlike the cutout size limit, annotation channels are not discounted since the data is held uncompressed.
+
+    Args:
+        req (bosscore.request.BossRequest): Validated request with a region
+        bit_depth (int): Bit depth of the channel
+
+    Returns:
+        (int): Number of bytes
+    """
+    return req.get_x_span() * req.get_y_span() * req.get_z_span() * len(req.get_time()) * bit_depth // 8
+
+
+def get_user_key(user):
+    """Method to get the key of a user's in-flight byte counter
+
+    Args:
+        user (django.contrib.auth.models.User): User making the request
+
+    Returns:
+        (str)
+    """
+    return "{}&USER&{}".format(ADMISSION_PREFIX, user.username)
+
+
+def refresh_timeout(cache, key):
+    """Method to restart the timeout of an in-flight counter
+
+    Uses `touch` where the cache backend provides it (Django 2.1+) and `expire` on django-redis caches.
+
+    Args:
+        cache (django.core.cache.backends.base.BaseCache): Cache holding the counters
+        key (str): Key of the counter
+
+    Returns:
+        None
+    """
+    touch = getattr(cache, 'touch', None) or getattr(cache, 'expire', None)
+    if touch is not None:
+        touch(key, settings.ADMISSION_KEY_TIMEOUT)
+
+
+def try_reserve(cache, key, nbytes, budget):
+    """Method to add bytes to an in-flight counter if they fit in its budget
+
+    A request is always admitted when nothing else is in flight on the counter, so a single request larger than the
+    budget is throttled to one at a time instead of rejected.
+
+    Args:
+        cache (django.core.cache.backends.base.BaseCache): Cache holding the counters
+        key (str): Key of the counter
+        nbytes (int): Number of bytes to reserve
+        budget (int): Maximum number of bytes in flight
+
+    Returns:
+        bool: True if the bytes were reserved
+    """
+    # Counters expire so bytes leaked by a killed worker are eventually returned. The timeout is restarted by every
+    # reservation, so a counter only expires once it has been idle for ADMISSION_KEY_TIMEOUT seconds.
+    cache.add(key, 0, timeout=settings.ADMISSION_KEY_TIMEOUT)
+    try:
+        total = cache.incr(key, nbytes)
+    except ValueError:
+        # The counter expired between add and incr
+        cache.add(key, 0, timeout=settings.ADMISSION_KEY_TIMEOUT)
+        total = cache.incr(key, nbytes)
+    refresh_timeout(cache, key)
+
+    if total > budget and total != nbytes:
+        release_bytes(cache, key, nbytes)
+        return False
+    return True
+
+
+def release_bytes(cache, key, nbytes):
+    """Method to remove bytes from an in-flight counter
+
+    Args:
+        cache (django.core.cache.backends.base.BaseCache): Cache holding the counters
+        key (str): Key of the counter
+        nbytes (int): Number of bytes to release
+
+    Returns:
+        None
+    """
+    try:
+        total = cache.decr(key, nbytes)
+    except ValueError:
+        # The counter already expired
+        return
+
+    if total < 0:
+        # The counter expired and was recreated while these bytes were in flight
+        try:
+            cache.incr(key, -total)
+        except ValueError:
+            pass
+
+
+class AdmissionRejected(Exception):
+    """
+    Exception raised from a parser when an upload is not admitted before its body has been read
+    """
+
+    def __init__(self, response):
+        """
+
+        Args:
+            response (bosscore.error.BossHTTPError): Error to return
+        """
+        super().__init__(response)
+        self.response = response
+
+
+class Admission:
+    """
+    Class holding the bytes reserved for a single request
+
+    The reservation is released when the response is closed by the server, after the last byte has been sent, so
+    bytes stay in flight while a response is rendered or streamed.
+    """
+
+    def __init__(self, cache, user_key, nbytes):
+        """
+
+        Args:
+            cache (django.core.cache.backends.base.BaseCache): Cache holding the counters
+            user_key (str): Key of the user's counter
+            nbytes (int): Number of bytes reserved
+        """
+        self.cache = cache
+        self.user_key = user_key
+        self.nbytes = nbytes
+        self.released = False
+
+    @classmethod
+    def acquire(cls, user, nbytes):
+        """Method to reserve bytes for a request against the user and global budgets
+
+        The request is rejected immediately if a budget is full, so a worker is never held waiting for capacity.
+
+        Args:
+            user (django.contrib.auth.models.User): User making the request
+            nbytes (int): Uncompressed size of the request
+
+        Returns:
+            (Admission)
+
+        Raises:
+            BossError: If the bytes could not be reserved
+        """
+        cache = caches[settings.ADMISSION_CACHE_ALIAS]
+        user_key = get_user_key(user)
+
+        if not try_reserve(cache, user_key, nbytes, settings.ADMISSION_USER_MAX_BYTES):
+            raise BossError("Too many concurrent data requests. Retry later or reduce the number of parallel "
+                            "requests.", ErrorCodes.TOO_MANY_REQUESTS)
+        if not try_reserve(cache, GLOBAL_KEY, nbytes, settings.ADMISSION_MAX_BYTES):
+            release_bytes(cache, user_key, nbytes)
+            raise BossError("The server is busy with other data requests. Retry later.", ErrorCodes.SERVER_BUSY)
+        return cls(cache, user_key, nbytes)
+
+    def release(self):
+        """Method to return the reserved bytes to the budgets
+
+        Returns:
+            None
+        """
+        if self.released:
+            return
+        self.released = True
+        release_bytes(self.cache, self.user_key, self.nbytes)
+        release_bytes(self.cache, GLOBAL_KEY, self.nbytes)
+
+    def release_on_finish(self):
+        """Method to release the reservation when the current thread finishes sending its response
+
+        Returns:
+            None
+        """
+        if not hasattr(_pending, 'admissions'):
+            _pending.admissions = []
+        _pending.admissions.append(self)
+
+
+def release_finished(sender, **kwargs):
+    """Signal receiver that releases the reservations of the response the current thread has finished sending
+
+    Returns:
+        None
+    """
+    admissions = getattr(_pending, 'admissions', None)
+    while admissions:
+        admissions.pop().release()
+
+
+def connect_signals():
+    """Method to release reservations when a response has been sent
+
+    Called when the bossspatialdb app is ready.
+
+    Returns:
+        None
+    """
+    request_finished.connect(release_finished, dispatch_uid="release_finished_admissions")
+
+
+class AdmissionMixin:
+    """
+    Mixin for APIViews that reserve in-flight bytes for their requests
+
+    Call `admit` once the size of the request is known. Uploads are admitted with `admit_upload` by the parser, once
+    the request is validated and before the body is read. The reservation is released by the request_finished signal
+    once the response has been sent, or released immediately if the view raises.
+    """
+    admission = None
+
+    def admit(self, request, nbytes):
+        """Method to reserve bytes for the current request
+
+        Args:
+            request (rest_framework.request.Request): DRF Request object
+            nbytes (int): Uncompressed size of the request
+
+        Returns:
+            (bosscore.error.BossHTTPError|None): Error to return if the request was not admitted
+        """
+        if not settings.ADMISSION_CONTROL_ENABLED:
+            return None
+
+        try:
+            self.admission = Admission.acquire(request.user, int(nbytes))
+        except BossError as err:
+            response = err.to_http()
+            response['Retry-After'] = str(settings.ADMISSION_RETRY_AFTER)
+            return response
+        return None
+
+    def admit_upload(self, request, nbytes):
+        """Method to reserve bytes for an upload before its body has been read
+
+        If the request is not admitted the body is drained, so the connection to the web server is kept, and
+        AdmissionRejected is raised to end the request.
+
+        Args:
+            request (rest_framework.request.Request): DRF Request object
+            nbytes (int): Number of bytes the upload holds in memory at once
+
+        Returns:
+            None
+
+        Raises:
+            AdmissionRejected: If the request was not admitted
+        """
+        if not nbytes:
+            return
+        error = self.admit(request, nbytes)
+        if error:
+            try:
+                while request.stream.read(READ_CHUNK_SIZE):
+                    pass
+            except Exception:
+                pass
+            raise AdmissionRejected(error)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.admission is not None:
+            self.admission.release_on_finish()
+            self.admission = None
+        return response
+
+    def handle_exception(self, exc):
+        if self.admission is not None:
+            self.admission.release()
+            self.admission = None
+        if isinstance(exc, AdmissionRejected):
+            return exc.response
+        return super().handle_exception(exc)
@@ -17,3 +17,7 @@ from django.apps import AppConfig
 
 class BossspatialdbConfig(AppConfig):
     name = 'bossspatialdb'
+
+    def ready(self):
+        from . import admission
+        admission.connect_signals()
@@ -0,0 +1,208 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+
+from .write_state import get_cuboid_indices
+
+
+def get_region_box(req):
+    """Method to get the corner and extent of a region request
+
+    Args:
+        req (bosscore.request.BossRequest): Validated cutout request
+
+    Returns:
+        ((int, int, int), (int, int, int)): x, y, z corner and extent
+    """
+    return ((req.get_x_start(), req.get_y_start(), req.get_z_start()),
+            (req.get_x_span(), req.get_y_span(), req.get_z_span()))
+
+
+def get_bounding_box(boxes):
+    """Method to get the box containing a list of boxes
+
+    Args:
+        boxes (list(((int, int, int), (int, int, int)))): x, y, z corner and extent of each box
+
+    Returns:
+        ((int, int, int), (int, int, int)): x, y, z corner and extent
+    """
+    start = [min(corner[d] for corner, _ in boxes) for d in range(3)]
+    stop = [max(corner[d] + extent[d] for corner, extent in boxes) for d in range(3)]
+    return tuple(start), tuple(stop[d] - start[d] for d in range(3))
+
+
+class BatchCutout:
+    """
+    Class to read many regions of a single channel with as few SpatialDB reads as possible
+
+    Regions with the same resolution and time range that touch a common cuboid are grouped. A group is read with a
+    single cutout of its bounding box, so every cuboid shared by its regions is only fetched once. If the bounding box
+    would fetch more than BATCH_CUTOUT_MERGE_RATIO times the cuboids the group actually needs (e.g. a long diagonal
+    chain of regions), or would be over CUTOUT_MAX_SIZE, the regions of the group are read individually instead.
+    """
+
+    def __init__(self, cache, resource, regions, bit_depth, iso=False, no_cache=False):
+        """
+
+        Args:
+            cache (spdb.spatialdb.SpatialDB): Interface to the spatialdb
+            resource (spdb.project.BossResource): Resource for the channel being read
+            regions (list(bosscore.request.BossRequest)): Validated cutout request for each region
+            bit_depth (int): Bit depth of the channel
+            iso (bool): Flag indicating if the isotropic version of the channel should be read
+            no_cache (bool): Flag indicating if the cache should be bypassed
+        """
+        self.cache = cache
+        self.resource = resource
+        self.regions = regions
+        self.bit_depth = bit_depth
+        self.iso = iso
+        self.no_cache = no_cache
+
+    def get_groups(self):
+        """Method to group regions that share at least one cuboid
+
+        Returns:
+            (list((list(int), int))): Indices of the regions in each group and the number of distinct cuboids the
+            group needs
+        """
+        parents = list(range(len(self.regions)))
+
+        def find(i):
+            while parents[i] != i:
+                parents[i] = parents[parents[i]]
+                i = parents[i]
+            return i
+
+        owners = {}
+        for i, region in enumerate(self.regions):
+            corner, extent = get_region_box(region)
+            key = (region.get_resolution(), region.get_time().start, region.get_time().stop)
+            for index in get_cuboid_indices(corner, extent, CUBOIDSIZE[region.get_resolution()]):
+                owner = owners.setdefault(key + index, i)
+                if owner != i:
+                    parents[find(i)] = find(owner)
+
+        members = defaultdict(list)
+        for i in range(len(self.regions)):
+            members[find(i)].append(i)
+
+        num_cuboids = defaultdict(int)
+        for owner in owners.values():
+            num_cuboids[find(owner)] += 1
+
+        return [(members[root], num_cuboids[root]) for root in sorted(members)]
+
+    def is_mergeable(self, members, num_cuboids):
+        """Method to check if a group should be read with a single cutout of its bounding box
+
+        Args:
+            members (list(int)): Indices of the regions in the group
+            num_cuboids (int): Number of distinct cuboids the group needs
+
+        Returns:
+            bool
+        """
+        if len(members) < 2:
+            return False
+
+        region = self.regions[members[0]]
+        corner, extent = get_bounding_box([get_region_box(self.regions[i]) for i in members])
+        box_cuboids = len(get_cuboid_indices(corner, extent, CUBOIDSIZE[region.get_resolution()]))
+        if box_cuboids > settings.BATCH_CUTOUT_MERGE_RATIO * num_cuboids:
+            return False
+
+        box_bytes = extent[0] * extent[1] * extent[2] * len(region.get_time()) * self.bit_depth / 8
+        return box_bytes <= settings.CUTOUT_MAX_SIZE
+
+    def read(self, region, corner, extent):
+        """Method to read a box at the resolution and time range of a region
+
+        Args:
+            region (bosscore.request.BossRequest): Region providing the resolution and time range
+            corner ((int, int, int)): x, y, z corner of the box
+            extent ((int, int, int)): x, y, z extent of the box
+
+        Returns:
+            (numpy.ndarray): 4D matrix (t, z, y, x)
+        """
+        cube = self.cache.cutout(self.resource, corner, extent, region.get_resolution(),
+                                 [region.get_time().start, region.get_time().stop],
+                                 iso=self.iso, no_cache=self.no_cache)
+        return cube.data
+
+    def get_region_data(self, region, data, corner):
+        """Method to extract the matrix for a region from data that was read for a box containing it
+
+        Args:
+            region (bosscore.request.BossRequest): Region to extract
+            data (numpy.ndarray): 4D matrix (t, z, y, x) for the box
+            corner ((int, int, int)): x, y, z corner of the box
+
+        Returns:
+            (numpy.ndarray): C-ordered matrix for the region. 4D if the region included a time range, otherwise 3D.
+        """
+        (x, y, z), (x_span, y_span, z_span) = get_region_box(region)
+        x -= corner[0]
+        y -= corner[1]
+        z -= corner[2]
+        region_data = data[:, z:z + z_span, y:y + y_span, x:x + x_span]
+        if not region.time_request:
+            region_data = region_data[0]
+        return np.ascontiguousarray(region_data)
+
+    def iter_region_data(self):
+        """Method to read every region
+
+        Groups are read one at a time, so only a single group is held uncompressed by the batch.
+
+        Returns:
+            (generator((int, numpy.ndarray))): Index of each region and its matrix (see get_region_data), in the
+            order the regions are read
+        """
+        for members, num_cuboids in self.get_groups():
+            if self.is_mergeable(members, num_cuboids):
+                corner, extent = get_bounding_box([get_region_box(self.regions[i]) for i in members])
+                data = self.read(self.regions[members[0]], corner, extent)
+                for i in members:
+                    yield i, self.get_region_data(self.regions[i], data, corner)
+                del data
+            else:
+                for i in members:
+                    corner, extent = get_region_box(self.regions[i])
+                    data = self.read(self.regions[i], corner, extent)
+                    yield i, self.get_region_data(self.regions[i], data, corner)
+
+    def blosc_frames(self, options):
+        """Method to read every region and encode each as an independent blosc chunk
+
+        Each region is compressed as soon as it has been read.
+
+        Args:
+            options (bossspatialdb.compression.BloscOptions): Codec settings
+
+        Returns:
+            (list(bytes)): Blosc compressed region, in the order the regions were requested
+        """
+        frames = [None] * len(self.regions)
+        for i, data in self.iter_region_data():
+            frames[i] = options.compress(data, typesize=self.bit_depth)
+        return frames
@@ -0,0 +1,176 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Helpers to benchmark the encodings used by the cutout service
+
+import time
+
+import blosc
+import numpy as np
+
+from .compression import BloscOptions, SHUFFLE_MODES, iter_array_buffers
+
+
+def get_test_data(dtype, shape):
+    """Method to generate a matrix the same way the cutout view tests do
+
+    Args:
+        dtype (str): One of uint8, uint16 or uint64
+        shape (tuple): z, y, x shape of the matrix
+
+    Returns:
+        (numpy.ndarray)
+    """
+    if dtype == 'uint8':
+        return np.random.randint(1, 254, shape).astype(np.uint8)
+    else:
+        return np.random.randint(1, 2 ** 16 - 1, shape).astype(dtype)
+
+
+def time_call(fcn, repeat):
+    """Method to get the best wall time of a function over several runs
+
+    Args:
+        fcn (function): Function to time
+        repeat (int): Number of runs
+
+    Returns:
+        (float, object): Best time in seconds and the result of the last call
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fcn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def benchmark_blosc(dtypes, shape, codecs, clevels, shuffles, nthreads, repeat=3):
+    """Method to measure blosc compression and decompression throughput and ratio for each combination of options
+
+    Args:
+        dtypes (list(str)): Datatypes to test
+        shape (tuple): z, y, x shape of the test matrix
+        codecs (list(str)): Blosc codecs to test
+        clevels (list(int)): Compression levels to test
+        shuffles (list(str)): Shuffle modes to test
+        nthreads (list(int)): Thread counts to test
+        repeat (int): Number of runs per measurement
+
+    Returns:
+        (list(dict)): One result per combination, with compress/decompress MB/s and compression ratio
+    """
+    results = []
+    for dtype in dtypes:
+        data = get_test_data(dtype, shape)
+        typesize = data.dtype.itemsize
+        mbytes = data.nbytes / 1048576
+        for codec in codecs:
+            for clevel in clevels:
+                for shuffle in shuffles:
+                    for threads in nthreads:
+                        options = BloscOptions(codec, clevel, shuffle, threads)
+                        compress_time, compressed = time_call(lambda: options.compress(data, typesize), repeat)
+                        decompress_time, _ = time_call(lambda: blosc.decompress(compressed), repeat)
+                        results.append({'dtype': dtype,
+                                        'codec': codec,
+                                        'clevel': clevel,
+                                        'shuffle': shuffle,
+                                        'nthreads': threads,
+                                        'compress_mbps': mbytes / compress_time,
+                                        'decompress_mbps': mbytes / decompress_time,
+                                        'ratio': data.nbytes / len(compressed)})
+    return results
+
+
+def benchmark_transfer(dtypes, shape, link_gbps, repeat=3):
+    """Method to compare the end-to-end throughput of blosc and uncompressed (application/octet-stream) cutouts
+
+    The server encode and client decode are measured the same way the cutout service and a python client perform
+    them, and the transfer time is modeled from the compressed size and the link speed. Blosc uses the deployment
+    defaults.
+
+    Args:
+        dtypes (list(str)): Datatypes to test
+        shape (tuple): z, y, x shape of the test matrix
+        link_gbps (list(float)): Network speeds to model, in Gbit/s
+        repeat (int): Number of runs per measurement
+
+    Returns:
+        (list(dict)): One result per datatype, encoding and link speed, with encode/decode MB/s, compression ratio,
+            end-to-end MB/s and the CPU seconds spent per GB of cutout data
+    """
+    options = BloscOptions.from_settings()
+
+    results = []
+    for dtype in dtypes:
+        data = get_test_data(dtype, shape)
+        mbytes = data.nbytes / 1048576
+
+        # Encoding returns the buffers the view sends. Raw responses are sent as views of the cube's buffer without
+        # copying it, so only iterating the views is timed.
+        encodings = [('blosc', lambda: [options.compress(data, data.dtype.itemsize)],
+                      lambda body: np.frombuffer(blosc.decompress(body), dtype=data.dtype).reshape(data.shape)),
+                     ('octet-stream', lambda: list(iter_array_buffers(data)),
+                      lambda body: np.frombuffer(body, dtype=data.dtype).reshape(data.shape))]
+
+        for name, encode, decode in encodings:
+            encode_time, buffers = time_call(encode, repeat)
+            nbytes = sum(len(b) for b in buffers)
+
+            # The client receives the buffers as a single body
+            body = b"".join(buffers)
+            decode_time, _ = time_call(lambda: decode(body), repeat)
+            for gbps in link_gbps:
+                transfer_time = nbytes * 8 / (gbps * 1e9)
+                results.append({'dtype': dtype,
+                                'encoding': name,
+                                'link_gbps': gbps,
+                                'encode_mbps': mbytes / encode_time,
+                                'decode_mbps': mbytes / decode_time,
+                                'ratio': data.nbytes / nbytes,
+                                'e2e_mbps': mbytes / (encode_time + transfer_time + decode_time),
+                                'cpu_s_per_gb': (encode_time + decode_time) * 1024 / mbytes})
+    return results
+
+
+def format_results(results, columns):
+    """Method to format benchmark results as a fixed width table
+
+    Args:
+        results (list(dict)): Benchmark results
+        columns (list(str)): Keys to include, in order
+
+    Returns:
+        (str)
+    """
+    lines = ["  ".join(["{:>15}".format(c) for c in columns])]
+    for result in results:
+        cells = []
+        for c in columns:
+            if isinstance(result[c], float):
+                cells.append("{:>15.2f}".format(result[c]))
+            else:
+                cells.append("{:>15}".format(result[c]))
+        lines.append("  ".join(cells))
+    return "\n".join(lines)
+
+
+BLOSC_COLUMNS = ['dtype', 'codec', 'clevel', 'shuffle', 'nthreads', 'compress_mbps', 'decompress_mbps', 'ratio']
+SUPPORTED_SHUFFLES = sorted(SHUFFLE_MODES)
+TRANSFER_COLUMNS = ['dtype', 'encoding', 'link_gbps', 'encode_mbps', 'decode_mbps', 'ratio', 'e2e_mbps',
+                    'cpu_s_per_gb']
@@ -0,0 +1,417 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import threading
+import zlib
+from contextlib import contextmanager
+
+import blosc
+import numpy as np
+
+from django.conf import settings
+
+from bosscore.error import BossError, ErrorCodes
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# Media types of npy files compressed as a single stream, mapped to their codec
+NPY_MEDIA_TYPES = {'application/npygz': 'gzip',
+                   'application/npy-zstd': 'zstd',
+                   'application/npy-lz4': 'lz4'}
+
+# Number of bytes of an array fed to a stream compressor at a time
+NPY_CHUNK_SIZE = 4 * 1048576
+
+# Uncompressed cutouts. The body is the C-ordered buffer of the matrix, in little-endian byte order, and its datatype
+# and shape are sent in headers.
+RAW_MEDIA_TYPE = 'application/octet-stream'
+RAW_DTYPE_HEADER = 'X-Boss-Dtype'
+RAW_SHAPE_HEADER = 'X-Boss-Shape'
+
+# Serializes blosc calls that change the process wide thread count
+_nthreads_lock = threading.Lock()
+
+SHUFFLE_MODES = {'none': blosc.NOSHUFFLE,
+                 'byte': blosc.SHUFFLE,
+                 'bit': blosc.BITSHUFFLE}
+
+
+def get_media_type_params(media_type):
+    """Method to get the parameters of a media type (e.g. application/blosc; codec=zstd; clevel=5)
+
+    Args:
+        media_type (str): Full media type string
+
+    Returns:
+        (dict): Parameter names mapped to values. The quality factor `q` is excluded.
+    """
+    params = {}
+    if not media_type:
+        return params
+
+    for param in media_type.split(";")[1:]:
+        if "=" not in param:
+            continue
+        key, value = param.split("=", 1)
+        key = key.strip().lower()
+        if key != "q":
+            params[key] = value.strip().strip('"')
+    return params
+
+
+class BloscOptions:
+    """
+    Class holding the blosc settings used to encode a cutout
+
+    Defaults come from the BLOSC_* settings. A request can override them with media type parameters on the Accept
+    header (application/blosc; codec=zstd; clevel=5; shuffle=bit; nthreads=4) or with query parameters of the same
+    name. The number of threads is capped by BLOSC_MAX_NTHREADS.
+    """
+
+    def __init__(self, cname, clevel, shuffle, nthreads):
+        """
+
+        Args:
+            cname (str): Blosc codec (e.g. blosclz, lz4, zstd)
+            clevel (int): Compression level 0-9
+            shuffle (str): Shuffle mode, one of none, byte or bit
+            nthreads (int): Number of blosc threads
+        """
+        self.cname = cname
+        self.clevel = clevel
+        self.shuffle = shuffle
+        self.nthreads = nthreads
+
+    @classmethod
+    def from_settings(cls):
+        """Method to get the deployment wide defaults
+
+        Returns:
+            (BloscOptions)
+        """
+        return cls(settings.BLOSC_CNAME, settings.BLOSC_CLEVEL, settings.BLOSC_SHUFFLE, settings.BLOSC_NTHREADS)
+
+    @classmethod
+    def from_request(cls, request):
+        """Method to get the options requested by the client
+
+        Args:
+            request (rest_framework.request.Request): DRF Request object after content negotiation
+
+        Returns:
+            (BloscOptions)
+
+        Raises:
+            BossError: If an option is invalid
+        """
+        options = cls.from_settings()
+
+        requested = get_media_type_params(getattr(request, "accepted_media_type", None))
+        for key in ("codec", "clevel", "shuffle", "nthreads"):
+            if key in request.query_params:
+                requested[key] = request.query_params[key]
+
+        if "codec" in requested:
+            if requested["codec"] not in blosc.compressor_list():
+                raise BossError("Unsupported blosc codec {}. Supported codecs: {}"
+                                .format(requested["codec"], ", ".join(blosc.compressor_list())),
+                                ErrorCodes.INVALID_ARGUMENT)
+            options.cname = requested["codec"]
+
+        if "clevel" in requested:
+            try:
+                options.clevel = int(requested["clevel"])
+            except ValueError:
+                options.clevel = -1
+            if options.clevel < 0 or options.clevel > 9:
+                raise BossError("Invalid blosc clevel {}. Must be between 0 and 9".format(requested["clevel"]),
+                                ErrorCodes.INVALID_ARGUMENT)
+
+        if "shuffle" in requested:
+            if requested["shuffle"] not in SHUFFLE_MODES:
+                raise BossError("Invalid blosc shuffle mode {}. Supported modes: {}"
+                                .format(requested["shuffle"], ", ".join(sorted(SHUFFLE_MODES))),
+                                ErrorCodes.INVALID_ARGUMENT)
+            options.shuffle = requested["shuffle"]
+
+        if "nthreads" in requested:
+            try:
+                nthreads = int(requested["nthreads"])
+            except ValueError:
+                nthreads = 0
+            if nthreads < 1:
+                raise BossError("Invalid blosc nthreads {}".format(requested["nthreads"]),
+                                ErrorCodes.INVALID_ARGUMENT)
+            options.nthreads = min(nthreads, settings.BLOSC_MAX_NTHREADS)
+
+        return options
+
+    def get_key(self):
+        """Method to get a string identifying the encoding, for use in cache keys
+
+        Returns:
+            (str)
+        """
+        return "{}&{}&{}".format(self.cname, self.clevel, self.shuffle)
+
+    @contextmanager
+    def _nthreads(self):
+        # The blosc thread count is process wide, so calls that change it are serialized and it is restored afterwards
+        with _nthreads_lock:
+            previous = blosc.set_nthreads(self.nthreads)
+            try:
+                yield
+            finally:
+                blosc.set_nthreads(previous)
+
+    def compress(self, data, typesize):
+        """Method to blosc compress a buffer with these options
+
+        Args:
+            data (bytes-like): Data to compress
+            typesize (int): Typesize to provide to blosc
+
+        Returns:
+            (bytes)
+        """
+        with self._nthreads():
+            return blosc.compress(data, typesize=typesize, clevel=self.clevel, shuffle=SHUFFLE_MODES[self.shuffle],
+                                  cname=self.cname)
+
+    def pack_array(self, array):
+        """Method to blosc compress a numpy array, including its shape and dtype, with these options
+
+        Args:
+            array (numpy.ndarray): Matrix to compress
+
+        Returns:
+            (bytes)
+        """
+        with self._nthreads():
+            return blosc.pack_array(array, clevel=self.clevel, shuffle=SHUFFLE_MODES[self.shuffle],
+                                    cname=self.cname)
+
+
+class StreamCompressor:
+    """
+    Class providing a common interface to the incremental compressors of the npy stream codecs
+
+    Every codec produces a single standard stream (zlib, zstd frame or lz4 frame) that can be decompressed by any
+    client library for that codec, regardless of how the input was chunked.
+    """
+
+    def __init__(self, codec):
+        """
+
+        Args:
+            codec (str): One of gzip, zstd or lz4
+
+        Raises:
+            ValueError: If the codec is unknown or its library is not installed
+        """
+        if not is_codec_available(codec):
+            raise ValueError("Codec {} is not available".format(codec))
+
+        self.codec = codec
+        self.started = False
+        if codec == 'gzip':
+            self.compressor = zlib.compressobj()
+        elif codec == 'zstd':
+            self.compressor = zstandard.ZstdCompressor().compressobj()
+        else:
+            self.compressor = lz4.frame.LZ4FrameCompressor()
+
+    def compress(self, data):
+        """Method to compress the next piece of the stream
+
+        Args:
+            data (bytes-like): Uncompressed bytes
+
+        Returns:
+            (bytes): Compressed bytes that are ready, possibly empty
+        """
+        chunk = b''
+        if self.codec == 'lz4' and not self.started:
+            chunk = self.compressor.begin()
+        self.started = True
+        return chunk + self.compressor.compress(data)
+
+    def sync_flush(self):
+        """Method to flush everything compressed so far so a client can decode it before the stream ends
+
+        Returns:
+            (bytes)
+        """
+        if self.codec == 'gzip':
+            return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        elif self.codec == 'zstd':
+            return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        # lz4 frames emit each block as it fills and have no partial flush
+        return b''
+
+    def finish(self):
+        """Method to end the stream
+
+        Returns:
+            (bytes)
+        """
+        if self.codec == 'lz4':
+            chunk = b'' if self.started else self.compressor.begin()
+            return chunk + self.compressor.flush()
+        return self.compressor.flush()
+
+
+def is_codec_available(codec):
+    """Method to check if the library for an npy stream codec is installed
+
+    Args:
+        codec (str): One of gzip, zstd or lz4
+
+    Returns:
+        bool
+    """
+    return {'gzip': True, 'zstd': zstandard is not None, 'lz4': lz4 is not None}.get(codec, False)
+
+
+def get_npy_header(dtype, shape):
+    """Method to get the npy header of a C-ordered array
+
+    Args:
+        dtype (numpy.dtype): Datatype of the array
+        shape (tuple): Shape of the array
+
+    Returns:
+        (bytes)
+    """
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(header, {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                                                  'fortran_order': False,
+                                                  'shape': tuple(shape)})
+    return header.getvalue()
+
+
+def iter_array_buffers(array, chunk_size=NPY_CHUNK_SIZE):
+    """Generator that yields the bytes of an array in C order, in pieces of about chunk_size
+
+    A C-contiguous array is yielded as views of its own buffer. Otherwise groups of leading-axis slices are copied one
+    at a time, so at most about chunk_size bytes are copied at once.
+
+    Args:
+        array (numpy.ndarray): Matrix to read
+        chunk_size (int): Approximate number of bytes per piece
+
+    Yields:
+        (memoryview|numpy.ndarray): Bytes-like piece of the array
+    """
+    if array.flags['C_CONTIGUOUS']:
+        flat = array.reshape(-1).view(np.uint8)
+        for start in range(0, len(flat), chunk_size):
+            yield flat[start:start + chunk_size].data
+        return
+
+    slice_bytes = max(1, array[0].nbytes) if len(array) else 1
+    group = max(1, chunk_size // slice_bytes)
+    for start in range(0, len(array), group):
+        yield np.ascontiguousarray(array[start:start + group]).reshape(-1).view(np.uint8).data
+
+
+def iter_npy_stream(arrays, dtype, shape, codec, sync_flush=False):
+    """Generator that encodes a series of arrays as a single compressed npy file
+
+    The npy header for the full shape is written first, then each array is fed through the compressor in pieces, so
+    the only full size buffer is the compressed output.
+
+    Args:
+        arrays (iterable(numpy.ndarray)): Pieces of the full array, in C order
+        dtype (numpy.dtype): Datatype of the full array
+        shape (tuple): Shape of the full array
+        codec (str): One of gzip, zstd or lz4
+        sync_flush (bool): Flag indicating if the compressor should be flushed after each array
+
+    Yields:
+        (bytes): Chunk of the compressed stream
+    """
+    compressor = StreamCompressor(codec)
+    chunk = compressor.compress(get_npy_header(dtype, shape))
+    if chunk:
+        yield chunk
+
+    for array in arrays:
+        for buffer in iter_array_buffers(array):
+            chunk = compressor.compress(buffer)
+            if chunk:
+                yield chunk
+        if sync_flush:
+            chunk = compressor.sync_flush()
+            if chunk:
+                yield chunk
+
+    yield compressor.finish()
+
+
+def format_shape(shape):
+    """Method to format the shape of a matrix for the RAW_SHAPE_HEADER header
+
+    Args:
+        shape (tuple): Shape of the matrix
+
+    Returns:
+        (str): Comma separated dimensions (e.g. 16,512,512)
+    """
+    return ",".join(str(dim) for dim in shape)
+
+
+def parse_shape(value):
+    """Method to parse the RAW_SHAPE_HEADER header
+
+    Args:
+        value (str): Comma separated dimensions
+
+    Returns:
+        (tuple): Shape of the matrix
+
+    Raises:
+        (ValueError): If a dimension is not a non-negative integer
+    """
+    shape = tuple(int(dim) for dim in value.split(","))
+    if any(dim < 0 for dim in shape):
+        raise ValueError("Invalid shape {}".format(value))
+    return shape
+
+
+def set_raw_headers(response, dtype, shape):
+    """Method to describe an uncompressed matrix in the headers of a response
+
+    Args:
+        response (django.http.HttpResponseBase): Response containing the matrix
+        dtype (numpy.dtype): Datatype of the matrix
+        shape (tuple): Shape of the matrix
+
+    Returns:
+        (django.http.HttpResponseBase): The response
+    """
+    dtype = np.dtype(dtype)
+    response[RAW_DTYPE_HEADER] = dtype.name
+    response[RAW_SHAPE_HEADER] = format_shape(shape)
+    response['Content-Length'] = str(int(np.prod(shape)) * dtype.itemsize)
+    return response
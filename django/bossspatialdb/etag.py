@@ -0,0 +1,129 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Conditional GET support for responses derived from a region of a channel
+
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+
+from .write_state import WriteVersions
+
+
+def get_cutout_tag(req, media_type, iso=False, encoding=None, stream=False):
+    """Method to get a tag identifying the bytes of a cutout response in the current write state of its region
+
+    Args:
+        req (bosscore.request.BossRequest): Validated cutout request
+        media_type (str): Full accepted media type, including any parameters
+        iso (bool): Flag indicating if the isotropic version of the channel is being read
+        encoding (str): Optional key of any other options that change the rendered bytes
+        stream (bool): Flag indicating if the response is streamed
+
+    Returns:
+        (str): Hex digest
+    """
+    filter_ids = req.get_filter_ids()
+    if filter_ids is not None:
+        filter_ids = ",".join([str(x) for x in sorted(filter_ids)])
+
+    versions = WriteVersions(req.get_lookup_key(), req.get_resolution(), iso=iso)
+    return versions.get_region_tag((req.get_x_start(), req.get_y_start(), req.get_z_start()),
+                                   (req.get_x_span(), req.get_y_span(), req.get_z_span()),
+                                   [req.get_time().start, req.get_time().stop],
+                                   [media_type, encoding, req.time_request, filter_ids, stream])
+
+
+def get_image_tag(req, media_type, orientation, encoding=None):
+    """Method to get a tag identifying the bytes of an image or tile response in the current write state of its region
+
+    Args:
+        req (bosscore.request.BossRequest): Validated image or tile request
+        media_type (str): Full accepted media type, including any parameters
+        orientation (str): Image plane
+        encoding (str): Optional key of any other options that change the rendered bytes
+
+    Returns:
+        (str): Hex digest
+    """
+    return get_region_image_tag(req.get_lookup_key(), req.get_resolution(),
+                                (req.get_x_start(), req.get_y_start(), req.get_z_start()),
+                                (req.get_x_span(), req.get_y_span(), req.get_z_span()),
+                                [req.get_time().start, req.get_time().stop], media_type, orientation,
+                                encoding=encoding)
+
+
+def get_region_image_tag(lookup_key, resolution, corner, extent, time_range, media_type, orientation, encoding=None):
+    """Method to get the tag of an image of a region in its current write state without a request
+
+    Args:
+        lookup_key (str): Lookup key of the channel
+        resolution (int): Resolution level
+        corner ((int, int, int)): x, y, z corner of the region
+        extent ((int, int, int)): x, y, z extent of the region
+        time_range ([int, int]): Start and stop time samples
+        media_type (str): Full accepted media type, including any parameters
+        orientation (str): Image plane
+        encoding (str): Optional key of any other options that change the rendered bytes
+
+    Returns:
+        (str): Hex digest
+    """
+    versions = WriteVersions(lookup_key, resolution)
+    return versions.get_region_tag(corner, extent, time_range, [media_type, orientation, encoding])
+
+
+def is_not_modified(request, tag):
+    """Method to check if the client already has the current version of a response
+
+    Args:
+        request (rest_framework.request.Request): DRF Request object
+        tag (str): Tag of the current version of the response
+
+    Returns:
+        bool: True if the If-None-Match header matches the tag
+    """
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return "*" in etags or tag in etags
+
+
+def not_modified(tag):
+    """Method to get the response sent when the client already has the current version
+
+    Args:
+        tag (str): Tag of the current version of the response
+
+    Returns:
+        (django.http.HttpResponseNotModified)
+    """
+    return set_etag(HttpResponseNotModified(), tag)
+
+
+def set_etag(response, tag):
+    """Method to add the ETag to a response
+
+    The response is marked no-cache so clients always revalidate, since the region may be written at any time.
+
+    Args:
+        response (django.http.HttpResponseBase): Response to update
+        tag (str): Tag of the version of the response
+
+    Returns:
+        (django.http.HttpResponseBase): The same response
+    """
+    response['ETag'] = quote_etag(tag)
+    response['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,267 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Read-time downsampling for channels whose resolution hierarchy has not been built yet
+
+import blosc
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+from spdb.spatialdb import Cube
+
+from .id_filter import mask_ids
+from .stream import get_blosc_nbytes
+from .write_state import WriteVersions
+
+FALLBACK_CACHE_PREFIX = "DOWNSAMPLE-FALLBACK"
+
+# Channel states in which resolutions above the base resolution have not been written
+FALLBACK_STATUSES = ("NOT_DOWNSAMPLED", "IN_PROGRESS")
+
+
+def block_average(data, factors):
+    """Method to downsample image data by averaging each block of voxels
+
+    Args:
+        data (numpy.ndarray): 4D (t, z, y, x) matrix. Each spatial dimension must be a multiple of its factor.
+        factors ((int, int, int)): x, y, z downsample factors
+
+    Returns:
+        (numpy.ndarray): Downsampled matrix of the same dtype
+    """
+    fx, fy, fz = factors
+    t, z, y, x = data.shape
+    blocks = data.reshape(t, z // fz, fz, y // fy, fy, x // fx, fx)
+    return np.rint(blocks.mean(axis=(2, 4, 6))).astype(data.dtype)
+
+
+def block_mode(data, factors):
+    """Method to downsample annotation data to the most common non-zero id of each block of voxels
+
+    A block is only 0 if all of its voxels are 0. Ties go to the smallest id.
+
+    Args:
+        data (numpy.ndarray): 4D (t, z, y, x) matrix. Each spatial dimension must be a multiple of its factor.
+        factors ((int, int, int)): x, y, z downsample factors
+
+    Returns:
+        (numpy.ndarray): Downsampled matrix of the same dtype
+    """
+    fx, fy, fz = factors
+    t, z, y, x = data.shape
+    out = np.empty((t, z // fz, y // fy, x // fx), dtype=data.dtype)
+
+    # Reduce one output z plane at a time so the sorted copy and counts stay a fraction of the input
+    for t_index in range(t):
+        for z_index in range(out.shape[1]):
+            out[t_index, z_index] = _plane_mode(data[t_index, z_index * fz:(z_index + 1) * fz], factors)
+    return out
+
+
+def _plane_mode(data, factors):
+    """Method to get the most common non-zero id of each block in a single output z plane
+
+    Args:
+        data (numpy.ndarray): 3D (z, y, x) matrix with fz planes
+        factors ((int, int, int)): x, y, z downsample factors
+
+    Returns:
+        (numpy.ndarray): 2D (y, x) matrix
+    """
+    fx, fy, fz = factors
+    out_shape = (data.shape[1] // fy, data.shape[2] // fx)
+
+    # One row per block
+    blocks = data.reshape(fz, out_shape[0], fy, out_shape[1], fx).transpose(1, 3, 0, 2, 4)
+    blocks = np.sort(blocks.reshape(-1, fx * fy * fz), axis=1)
+
+    # Count how many times each value has been seen so far in its sorted row. The count at the last voxel of a run is
+    # the number of voxels with that id.
+    positions = np.arange(blocks.shape[1])
+    starts = np.zeros(blocks.shape, dtype=np.int64)
+    starts[:, 1:] = np.where(blocks[:, 1:] != blocks[:, :-1], positions[1:], 0)
+    np.maximum.accumulate(starts, axis=1, out=starts)
+    counts = positions - starts + 1
+    counts[blocks == 0] = 0
+
+    best = np.argmax(counts, axis=1)
+    return blocks[np.arange(blocks.shape[0]), best].reshape(out_shape)
+
+
+class DownsampleFallback:
+    """
+    Class to serve a region above the base resolution of a channel that has not been downsampled yet
+
+    The matching base resolution region is read and reduced with the factors between the channel's downsampled voxel
+    sizes (which follow the experiment's hierarchy_method). Image channels are block averaged and annotation channels
+    take the most common id of each block. The base region is read in z slabs no larger than CUTOUT_MAX_SIZE.
+
+    Results are cached, keyed by the write versions of the base region, so writes to the base resolution are seen
+    immediately.
+    """
+
+    def __init__(self, resource, resolution, factors):
+        """
+
+        Args:
+            resource (spdb.project.BossResource): Resource for the channel being read
+            resolution (int): Requested resolution level
+            factors ((int, int, int)): x, y, z downsample factors from the base resolution
+        """
+        self.resource = resource
+        self.resolution = resolution
+        self.factors = factors
+        self.base_resolution = resource.get_channel().base_resolution
+        self.cache = caches[settings.CUTOUT_DOWNSAMPLE_FALLBACK_CACHE_ALIAS]
+
+    @classmethod
+    def from_request(cls, resource, req, bit_depth, iso=False):
+        """Method to get the fallback for a request, if one is needed
+
+        Args:
+            resource (spdb.project.BossResource): Resource for the channel being read
+            req (bosscore.request.BossRequest): Validated request with a region
+            bit_depth (int): Bit depth of the channel
+            iso (bool): Flag indicating if the isotropic version of the channel is being read
+
+        Returns:
+            (DownsampleFallback|None): None if the region can be read normally, or is too large to downsample on the fly
+        """
+        if not settings.CUTOUT_DOWNSAMPLE_FALLBACK_ENABLED:
+            return None
+
+        channel = resource.get_channel()
+        resolution = req.get_resolution()
+        if channel.downsample_status.upper() not in FALLBACK_STATUSES or resolution <= channel.base_resolution:
+            return None
+
+        voxel_dims = resource.get_downsampled_voxel_dims(iso=iso)
+        factors = tuple(int(round(voxel_dims[resolution][d] / voxel_dims[channel.base_resolution][d]))
+                        for d in range(3))
+
+        base_bytes = (req.get_x_span() * req.get_y_span() * req.get_z_span() * len(req.get_time()) * bit_depth // 8 *
+                      factors[0] * factors[1] * factors[2])
+        if base_bytes > settings.CUTOUT_DOWNSAMPLE_FALLBACK_MAX_SIZE:
+            return None
+
+        return cls(resource, resolution, factors)
+
+    def get_base_region(self, corner, extent):
+        """Method to get the base resolution region covering a region
+
+        Args:
+            corner ((int, int, int)): x, y, z corner at the requested resolution
+            extent ((int, int, int)): x, y, z extent at the requested resolution
+
+        Returns:
+            ((int, int, int), (int, int, int)): x, y, z corner and extent at the base resolution
+        """
+        return (tuple(corner[d] * self.factors[d] for d in range(3)),
+                tuple(extent[d] * self.factors[d] for d in range(3)))
+
+    def get_tag(self, corner, extent, time_range):
+        """Method to get a tag identifying the downsampled region in the current write state of the base region
+
+        Args:
+            corner ((int, int, int)): x, y, z corner at the requested resolution
+            extent ((int, int, int)): x, y, z extent at the requested resolution
+            time_range ([int, int]): Start and stop time samples
+
+        Returns:
+            (str): Hex digest
+        """
+        base_corner, base_extent = self.get_base_region(corner, extent)
+        versions = WriteVersions(self.resource.get_lookup_key(), self.base_resolution)
+        return versions.get_region_tag(base_corner, base_extent, time_range, ["downsample", self.resolution])
+
+    def reduce(self, data):
+        """Method to downsample a base resolution matrix
+
+        Args:
+            data (numpy.ndarray): 4D (t, z, y, x) matrix
+
+        Returns:
+            (numpy.ndarray)
+        """
+        if self.resource.get_channel().is_image():
+            return block_average(data, self.factors)
+        return block_mode(data, self.factors)
+
+    def read(self, spatialdb, corner, extent, time_range, out, no_cache=False):
+        """Method to read and downsample a region
+
+        Args:
+            spatialdb (spdb.spatialdb.SpatialDB): Interface to the spatialdb
+            corner ((int, int, int)): x, y, z corner at the requested resolution
+            extent ((int, int, int)): x, y, z extent at the requested resolution
+            time_range ([int, int]): Start and stop time samples
+            out (numpy.ndarray): 4D (t, z, y, x) matrix to write the downsampled region into
+            no_cache (bool): Flag indicating if the cache should be bypassed
+
+        Returns:
+            None
+        """
+        base_corner, base_extent = self.get_base_region(corner, extent)
+
+        # Output z planes per slab so each base resolution read is under CUTOUT_MAX_SIZE
+        plane_bytes = base_extent[0] * base_extent[1] * self.factors[2] * out.shape[0] * out.dtype.itemsize
+        slab_size = max(1, settings.CUTOUT_MAX_SIZE // plane_bytes)
+
+        for z_start in range(0, extent[2], slab_size):
+            z_stop = min(z_start + slab_size, extent[2])
+            slab_corner = (base_corner[0], base_corner[1], base_corner[2] + z_start * self.factors[2])
+            slab_extent = (base_extent[0], base_extent[1], (z_stop - z_start) * self.factors[2])
+            cube = spatialdb.cutout(self.resource, slab_corner, slab_extent, self.base_resolution, time_range,
+                                    no_cache=no_cache)
+            out[:, z_start:z_stop] = self.reduce(cube.data)
+            del cube
+
+    def cutout(self, spatialdb, corner, extent, time_range, filter_ids=None, no_cache=False):
+        """Method to get a downsampled region as a Cube, using the cache when possible
+
+        The region is written directly into the Cube's matrix, from the cache or from the base resolution.
+
+        Args:
+            spatialdb (spdb.spatialdb.SpatialDB): Interface to the spatialdb
+            corner ((int, int, int)): x, y, z corner at the requested resolution
+            extent ((int, int, int)): x, y, z extent at the requested resolution
+            time_range ([int, int]): Start and stop time samples
+            filter_ids (list(int)): Optional annotation ids to keep. All other voxels are set to 0.
+            no_cache (bool): Flag indicating if the cache should be bypassed
+
+        Returns:
+            (spdb.spatialdb.Cube)
+        """
+        key = "{}&{}".format(FALLBACK_CACHE_PREFIX, self.get_tag(corner, extent, time_range))
+        cube = Cube.create_cube(self.resource, list(extent), time_range)
+        data = cube.data
+
+        cached = False
+        if not no_cache:
+            compressed = self.cache.get(key)
+            if compressed is not None and get_blosc_nbytes(compressed) == data.nbytes:
+                blosc.decompress_ptr(compressed, data.__array_interface__['data'][0])
+                cached = True
+
+        if not cached:
+            self.read(spatialdb, corner, extent, time_range, data, no_cache=no_cache)
+            if not no_cache:
+                compressed = blosc.compress(data, typesize=data.dtype.itemsize)
+                if len(compressed) <= settings.CUTOUT_DOWNSAMPLE_FALLBACK_MAX_ENTRY_SIZE:
+                    self.cache.set(key, compressed, timeout=settings.CUTOUT_DOWNSAMPLE_FALLBACK_CACHE_TIMEOUT)
+
+        if filter_ids is not None:
+            mask_ids(data, np.asarray(filter_ids, dtype=data.dtype))
+        return cube
@@ -0,0 +1,207 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Filtered annotation cutouts that only read the cuboids containing the requested ids
+
+import numpy as np
+from django.conf import settings
+
+from spdb.c_lib import ndlib
+from spdb.spatialdb import Cube
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+
+from bossutils.logger import BossLogger
+
+from .pool import get_object_indices
+from .write_state import WriteVersions, get_cuboid_indices
+
+# Resolutions below this level are written to the id index. Passed to the downsample step function as
+# annotation_index_max, so cuboids of higher resolutions never appear in the index.
+ANNOTATION_INDEX_MAX = 1
+
+
+def mask_ids(data, filter_ids):
+    """Method to zero every voxel that does not contain one of a list of ids
+
+    Args:
+        data (numpy.ndarray): Annotation matrix. Modified in place.
+        filter_ids (numpy.ndarray): Ids to keep
+
+    Returns:
+        (numpy.ndarray): The masked matrix
+    """
+    data[~np.in1d(data, filter_ids).reshape(data.shape)] = 0
+    return data
+
+
+def get_cuboid_runs(indices):
+    """Method to group cuboid indices into runs of consecutive cuboids along x
+
+    Args:
+        indices (list((int, int, int))): x, y, z index of each cuboid
+
+    Returns:
+        (list(((int, int, int), int))): x, y, z index of the first cuboid of each run and the number of cuboids in it
+    """
+    runs = []
+    for x, y, z in sorted(indices, key=lambda idx: (idx[2], idx[1], idx[0])):
+        if runs:
+            (start_x, start_y, start_z), length = runs[-1]
+            if (y, z) == (start_y, start_z) and x == start_x + length:
+                runs[-1] = ((start_x, start_y, start_z), length + 1)
+                continue
+        runs.append(((x, y, z), 1))
+    return runs
+
+
+class IdFilter:
+    """
+    Class to read a filtered annotation cutout from only the cuboids that contain the requested ids
+
+    The cuboids holding each id are looked up in the id index (the id_index_table of OBJECTIO_CONFIG). The id index is
+    updated when cuboids are flushed to S3, so cuboids written through the API that may not have been indexed yet are
+    always read as well. All other cuboids of the region are returned as zeros without being read.
+
+    Writes are only known from the write versions, so the index is only used once the write versions have been kept
+    without loss for CUTOUT_FILTER_INDEX_DELAY seconds, the longest a write may take to reach the id index. Until then
+    every cuboid of the region is read and filtered.
+
+    Only resolutions below ANNOTATION_INDEX_MAX are indexed. Filtered cutouts of other resolutions are read and
+    filtered by the spatialdb.
+
+    The cuboid set is looked up once per instance, so a single instance can serve every slab of a streamed cutout.
+    """
+
+    def __init__(self, resource, resolution, filter_ids):
+        """
+
+        Args:
+            resource (spdb.project.BossResource): Resource for the channel being read
+            resolution (int): Resolution level
+            filter_ids (numpy.ndarray): Ids to keep
+        """
+        self.resource = resource
+        self.resolution = resolution
+        self.filter_ids = filter_ids
+        self.cuboid_size = CUBOIDSIZE[resolution]
+        self.versions = WriteVersions(resource.get_lookup_key(), resolution)
+        self._indexed = None
+
+    @classmethod
+    def create(cls, resource, resolution, filter_ids, iso=False):
+        """Method to get the filter for a cutout, if the id index can be used
+
+        Args:
+            resource (spdb.project.BossResource): Resource for the channel being read
+            resolution (int): Resolution level
+            filter_ids (numpy.ndarray|None): Ids to keep
+            iso (bool): Flag indicating if the isotropic version of the channel is being read
+
+        Returns:
+            (IdFilter|None): None if the cutout should be read and filtered by the spatialdb
+        """
+        if not settings.CUTOUT_FILTER_INDEX_ENABLED or filter_ids is None or iso:
+            return None
+        if resolution >= ANNOTATION_INDEX_MAX:
+            # The id index is empty for this resolution
+            return None
+        if len(filter_ids) == 0 or len(filter_ids) > settings.CUTOUT_FILTER_INDEX_MAX_IDS:
+            return None
+        return cls(resource, resolution, filter_ids)
+
+    def get_indexed_cuboids(self):
+        """Method to get the cuboids that contain any of the ids according to the id index
+
+        Returns:
+            (set((int, int, int))|None): x, y, z index of each cuboid, or None if the index could not be read
+        """
+        if self._indexed is None:
+            try:
+                index = get_object_indices()
+                cuboids = set()
+                for obj_id in self.filter_ids:
+                    for morton in index.get_cuboids(self.resource, self.resolution, int(obj_id)):
+                        cuboids.add(tuple(ndlib.MortonXYZ(int(morton))))
+                self._indexed = cuboids
+            except Exception:
+                BossLogger().logger.exception("Could not read the id index of {}. Reading every cuboid of the "
+                                              "filtered cutout.".format(self.resource.get_lookup_key()))
+                return None
+        return self._indexed
+
+    def get_needed_cuboids(self, corner, extent, time_range):
+        """Method to get the cuboids of a region that may contain any of the ids
+
+        Args:
+            corner ((int, int, int)): x, y, z corner of the region
+            extent ((int, int, int)): x, y, z extent of the region
+            time_range ([int, int]): Start and stop (exclusive) time samples
+
+        Returns:
+            (list((int, int, int))|None): x, y, z index of each cuboid, or None if every cuboid must be read
+        """
+        if not self.versions.is_complete(settings.CUTOUT_FILTER_INDEX_DELAY):
+            # Writes that are not indexed yet may be missing from the write versions
+            return None
+
+        indexed = self.get_indexed_cuboids()
+        if indexed is None:
+            return None
+
+        indices = get_cuboid_indices(corner, extent, self.cuboid_size)
+        needed = indexed | self.versions.get_written_indices(corner, extent, time_range)
+        needed = [idx for idx in indices if idx in needed]
+        if len(needed) == len(indices):
+            return None
+        return needed
+
+    def cutout(self, spatialdb, corner, extent, time_range, iso=False, no_cache=False):
+        """Method to read a filtered region
+
+        Args:
+            spatialdb (spdb.spatialdb.SpatialDB): Interface to the spatialdb
+            corner ((int, int, int)): x, y, z corner of the region
+            extent ((int, int, int)): x, y, z extent of the region
+            time_range ([int, int]): Start and stop (exclusive) time samples
+            iso (bool): Flag indicating if the isotropic version of the channel is being read
+            no_cache (bool): Flag indicating if the cache should be bypassed
+
+        Returns:
+            (spdb.spatialdb.Cube)
+        """
+        needed = self.get_needed_cuboids(corner, extent, time_range)
+        if needed is None:
+            cube = spatialdb.cutout(self.resource, corner, extent, self.resolution, time_range, iso=iso,
+                                    no_cache=no_cache)
+            mask_ids(cube.data, self.filter_ids)
+            return cube
+
+        data = np.zeros((time_range[1] - time_range[0], extent[2], extent[1], extent[0]),
+                        dtype=self.resource.get_numpy_data_type())
+        stop = [corner[d] + extent[d] for d in range(3)]
+        for first, length in get_cuboid_runs(needed):
+            # Clip the run of cuboids to the region
+            run_start = [max(corner[d], first[d] * self.cuboid_size[d]) for d in range(3)]
+            run_stop = [min(stop[d], (first[d] + (length if d == 0 else 1)) * self.cuboid_size[d]) for d in range(3)]
+            run_extent = [run_stop[d] - run_start[d] for d in range(3)]
+
+            cube = spatialdb.cutout(self.resource, run_start, run_extent, self.resolution, time_range, iso=iso,
+                                    no_cache=no_cache)
+            offset = [run_start[d] - corner[d] for d in range(3)]
+            data[:, offset[2]:offset[2] + run_extent[2], offset[1]:offset[1] + run_extent[1],
+                 offset[0]:offset[0] + run_extent[0]] = mask_ids(cube.data, self.filter_ids)
+
+        cube = Cube.create_cube(self.resource, list(extent), time_range)
+        cube.data = data
+        return cube
@@ -0,0 +1,37 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import blosc
+
+from django.core.management.base import BaseCommand
+
+from bossspatialdb.benchmark import benchmark_blosc, format_results, BLOSC_COLUMNS, SUPPORTED_SHUFFLES
+
+
+class Command(BaseCommand):
+    help = "Report blosc compress/decompress MB/s and compression ratio per dtype, codec, clevel, shuffle and nthreads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dtypes', nargs='+', default=['uint8', 'uint16', 'uint64'])
+        parser.add_argument('--shape', nargs=3, type=int, default=[16, 512, 512], metavar=('Z', 'Y', 'X'))
+        parser.add_argument('--codecs', nargs='+', default=blosc.compressor_list())
+        parser.add_argument('--clevels', nargs='+', type=int, default=[1, 5, 9])
+        parser.add_argument('--shuffles', nargs='+', default=SUPPORTED_SHUFFLES)
+        parser.add_argument('--nthreads', nargs='+', type=int, default=[1, 4])
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        results = benchmark_blosc(options['dtypes'], tuple(options['shape']), options['codecs'], options['clevels'],
+                                  options['shuffles'], options['nthreads'], repeat=options['repeat'])
+        self.stdout.write(format_results(results, BLOSC_COLUMNS))
@@ -0,0 +1,32 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.core.management.base import BaseCommand
+
+from bossspatialdb.benchmark import benchmark_transfer, format_results, TRANSFER_COLUMNS
+
+
+class Command(BaseCommand):
+    help = "Compare end-to-end throughput and CPU cost of blosc and uncompressed cutouts at several link speeds"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dtypes', nargs='+', default=['uint8', 'uint16', 'uint64'])
+        parser.add_argument('--shape', nargs=3, type=int, default=[16, 512, 512], metavar=('Z', 'Y', 'X'))
+        parser.add_argument('--link-gbps', nargs='+', type=float, default=[1.0, 10.0, 25.0])
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        results = benchmark_transfer(options['dtypes'], tuple(options['shape']), options['link_gbps'],
+                                     repeat=options['repeat'])
+        self.stdout.write(format_results(results, TRANSFER_COLUMNS))
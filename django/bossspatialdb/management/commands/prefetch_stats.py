@@ -0,0 +1,30 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.core.management.base import BaseCommand
+
+from bossspatialdb.prefetch import get_prefetch_stats, STAT_NAMES
+
+
+class Command(BaseCommand):
+    help = "Report the prefetch hit, miss, issued and skipped counters of all workers"
+
+    def handle(self, *args, **options):
+        stats = get_prefetch_stats()
+        for name in STAT_NAMES:
+            self.stdout.write("{:>10}  {}".format(name, stats[name]))
+
+        scored = stats["hits"] + stats["misses"]
+        if scored:
+            self.stdout.write("{:>10}  {:.1f}%".format("hit rate", 100.0 * stats["hits"] / scored))
@@ -25,27 +25,327 @@ from bosscore.error import BossParserError, BossError, ErrorCodes
 
 import spdb
 
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
 
-def is_too_large(request_obj, bit_depth):
-    """Method to check if a request is too large to handle
+from .compression import RAW_MEDIA_TYPE, RAW_DTYPE_HEADER, RAW_SHAPE_HEADER, parse_shape
+from .segmentation import decode_compressed_segmentation, get_max_encoded_size
+from .stream import get_blosc_nbytes, get_blosc_cbytes, get_slab_ranges, BLOSC_HEADER_SIZE
+
+# Number of bytes read from the request stream at a time
+READ_CHUNK_SIZE = 16 * 1048576
+
+# Bytes needed to determine the length of an npy header (magic string, version, 4 byte header length)
+NPY_PREAMBLE_SIZE = 12
+
+# Most bytes blosc adds when compressing incompressible data
+BLOSC_MAX_OVERHEAD = 16
+
+
+def get_expected_shape(req):
+    """Method to get the shape of the matrix described by a cutout request URL
+
+    Args:
+        req (bosscore.request.BossRequest): Validated cutout request
+
+    Returns:
+        (tuple): ([t,] z, y, x) shape. Time series requests (even if single time point) are 4D.
+    """
+    if req.time_request:
+        return len(req.get_time()), req.get_z_span(), req.get_y_span(), req.get_x_span()
+    else:
+        return req.get_z_span(), req.get_y_span(), req.get_x_span()
+
+
+def get_content_length(parser_context):
+    """Method to get the Content-Length of the request being parsed
+
+    Args:
+        parser_context (dict): DRF parser context
+
+    Returns:
+        (int): Content length, or None if not provided
+    """
+    try:
+        return int(parser_context['request'].META.get('CONTENT_LENGTH'))
+    except (TypeError, ValueError, KeyError):
+        return None
+
+
+def fill_buffer(stream, view):
+    """Method to fill a preallocated buffer from a request stream
+
+    Args:
+        stream: Request stream
+        view (memoryview): Writable view of the buffer to fill
+
+    Returns:
+        (int): Number of bytes read. Less than the size of the buffer if the stream ended first.
+    """
+    offset = 0
+    while offset < len(view):
+        chunk = stream.read(min(READ_CHUNK_SIZE, len(view) - offset))
+        if not chunk:
+            break
+        view[offset:offset + len(chunk)] = chunk
+        offset += len(chunk)
+    return offset
+
+
+def read_into_buffer(stream, content_length):
+    """Method to read a request body into a single preallocated buffer
+
+    Reading in fixed size chunks avoids holding a second full size copy of the body while it is assembled.
+
+    Args:
+        stream: Request stream
+        content_length (int): Size of the body, or None if unknown
+
+    Returns:
+        (memoryview): View of the bytes that were read
+    """
+    if content_length is None:
+        return memoryview(stream.read())
+
+    view = memoryview(bytearray(content_length))
+    return view[:fill_buffer(stream, view)]
+
+
+def get_max_body_size(nbytes, overhead=0):
+    """Method to get the largest request body accepted for an upload
+
+    Args:
+        nbytes (int): Largest size of the encoded upload, from the extent in the URL
+        overhead (int): Bytes the encoding may add to data that does not compress
+
+    Returns:
+        (int): Number of bytes, never more than CUTOUT_MAX_SIZE plus the overhead
+    """
+    return min(nbytes, settings.CUTOUT_MAX_SIZE) + overhead
+
+
+def read_body(stream, parser_context, max_size):
+    """Method to read a request body of limited size into a single buffer
+
+    The Content-Length is checked before anything is allocated. Bodies without a Content-Length are read up to one
+    byte past the limit.
+
+    Args:
+        stream: Request stream
+        parser_context (dict): DRF parser context
+        max_size (int): Largest body accepted
+
+    Returns:
+        (memoryview): View of the bytes that were read
+
+    Raises:
+        (BossError): If the body is larger than max_size
+    """
+    content_length = get_content_length(parser_context)
+    if content_length is not None and content_length > max_size:
+        raise BossError("Request body of {} bytes is larger than the cutout in the URL can be ({} bytes). Verify "
+                        "the xyz dimensions used in the POST URL.".format(content_length, max_size),
+                        ErrorCodes.REQUEST_TOO_LARGE)
+
+    if content_length is None:
+        view = memoryview(stream.read(max_size + 1))
+    else:
+        view = read_into_buffer(stream, content_length)
+
+    if len(view) > max_size:
+        raise BossError("Request body is larger than the cutout in the URL can be ({} bytes). Verify the xyz "
+                        "dimensions used in the POST URL.".format(max_size), ErrorCodes.REQUEST_TOO_LARGE)
+    return view
+
+
+def read_blosc_frame(stream):
+    """Method to read the next blosc chunk from a request stream
+
+    The chunk header is read first to get the compressed size, so exactly one chunk is consumed.
+
+    Args:
+        stream: Request stream
+
+    Returns:
+        (memoryview): The compressed chunk, including its header, or None if the stream has ended
+
+    Raises:
+        (ValueError): If the stream ends part way through a chunk
+    """
+    header = read_into_buffer(stream, BLOSC_HEADER_SIZE)
+    if len(header) == 0:
+        return None
+
+    cbytes = get_blosc_cbytes(header)
+    if cbytes < BLOSC_HEADER_SIZE:
+        raise ValueError("Invalid blosc header")
+
+    view = memoryview(bytearray(cbytes))
+    view[:BLOSC_HEADER_SIZE] = header
+    if fill_buffer(stream, view[BLOSC_HEADER_SIZE:]) != cbytes - BLOSC_HEADER_SIZE:
+        raise ValueError("Truncated blosc frame")
+    return view
+
+
+def iter_decompressed(stream):
+    """Generator to incrementally zlib decompress a request stream
+
+    Both the compressed reads and the decompressed pieces are bounded by READ_CHUNK_SIZE.
+
+    Args:
+        stream: Request stream
+
+    Yields:
+        (bytes): Decompressed data
+    """
+    decompressor = zlib.decompressobj()
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        while chunk:
+            data = decompressor.decompress(chunk, READ_CHUNK_SIZE)
+            if data:
+                yield data
+            chunk = decompressor.unconsumed_tail
+
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+def decompress_npygz(stream, expected_shape):
+    """Method to incrementally decompress a gzipped npy file directly into a preallocated array
+
+    The npy header is decoded first so the shape can be validated before the output array is allocated.
+
+    Args:
+        stream: Request stream
+        expected_shape (tuple): Shape from the request URL. Leading dimensions of size 1 may be omitted or added.
+
+    Returns:
+        (numpy.ndarray): The decoded matrix
+
+    Raises:
+        (ValueError): If the data is not a valid npy file or does not match the expected shape
+    """
+    pieces = iter_decompressed(stream)
+
+    # Decompress until the full npy header is available
+    pending = b''
+    header_size = None
+    while header_size is None or len(pending) < header_size:
+        try:
+            pending += next(pieces)
+        except StopIteration:
+            raise ValueError("Truncated npy header")
+        if header_size is None and len(pending) >= NPY_PREAMBLE_SIZE:
+            major, _ = np.lib.format.read_magic(io.BytesIO(pending))
+            if major == 1:
+                header_size = 10 + int.from_bytes(pending[8:10], 'little')
+            else:
+                header_size = 12 + int.from_bytes(pending[8:12], 'little')
+
+    header_file = io.BytesIO(pending[:header_size])
+    version = np.lib.format.read_magic(header_file)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(header_file)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(header_file)
+
+    if shape[-3:] != expected_shape[-3:] or int(np.prod(shape)) != int(np.prod(expected_shape)):
+        raise ValueError("Shape {} does not match the request".format(shape))
+
+    # Copy decompressed pieces into the output buffer as they arrive
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    flat = np.empty(nbytes, dtype=np.uint8)
+    offset = 0
+    data = pending[header_size:]
+    while True:
+        if offset + len(data) > nbytes:
+            raise ValueError("More data than described by the npy header")
+        flat[offset:offset + len(data)] = np.frombuffer(data, dtype=np.uint8)
+        offset += len(data)
+        try:
+            data = next(pieces)
+        except StopIteration:
+            break
+
+    if offset != nbytes:
+        raise ValueError("Less data than described by the npy header")
+
+    return flat.view(dtype).reshape(shape, order='F' if fortran_order else 'C')
+
+
+def get_request_size(request_obj, bit_depth):
+    """Method to get the size of a request, as counted against the cutout size limits
 
     Args:
         request_obj:
+        bit_depth (int): Bit depth of the channel
 
     Returns:
-        bool
+        (float): Number of bytes
     """
     t_span = request_obj.get_time().stop - request_obj.get_time().start
     total_bytes = request_obj.get_x_span() * request_obj.get_y_span() * request_obj.get_z_span() * t_span * bit_depth/8
     if bit_depth == 64:
         # Allow larger annotation posts since things compress so well
         total_bytes /= 4
-    if total_bytes > settings.CUTOUT_MAX_SIZE:
+    return total_bytes
+
+
+def is_too_large(request_obj, bit_depth, max_size=None):
+    """Method to check if a request is too large to handle
+
+    Args:
+        request_obj:
+        bit_depth (int): Bit depth of the channel
+        max_size (int): Optional limit in bytes. Defaults to CUTOUT_MAX_SIZE
+
+    Returns:
+        bool
+    """
+    if max_size is None:
+        max_size = settings.CUTOUT_MAX_SIZE
+    if get_request_size(request_obj, bit_depth) > max_size:
         return True
     else:
         return False
 
 
+def admit_upload(parser_context, nbytes):
+    """Method to reserve the memory an upload holds, once the request is validated and before the body is read
+
+    Only views using bossspatialdb.admission.AdmissionMixin reserve memory. If the upload is not admitted the view
+    drains the body and raises AdmissionRejected, which ends the request.
+
+    Args:
+        parser_context (dict): DRF parser context
+        nbytes (int): Number of bytes the upload holds in memory at once
+
+    Returns:
+        None
+    """
+    view = parser_context.get('view')
+    if hasattr(view, 'admit_upload'):
+        view.admit_upload(parser_context['request'], nbytes)
+
+
+def get_upload_bytes(req, bit_depth, parser_context):
+    """Method to get the number of bytes an upload holds in memory at once, the compressed body and the decoded region
+
+    Args:
+        req (bosscore.request.BossRequest): Validated cutout request
+        bit_depth (int): Bit depth of the channel
+        parser_context (dict): DRF parser context
+
+    Returns:
+        (int): Number of bytes
+    """
+    num_voxels = req.get_x_span() * req.get_y_span() * req.get_z_span() * len(req.get_time())
+    return num_voxels * bit_depth // 8 + (get_content_length(parser_context) or 0)
+
+
 class ConsumeReqMixin:
     """
     Provides a method to ensure a request is entirely consumed by a parser
@@ -61,7 +361,9 @@ class ConsumeReqMixin:
             stream (stream-like object): The stream to consume.
         """
         try:
-            stream.read()
+            # Read in chunks so a large body is never held in memory
+            while stream.read(READ_CHUNK_SIZE):
+                pass
         except:
             pass
 
@@ -123,34 +425,42 @@ class BloscParser(BaseParser, ConsumeReqMixin):
             return BossParserError("Cutout request is over 500MB when uncompressed. Reduce cutout dimensions.",
                                    ErrorCodes.REQUEST_TOO_LARGE)
 
+        admit_upload(parser_context, get_upload_bytes(req, bit_depth, parser_context))
+
+        # Read the compressed body into a single buffer, rejecting bodies larger than the URL extent allows
+        dtype = np.dtype(resource.get_numpy_data_type())
+        expected_shape = get_expected_shape(req)
+        max_size = get_max_body_size(int(np.prod(expected_shape)) * dtype.itemsize, BLOSC_MAX_OVERHEAD)
         try:
-            # Decompress
-            raw_data = blosc.decompress(stream.read())
-            data_mat = np.fromstring(raw_data, dtype=resource.get_numpy_data_type())
+            compressed_data = read_body(stream, parser_context, max_size)
+        except BossError as err:
+            self.consume_request(stream)
+            return BossParserError(err.message, err.error_code)
         except MemoryError:
             return BossParserError("Ran out of memory decompressing data.",
                                     ErrorCodes.BOSS_SYSTEM_ERROR)
-        except:
-            return BossParserError("Failed to decompress data. Verify the datatype/bitdepth of your data "
-                                   "matches the channel.", ErrorCodes.DATATYPE_DOES_NOT_MATCH)
 
-        # Reshape and return
+        # Validate the decompressed size against the URL extent before allocating the output matrix
         try:
-            if req.time_request:
-                # Time series request (even if single time point) - Get 4D matrix
-                parsed_data = np.reshape(data_mat,
-                                         (len(req.get_time()),
-                                          req.get_z_span(),
-                                          req.get_y_span(),
-                                          req.get_x_span()),
-                                         order='C')
-            else:
-                # Not a time series request (time range [0,1] auto-populated) - Get 3D matrix
-                parsed_data = np.reshape(data_mat, (req.get_z_span(), req.get_y_span(), req.get_x_span()), order='C')
+            nbytes = get_blosc_nbytes(compressed_data)
         except ValueError:
+            return BossParserError("Failed to decompress data. Verify the datatype/bitdepth of your data "
+                                   "matches the channel.", ErrorCodes.DATATYPE_DOES_NOT_MATCH)
+        if nbytes != int(np.prod(expected_shape)) * dtype.itemsize:
             return BossParserError("Failed to unpack data. Verify the datatype of your POSTed data and "
                                    "xyz dimensions used in the POST URL.", ErrorCodes.DATA_DIMENSION_MISMATCH)
 
+        # Decompress directly into the output matrix
+        try:
+            parsed_data = np.empty(expected_shape, dtype=dtype, order='C')
+            blosc.decompress_ptr(compressed_data, parsed_data.__array_interface__['data'][0])
+        except MemoryError:
+            return BossParserError("Ran out of memory decompressing data.",
+                                    ErrorCodes.BOSS_SYSTEM_ERROR)
+        except:
+            return BossParserError("Failed to decompress data. Verify the datatype/bitdepth of your data "
+                                   "matches the channel.", ErrorCodes.DATATYPE_DOES_NOT_MATCH)
+
         return req, resource, parsed_data
 
 
@@ -212,6 +522,8 @@ class BloscPythonParser(BaseParser, ConsumeReqMixin):
             return BossParserError("Cutout request is over 500MB when uncompressed. Reduce cutout dimensions.",
                                    ErrorCodes.REQUEST_TOO_LARGE)
 
+        admit_upload(parser_context, get_upload_bytes(req, bit_depth, parser_context))
+
         # Decompress and return
         try:
             parsed_data = blosc.unpack_array(stream.read())
@@ -281,18 +593,381 @@ class NpygzParser(BaseParser, ConsumeReqMixin):
             return BossParserError("Cutout request is over 500MB when uncompressed. Reduce cutout dimensions.",
                                    ErrorCodes.REQUEST_TOO_LARGE)
 
+        admit_upload(parser_context, get_upload_bytes(req, bit_depth, parser_context))
+
         # Decompress and return
         try:
-            data_bytes = zlib.decompress(stream.read())
-
-            # Open
-            data_obj = io.BytesIO(data_bytes)
-            parsed_data = np.load(data_obj)
+            parsed_data = decompress_npygz(stream, get_expected_shape(req))
         except MemoryError:
+            self.consume_request(stream)
             return BossParserError("Ran out of memory decompressing data.",
                                     ErrorCodes.BOSS_SYSTEM_ERROR)
-        except EOFError:
+        except (EOFError, ValueError, zlib.error):
+            self.consume_request(stream)
             return BossParserError("Failed to unpack data. Verify the datatype of your POSTed data and "
                                    "xyz dimensions used in the POST URL.", ErrorCodes.DATA_DIMENSION_MISMATCH)
 
         return req, resource, parsed_data
+
+
+class OctetStreamParser(BaseParser, ConsumeReqMixin):
+    """
+    Parser that handles uncompressed binary data, described by the X-Boss-Dtype and X-Boss-Shape headers
+
+    The body is read into a single preallocated buffer and the returned matrix is a view of that buffer.
+    """
+    media_type = RAW_MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """Method to read bytes from a POST that contains the C-ordered buffer of a numpy ndarray
+
+        The X-Boss-Dtype header is optional, but must match the channel if provided. The X-Boss-Shape header is
+        optional and defaults to the shape described by the URL.
+
+        :param stream: Request stream
+        stream type: django.core.handlers.wsgi.WSGIRequest
+        :param media_type:
+        :param parser_context:
+        :return:
+        """
+        try:
+            request_args = {
+                "service": "cutout",
+                "collection_name": parser_context['kwargs']['collection'],
+                "experiment_name": parser_context['kwargs']['experiment'],
+                "channel_name": parser_context['kwargs']['channel'],
+                "resolution": parser_context['kwargs']['resolution'],
+                "x_args": parser_context['kwargs']['x_range'],
+                "y_args": parser_context['kwargs']['y_range'],
+                "z_args": parser_context['kwargs']['z_range'],
+            }
+            if 't_range' in parser_context['kwargs']:
+                request_args["time_args"] = parser_context['kwargs']['t_range']
+            else:
+                request_args["time_args"] = None
+
+            req = BossRequest(parser_context['request'], request_args)
+        except BossError as err:
+            self.consume_request(stream)
+            return BossParserError(err.message, err.error_code)
+        except Exception as err:
+            self.consume_request(stream)
+            return BossParserError(str(err), ErrorCodes.UNHANDLED_EXCEPTION)
+
+        # Convert to Resource
+        resource = spdb.project.BossResourceDjango(req)
+
+        # Get bit depth
+        try:
+            bit_depth = resource.get_bit_depth()
+            dtype = np.dtype(resource.get_numpy_data_type())
+        except ValueError:
+            self.consume_request(stream)
+            return BossParserError("Unsupported data type provided to parser: {}".format(resource.get_data_type()),
+                                   ErrorCodes.TYPE_ERROR)
+
+        # Make sure cutout request is under 500MB UNCOMPRESSED
+        if is_too_large(req, bit_depth):
+            self.consume_request(stream)
+            return BossParserError("Cutout request is over 500MB when uncompressed. Reduce cutout dimensions.",
+                                   ErrorCodes.REQUEST_TOO_LARGE)
+
+        admit_upload(parser_context, get_upload_bytes(req, bit_depth, parser_context))
+
+        # Validate the headers describing the body
+        meta = parser_context['request'].META
+        header = 'HTTP_' + RAW_DTYPE_HEADER.upper().replace('-', '_')
+        try:
+            if header in meta and np.dtype(meta[header]) != dtype:
+                raise TypeError()
+        except TypeError:
+            self.consume_request(stream)
+            return BossParserError("Datatype {} does not match channel".format(meta[header]),
+                                   ErrorCodes.DATATYPE_DOES_NOT_MATCH)
+
+        shape = get_expected_shape(req)
+        header = 'HTTP_' + RAW_SHAPE_HEADER.upper().replace('-', '_')
+        if header in meta:
+            try:
+                shape = parse_shape(meta[header])
+            except ValueError:
+                self.consume_request(stream)
+                return BossParserError("Invalid {} header: {}".format(RAW_SHAPE_HEADER, meta[header]),
+                                       ErrorCodes.INVALID_ARGUMENT)
+            if int(np.prod(shape)) != int(np.prod(get_expected_shape(req))):
+                self.consume_request(stream)
+                return BossParserError("Data dimensions in URL do not match POSTed data.",
+                                       ErrorCodes.DATA_DIMENSION_MISMATCH)
+
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        content_length = get_content_length(parser_context)
+        if content_length is not None and content_length != nbytes:
+            self.consume_request(stream)
+            return BossParserError("Received {} bytes but expected {} for a {} {} matrix. Verify the datatype of "
+                                   "your POSTed data and xyz dimensions used in the POST URL."
+                                   .format(content_length, nbytes, dtype.name, shape),
+                                   ErrorCodes.DATA_DIMENSION_MISMATCH)
+
+        # Read the body directly into the matrix's buffer
+        try:
+            buffer = bytearray(nbytes)
+        except MemoryError:
+            self.consume_request(stream)
+            return BossParserError("Ran out of memory reading data.", ErrorCodes.BOSS_SYSTEM_ERROR)
+
+        if fill_buffer(stream, memoryview(buffer)) != nbytes or stream.read(1):
+            self.consume_request(stream)
+            return BossParserError("Body does not contain a {} {} matrix. Verify the datatype of your POSTed data and "
+                                   "xyz dimensions used in the POST URL.".format(dtype.name, shape),
+                                   ErrorCodes.DATA_DIMENSION_MISMATCH)
+
+        return req, resource, np.frombuffer(buffer, dtype=dtype).reshape(shape)
+
+
+class CompressedSegmentationParser(BaseParser, ConsumeReqMixin):
+    """
+    Parser that handles uint64 data encoded in the neuroglancer compressed_segmentation format
+    """
+    media_type = 'application/compressed-segmentation'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """Method to decode bytes from a POST that contains compressed_segmentation encoded uint64 data
+
+        Blocks are 8x8x8 and time samples of a 4D POST are encoded as channels.
+
+        :param stream: Request stream
+        stream type: django.core.handlers.wsgi.WSGIRequest
+        :param media_type:
+        :param parser_context:
+        :return:
+        """
+        try:
+            request_args = {
+                "service": "cutout",
+                "collection_name": parser_context['kwargs']['collection'],
+                "experiment_name": parser_context['kwargs']['experiment'],
+                "channel_name": parser_context['kwargs']['channel'],
+                "resolution": parser_context['kwargs']['resolution'],
+                "x_args": parser_context['kwargs']['x_range'],
+                "y_args": parser_context['kwargs']['y_range'],
+                "z_args": parser_context['kwargs']['z_range'],
+            }
+            if 't_range' in parser_context['kwargs']:
+                request_args["time_args"] = parser_context['kwargs']['t_range']
+            else:
+                request_args["time_args"] = None
+
+            req = BossRequest(parser_context['request'], request_args)
+        except BossError as err:
+            self.consume_request(stream)
+            return BossParserError(err.message, err.error_code)
+        except Exception as err:
+            self.consume_request(stream)
+            return BossParserError(str(err), ErrorCodes.UNHANDLED_EXCEPTION)
+
+        # Convert to Resource
+        resource = spdb.project.BossResourceDjango(req)
+
+        # Get bit depth
+        try:
+            bit_depth = resource.get_bit_depth()
+        except ValueError:
+            self.consume_request(stream)
+            return BossParserError("Unsupported data type provided to parser: {}".format(resource.get_data_type()),
+                                   ErrorCodes.TYPE_ERROR)
+
+        if bit_depth != 64:
+            self.consume_request(stream)
+            return BossParserError("The compressed segmentation interface only supports uint64 annotation data",
+                                   ErrorCodes.DATATYPE_DOES_NOT_MATCH)
+
+        # Make sure cutout request is under 500MB UNCOMPRESSED
+        if is_too_large(req, bit_depth):
+            self.consume_request(stream)
+            return BossParserError("Cutout request is over 500MB when uncompressed. Reduce cutout dimensions.",
+                                   ErrorCodes.REQUEST_TOO_LARGE)
+
+        admit_upload(parser_context, get_upload_bytes(req, bit_depth, parser_context))
+
+        # Read the encoded body, rejecting bodies larger than the URL extent allows
+        expected_shape = get_expected_shape(req)
+        try:
+            encoded_data = read_body(stream, parser_context, get_max_body_size(get_max_encoded_size(expected_shape)))
+        except BossError as err:
+            self.consume_request(stream)
+            return BossParserError(err.message, err.error_code)
+        except MemoryError:
+            return BossParserError("Ran out of memory decompressing data.",
+                                    ErrorCodes.BOSS_SYSTEM_ERROR)
+
+        # Decode and return
+        try:
+            parsed_data = decode_compressed_segmentation(encoded_data, expected_shape)
+        except MemoryError:
+            return BossParserError("Ran out of memory decompressing data.",
+                                    ErrorCodes.BOSS_SYSTEM_ERROR)
+        except ValueError:
+            return BossParserError("Failed to decode data. Verify the xyz dimensions used in the POST URL match "
+                                   "the encoded data.", ErrorCodes.DATA_DIMENSION_MISMATCH)
+
+        return req, resource, parsed_data
+
+
+class BloscFramedUpload(ConsumeReqMixin):
+    """
+    Lazy reader for a framed blosc upload
+
+    The body is a sequence of independently blosc compressed, C-ordered (z, y, x) slabs. Each slab covers the full x
+    and y extent of the request and a cuboid aligned z range, and slabs are ordered by time sample and then z, exactly
+    as a streamed blosc cutout is returned. Frames are read from the request stream one at a time as the view writes
+    them, so only a single slab is held in memory.
+    """
+
+    def __init__(self, stream, req, dtype):
+        """
+
+        Args:
+            stream: Request stream positioned at the first frame
+            req (bosscore.request.BossRequest): Validated cutout request
+            dtype (numpy.dtype): Datatype of the channel
+        """
+        self.stream = stream
+        self.req = req
+        self.dtype = np.dtype(dtype)
+        self.frames_read = 0
+
+    def get_slabs(self):
+        """Method to get the time sample and z range of every frame expected in the body
+
+        Returns:
+            (list((int, int, int))): (time sample, z start, z stop) of each frame, in upload order
+        """
+        z_start = self.req.get_z_start()
+        z_stop = self.req.get_z_stop()
+        z_ranges = get_slab_ranges(z_start, z_stop, CUBOIDSIZE[self.req.get_resolution()][2])
+        return [(t, start, stop) for t in self.req.get_time() for start, stop in z_ranges]
+
+    def frames(self):
+        """Generator that reads and decompresses one frame at a time
+
+        Yields:
+            (int, int, numpy.ndarray): Time sample, z start and the decompressed (z, y, x) slab
+
+        Raises:
+            BossError: If a frame is missing, malformed or does not match the slab described by the URL
+        """
+        for t, z_start, z_stop in self.get_slabs():
+            shape = (z_stop - z_start, self.req.get_y_span(), self.req.get_x_span())
+            try:
+                frame = read_blosc_frame(self.stream)
+            except ValueError:
+                raise BossError("Failed to read frame {}. Frames must be complete blosc chunks."
+                                .format(self.frames_read), ErrorCodes.DATA_DIMENSION_MISMATCH)
+            if frame is None:
+                raise BossError("Expected {} frames but received {}. Verify the xyz dimensions used in the POST URL."
+                                .format(len(self.get_slabs()), self.frames_read),
+                                ErrorCodes.DATA_DIMENSION_MISMATCH)
+
+            if get_blosc_nbytes(frame) != int(np.prod(shape)) * self.dtype.itemsize:
+                raise BossError("Frame {} does not decompress to a {} slab. Verify the datatype of your POSTed data "
+                                "and that frames are cuboid aligned in z.".format(self.frames_read, shape),
+                                ErrorCodes.DATA_DIMENSION_MISMATCH)
+
+            slab = np.empty(shape, dtype=self.dtype, order='C')
+            try:
+                blosc.decompress_ptr(frame, slab.__array_interface__['data'][0])
+            except MemoryError:
+                raise BossError("Ran out of memory decompressing data.", ErrorCodes.BOSS_SYSTEM_ERROR)
+            except:
+                raise BossError("Failed to decompress frame {}. Verify the datatype/bitdepth of your data "
+                                "matches the channel.".format(self.frames_read), ErrorCodes.DATATYPE_DOES_NOT_MATCH)
+
+            self.frames_read += 1
+            yield t, z_start, slab
+
+        if self.stream.read(1):
+            raise BossError("Received more frames than described by the POST URL.",
+                            ErrorCodes.DATA_DIMENSION_MISMATCH)
+
+    def consume(self):
+        """Method to discard any remaining frames after an error
+
+        Returns:
+            None
+        """
+        self.consume_request(self.stream)
+
+
+class BloscFramedParser(BaseParser, ConsumeReqMixin):
+    """
+    Parser that handles a sequence of blosc compressed, cuboid aligned z-slabs
+
+    The body is not read by the parser. The view writes each slab as it is decoded, so uploads may be as large as
+    CUTOUT_FRAMED_MAX_SIZE while memory is bounded by a single slab.
+    """
+    media_type = 'application/blosc-framed'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """Method to validate a framed blosc POST and return a lazy reader for its frames
+
+        :param stream: Request stream
+        stream type: django.core.handlers.wsgi.WSGIRequest
+        :param media_type:
+        :param parser_context:
+        :return:
+        """
+        try:
+            request_args = {
+                "service": "cutout",
+                "collection_name": parser_context['kwargs']['collection'],
+                "experiment_name": parser_context['kwargs']['experiment'],
+                "channel_name": parser_context['kwargs']['channel'],
+                "resolution": parser_context['kwargs']['resolution'],
+                "x_args": parser_context['kwargs']['x_range'],
+                "y_args": parser_context['kwargs']['y_range'],
+                "z_args": parser_context['kwargs']['z_range'],
+            }
+            if 't_range' in parser_context['kwargs']:
+                request_args["time_args"] = parser_context['kwargs']['t_range']
+            else:
+                request_args["time_args"] = None
+
+            req = BossRequest(parser_context['request'], request_args)
+        except BossError as err:
+            self.consume_request(stream)
+            return BossParserError(err.message, err.error_code)
+        except Exception as err:
+            self.consume_request(stream)
+            return BossParserError(str(err), ErrorCodes.UNHANDLED_EXCEPTION)
+
+        # Convert to Resource
+        resource = spdb.project.BossResourceDjango(req)
+
+        # Get bit depth
+        try:
+            bit_depth = resource.get_bit_depth()
+            dtype = resource.get_numpy_data_type()
+        except ValueError:
+            self.consume_request(stream)
+            return BossParserError("Unsupported data type provided to parser: {}".format(resource.get_data_type()),
+                                   ErrorCodes.TYPE_ERROR)
+
+        # Make sure the full upload is under the framed limit UNCOMPRESSED
+        if is_too_large(req, bit_depth, settings.CUTOUT_FRAMED_MAX_SIZE):
+            self.consume_request(stream)
+            return BossParserError("Framed cutout request is over {}MB when uncompressed. Reduce cutout dimensions."
+                                   .format(settings.CUTOUT_FRAMED_MAX_SIZE // 1048576),
+                                   ErrorCodes.REQUEST_TOO_LARGE)
+
+        # Make sure a single slab is under the regular cutout limit UNCOMPRESSED
+        slab_bytes = req.get_x_span() * req.get_y_span() * CUBOIDSIZE[req.get_resolution()][2] * bit_depth / 8
+        if slab_bytes > settings.CUTOUT_MAX_SIZE:
+            self.consume_request(stream)
+            return BossParserError("A single slab of this framed cutout request is over 500MB when uncompressed. "
+                                   "Reduce x and y dimensions.", ErrorCodes.REQUEST_TOO_LARGE)
+
+        # A framed upload holds a single slab
+        admit_upload(parser_context, int(req.get_x_span() * req.get_y_span() *
+                                         min(req.get_z_span(), CUBOIDSIZE[req.get_resolution()][2]) * bit_depth // 8))
+
+        return req, resource, BloscFramedUpload(stream, req, dtype)
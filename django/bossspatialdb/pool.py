@@ -0,0 +1,180 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Per-worker registry of SpatialDB instances so Redis connection pools and AWS clients are reused across requests
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+import spdb
+from spdb.spatialdb.object_indices import ObjectIndices
+
+import bossutils
+
+try:
+    # Only available when running under uwsgi
+    from uwsgidecorators import postfork
+except ImportError:
+    postfork = None
+
+_lock = threading.Lock()
+_registry = {'pid': None, 'instances': {}, 'executors': {}}
+
+
+def reset_spatialdb_pool():
+    """Method to drop all pooled SpatialDB instances and thread pools
+
+    Must be called in a forked child so sockets opened by the parent are never shared between processes. The threads
+    of a parent's thread pools do not exist in the child, so the pools are dropped rather than shut down.
+
+    Returns:
+        None
+    """
+    with _lock:
+        _registry['pid'] = os.getpid()
+        _registry['instances'] = {}
+        _registry['executors'] = {}
+
+
+def get_spatialdb():
+    """Method to get the SpatialDB instance for the current worker process
+
+    The first call in a process creates the instance (and its Redis clients and AWS session). Later calls in the
+    same process return the same instance. If the process has forked since the instance was created, the pool is
+    reset so a child never reuses its parent's connections.
+
+    Returns:
+        (spdb.spatialdb.SpatialDB): Interface to the spatialdb
+    """
+    # Look up the class at call time so it can be patched in tests
+    spatialdb_class = spdb.spatialdb.SpatialDB
+
+    if _registry['pid'] != os.getpid():
+        reset_spatialdb_pool()
+
+    instance = _registry['instances'].get(spatialdb_class)
+    if instance is None:
+        with _lock:
+            instance = _registry['instances'].get(spatialdb_class)
+            if instance is None:
+                instance = spatialdb_class(settings.KVIO_SETTINGS,
+                                           settings.STATEIO_CONFIG,
+                                           settings.OBJECTIO_CONFIG)
+                _registry['instances'][spatialdb_class] = instance
+    return instance
+
+
+def get_object_indices():
+    """Method to get the interface to the annotation id indices for the current worker process
+
+    Returns:
+        (spdb.spatialdb.object_indices.ObjectIndices)
+    """
+    if _registry['pid'] != os.getpid():
+        reset_spatialdb_pool()
+
+    instance = _registry['instances'].get(ObjectIndices)
+    if instance is None:
+        with _lock:
+            instance = _registry['instances'].get(ObjectIndices)
+            if instance is None:
+                instance = ObjectIndices(settings.OBJECTIO_CONFIG["s3_index_table"],
+                                         settings.OBJECTIO_CONFIG["id_index_table"],
+                                         settings.OBJECTIO_CONFIG["id_count_table"],
+                                         settings.OBJECTIO_CONFIG["cuboid_bucket"],
+                                         bossutils.aws.get_region())
+                _registry['instances'][ObjectIndices] = instance
+    return instance
+
+
+def _get_executor(name, max_workers):
+    """Method to get a named thread pool for the current worker process
+
+    Args:
+        name (str): Name of the pool
+        max_workers (int): Number of threads in the pool if it must be created
+
+    Returns:
+        (concurrent.futures.ThreadPoolExecutor)
+    """
+    if _registry['pid'] != os.getpid():
+        reset_spatialdb_pool()
+
+    executor = _registry['executors'].get(name)
+    if executor is None:
+        with _lock:
+            executor = _registry['executors'].get(name)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=max_workers)
+                _registry['executors'][name] = executor
+    return executor
+
+
+def get_write_executor():
+    """Method to get the thread pool used to write cuboids in parallel for the current worker process
+
+    The pool is shared by all requests handled by the process, so the number of write threads per process is bounded
+    by CUTOUT_WRITE_THREADS regardless of the number of concurrent requests.
+
+    Returns:
+        (concurrent.futures.ThreadPoolExecutor)
+    """
+    return _get_executor('write', settings.CUTOUT_WRITE_THREADS)
+
+
+def get_write_job_executor():
+    """Method to get the thread pool that applies asynchronous write jobs for the current worker process
+
+    At most CUTOUT_ASYNC_WORKERS jobs are applied at once per process. Later jobs wait in the pool's queue.
+
+    Returns:
+        (concurrent.futures.ThreadPoolExecutor)
+    """
+    return _get_executor('write_job', settings.CUTOUT_ASYNC_WORKERS)
+
+
+def get_prefetch_executor():
+    """Method to get the thread pool that pages in predicted regions for the current worker process
+
+    Returns:
+        (concurrent.futures.ThreadPoolExecutor)
+    """
+    return _get_executor('prefetch', settings.PREFETCH_THREADS)
+
+
+def get_prerender_executor():
+    """Method to get the thread pool that pre-renders tiles for the current worker process
+
+    At most TILE_PRERENDER_WORKERS jobs are rendered at once per process. Later jobs wait in the pool's queue.
+
+    Returns:
+        (concurrent.futures.ThreadPoolExecutor)
+    """
+    return _get_executor('prerender', settings.TILE_PRERENDER_WORKERS)
+
+
+def get_tile_render_executor():
+    """Method to get the thread pool that encodes the tiles of batch tile requests for the current worker process
+
+    Returns:
+        (concurrent.futures.ThreadPoolExecutor)
+    """
+    return _get_executor('tile_render', settings.TILE_BATCH_RENDER_THREADS)
+
+
+if postfork:
+    postfork(reset_spatialdb_pool)
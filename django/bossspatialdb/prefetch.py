@@ -0,0 +1,359 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Read-ahead for viewers that scroll through z or pan in xy. The direction a user is moving through a channel is
+# tracked from consecutive reads, and the next layer of cuboids in that direction is paged into the cache in the
+# background.
+
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+
+from bossutils.logger import BossLogger
+
+from .pool import get_prefetch_executor, get_spatialdb
+
+PREFETCH_PREFIX = "PREFETCH"
+
+# Counters kept in the cache for all workers
+STAT_NAMES = ("hits", "misses", "issued", "skipped")
+
+_lock = threading.Lock()
+_inflight = {'pid': None, 'count': 0}
+
+
+def get_stat_key(name):
+    """Method to get the key of a prefetch counter
+
+    Args:
+        name (str): One of STAT_NAMES
+
+    Returns:
+        (str)
+    """
+    return "{}&STATS&{}".format(PREFETCH_PREFIX, name)
+
+
+def count(name):
+    """Method to increment a prefetch counter
+
+    Args:
+        name (str): One of STAT_NAMES
+
+    Returns:
+        None
+    """
+    cache = caches[settings.PREFETCH_CACHE_ALIAS]
+    key = get_stat_key(name)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The counter was evicted between add and incr
+        pass
+
+
+def get_prefetch_stats():
+    """Method to get the prefetch counters of all workers
+
+    A hit is a read that touched the cuboids predicted from the reads before it, and a miss is a read that did not.
+
+    Returns:
+        (dict): Counter names mapped to values
+    """
+    cache = caches[settings.PREFETCH_CACHE_ALIAS]
+    values = cache.get_many([get_stat_key(name) for name in STAT_NAMES])
+    return {name: values.get(get_stat_key(name), 0) for name in STAT_NAMES}
+
+
+def get_cuboid_range(corner, extent, cuboid_size):
+    """Method to get the range of cuboid indices touched by a region
+
+    Args:
+        corner ((int, int, int)): x, y, z corner of the region
+        extent ((int, int, int)): x, y, z extent of the region
+        cuboid_size ((int, int, int)): x, y, z size of a cuboid
+
+    Returns:
+        ((int, int, int), (int, int, int)): First and last (inclusive) x, y, z cuboid index
+    """
+    return (tuple(corner[d] // cuboid_size[d] for d in range(3)),
+            tuple((corner[d] + extent[d] - 1) // cuboid_size[d] for d in range(3)))
+
+
+def ranges_overlap(first, second):
+    """Method to check if two cuboid ranges share a cuboid
+
+    Args:
+        first (((int, int, int), (int, int, int))): First and last cuboid index of a range
+        second (((int, int, int), (int, int, int))): First and last cuboid index of a range
+
+    Returns:
+        bool
+    """
+    return all(first[0][d] <= second[1][d] and second[0][d] <= first[1][d] for d in range(3))
+
+
+def range_contains(outer, inner):
+    """Method to check if a cuboid range contains another
+
+    Args:
+        outer (((int, int, int), (int, int, int))): First and last cuboid index of a range
+        inner (((int, int, int), (int, int, int))): First and last cuboid index of a range
+
+    Returns:
+        bool
+    """
+    return all(outer[0][d] <= inner[0][d] and inner[1][d] <= outer[1][d] for d in range(3))
+
+
+def predict_next(previous, corner, extent, cuboid_size, image_size):
+    """Method to predict the next layer of cuboids a user will read from the direction of their last two reads
+
+    Reads are only considered sequential if they have the same extent and are adjacent or overlapping. The predicted
+    region is the layer of cuboids just past the current region in every dimension that moved, over the same range
+    of the other dimensions, clipped to the channel's extent.
+
+    Args:
+        previous ((int, int, int)): x, y, z corner of the previous read
+        corner ((int, int, int)): x, y, z corner of the current read
+        extent ((int, int, int)): x, y, z extent of both reads
+        cuboid_size ((int, int, int)): x, y, z size of a cuboid
+        image_size ((int, int, int)): x, y, z size of the channel at the resolution being read
+
+    Returns:
+        ((int, int, int), (int, int, int))|None: x, y, z corner and extent of the predicted region, or None if the
+            reads are not sequential or the region is past the edge of the channel
+    """
+    delta = [corner[d] - previous[d] for d in range(3)]
+    if not any(delta) or any(abs(delta[d]) > extent[d] for d in range(3)):
+        return None
+
+    start = []
+    stop = []
+    for d in range(3):
+        if delta[d] > 0:
+            first = ((corner[d] + extent[d] - 1) // cuboid_size[d] + 1) * cuboid_size[d]
+            start.append(first)
+            stop.append(first + cuboid_size[d])
+        elif delta[d] < 0:
+            last = (corner[d] // cuboid_size[d]) * cuboid_size[d]
+            start.append(last - cuboid_size[d])
+            stop.append(last)
+        else:
+            start.append(corner[d])
+            stop.append(corner[d] + extent[d])
+
+    start = [max(0, start[d]) for d in range(3)]
+    stop = [min(image_size[d], stop[d]) for d in range(3)]
+    if any(stop[d] <= start[d] for d in range(3)):
+        return None
+    return tuple(start), tuple(stop[d] - start[d] for d in range(3))
+
+
+def reserve_slot():
+    """Method to reserve one of the PREFETCH_MAX_INFLIGHT prefetch slots of this worker process
+
+    Returns:
+        bool: True if a slot was reserved
+    """
+    with _lock:
+        if _inflight['pid'] != os.getpid():
+            # Prefetches of a parent process do not run in a forked child
+            _inflight['pid'] = os.getpid()
+            _inflight['count'] = 0
+        if _inflight['count'] >= settings.PREFETCH_MAX_INFLIGHT:
+            return False
+        _inflight['count'] += 1
+        return True
+
+
+def release_slot():
+    """Method to release a prefetch slot of this worker process
+
+    Returns:
+        None
+    """
+    with _lock:
+        _inflight['count'] = max(0, _inflight['count'] - 1)
+
+
+def page_in(resource, corner, extent, resolution, time_range, iso):
+    """Method to read a region through the spatialdb so its cuboids are paged into the cache
+
+    Runs on the prefetch thread pool. The data read is discarded.
+
+    Args:
+        resource (spdb.project.BossResource): Resource for the channel
+        corner ((int, int, int)): x, y, z corner of the region
+        extent ((int, int, int)): x, y, z extent of the region
+        resolution (int): Resolution level
+        time_range ([int, int]): Start and stop time samples
+        iso (bool): Flag indicating if the isotropic version of the channel is being read
+
+    Returns:
+        None
+    """
+    try:
+        get_spatialdb().cutout(resource, corner, extent, resolution, time_range, iso=iso)
+    except Exception:
+        BossLogger().logger.exception("Prefetch of {} {} {} failed".format(resource.get_lookup_key(), corner, extent))
+    finally:
+        release_slot()
+        # Prefetches run outside of the request cycle, so the thread's database connection is not closed by Django
+        connection.close()
+
+
+class Prefetcher:
+    """
+    Class to follow the reads of one user through one channel and resolution and page in the region read next
+
+    The corner, extent and time range of the last read and the last prediction are kept in the PREFETCH_CACHE_ALIAS
+    cache, so the direction is tracked across workers. Prefetches are rate limited per user to PREFETCH_USER_RATE
+    per second and per worker process to PREFETCH_MAX_INFLIGHT at once, and regions over PREFETCH_MAX_SIZE bytes are
+    never prefetched.
+    """
+
+    def __init__(self, user, resource, resolution, iso=False):
+        """
+
+        Args:
+            user (django.contrib.auth.models.User): User making the request
+            resource (spdb.project.BossResource): Resource for the channel being read
+            resolution (int): Resolution level
+            iso (bool): Flag indicating if the isotropic version of the channel is being read
+        """
+        self.user = user
+        self.resource = resource
+        self.resolution = resolution
+        self.iso = iso
+        self.cache = caches[settings.PREFETCH_CACHE_ALIAS]
+
+    def get_key(self):
+        """Method to get the key of the access history of this user, channel and resolution
+
+        Returns:
+            (str)
+        """
+        return "{}&{}&{}&{}&{}".format(PREFETCH_PREFIX, self.user.username, self.resource.get_lookup_key(),
+                                       self.resolution, "iso" if self.iso else "aniso")
+
+    def is_rate_limited(self):
+        """Method to count a prefetch against the user's rate limit
+
+        Returns:
+            bool: True if the user has already issued PREFETCH_USER_RATE prefetches in the current second
+        """
+        key = "{}&RATE&{}&{}".format(PREFETCH_PREFIX, self.user.username, int(time.time()))
+        self.cache.add(key, 0, timeout=2)
+        try:
+            return self.cache.incr(key) > settings.PREFETCH_USER_RATE
+        except ValueError:
+            return False
+
+    def observe(self, corner, extent, time_range):
+        """Method to record a read and, if it continues a sequential scan, page in the region predicted to be next
+
+        The pending prediction is scored once a read leaves the cuboids of the read before it: a hit if the read
+        touches the predicted cuboids and a miss otherwise. A prediction replaced before it was scored is also a miss.
+        A prediction is only issued once, so scrolling through the slices of a single cuboid does not repeat it.
+
+        Args:
+            corner ((int, int, int)): x, y, z corner of the read
+            extent ((int, int, int)): x, y, z extent of the read
+            time_range ([int, int]): Start and stop time samples of the read
+
+        Returns:
+            ((int, int, int), (int, int, int))|None: x, y, z corner and extent of the region being prefetched
+        """
+        cuboid_size = CUBOIDSIZE[self.resolution]
+        touched = get_cuboid_range(corner, extent, cuboid_size)
+        key = self.get_key()
+        history = self.cache.get(key)
+
+        # Score the pending prediction against the region actually read
+        pending = history["pending"] if history else None
+        if pending is not None:
+            if ranges_overlap(pending, touched):
+                count("hits")
+                pending = None
+            elif not range_contains(history["touched"], touched):
+                count("misses")
+                pending = None
+
+        predicted = None
+        if history and tuple(history["extent"]) == tuple(extent) and list(history["time_range"]) == list(time_range):
+            image_size = self.resource.get_downsampled_extent_dims(iso=self.iso)[self.resolution]
+            predicted = predict_next(history["corner"], corner, extent, cuboid_size, image_size)
+
+        if predicted is not None and get_cuboid_range(predicted[0], predicted[1], cuboid_size) == pending:
+            # Already prefetched
+            predicted = None
+
+        if predicted is not None:
+            num_bytes = (predicted[1][0] * predicted[1][1] * predicted[1][2] * (time_range[1] - time_range[0]) *
+                         self.resource.get_bit_depth() // 8)
+            if num_bytes > settings.PREFETCH_MAX_SIZE or self.is_rate_limited() or not reserve_slot():
+                count("skipped")
+                predicted = None
+
+        if predicted is not None:
+            try:
+                get_prefetch_executor().submit(page_in, self.resource, predicted[0], predicted[1], self.resolution,
+                                               list(time_range), self.iso)
+                count("issued")
+                if pending is not None:
+                    # The direction changed before the last prediction was read
+                    count("misses")
+                pending = get_cuboid_range(predicted[0], predicted[1], cuboid_size)
+            except RuntimeError:
+                # The pool is shutting down
+                release_slot()
+                predicted = None
+
+        self.cache.set(key, {"corner": tuple(corner),
+                             "extent": tuple(extent),
+                             "time_range": list(time_range),
+                             "touched": touched,
+                             "pending": pending},
+                       timeout=settings.PREFETCH_HISTORY_TIMEOUT)
+        return predicted
+
+
+def prefetch_next(request, resource, resolution, corner, extent, time_range, iso=False):
+    """Method to record a read of a channel and page in the region the user is predicted to read next
+
+    Does nothing unless PREFETCH_ENABLED is set.
+
+    Args:
+        request (rest_framework.request.Request): DRF Request object
+        resource (spdb.project.BossResource): Resource for the channel being read
+        resolution (int): Resolution level
+        corner ((int, int, int)): x, y, z corner of the read
+        extent ((int, int, int)): x, y, z extent of the read
+        time_range ([int, int]): Start and stop time samples of the read
+        iso (bool): Flag indicating if the isotropic version of the channel is being read
+
+    Returns:
+        ((int, int, int), (int, int, int))|None: x, y, z corner and extent of the region being prefetched
+    """
+    if not settings.PREFETCH_ENABLED:
+        return None
+    return Prefetcher(request.user, resource, resolution, iso).observe(corner, extent, time_range)
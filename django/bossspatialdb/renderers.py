@@ -14,14 +14,34 @@
 
 from rest_framework import renderers
 from rest_framework.renderers import JSONRenderer
-import blosc
 import numpy as np
-import zlib
 import io
 from PIL import Image
 
 from bosscore.renderer_helper import check_for_403
 
+from .compression import BloscOptions, NPY_MEDIA_TYPES, RAW_MEDIA_TYPE, is_codec_available, iter_npy_stream
+from .compression import set_raw_headers
+from .segmentation import encode_compressed_segmentation
+
+
+def get_blosc_options(renderer_context):
+    """Method to get the blosc options negotiated by the view, falling back to the deployment defaults
+
+    Args:
+        renderer_context (dict): DRF renderer context
+
+    Returns:
+        (bossspatialdb.compression.BloscOptions)
+    """
+    options = None
+    if renderer_context and 'view' in renderer_context:
+        options = getattr(renderer_context['view'], 'blosc_options', None)
+    if options is None:
+        options = BloscOptions.from_settings()
+    return options
+
+
 class BloscPythonRenderer(renderers.BaseRenderer):
     """ A DRF renderer for a blosc encoded cube of data using the numpy interface
 
@@ -39,10 +59,11 @@ class BloscPythonRenderer(renderers.BaseRenderer):
             data["data"].data = np.ascontiguousarray(data["data"].data, dtype=data["data"].data.dtype)
 
         # Return data, squeezing time dimension if only a single point
+        options = get_blosc_options(renderer_context)
         if data["time_request"]:
-            return blosc.pack_array(data["data"].data)
+            return options.pack_array(data["data"].data)
         else:
-            return blosc.pack_array(np.squeeze(data["data"].data, axis=(0,)))
+            return options.pack_array(np.squeeze(data["data"].data, axis=(0,)))
 
 
 class BloscRenderer(renderers.BaseRenderer):
@@ -70,17 +91,21 @@ class BloscRenderer(renderers.BaseRenderer):
             data["data"].data = np.ascontiguousarray(data["data"].data, dtype=data["data"].data.dtype)
 
         # Return data, squeezing time dimension if only a single point
+        options = get_blosc_options(renderer_context)
         if data["time_request"]:
-            return blosc.compress(data["data"].data, typesize=renderer_context['view'].bit_depth)
+            return options.compress(data["data"].data, typesize=renderer_context['view'].bit_depth)
         else:
-            return blosc.compress(np.squeeze(data["data"].data, axis=(0,)),
-                                  typesize=renderer_context['view'].bit_depth)
+            return options.compress(np.squeeze(data["data"].data, axis=(0,)),
+                                    typesize=renderer_context['view'].bit_depth)
 
 
 class NpygzRenderer(renderers.BaseRenderer):
     """ A DRF renderer for a gzip compressed npy encoded cube of data, following a similar method as ndstore for
     compatibility with existing tools
 
+    The npy header and the cube's buffer are fed through a single compressor, so the only full size copy made is the
+    compressed output. Subclasses use the same encoding with a different codec.
+
     """
     media_type = 'application/npygz'
     format = 'bin'
@@ -90,24 +115,105 @@ class NpygzRenderer(renderers.BaseRenderer):
     @check_for_403
     def render(self, data, media_type=None, renderer_context=None):
 
-        if not data["data"].data.flags['C_CONTIGUOUS']:
-            data["data"].data = np.ascontiguousarray(data["data"].data, dtype=data["data"].data.dtype)
+        # Return data, squeezing time dimension if only a single point
+        cube = data["data"].data
+        if not data["time_request"]:
+            cube = cube[0]
+
+        return b"".join(iter_npy_stream([cube], cube.dtype, cube.shape, NPY_MEDIA_TYPES[self.media_type]))
+
+
+class NpyZstdRenderer(NpygzRenderer):
+    """ A DRF renderer for a zstd compressed npy encoded cube of data
+
+    """
+    media_type = 'application/npy-zstd'
+
+
+class NpyLz4Renderer(NpygzRenderer):
+    """ A DRF renderer for an lz4 frame compressed npy encoded cube of data
+
+    """
+    media_type = 'application/npy-lz4'
+
+
+def get_npy_renderers():
+    """Method to get the npy renderers whose codec library is installed
+
+    Returns:
+        (tuple)
+    """
+    return tuple(renderer for renderer in (NpygzRenderer, NpyZstdRenderer, NpyLz4Renderer)
+                 if is_codec_available(NPY_MEDIA_TYPES[renderer.media_type]))
+
+
+class OctetStreamRenderer(renderers.BaseRenderer):
+    """ A DRF renderer for an uncompressed cube of data, described by the X-Boss-Dtype and X-Boss-Shape headers
+
+    Intended for clients in the same datacenter that are limited by decompression rather than the network. The cutout
+    view streams the cube's own buffer instead of rendering it, so this is only used when a Response must be rendered.
+
+    """
+    media_type = RAW_MEDIA_TYPE
+    format = 'raw'
+    charset = None
+    render_style = 'binary'
+
+    @check_for_403
+    def render(self, data, media_type=None, renderer_context=None):
 
         # Return data, squeezing time dimension if only a single point
+        cube = data["data"].data
         if not data["time_request"]:
-            data["data"].data = np.squeeze(data["data"].data, axis=(0,))
+            cube = cube[0]
 
-        # Save Data to npy
-        npy_file = io.BytesIO()
-        np.save(npy_file, data["data"].data, allow_pickle=False)
+        set_raw_headers(renderer_context['response'], cube.dtype, cube.shape)
+        return cube.tobytes()
 
-        # Compress npy
-        npy_gz = zlib.compress(npy_file.getvalue())
 
-        # Send file
-        npy_gz_file = io.BytesIO(npy_gz)
-        npy_gz_file.seek(0)
-        return npy_gz_file.read()
+class CompressedSegmentationRenderer(renderers.BaseRenderer):
+    """ A DRF renderer for a uint64 cube of data encoded in the neuroglancer compressed_segmentation format, using
+    8x8x8 blocks. Time samples of a 4D cutout are encoded as channels.
+
+    """
+    media_type = 'application/compressed-segmentation'
+    format = 'bin'
+    charset = None
+    render_style = 'binary'
+
+    @check_for_403
+    def render(self, data, media_type=None, renderer_context=None):
+
+        if renderer_context['view'].bit_depth != 64:
+            # This renderer only works on uint64 annotation data
+            renderer_context["response"].status_code = 400
+            renderer_context['response']['Content-Type'] = 'application/json'
+            renderer_context["accepted_media_type"] = 'application/json'
+            self.media_type = 'application/json'
+            self.format = 'json'
+            err_msg = {"status": 400, "message": "The cutout service compressed segmentation interface only "
+                                                 "supports uint64 annotation data",
+                       "code": 2001}
+            jr = JSONRenderer()
+            return jr.render(err_msg, 'application/json', renderer_context)
+
+        # Return data, squeezing time dimension if only a single point
+        if data["time_request"]:
+            cube = data["data"].data
+        else:
+            cube = data["data"].data[0]
+
+        try:
+            return encode_compressed_segmentation(cube)
+        except ValueError as err:
+            renderer_context["response"].status_code = 413
+            renderer_context['response']['Content-Type'] = 'application/json'
+            renderer_context["accepted_media_type"] = 'application/json'
+            self.media_type = 'application/json'
+            self.format = 'json'
+            err_msg = {"status": 413, "message": str(err), "code": 2000}
+            jr = JSONRenderer()
+            return jr.render(err_msg, 'application/json', renderer_context)
 
 
 class JpegRenderer(renderers.BaseRenderer):
@@ -0,0 +1,100 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from .etag import get_cutout_tag
+
+RESPONSE_CACHE_PREFIX = "CUTOUT-RESPONSE"
+
+
+class CutoutResponseCache:
+    """
+    Class to cache the final rendered bytes of a cutout response
+
+    Entries are keyed by the region, the negotiated media type and the write versions of every cuboid in the region,
+    so a write to an overlapping region makes existing entries unreachable. Unreachable entries age out through the
+    cache timeout (and LRU eviction in the redis backend). Responses larger than CUTOUT_CACHE_MAX_ENTRY_SIZE are
+    never stored.
+    """
+
+    def __init__(self, req, media_type, iso=False, encoding=None, tag=None):
+        """
+
+        Args:
+            req (bosscore.request.BossRequest): Validated cutout request
+            media_type (str): Full accepted media type, including any parameters
+            iso (bool): Flag indicating if the isotropic version of the channel is being read
+            encoding (str): Optional key of any other options that change the rendered bytes
+            tag (str): Tag from bossspatialdb.etag.get_cutout_tag if already computed for the request
+        """
+        self.media_type = media_type
+        self.cache = caches[settings.CUTOUT_CACHE_ALIAS]
+
+        if tag is None:
+            tag = get_cutout_tag(req, media_type, iso=iso, encoding=encoding)
+        self.tag = tag
+        self.key = "{}&{}".format(RESPONSE_CACHE_PREFIX, tag)
+
+    @staticmethod
+    def is_enabled():
+        """Method to check if the response cache is enabled
+
+        Returns:
+            bool
+        """
+        return settings.CUTOUT_CACHE_ENABLED
+
+    def get(self):
+        """Method to get a cached response
+
+        Returns:
+            (django.http.HttpResponse): The cached response or None on a miss
+        """
+        content = self.cache.get(self.key)
+        if content is None:
+            return None
+        return HttpResponse(content, content_type=self.media_type.split(";")[0].strip())
+
+    def store_on_render(self, response):
+        """Method to store a DRF response in the cache once it has been rendered
+
+        Args:
+            response (rest_framework.response.Response): Response returned by the view
+
+        Returns:
+            (rest_framework.response.Response): The same response
+        """
+        response.add_post_render_callback(self._store)
+        return response
+
+    def _store(self, response):
+        """Post render callback that stores successfully rendered binary content
+
+        Args:
+            response (rest_framework.response.Response): Rendered response
+
+        Returns:
+            None
+        """
+        if response.status_code != 200:
+            return
+        if not response['Content-Type'].startswith(self.media_type.split(";")[0].strip()):
+            # Renderer fell back to an error message
+            return
+        if len(response.content) > settings.CUTOUT_CACHE_MAX_ENTRY_SIZE:
+            return
+        self.cache.set(self.key, response.content, timeout=settings.CUTOUT_CACHE_TIMEOUT)
@@ -0,0 +1,304 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Encoder and decoder for the neuroglancer compressed_segmentation format
+#
+# The volume is split into blocks. Each block stores a lookup table of the distinct labels it contains and, for every
+# voxel, a bit-packed index into that table. All values are little endian uint32 words:
+#
+#   [channel offsets (1 word per channel)]
+#   per channel:
+#     [block headers (2 words per block)] [lookup tables] [encoded values]
+#
+# Word 0 of a block header holds the lookup table offset in its low 24 bits and the number of bits per index in its
+# high 8 bits. Word 1 holds the encoded values offset. Block offsets are relative to the start of the channel and
+# channel offsets are relative to the start of the buffer. Blocks are ordered x fastest, as are the voxels in a block.
+# Partial blocks at the edge of the volume are padded with edge values so the padding never adds a label.
+#
+# Time samples of a 4D (t, z, y, x) cutout are encoded as channels.
+
+import numpy as np
+
+# x, y, z size of a block
+BLOCK_SIZE = (8, 8, 8)
+BLOCK_VOXELS = BLOCK_SIZE[0] * BLOCK_SIZE[1] * BLOCK_SIZE[2]
+
+# Allowed number of bits per encoded index
+ENCODED_BITS = np.array([0, 1, 2, 4, 8, 16, 32], dtype=np.uint32)
+
+# The lookup table offset is stored in 24 bits
+MAX_TABLE_OFFSET = 2 ** 24 - 1
+
+
+def get_encoded_bits(num_values):
+    """Method to get the number of bits used to encode indices into lookup tables of the given sizes
+
+    Args:
+        num_values (numpy.ndarray): Number of distinct values in each block
+
+    Returns:
+        (numpy.ndarray): Bits per index for each block
+    """
+    capacity = 2 ** ENCODED_BITS.astype(np.int64)
+    return ENCODED_BITS[np.searchsorted(capacity, num_values)]
+
+
+def get_grid_size(shape):
+    """Method to get the number of blocks needed to cover a volume
+
+    Args:
+        shape ((int, int, int)): z, y, x shape of the volume
+
+    Returns:
+        ((int, int, int)): Number of blocks in z, y, x
+    """
+    return tuple(-(-shape[i] // BLOCK_SIZE[2 - i]) for i in range(3))
+
+
+def get_max_encoded_size(shape):
+    """Method to get the largest valid encoding of a volume
+
+    Every block is counted with a full lookup table and indices of the largest allowed width.
+
+    Args:
+        shape (tuple): 3D (z, y, x) or 4D (t, z, y, x) shape of the data
+
+    Returns:
+        (int): Number of bytes
+    """
+    num_channels = shape[0] if len(shape) == 4 else 1
+    num_blocks = int(np.prod(get_grid_size(shape[-3:])))
+    block_words = 2 + 2 * BLOCK_VOXELS + BLOCK_VOXELS * int(ENCODED_BITS[-1]) // 32
+    return 4 * num_channels * (1 + num_blocks * block_words)
+
+
+def encode_blocks(blocks):
+    """Method to build the lookup tables and bit-packed indices for a set of blocks
+
+    Args:
+        blocks (numpy.ndarray): (n, BLOCK_VOXELS) uint64 matrix. Each row is a block in x fastest order.
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray): Number of distinct values in each block, bits per
+        index of each block, the lookup tables of all blocks concatenated (uint64), and the encoded values of all
+        blocks concatenated (uint32)
+    """
+    rows = np.arange(blocks.shape[0])[:, None]
+
+    # Sort each block so distinct values can be found in one pass
+    order = np.argsort(blocks, axis=1, kind='mergesort')
+    sorted_blocks = blocks[rows, order]
+    first = np.ones(blocks.shape, dtype=bool)
+    first[:, 1:] = sorted_blocks[:, 1:] != sorted_blocks[:, :-1]
+
+    # Index of each voxel's value in its block's lookup table
+    indices = np.empty(blocks.shape, dtype=np.uint32)
+    indices[rows, order] = np.cumsum(first, axis=1) - 1
+
+    counts = first.sum(axis=1)
+    tables = sorted_blocks[first]
+    bits = get_encoded_bits(counts)
+
+    # Pack indices into 32 bit words, one group of blocks with the same number of bits at a time
+    num_words = BLOCK_VOXELS * bits.astype(np.int64) // 32
+    offsets = np.cumsum(num_words) - num_words
+    values = np.empty(num_words.sum(), dtype=np.uint32)
+    for b in np.unique(bits):
+        if b == 0:
+            continue
+        selected = bits == b
+        per_word = 32 // int(b)
+        shifts = (np.arange(per_word) * b).astype(np.uint32)
+        packed = indices[selected].reshape(-1, BLOCK_VOXELS // per_word, per_word) << shifts
+        packed = np.bitwise_or.reduce(packed, axis=2)
+        values[offsets[selected][:, None] + np.arange(packed.shape[1])] = packed
+
+    return counts, bits, tables, values
+
+
+def iter_layers(data):
+    """Generator that splits a volume into z-layers of blocks
+
+    Args:
+        data (numpy.ndarray): 3D (z, y, x) matrix
+
+    Yields:
+        (numpy.ndarray): (gy * gx, BLOCK_VOXELS) matrix of the blocks in the layer, x fastest
+    """
+    gz, gy, gx = get_grid_size(data.shape)
+    bx, by, bz = BLOCK_SIZE
+    for k in range(gz):
+        layer = data[k * bz:(k + 1) * bz]
+        pad = [(0, bz - layer.shape[0]), (0, gy * by - layer.shape[1]), (0, gx * bx - layer.shape[2])]
+        if any(p[1] for p in pad):
+            layer = np.pad(layer, pad, mode='edge')
+        layer = layer.reshape(bz, gy, by, gx, bx).transpose(1, 3, 0, 2, 4)
+        yield layer.reshape(gy * gx, BLOCK_VOXELS)
+
+
+def encode_channel(data):
+    """Method to encode a single 3D volume
+
+    The volume is encoded one z-layer of blocks at a time to bound the size of the intermediate arrays.
+
+    Args:
+        data (numpy.ndarray): 3D (z, y, x) uint64 matrix
+
+    Returns:
+        (numpy.ndarray): Encoded channel as uint32 words
+
+    Raises:
+        (ValueError): If the lookup tables are too large to be addressed
+    """
+    counts, bits, tables, values = zip(*[encode_blocks(blocks) for blocks in iter_layers(data)])
+    counts = np.concatenate(counts).astype(np.int64)
+    bits = np.concatenate(bits)
+    num_blocks = counts.shape[0]
+
+    # Lookup tables are stored before the encoded values so their offsets stay small
+    table_words = 2 * counts
+    table_offsets = 2 * num_blocks + np.cumsum(table_words) - table_words
+    if table_offsets[-1] > MAX_TABLE_OFFSET:
+        raise ValueError("Too many distinct values to encode. Reduce cutout dimensions.")
+
+    value_words = BLOCK_VOXELS * bits.astype(np.int64) // 32
+    value_offsets = 2 * num_blocks + table_words.sum() + np.cumsum(value_words) - value_words
+
+    header = np.empty((num_blocks, 2), dtype=np.uint32)
+    header[:, 0] = table_offsets.astype(np.uint32) | (bits << np.uint32(24))
+    header[:, 1] = value_offsets
+
+    tables = np.concatenate(tables).astype('<u8').view('<u4')
+    return np.concatenate([header.ravel(), tables, np.concatenate(values)])
+
+
+def encode_compressed_segmentation(data):
+    """Method to encode a uint64 cutout in the compressed_segmentation format
+
+    Args:
+        data (numpy.ndarray): 3D (z, y, x) or 4D (t, z, y, x) uint64 matrix
+
+    Returns:
+        (bytes): Encoded data
+
+    Raises:
+        (ValueError): If the data cannot be encoded
+    """
+    channels = data if data.ndim == 4 else [data]
+    encoded = [encode_channel(np.asarray(channel, dtype=np.uint64)) for channel in channels]
+
+    sizes = np.array([len(channel) for channel in encoded], dtype=np.int64)
+    offsets = len(encoded) + np.cumsum(sizes) - sizes
+    return np.concatenate([offsets.astype('<u4')] + encoded).astype('<u4').tobytes()
+
+
+def decode_blocks(words, start, header):
+    """Method to decode a set of blocks of a channel
+
+    Args:
+        words (numpy.ndarray): The full encoded buffer as uint32 words
+        start (int): Word offset of the channel
+        header (numpy.ndarray): (n, 2) block headers of the blocks to decode
+
+    Returns:
+        (numpy.ndarray): (n, BLOCK_VOXELS) uint64 matrix
+    """
+    table_offsets = start + (header[:, 0] & 0xFFFFFF).astype(np.int64)
+    bits = header[:, 0] >> np.uint32(24)
+    value_offsets = start + header[:, 1].astype(np.int64)
+
+    indices = np.zeros((header.shape[0], BLOCK_VOXELS), dtype=np.int64)
+    for b in np.unique(bits):
+        if b not in ENCODED_BITS:
+            raise ValueError("Invalid number of encoded bits {}".format(b))
+        if b == 0:
+            continue
+        selected = bits == b
+        per_word = 32 // int(b)
+        shifts = (np.arange(per_word) * b).astype(np.uint32)
+        mask = np.uint32(2 ** int(b) - 1)
+        packed = words[value_offsets[selected][:, None] + np.arange(BLOCK_VOXELS // per_word)]
+        indices[selected] = ((packed[:, :, None] >> shifts) & mask).reshape(-1, BLOCK_VOXELS)
+
+    lookup = table_offsets[:, None] + 2 * indices
+    return words[lookup].astype(np.uint64) | (words[lookup + 1].astype(np.uint64) << np.uint64(32))
+
+
+def decode_channel(words, start, shape):
+    """Method to decode a single 3D volume
+
+    Args:
+        words (numpy.ndarray): The full encoded buffer as uint32 words
+        start (int): Word offset of the channel
+        shape ((int, int, int)): z, y, x shape of the volume
+
+    Returns:
+        (numpy.ndarray): 3D (z, y, x) uint64 matrix
+    """
+    gz, gy, gx = get_grid_size(shape)
+    bx, by, bz = BLOCK_SIZE
+    layer_blocks = gy * gx
+
+    header = words[start:start + 2 * gz * layer_blocks]
+    if len(header) != 2 * gz * layer_blocks:
+        raise ValueError("Truncated block headers")
+    header = header.reshape(-1, 2)
+
+    # The format does not store the shape, but encoders place block data directly after the block headers. If the
+    # first referenced word is anywhere else the number of blocks does not match the shape.
+    data_offsets = header[:, 0] & 0xFFFFFF
+    has_values = (header[:, 0] >> np.uint32(24)) > 0
+    if has_values.any():
+        data_offsets = np.concatenate([data_offsets, header[has_values, 1]])
+    if data_offsets.min() != 2 * gz * layer_blocks:
+        raise ValueError("Block headers do not match the shape")
+
+    data = np.empty(shape, dtype=np.uint64)
+    for k in range(gz):
+        blocks = decode_blocks(words, start, header[k * layer_blocks:(k + 1) * layer_blocks])
+        layer = blocks.reshape(gy, gx, bz, by, bx).transpose(2, 0, 3, 1, 4).reshape(bz, gy * by, gx * bx)
+        z_stop = min((k + 1) * bz, shape[0])
+        data[k * bz:z_stop] = layer[:z_stop - k * bz, :shape[1], :shape[2]]
+    return data
+
+
+def decode_compressed_segmentation(buffer, shape):
+    """Method to decode compressed_segmentation data
+
+    Args:
+        buffer (bytes-like): Encoded data
+        shape (tuple): 3D (z, y, x) or 4D (t, z, y, x) shape of the data
+
+    Returns:
+        (numpy.ndarray): uint64 matrix of the given shape
+
+    Raises:
+        (ValueError): If the data is malformed or does not match the shape
+    """
+    if len(buffer) % 4 != 0:
+        raise ValueError("Encoded data must be a whole number of 32 bit words")
+    words = np.frombuffer(buffer, dtype='<u4')
+
+    num_channels = shape[0] if len(shape) == 4 else 1
+    if len(words) < num_channels:
+        raise ValueError("Truncated channel offsets")
+
+    try:
+        channels = [decode_channel(words, int(words[c]), shape[-3:]) for c in range(num_channels)]
+    except IndexError:
+        raise ValueError("Offset out of range")
+
+    if len(shape) == 4:
+        return np.stack(channels)
+    return channels[0]
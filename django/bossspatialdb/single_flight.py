@@ -0,0 +1,204 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Coalescing of identical concurrent reads across workers. The first request for a response becomes the leader and
+# computes it. Identical requests that arrive while it is in flight wait for the leader's rendered bytes instead of
+# paging in and assembling the same region again.
+
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+SINGLE_FLIGHT_PREFIX = "SINGLE-FLIGHT"
+
+
+class SingleFlight:
+    """
+    Class to coordinate the requests for a single response
+
+    The leader holds a lock key in the SINGLE_FLIGHT_CACHE_ALIAS cache while it computes the response, and publishes
+    the rendered bytes to a result key once rendered. The lock expires after SINGLE_FLIGHT_LOCK_TIMEOUT seconds so a
+    killed leader never blocks a response for long. It is also closable so it can be released when the response has
+    been sent.
+    """
+
+    def __init__(self, tag):
+        """
+
+        Args:
+            tag (str): Tag identifying the response, including the write state of its region (see
+                bossspatialdb.etag)
+        """
+        self.cache = caches[settings.SINGLE_FLIGHT_CACHE_ALIAS]
+        self.lock_key = "{}&LOCK&{}".format(SINGLE_FLIGHT_PREFIX, tag)
+        self.result_key = "{}&RESULT&{}".format(SINGLE_FLIGHT_PREFIX, tag)
+        self.waiters_key = "{}&WAITERS&{}".format(SINGLE_FLIGHT_PREFIX, tag)
+        self.token = uuid.uuid4().hex
+        self.is_leader = False
+
+    def acquire(self):
+        """Method to try to become the leader for the response
+
+        Returns:
+            bool: True if this request is the leader and must compute the response
+        """
+        self.is_leader = self.cache.add(self.lock_key, self.token, timeout=settings.SINGLE_FLIGHT_LOCK_TIMEOUT)
+        return self.is_leader
+
+    def join(self):
+        """Method to count this request as waiting for the leader, if fewer than SINGLE_FLIGHT_MAX_WAITERS already are
+
+        Each waiting request holds a worker, so a hot response must not park every worker behind its leader.
+
+        Returns:
+            bool: True if this request may wait
+        """
+        self.cache.add(self.waiters_key, 0, timeout=settings.SINGLE_FLIGHT_LOCK_TIMEOUT)
+        try:
+            waiters = self.cache.incr(self.waiters_key)
+        except ValueError:
+            # The counter expired between add and incr
+            return False
+        if waiters > settings.SINGLE_FLIGHT_MAX_WAITERS:
+            self.leave()
+            return False
+        return True
+
+    def leave(self):
+        """Method to stop counting this request as waiting
+
+        Returns:
+            None
+        """
+        try:
+            self.cache.decr(self.waiters_key)
+        except ValueError:
+            # The counter already expired
+            pass
+
+    def wait(self):
+        """Method to wait for the leader's response
+
+        Returns when the result is published, or when the leader has released its lock without publishing (e.g. the
+        response was too large or failed), or after SINGLE_FLIGHT_WAIT_TIMEOUT seconds. Returns immediately if
+        SINGLE_FLIGHT_MAX_WAITERS requests are already waiting.
+
+        Returns:
+            (django.http.HttpResponse|None): The leader's response, or None if it must be computed
+        """
+        if not self.join():
+            return None
+
+        try:
+            deadline = time.time() + settings.SINGLE_FLIGHT_WAIT_TIMEOUT
+            while True:
+                result = self.cache.get(self.result_key)
+                if result is not None:
+                    content_type, content = result
+                    return HttpResponse(content, content_type=content_type)
+                if self.cache.get(self.lock_key) is None or time.time() > deadline:
+                    return None
+                time.sleep(settings.SINGLE_FLIGHT_POLL_INTERVAL)
+        finally:
+            self.leave()
+
+    def publish_on_render(self, response):
+        """Method to publish a DRF response to the waiting requests once it has been rendered
+
+        Args:
+            response (rest_framework.response.Response): Response returned by the view
+
+        Returns:
+            (rest_framework.response.Response): The same response
+        """
+        response.add_post_render_callback(self._publish)
+        return response
+
+    def _publish(self, response):
+        """Post render callback that publishes successfully rendered content
+
+        Args:
+            response (rest_framework.response.Response): Rendered response
+
+        Returns:
+            None
+        """
+        if response.status_code != 200 or len(response.content) > settings.SINGLE_FLIGHT_MAX_RESULT_SIZE:
+            return
+        self.cache.set(self.result_key, (response['Content-Type'], response.content),
+                       timeout=settings.SINGLE_FLIGHT_RESULT_TIMEOUT)
+
+    def release(self):
+        """Method to release the lock if this request is the leader
+
+        Returns:
+            None
+        """
+        if not self.is_leader:
+            return
+        self.is_leader = False
+        if self.cache.get(self.lock_key) == self.token:
+            self.cache.delete(self.lock_key)
+
+    def close(self):
+        self.release()
+
+
+class SingleFlightMixin:
+    """
+    Mixin for APIViews that coalesce identical concurrent reads
+
+    Call `coalesce` once the tag of the response is known. If another request is already computing the response the
+    waiting request returns its result. Otherwise this request leads: its rendered response is published when the
+    view returns a Response, and the lock is released when the response has been sent or if the view raises.
+    """
+    flight = None
+
+    def coalesce(self, tag):
+        """Method to join the in-flight computation of a response
+
+        Args:
+            tag (str): Tag identifying the response
+
+        Returns:
+            (django.http.HttpResponse|None): The leader's response, or None if this request must compute it
+        """
+        if not settings.SINGLE_FLIGHT_ENABLED:
+            return None
+
+        flight = SingleFlight(tag)
+        if flight.acquire():
+            self.flight = flight
+            return None
+        return flight.wait()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.flight is not None:
+            if isinstance(response, Response):
+                self.flight.publish_on_render(response)
+            # Closed by the server once the response has been sent
+            response._closable_objects.append(self.flight)
+            self.flight = None
+        return response
+
+    def handle_exception(self, exc):
+        if self.flight is not None:
+            self.flight.release()
+            self.flight = None
+        return super().handle_exception(exc)
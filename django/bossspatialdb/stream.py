@@ -0,0 +1,208 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import struct
+
+import blosc
+import numpy as np
+
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+
+from .compression import iter_array_buffers, iter_npy_stream
+from .id_filter import IdFilter
+
+# Size of the blosc chunk header and offsets of the decompressed/compressed size fields within it
+BLOSC_HEADER_SIZE = 16
+BLOSC_NBYTES_OFFSET = 4
+BLOSC_CBYTES_OFFSET = 12
+
+
+def get_slab_ranges(z_start, z_stop, z_cuboid_size):
+    """Method to split a z range into cuboid aligned slabs
+
+    The first and last slab may be partial if the range is not cuboid aligned.
+
+    Args:
+        z_start (int): Start of the z range
+        z_stop (int): Stop of the z range (exclusive)
+        z_cuboid_size (int): Size of a cuboid in the z dimension at the requested resolution
+
+    Returns:
+        (list((int, int))): List of (start, stop) tuples covering the z range
+    """
+    slabs = []
+    start = z_start
+    while start < z_stop:
+        stop = min((start // z_cuboid_size + 1) * z_cuboid_size, z_stop)
+        slabs.append((start, stop))
+        start = stop
+    return slabs
+
+
+def get_blosc_nbytes(buffer):
+    """Method to get the decompressed size of a blosc chunk from its header
+
+    Args:
+        buffer (bytes-like): Blosc compressed chunk
+
+    Returns:
+        (int): Number of bytes the chunk decompresses to
+    """
+    if len(buffer) < BLOSC_HEADER_SIZE:
+        raise ValueError("Buffer is too small to contain a blosc header")
+    return struct.unpack_from("<I", buffer, BLOSC_NBYTES_OFFSET)[0]
+
+
+def get_blosc_cbytes(buffer):
+    """Method to get the compressed size of a blosc chunk, including its header, from its header
+
+    Args:
+        buffer (bytes-like): Blosc compressed chunk, or at least its header
+
+    Returns:
+        (int): Number of bytes in the compressed chunk
+    """
+    if len(buffer) < BLOSC_HEADER_SIZE:
+        raise ValueError("Buffer is too small to contain a blosc header")
+    return struct.unpack_from("<I", buffer, BLOSC_CBYTES_OFFSET)[0]
+
+
+def iter_blosc_frames(buffer):
+    """Generator to split a concatenated series of blosc chunks into individual decompressed frames
+
+    Each blosc chunk carries its compressed size in its header, so a streamed response is self-delimiting.
+
+    Args:
+        buffer (bytes): Concatenated blosc chunks
+
+    Yields:
+        (bytes): Decompressed bytes of each frame
+    """
+    offset = 0
+    while offset < len(buffer):
+        if len(buffer) - offset < BLOSC_HEADER_SIZE:
+            raise ValueError("Truncated blosc frame at offset {}".format(offset))
+        cbytes = get_blosc_cbytes(buffer[offset:offset + BLOSC_HEADER_SIZE])
+        yield blosc.decompress(bytes(buffer[offset:offset + cbytes]))
+        offset += cbytes
+
+
+class CutoutStream:
+    """
+    Class to read a cutout as a series of cuboid aligned z-slabs and encode each slab as it is read
+
+    Only a single slab is held in memory at a time so the peak memory of a streamed cutout is bounded by the slab
+    size instead of the full cube.
+    """
+
+    def __init__(self, cache, resource, corner, extent, resolution, time_range, time_request,
+                 filter_ids=None, iso=False, no_cache=False):
+        """
+
+        Args:
+            cache (spdb.spatialdb.SpatialDB): Interface to the spatialdb
+            resource (spdb.project.BossResource): Resource for the channel being read
+            corner ((int, int, int)): x, y, z corner of the cutout
+            extent ((int, int, int)): x, y, z extent of the cutout
+            resolution (int): Resolution level of the cutout
+            time_range ([int, int]): Start and stop (exclusive) time samples
+            time_request (bool): Flag indicating if the request contained a time range
+            filter_ids (numpy.ndarray): Optional list of ids to filter annotation cutouts on
+            iso (bool): Flag indicating if the isotropic version of the channel should be read
+            no_cache (bool): Flag indicating if the cache should be bypassed
+        """
+        self.cache = cache
+        self.resource = resource
+        self.corner = corner
+        self.extent = extent
+        self.resolution = resolution
+        self.time_range = time_range
+        self.time_request = time_request
+        self.filter_ids = filter_ids
+        self.iso = iso
+        self.no_cache = no_cache
+        self.z_cuboid_size = CUBOIDSIZE[resolution][2]
+        self.id_filter = IdFilter.create(resource, resolution, filter_ids, iso=iso)
+
+    def get_shape(self):
+        """Method to get the shape of the full cube, matching the non-streaming renderers
+
+        Returns:
+            (tuple): Shape of the data ([t,] z, y, x)
+        """
+        shape = (self.extent[2], self.extent[1], self.extent[0])
+        if self.time_request:
+            shape = (self.time_range[1] - self.time_range[0],) + shape
+        return shape
+
+    def slabs(self):
+        """Generator that reads the cutout one time sample and cuboid aligned z-slab at a time
+
+        Slabs are yielded in C-order of the full cube, so concatenating them reproduces the non-streamed data.
+
+        Yields:
+            (numpy.ndarray): 3D matrix (z, y, x) for a single time sample and slab
+        """
+        z_start = self.corner[2]
+        z_stop = self.corner[2] + self.extent[2]
+        for t in range(self.time_range[0], self.time_range[1]):
+            for slab_start, slab_stop in get_slab_ranges(z_start, z_stop, self.z_cuboid_size):
+                corner = (self.corner[0], self.corner[1], slab_start)
+                extent = (self.extent[0], self.extent[1], slab_stop - slab_start)
+                if self.id_filter:
+                    cube = self.id_filter.cutout(self.cache, corner, extent, [t, t + 1], iso=self.iso,
+                                                 no_cache=self.no_cache)
+                else:
+                    cube = self.cache.cutout(self.resource, corner, extent, self.resolution, [t, t + 1],
+                                             filter_ids=self.filter_ids, iso=self.iso, no_cache=self.no_cache)
+                yield np.ascontiguousarray(cube.data[0])
+
+    def blosc_frames(self, typesize, options=None):
+        """Generator that encodes each slab as an independent blosc chunk
+
+        Args:
+            typesize (int): Typesize to provide to blosc
+            options (bossspatialdb.compression.BloscOptions): Optional codec settings. Library defaults if omitted.
+
+        Yields:
+            (bytes): Blosc compressed slab
+        """
+        for slab in self.slabs():
+            if options:
+                yield options.compress(slab, typesize=typesize)
+            else:
+                yield blosc.compress(slab, typesize=typesize)
+
+    def raw_frames(self):
+        """Generator that sends the uncompressed buffer of each slab
+
+        Yields:
+            (memoryview): Bytes of a slab, in C order
+        """
+        for slab in self.slabs():
+            yield from iter_array_buffers(slab)
+
+    def npy_frames(self, dtype, codec='gzip'):
+        """Generator that encodes the cube as a single compressed npy file, flushing after each slab
+
+        The concatenated output is identical in format to the non-streamed npy responses.
+
+        Args:
+            dtype (numpy.dtype): Datatype of the channel
+            codec (str): One of gzip, zstd or lz4
+
+        Yields:
+            (bytes): Chunk of the compressed stream
+        """
+        return iter_npy_stream(self.slabs(), dtype, self.get_shape(), codec, sync_flush=True)
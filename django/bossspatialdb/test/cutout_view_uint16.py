@@ -20,6 +20,7 @@ from rest_framework.test import force_authenticate
 from rest_framework import status
 
 from bossspatialdb.views import Cutout
+from bossspatialdb.pool import reset_spatialdb_pool
 
 from bosscore.test.setup_db import SetupTestDB
 from bosscore.error import BossError
@@ -126,7 +127,8 @@ class CutoutInterfaceViewUint16TestMixin(object):
         # Make request
         response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel2',
                                     resolution='0', x_range='0:100', y_range='0:128', z_range='0:16', t_range=None)
-        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # The incompressible body is larger than the cutout in the URL can be, so it is rejected before it is read
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
 
     def test_channel_uint16_wrong_dimensions_numpy(self):
         """ Test posting with the wrong xyz dims using the numpy interface"""
@@ -526,6 +528,9 @@ class TestCutoutInterfaceView(CutoutInterfaceViewUint16TestMixin, APITestCase):
         Initialize the database
         :return:
         """
+        # Drop SpatialDB instances bound to the mocks of earlier tests
+        reset_spatialdb_pool()
+
         # Create a user
         dbsetup = SetupTestDB()
         self.user = dbsetup.create_user('testuser')
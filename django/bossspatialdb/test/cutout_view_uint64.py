@@ -13,6 +13,7 @@
 # limitations under the License.
 
 from django.conf import settings
+from django.core.cache import caches
 import blosc
 
 from rest_framework.test import APITestCase, APIRequestFactory
@@ -20,6 +21,8 @@ from rest_framework.test import force_authenticate
 from rest_framework import status
 
 from bossspatialdb.views import Cutout
+from bossspatialdb.segmentation import encode_compressed_segmentation, decode_compressed_segmentation
+from bossspatialdb.pool import reset_spatialdb_pool
 
 from bosscore.test.setup_db import SetupTestDB
 from bosscore.error import BossError
@@ -28,7 +31,7 @@ import numpy as np
 import zlib
 import io
 
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 from mockredis import mock_strict_redis_client
 
 import spdb
@@ -291,6 +294,99 @@ class CutoutInterfaceViewUint64TestMixin(object):
         np.testing.assert_array_equal(data_mat, test_mat)
         np.testing.assert_array_equal(np.unique(data_mat), np.arange(1, 2, dtype=np.uint64))
 
+    def test_channel_uint64_filter_by_id_unindexed_resolution(self):
+        """ Test that a filtered cutout above the indexed resolutions does not use the empty id index"""
+
+        test_mat = np.ones((4, 128, 128), dtype=np.uint64)
+        bb = blosc.compress(test_mat.tobytes(), typesize=64)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/layer1/1/128:256/256:384/16:20/', bb,
+                               content_type='application/blosc')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='layer1',
+                                    resolution='1', x_range='128:256', y_range='256:384', z_range='16:20', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Forget the write, as if the data had been written by another deployment or by downsampling
+        caches[settings.WRITE_VERSION_CACHE_ALIAS].clear()
+
+        # The id index only holds resolution 0, so it lists no cuboids here
+        index = MagicMock()
+        index.get_cuboids.return_value = []
+
+        # Create Request to get data you posted
+        request = factory.get('/' + version + '/cutout/col1/exp1/layer1/1/128:256/256:384/16:20/?filter=1',
+                              accepts='application/blosc')
+
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        with self.settings(CUTOUT_FILTER_INDEX_ENABLED=True, CUTOUT_FILTER_INDEX_DELAY=0), \
+                patch('bossspatialdb.id_filter.get_object_indices', return_value=index):
+            response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='layer1',
+                                        resolution='1', x_range='128:256', y_range='256:384', z_range='16:20',
+                                        t_range=None).render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        index.get_cuboids.assert_not_called()
+
+        # Decompress
+        raw_data = blosc.decompress(response.content)
+        data_mat = np.frombuffer(raw_data, dtype=np.uint64).reshape(4, 128, 128)
+        np.testing.assert_array_equal(data_mat, test_mat)
+
+    def test_channel_uint64_filter_by_id_index(self):
+        """ Test that a filtered cutout only reads the cuboids the id index lists for the ids"""
+
+        test_mat = np.ones((4, 64, 64), dtype=np.uint64)
+        bb = blosc.compress(test_mat.tobytes(), typesize=64)
+
+        # Create request spanning cuboids (0, 0, 0) and (1, 0, 0)
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/layer1/0/480:544/0:64/0:4/', bb,
+                               content_type='application/blosc')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='layer1',
+                                    resolution='0', x_range='480:544', y_range='0:64', z_range='0:4', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Forget the write, as if the data had been written by another deployment
+        caches[settings.WRITE_VERSION_CACHE_ALIAS].clear()
+
+        # The id index only lists cuboid (0, 0, 0)
+        index = MagicMock()
+        index.get_cuboids.return_value = [0]
+
+        # Create Request to get data you posted
+        request = factory.get('/' + version + '/cutout/col1/exp1/layer1/0/480:544/0:64/0:4/?filter=1',
+                              accepts='application/blosc')
+
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        with self.settings(CUTOUT_FILTER_INDEX_ENABLED=True, CUTOUT_FILTER_INDEX_DELAY=0), \
+                patch('bossspatialdb.id_filter.get_object_indices', return_value=index):
+            response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='layer1',
+                                        resolution='0', x_range='480:544', y_range='0:64', z_range='0:4',
+                                        t_range=None).render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        index.get_cuboids.assert_called_once()
+
+        # Only the indexed cuboid was read
+        raw_data = blosc.decompress(response.content)
+        data_mat = np.frombuffer(raw_data, dtype=np.uint64).reshape(4, 64, 64)
+        np.testing.assert_array_equal(data_mat[:, :, :32], test_mat[:, :, :32])
+        np.testing.assert_array_equal(data_mat[:, :, 32:], 0)
+
     def test_channel_uint64_filter_multiple_ids(self):
         """ Test filter_cutout by ids - multiple ids in the filter list"""
 
@@ -511,6 +607,61 @@ class CutoutInterfaceViewUint64TestMixin(object):
         # Test for data equality (what you put in is what you got back!)
         np.testing.assert_array_equal(data_mat, test_mat)
 
+    def test_channel_uint64_cuboid_unaligned_offset_time_compressed_segmentation(self):
+        """ Test uint64 data, not cuboid aligned, offset, time samples, compressed segmentation interface
+        """
+        test_mat = np.random.randint(1, 256, (2, 17, 300, 280))
+        test_mat = test_mat.astype(np.uint64)
+        bb = encode_compressed_segmentation(test_mat)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/layer1/0/100:380/450:750/20:37/0:2', bb,
+                               content_type='application/compressed-segmentation')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='layer1',
+                                    resolution='0', x_range='100:380', y_range='450:750', z_range='20:37', t_range='0:2')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Create Request to get data you posted
+        request = factory.get('/' + version + '/cutout/col1/exp1/layer1/0/100:380/450:750/20:37/0:2',
+                              HTTP_ACCEPT='application/compressed-segmentation')
+
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='layer1',
+                                    resolution='0', x_range='100:380', y_range='450:750', z_range='20:37', t_range='0:2').render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Decode
+        data_mat = decode_compressed_segmentation(response.content, (2, 17, 300, 280))
+
+        # Test for data equality (what you put in is what you got back!)
+        np.testing.assert_array_equal(data_mat, test_mat)
+
+    def test_channel_uint64_wrong_dimensions_compressed_segmentation(self):
+        """ Test posting compressed segmentation data that does not match the URL """
+        test_mat = np.random.randint(1, 256, (16, 128, 128))
+        test_mat = test_mat.astype(np.uint64)
+        bb = encode_compressed_segmentation(test_mat)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/layer1/0/0:100/0:128/0:16/', bb,
+                               content_type='application/compressed-segmentation')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='layer1',
+                                    resolution='0', x_range='0:100', y_range='0:128', z_range='0:16', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_channel_uint64_cuboid_aligned_no_offset_no_time_blosc_numpy(self):
         """ Test uint64 data, cuboid aligned, no offset, no time samples"""
 
@@ -907,6 +1058,9 @@ class TestCutoutInterfaceView(CutoutInterfaceViewUint64TestMixin, APITestCase):
         Initialize the database
         :return:
         """
+        # Drop SpatialDB instances bound to the mocks of earlier tests
+        reset_spatialdb_pool()
+
         # Create a user
         dbsetup = SetupTestDB()
         self.user = dbsetup.create_user('testuser')
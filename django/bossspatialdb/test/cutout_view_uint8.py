@@ -13,13 +13,18 @@
 # limitations under the License.
 
 from django.conf import settings
+from django.core.cache import caches
 import blosc
 
 from rest_framework.test import APITestCase, APIRequestFactory
 from rest_framework.test import force_authenticate
 from rest_framework import status
 
-from bossspatialdb.views import Cutout
+from bossspatialdb.views import Cutout, CutoutBatch
+from bossspatialdb.admission import Admission
+from bossspatialdb.stream import iter_blosc_frames
+from bossspatialdb.pool import reset_spatialdb_pool
+from bossspatialdb.prefetch import get_prefetch_stats, page_in, release_slot
 
 from bosscore.test.setup_db import SetupTestDB
 from bosscore.error import BossError
@@ -27,9 +32,15 @@ from bosscore.error import BossError
 import numpy as np
 import zlib
 import io
+import unittest
 from PIL import Image
 
-from unittest.mock import patch
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from unittest.mock import MagicMock, patch
 from mockredis import mock_strict_redis_client
 
 import spdb
@@ -159,7 +170,8 @@ class CutoutInterfaceViewUint8TestMixin(object):
         # Make request
         response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
                                     resolution='0', x_range='0:100', y_range='0:128', z_range='0:16', t_range=None)
-        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # The incompressible body is larger than the cutout in the URL can be, so it is rejected before it is read
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
 
     def test_channel_uint8_wrong_dimensions_numpy(self):
         """ Test posting with the wrong xyz dims using the numpy interface"""
@@ -180,6 +192,31 @@ class CutoutInterfaceViewUint8TestMixin(object):
                                     resolution='0', x_range='0:100', y_range='0:128', z_range='0:16', t_range=None)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_channel_uint8_wrong_dimensions_npygz(self):
+        """ Test posting with the wrong xyz dims using the npygz interface"""
+
+        test_mat = np.random.randint(1, 2 ** 16 - 1, (16, 128, 128))
+        test_mat = test_mat.astype(np.uint8)
+
+        # Save Data to npy
+        npy_file = io.BytesIO()
+        np.save(npy_file, test_mat, allow_pickle=False)
+
+        # Compress npy
+        npy_gz = zlib.compress(npy_file.getvalue())
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/0:100/0:128/0:16/', npy_gz,
+                               content_type='application/npygz')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='0:100', y_range='0:128', z_range='0:16', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_channel_uint8_get_too_big(self):
         """ Test getting a cutout that is over 1GB uncompressed"""
         # Create request
@@ -675,6 +712,103 @@ class CutoutInterfaceViewUint8TestMixin(object):
         # Test for data equality (what you put in is what you got back!)
         np.testing.assert_array_equal(data_mat, test_mat)
 
+    @unittest.skipUnless(zstandard, "zstandard is not installed")
+    def test_channel_uint8_notime_npy_zstd_download(self):
+        """ Test uint8 data, using the zstd compressed npy interface
+        """
+        test_mat = np.random.randint(1, 254, (17, 300, 500))
+        test_mat = test_mat.astype(np.uint8)
+        bb = blosc.pack_array(test_mat)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/20:37/', bb,
+                               content_type='application/blosc-python')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make POST data
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='20:37', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Create Request to get data you posted
+        request = factory.get('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/20:37',
+                              HTTP_ACCEPT='application/npy-zstd')
+
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request to GET data
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='20:37',
+                                    t_range=None).render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Decompress
+        data_bytes = zstandard.ZstdDecompressor().decompressobj().decompress(response.content)
+        data_mat = np.load(io.BytesIO(data_bytes))
+
+        # Test for data equality (what you put in is what you got back!)
+        np.testing.assert_array_equal(data_mat, test_mat)
+
+    def test_channel_uint8_notime_octet_stream(self):
+        """ Test uint8 data, using the uncompressed octet-stream interface
+        """
+        test_mat = np.random.randint(1, 254, (17, 300, 500))
+        test_mat = test_mat.astype(np.uint8)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/20:37/',
+                               test_mat.tobytes(), content_type='application/octet-stream',
+                               HTTP_X_BOSS_DTYPE='uint8', HTTP_X_BOSS_SHAPE='17,300,500')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make POST data
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='20:37', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Create Request to get data you posted
+        request = factory.get('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/20:37',
+                              HTTP_ACCEPT='application/octet-stream')
+
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request to GET data
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='20:37',
+                                    t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Boss-Dtype'], 'uint8')
+        self.assertEqual(response['X-Boss-Shape'], '17,300,500')
+
+        data_mat = np.frombuffer(b"".join(response.streaming_content), dtype=np.uint8).reshape(17, 300, 500)
+
+        # Test for data equality (what you put in is what you got back!)
+        np.testing.assert_array_equal(data_mat, test_mat)
+
+    def test_channel_uint8_octet_stream_wrong_size(self):
+        """ Test that an uncompressed POST that does not match the URL is rejected
+        """
+        test_mat = np.random.randint(1, 254, (17, 300, 499))
+        test_mat = test_mat.astype(np.uint8)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/20:37/',
+                               test_mat.tobytes(), content_type='application/octet-stream')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make POST data
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='20:37', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_channel_uint8_time_npygz_download(self):
         """ Test uint8 data, using the npygz interface with time series support
 
@@ -828,6 +962,409 @@ class CutoutInterfaceViewUint8TestMixin(object):
         # Test for data equality (what you put in is what you got back!)
         np.testing.assert_array_equal(data_mat, test_mat)
 
+    def test_channel_uint8_time_blosc_stream_download(self):
+        """ Test uint8 data, using the streaming blosc interface with time series support
+        """
+        test_mat = np.random.randint(1, 254, (2, 37, 300, 500))
+        test_mat = test_mat.astype(np.uint8)
+        bb = blosc.pack_array(test_mat)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/5:42/0:2', bb,
+                               content_type='application/blosc-python')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make POST data
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='5:42', t_range='0:2')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Create Request to stream the data you posted
+        request = factory.get('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/5:42/0:2/?stream=true',
+                              HTTP_ACCEPT='application/blosc')
+
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request to GET data
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='5:42',
+                                    t_range='0:2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+
+        # Decompress each frame. The z range spans 3 cuboid aligned slabs per time sample
+        frames = list(iter_blosc_frames(b''.join(response.streaming_content)))
+        self.assertEqual(len(frames), 6)
+        data_mat = np.fromstring(b''.join(frames), dtype=np.uint8)
+        data_mat = np.reshape(data_mat, (2, 37, 300, 500), order='C')
+
+        # Test for data equality (what you put in is what you got back!)
+        np.testing.assert_array_equal(data_mat, test_mat)
+
+    def test_channel_uint8_notime_npygz_stream_download(self):
+        """ Test uint8 data, using the streaming npygz interface
+        """
+        test_mat = np.random.randint(1, 254, (37, 300, 500))
+        test_mat = test_mat.astype(np.uint8)
+        bb = blosc.pack_array(test_mat)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/5:42/', bb,
+                               content_type='application/blosc-python')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make POST data
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='5:42', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Create Request to stream the data you posted
+        request = factory.get('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/5:42/?stream=true',
+                              HTTP_ACCEPT='application/npygz')
+
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request to GET data
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='5:42',
+                                    t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+
+        # Decompress. The streamed response is a regular npygz file
+        data_bytes = zlib.decompress(b''.join(response.streaming_content))
+        data_obj = io.BytesIO(data_bytes)
+        data_mat = np.load(data_obj)
+
+        # Test for data equality (what you put in is what you got back!)
+        np.testing.assert_array_equal(data_mat, test_mat)
+
+    def test_channel_uint8_stream_invalid_format(self):
+        """ Test that streaming is rejected for formats that do not support it """
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.get('/' + version + '/cutout/col1/exp1/channel1/0/0:128/0:128/0:16/?stream=true',
+                              HTTP_ACCEPT='application/blosc-python')
+
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='0:128', y_range='0:128', z_range='0:16', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_channel_uint8_time_blosc_framed_upload(self):
+        """ Test uint8 data, uploaded as cuboid aligned blosc frames with time series support
+        """
+        test_mat = np.random.randint(1, 254, (2, 37, 300, 500))
+        test_mat = test_mat.astype(np.uint8)
+
+        # One frame per time sample and cuboid aligned z-slab (5:16, 16:32, 32:42)
+        frames = []
+        for t in range(2):
+            for z_start, z_stop in [(0, 11), (11, 27), (27, 37)]:
+                frames.append(blosc.compress(np.ascontiguousarray(test_mat[t, z_start:z_stop]).tobytes(),
+                                             typesize=8))
+        bb = b''.join(frames)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/5:42/0:2', bb,
+                               content_type='application/blosc-framed')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make POST data
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='5:42', t_range='0:2')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Create Request to get data you posted
+        request = factory.get('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/5:42/0:2/',
+                              HTTP_ACCEPT='application/blosc-python')
+
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='5:42',
+                                    t_range='0:2').render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Decompress
+        data_mat = blosc.unpack_array(response.content)
+
+        # Test for data equality (what you put in is what you got back!)
+        np.testing.assert_array_equal(data_mat, test_mat)
+
+    def test_channel_uint8_blosc_framed_upload_wrong_frames(self):
+        """ Test that framed uploads that are not cuboid aligned in z are rejected
+        """
+        test_mat = np.random.randint(1, 254, (37, 300, 500))
+        test_mat = test_mat.astype(np.uint8)
+        bb = blosc.compress(test_mat.tobytes(), typesize=8)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/5:42/', bb,
+                               content_type='application/blosc-framed')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make POST data
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='5:42',
+                                    t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_channel_uint8_batch_download(self):
+        """ Test uint8 data, reading several overlapping and disjoint regions with the batch interface
+        """
+        test_mat = np.random.randint(1, 254, (2, 37, 300, 500))
+        test_mat = test_mat.astype(np.uint8)
+        bb = blosc.pack_array(test_mat)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/5:42/0:2', bb,
+                               content_type='application/blosc-python')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make POST data
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='5:42', t_range='0:2')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Create Request to read back regions of the data you posted
+        regions = [{"resolution": 0, "x_range": "100:164", "y_range": "450:514", "z_range": "5:21", "t_range": "0:2"},
+                   {"resolution": 0, "x_range": "132:196", "y_range": "480:544", "z_range": "10:26"},
+                   {"resolution": 0, "x_range": "500:600", "y_range": "700:750", "z_range": "30:42"}]
+        request = factory.post('/' + version + '/cutout/batch/col1/exp1/channel1/', {"regions": regions},
+                               format='json', HTTP_ACCEPT='application/blosc')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = CutoutBatch.as_view()(request, collection='col1', experiment='exp1', channel='channel1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Decompress each frame and test for data equality (what you put in is what you got back!)
+        frames = list(iter_blosc_frames(response.content))
+        self.assertEqual(len(frames), 3)
+        expected = [test_mat[:, 0:16, 0:64, 0:64],
+                    test_mat[0, 5:21, 30:94, 32:96],
+                    test_mat[0, 25:37, 250:300, 400:500]]
+        for frame, expected_mat in zip(frames, expected):
+            data_mat = np.reshape(np.frombuffer(frame, dtype=np.uint8), expected_mat.shape, order='C')
+            np.testing.assert_array_equal(data_mat, expected_mat)
+
+    def test_channel_uint8_batch_invalid_region(self):
+        """ Test that a batch with an invalid region is rejected
+        """
+        regions = [{"resolution": 0, "x_range": "0:64", "y_range": "0:64", "z_range": "0:16"},
+                   {"resolution": 0, "x_range": "64:0", "y_range": "0:64", "z_range": "0:16"}]
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/batch/col1/exp1/channel1/', {"regions": regions},
+                               format='json', HTTP_ACCEPT='application/blosc')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = CutoutBatch.as_view()(request, collection='col1', experiment='exp1', channel='channel1')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_channel_uint8_etag(self):
+        """ Test that cutouts are tagged with the write state of their region and revalidated with If-None-Match
+        """
+        test_mat = np.random.randint(1, 254, (16, 128, 128))
+        test_mat = test_mat.astype(np.uint8)
+        bb = blosc.compress(test_mat.tobytes(), typesize=8)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/0:128/0:128/0:16/', bb,
+                               content_type='application/blosc')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make POST data
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='0:128', y_range='0:128', z_range='0:16', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Get the data and its ETag
+        request = factory.get('/' + version + '/cutout/col1/exp1/channel1/0/0:128/0:128/0:16/',
+                              HTTP_ACCEPT='application/blosc')
+        force_authenticate(request, user=self.user)
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='0:128', y_range='0:128', z_range='0:16',
+                                    t_range=None).render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        # An unchanged region is not resent
+        request = factory.get('/' + version + '/cutout/col1/exp1/channel1/0/0:128/0:128/0:16/',
+                              HTTP_ACCEPT='application/blosc', HTTP_IF_NONE_MATCH=etag)
+        force_authenticate(request, user=self.user)
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='0:128', y_range='0:128', z_range='0:16', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # A different format has a different ETag
+        request = factory.get('/' + version + '/cutout/col1/exp1/channel1/0/0:128/0:128/0:16/',
+                              HTTP_ACCEPT='application/npygz', HTTP_IF_NONE_MATCH=etag)
+        force_authenticate(request, user=self.user)
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='0:128', y_range='0:128', z_range='0:16', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Write to an overlapping region
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/64:128/64:128/8:16/',
+                               blosc.compress(test_mat[8:16, 64:128, 64:128].copy().tobytes(), typesize=8),
+                               content_type='application/blosc')
+        force_authenticate(request, user=self.user)
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='64:128', y_range='64:128', z_range='8:16', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # The previous ETag no longer matches
+        request = factory.get('/' + version + '/cutout/col1/exp1/channel1/0/0:128/0:128/0:16/',
+                              HTTP_ACCEPT='application/blosc', HTTP_IF_NONE_MATCH=etag)
+        force_authenticate(request, user=self.user)
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='0:128', y_range='0:128', z_range='0:16',
+                                    t_range=None).render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_channel_uint8_downsample_fallback(self):
+        """ Test that a resolution that has not been downsampled yet is downsampled from the base resolution on read
+        """
+        test_mat = np.random.randint(1, 254, (16, 128, 128))
+        test_mat = test_mat.astype(np.uint8)
+        bb = blosc.compress(test_mat.tobytes(), typesize=8)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/0:128/0:128/0:16/', bb,
+                               content_type='application/blosc')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make POST data
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='0:128', y_range='0:128', z_range='0:16', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Create Request to get the region at resolution 1, which has not been downsampled
+        request = factory.get('/' + version + '/cutout/col1/exp1/channel1/1/0:64/0:64/0:16/',
+                              HTTP_ACCEPT='application/blosc')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        with self.settings(CUTOUT_DOWNSAMPLE_FALLBACK_ENABLED=True, CUTOUT_DOWNSAMPLE_FALLBACK_CACHE_ALIAS='default'):
+            response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                        resolution='1', x_range='0:64', y_range='0:64', z_range='0:16',
+                                        t_range=None).render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # The anisotropic hierarchy halves x and y at resolution 1
+        raw_data = blosc.decompress(response.content)
+        data_mat = np.reshape(np.frombuffer(raw_data, dtype=np.uint8), (16, 64, 64), order='C')
+        expected = np.rint(test_mat.reshape(16, 64, 2, 64, 2).mean(axis=(2, 4))).astype(np.uint8)
+        np.testing.assert_array_equal(data_mat, expected)
+
+    def test_channel_uint8_prefetch(self):
+        """ Test that reading consecutive z slabs pages in the next slab
+        """
+        caches[settings.PREFETCH_CACHE_ALIAS].clear()
+        executor = MagicMock()
+        factory = APIRequestFactory()
+
+        with self.settings(PREFETCH_ENABLED=True), \
+                patch('bossspatialdb.prefetch.get_prefetch_executor', return_value=executor):
+            for z_range in ('0:16', '16:32'):
+                request = factory.get('/' + version + '/cutout/col1/exp1/channel1/0/0:128/0:128/' + z_range + '/',
+                                      HTTP_ACCEPT='application/blosc')
+                force_authenticate(request, user=self.user)
+                response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                            resolution='0', x_range='0:128', y_range='0:128', z_range=z_range,
+                                            t_range=None).render()
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # The first read has nothing to follow. The second continues down z, so the next cuboid layer is paged in.
+        self.assertEqual(executor.submit.call_count, 1)
+        args = executor.submit.call_args[0]
+        self.assertEqual(args[0], page_in)
+        self.assertEqual(args[2:5], ((0, 0, 32), (128, 128, 16), 0))
+        self.assertEqual(get_prefetch_stats()["issued"], 1)
+
+        # Give back the slot the page in would have released
+        release_slot()
+
+    def test_channel_uint8_response_cache(self):
+        """ Test that repeat reads of an unchanged region are served from the response cache until it is written
+        """
+        test_mat = np.random.randint(1, 254, (16, 128, 128))
+        test_mat = test_mat.astype(np.uint8)
+        bb = blosc.compress(test_mat.tobytes(), typesize=8)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/0:128/0:128/0:16/', bb,
+                               content_type='application/blosc')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make POST data
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='0:128', y_range='0:128', z_range='0:16', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        def get_cutout():
+            request = factory.get('/' + version + '/cutout/col1/exp1/channel1/0/0:128/0:128/0:16/',
+                                  HTTP_ACCEPT='application/blosc')
+            force_authenticate(request, user=self.user)
+            response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                        resolution='0', x_range='0:128', y_range='0:128', z_range='0:16',
+                                        t_range=None).render()
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return np.reshape(np.frombuffer(blosc.decompress(response.content), dtype=np.uint8), (16, 128, 128))
+
+        with self.settings(CUTOUT_CACHE_ENABLED=True, CUTOUT_CACHE_ALIAS='default'):
+            np.testing.assert_array_equal(get_cutout(), test_mat)
+
+            # The second read does not touch the spatialdb
+            with patch.object(SpatialDB, 'cutout') as cutout:
+                np.testing.assert_array_equal(get_cutout(), test_mat)
+            cutout.assert_not_called()
+
+            # Write to an overlapping region
+            new_mat = np.random.randint(1, 254, (8, 64, 64)).astype(np.uint8)
+            request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/64:128/64:128/8:16/',
+                                   blosc.compress(new_mat.tobytes(), typesize=8), content_type='application/blosc')
+            force_authenticate(request, user=self.user)
+            response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                        resolution='0', x_range='64:128', y_range='64:128', z_range='8:16',
+                                        t_range=None)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+            # The cached response is no longer used
+            test_mat[8:16, 64:128, 64:128] = new_mat
+            np.testing.assert_array_equal(get_cutout(), test_mat)
+
     def test_channel_uint8_cuboid_aligned_offset_no_time_jpeg(self):
         """ Test uint8 data, cuboid aligned, offset, no time samples, jpeg interface"""
 
@@ -1129,6 +1666,33 @@ class CutoutInterfaceViewUint8TestMixin(object):
         np.testing.assert_array_equal(data_mat, test_mat)
 
 
+    def test_channel_uint8_post_admitted_before_parse(self):
+        """ Test that a POST over the in-flight byte budget is rejected before its body is decoded"""
+        test_mat = np.random.randint(1, 254, (16, 128, 128)).astype(np.uint8)
+        bb = blosc.compress(test_mat.tobytes(), typesize=8)
+
+        with self.settings(ADMISSION_CONTROL_ENABLED=True, ADMISSION_CACHE_ALIAS='default',
+                           ADMISSION_USER_MAX_BYTES=1024, ADMISSION_MAX_BYTES=1048576, ADMISSION_RETRY_AFTER=5,
+                           ADMISSION_KEY_TIMEOUT=60):
+            admission = Admission.acquire(self.user, 1024)
+            try:
+                for query in ('', '?async=true'):
+                    factory = APIRequestFactory()
+                    request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/0:128/0:128/0:16/' + query,
+                                           bb, content_type='application/blosc')
+                    force_authenticate(request, user=self.user)
+
+                    with patch('bossspatialdb.parsers.read_body') as read_body:
+                        response = Cutout.as_view()(request, collection='col1', experiment='exp1',
+                                                    channel='channel1', resolution='0', x_range='0:128',
+                                                    y_range='0:128', z_range='0:16', t_range=None)
+                    self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+                    self.assertEqual(response['Retry-After'], "5")
+                    read_body.assert_not_called()
+            finally:
+                admission.release()
+
+
 # @patch('bossutils.configuration.BossConfig', new=MockBossConfig)
 # @patch('redis.StrictRedis', new=mock_strict_redis_client)
 # @patch('spdb.spatialdb.spatialdb.SpatialDB', MockSpatialDB)
@@ -1140,6 +1704,9 @@ class TestCutoutInterfaceView(CutoutInterfaceViewUint8TestMixin, APITestCase):
         Initialize the database
         :return:
         """
+        # Drop SpatialDB instances bound to the mocks of earlier tests
+        reset_spatialdb_pool()
+
         # Create a user
         self.dbsetup = SetupTestDB()
         self.user = self.dbsetup.create_user('testuser')
@@ -0,0 +1,146 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test import SimpleTestCase, override_settings
+
+from unittest.mock import MagicMock
+
+from bosscore.error import BossError, ErrorCodes
+from bossspatialdb.admission import Admission, AdmissionMixin, AdmissionRejected, GLOBAL_KEY, get_user_key, \
+    release_bytes, try_reserve
+
+
+def make_user(username):
+    user = MagicMock()
+    user.username = username
+    return user
+
+
+class BaseView:
+    """Stand in for APIView"""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        return response
+
+    def handle_exception(self, exc):
+        raise exc
+
+
+class AdmissionView(AdmissionMixin, BaseView):
+    pass
+
+
+@override_settings(ADMISSION_CONTROL_ENABLED=True, ADMISSION_CACHE_ALIAS='default', ADMISSION_USER_MAX_BYTES=100,
+                   ADMISSION_MAX_BYTES=150, ADMISSION_RETRY_AFTER=5, ADMISSION_KEY_TIMEOUT=60)
+class TestAdmission(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = caches['default']
+        self.cache.clear()
+
+    def test_user_budget(self):
+        """Test that a user is rejected above their budget without affecting other users"""
+        first = Admission.acquire(make_user("alice"), 60)
+        with self.assertRaises(BossError) as err:
+            Admission.acquire(make_user("alice"), 60)
+        self.assertEqual(err.exception.error_code, ErrorCodes.TOO_MANY_REQUESTS)
+        self.assertEqual(err.exception.status_code, 429)
+
+        # The rejected request did not leave bytes behind
+        self.assertEqual(self.cache.get(get_user_key(make_user("alice"))), 60)
+        self.assertEqual(self.cache.get(GLOBAL_KEY), 60)
+
+        Admission.acquire(make_user("bob"), 60).release()
+        first.release()
+        Admission.acquire(make_user("alice"), 60)
+
+    def test_global_budget(self):
+        """Test that requests are rejected above the global budget"""
+        Admission.acquire(make_user("alice"), 80)
+        with self.assertRaises(BossError) as err:
+            Admission.acquire(make_user("bob"), 80)
+        self.assertEqual(err.exception.error_code, ErrorCodes.SERVER_BUSY)
+        self.assertEqual(err.exception.status_code, 503)
+        self.assertEqual(self.cache.get(get_user_key(make_user("bob"))), 0)
+
+    def test_large_request_admitted_alone(self):
+        """Test that a request over the budget is admitted when nothing else is in flight"""
+        admission = Admission.acquire(make_user("alice"), 120)
+        with self.assertRaises(BossError):
+            Admission.acquire(make_user("alice"), 1)
+        admission.release()
+        admission.release()
+        self.assertEqual(self.cache.get(GLOBAL_KEY), 0)
+
+    def test_released_on_close(self):
+        """Test that the reservation is released when the response is closed"""
+        view = AdmissionView()
+        request = MagicMock()
+        request.user = make_user("alice")
+        self.assertIsNone(view.admit(request, 100))
+
+        response = view.finalize_response(request, HttpResponse())
+        self.assertEqual(self.cache.get(GLOBAL_KEY), 100)
+        response.close()
+        self.assertEqual(self.cache.get(GLOBAL_KEY), 0)
+
+    def test_rejected_response(self):
+        """Test that a rejected request gets a 429 with Retry-After"""
+        Admission.acquire(make_user("alice"), 100)
+        request = MagicMock()
+        request.user = make_user("alice")
+        response = AdmissionView().admit(request, 10)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], "5")
+
+    def test_released_on_exception(self):
+        """Test that the reservation is released if the view raises"""
+        view = AdmissionView()
+        request = MagicMock()
+        request.user = make_user("alice")
+        view.admit(request, 100)
+        with self.assertRaises(ValueError):
+            view.handle_exception(ValueError())
+        self.assertEqual(self.cache.get(GLOBAL_KEY), 0)
+
+    def test_timeout_refreshed(self):
+        """Test that every reservation restarts the timeout of the counter"""
+        cache = MagicMock(wraps=self.cache)
+        cache.touch = MagicMock()
+        self.assertTrue(try_reserve(cache, GLOBAL_KEY, 10, 100))
+        cache.touch.assert_called_once_with(GLOBAL_KEY, 60)
+
+    def test_release_after_expiry(self):
+        """Test that releasing bytes reserved before the counter expired does not drive it below zero"""
+        Admission.acquire(make_user("alice"), 10)
+        self.cache.delete(GLOBAL_KEY)
+        Admission.acquire(make_user("bob"), 5)
+
+        release_bytes(self.cache, GLOBAL_KEY, 10)
+        self.assertEqual(self.cache.get(GLOBAL_KEY), 0)
+
+    def test_upload_rejected(self):
+        """Test that an upload over budget drains the body and ends the request with a 429"""
+        Admission.acquire(make_user("alice"), 100)
+        view = AdmissionView()
+        request = MagicMock()
+        request.user = make_user("alice")
+        request.stream.read.side_effect = [b"x" * 10, b""]
+
+        with self.assertRaises(AdmissionRejected) as err:
+            view.admit_upload(request, 10)
+        self.assertEqual(request.stream.read.call_count, 2)
+        self.assertEqual(view.handle_exception(err.exception).status_code, 429)
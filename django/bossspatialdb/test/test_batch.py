@@ -0,0 +1,88 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.test import SimpleTestCase, override_settings
+
+from unittest.mock import MagicMock
+
+import blosc
+import numpy as np
+
+from bossspatialdb.batch import BatchCutout, get_bounding_box
+from bossspatialdb.compression import BloscOptions
+
+
+def make_region(x_range, y_range, z_range, time_range=(0, 1)):
+    """Build a stand in for a validated region request"""
+    region = MagicMock()
+    region.get_x_start.return_value = x_range[0]
+    region.get_y_start.return_value = y_range[0]
+    region.get_z_start.return_value = z_range[0]
+    region.get_x_span.return_value = x_range[1] - x_range[0]
+    region.get_y_span.return_value = y_range[1] - y_range[0]
+    region.get_z_span.return_value = z_range[1] - z_range[0]
+    region.get_time.return_value = range(time_range[0], time_range[1])
+    region.get_resolution.return_value = 0
+    region.time_request = False
+    return region
+
+
+class MockCache:
+    """Stand in for SpatialDB that serves a ramp and records each read"""
+
+    def __init__(self):
+        self.reads = []
+
+    def cutout(self, resource, corner, extent, resolution, time_range, iso=False, no_cache=False):
+        self.reads.append((corner, extent))
+        z, y, x = np.meshgrid(np.arange(corner[2], corner[2] + extent[2]),
+                              np.arange(corner[1], corner[1] + extent[1]),
+                              np.arange(corner[0], corner[0] + extent[0]), indexing='ij')
+        cube = MagicMock()
+        cube.data = np.expand_dims((x + y + z).astype(np.uint16), axis=0)
+        return cube
+
+
+@override_settings(BATCH_CUTOUT_MERGE_RATIO=2, CUTOUT_MAX_SIZE=520 * 1048576)
+class TestBatchCutout(SimpleTestCase):
+
+    def test_bounding_box(self):
+        """Test the box containing several boxes"""
+        self.assertEqual(get_bounding_box([((0, 10, 5), (10, 10, 1)), ((5, 0, 0), (10, 5, 2))]),
+                         ((0, 0, 0), (15, 20, 6)))
+
+    def test_groups(self):
+        """Test that only regions sharing a cuboid at the same time range are grouped"""
+        regions = [make_region((0, 64), (0, 64), (0, 16)),
+                   make_region((32, 96), (32, 96), (8, 24)),
+                   make_region((2048, 2112), (0, 64), (0, 16)),
+                   make_region((0, 64), (0, 64), (0, 16), time_range=(1, 2))]
+        groups = BatchCutout(MockCache(), None, regions, 16).get_groups()
+        self.assertEqual(sorted(members for members, _ in groups), [[0, 1], [2], [3]])
+
+    def test_overlapping_regions_read_once(self):
+        """Test that a group is read with a single cutout and each region is extracted correctly"""
+        regions = [make_region((0, 64), (0, 64), (0, 16)),
+                   make_region((32, 96), (32, 96), (8, 24)),
+                   make_region((2048, 2112), (0, 64), (0, 16))]
+        cache = MockCache()
+        frames = BatchCutout(cache, None, regions, 16).blosc_frames(BloscOptions('blosclz', 9, 'byte', 1))
+
+        self.assertEqual(sorted(cache.reads), [((0, 0, 0), (96, 96, 24)), ((2048, 0, 0), (64, 64, 16))])
+        for frame, region in zip(frames, regions):
+            data = np.frombuffer(blosc.decompress(frame), dtype=np.uint16)
+            expected = cache.cutout(None, (region.get_x_start(), region.get_y_start(), region.get_z_start()),
+                                    (region.get_x_span(), region.get_y_span(), region.get_z_span()),
+                                    0, [0, 1]).data[0]
+            np.testing.assert_array_equal(data.reshape(expected.shape), expected)
@@ -0,0 +1,151 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.test import SimpleTestCase, override_settings
+
+from unittest.mock import MagicMock
+import io
+import unittest
+import zlib
+
+import blosc
+import numpy as np
+
+from bosscore.error import BossError
+from bossspatialdb.compression import BloscOptions, get_media_type_params, is_codec_available, iter_npy_stream
+from bossspatialdb.compression import format_shape, parse_shape, set_raw_headers
+
+
+def make_request(media_type='application/blosc', query_params=None):
+    """Build a stand in for a negotiated DRF request"""
+    request = MagicMock()
+    request.accepted_media_type = media_type
+    request.query_params = query_params if query_params else {}
+    return request
+
+
+@override_settings(BLOSC_CNAME='blosclz', BLOSC_CLEVEL=9, BLOSC_SHUFFLE='byte', BLOSC_NTHREADS=1,
+                   BLOSC_MAX_NTHREADS=4)
+class TestBloscOptions(SimpleTestCase):
+
+    def test_media_type_params(self):
+        """Test parsing media type parameters"""
+        params = get_media_type_params('application/blosc; codec=lz4; clevel="5"; q=0.9')
+        self.assertEqual(params, {'codec': 'lz4', 'clevel': '5'})
+        self.assertEqual(get_media_type_params('application/blosc'), {})
+
+    def test_defaults(self):
+        """Test that settings are used when nothing is requested"""
+        options = BloscOptions.from_request(make_request())
+        self.assertEqual(options.get_key(), 'blosclz&9&byte')
+        self.assertEqual(options.nthreads, 1)
+
+    def test_overrides(self):
+        """Test that query params take precedence over media type params and threads are capped"""
+        request = make_request('application/blosc; codec=lz4; clevel=1',
+                               {'clevel': '3', 'shuffle': 'bit', 'nthreads': '64'})
+        options = BloscOptions.from_request(request)
+        self.assertEqual(options.get_key(), 'lz4&3&bit')
+        self.assertEqual(options.nthreads, 4)
+
+    def test_invalid_options(self):
+        """Test that invalid options raise a BossError"""
+        for params in ({'codec': 'foo'}, {'clevel': '10'}, {'clevel': 'x'}, {'shuffle': 'foo'}, {'nthreads': '0'}):
+            with self.assertRaises(BossError):
+                BloscOptions.from_request(make_request(query_params=params))
+
+    def test_compress_round_trip(self):
+        """Test that data compressed with non-default options decompresses to the original"""
+        data = np.random.randint(1, 2 ** 16 - 1, (4, 32, 32)).astype(np.uint16)
+        options = BloscOptions('lz4', 5, 'bit', 2)
+        raw = blosc.decompress(options.compress(data, typesize=2))
+        self.assertEqual(raw, data.tobytes())
+        np.testing.assert_array_equal(blosc.unpack_array(options.pack_array(data)), data)
+
+    def test_nthreads_restored(self):
+        """Test that the process wide blosc thread count is restored after compressing"""
+        previous = blosc.set_nthreads(3)
+        try:
+            BloscOptions('lz4', 5, 'bit', 2).compress(b"0" * 1024, typesize=1)
+            self.assertEqual(blosc.set_nthreads(3), 3)
+        finally:
+            blosc.set_nthreads(previous)
+
+
+def decompress_stream(codec, data):
+    """Decompress a full stream with the codec's standard library"""
+    if codec == 'gzip':
+        return zlib.decompress(data)
+    elif codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    import lz4.frame
+    return lz4.frame.decompress(data)
+
+
+class TestNpyStream(SimpleTestCase):
+
+    def check_round_trip(self, codec):
+        """Encode arrays with a codec and check they decode to the original data"""
+        data = np.random.randint(0, 5000, (3, 7, 11, 13)).astype(np.uint16)
+        original = data.copy()
+
+        # Contiguous, non-contiguous and split inputs
+        encoded = b"".join(iter_npy_stream([data], data.dtype, data.shape, codec))
+        np.testing.assert_array_equal(np.load(io.BytesIO(decompress_stream(codec, encoded))), data)
+
+        view = data[:, :, 2:9, 1:12]
+        encoded = b"".join(iter_npy_stream([view], view.dtype, view.shape, codec))
+        np.testing.assert_array_equal(np.load(io.BytesIO(decompress_stream(codec, encoded))), view)
+
+        encoded = b"".join(iter_npy_stream([data[:1], data[1:]], data.dtype, data.shape, codec, sync_flush=True))
+        np.testing.assert_array_equal(np.load(io.BytesIO(decompress_stream(codec, encoded))), data)
+
+        # The input is never modified
+        np.testing.assert_array_equal(data, original)
+
+    def test_gzip(self):
+        """Test the npygz stream"""
+        self.check_round_trip('gzip')
+
+    @unittest.skipUnless(is_codec_available('zstd'), "zstandard is not installed")
+    def test_zstd(self):
+        """Test the zstd compressed npy stream"""
+        self.check_round_trip('zstd')
+
+    @unittest.skipUnless(is_codec_available('lz4'), "lz4 is not installed")
+    def test_lz4(self):
+        """Test the lz4 compressed npy stream"""
+        self.check_round_trip('lz4')
+
+
+class TestRawHeaders(SimpleTestCase):
+
+    def test_shape_round_trip(self):
+        """Test that shapes are formatted and parsed"""
+        self.assertEqual(format_shape((3, 16, 512, 256)), "3,16,512,256")
+        self.assertEqual(parse_shape("3,16,512,256"), (3, 16, 512, 256))
+        self.assertEqual(parse_shape(" 16, 512 ,256"), (16, 512, 256))
+
+    def test_invalid_shape(self):
+        """Test that invalid shapes are rejected"""
+        for value in ("", "16,a,2", "16,-1,2"):
+            with self.assertRaises(ValueError):
+                parse_shape(value)
+
+    def test_set_raw_headers(self):
+        """Test that the datatype, shape and size are set"""
+        response = {}
+        set_raw_headers(response, np.uint16, (2, 3, 4))
+        self.assertEqual(response, {'X-Boss-Dtype': 'uint16', 'X-Boss-Shape': '2,3,4', 'Content-Length': '48'})
@@ -0,0 +1,152 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+from bossspatialdb.fallback import DownsampleFallback, block_average, block_mode
+
+
+class MockSpatialDB:
+    """Stand in for SpatialDB that serves a ramp and records each read"""
+
+    def __init__(self, dtype):
+        self.dtype = dtype
+        self.reads = []
+
+    def cutout(self, resource, corner, extent, resolution, time_range, iso=False, no_cache=False):
+        self.reads.append((corner, extent, resolution))
+        z, y, x = np.meshgrid(np.arange(corner[2], corner[2] + extent[2]),
+                              np.arange(corner[1], corner[1] + extent[1]),
+                              np.arange(corner[0], corner[0] + extent[0]), indexing='ij')
+        cube = MagicMock()
+        cube.data = np.expand_dims((x + y + z).astype(self.dtype), axis=0)
+        return cube
+
+
+def make_resource(is_image, datatype='uint8'):
+    resource = MagicMock()
+    resource.get_channel.return_value.base_resolution = 0
+    resource.get_channel.return_value.downsample_status = "NOT_DOWNSAMPLED"
+    resource.get_channel.return_value.is_image.return_value = is_image
+    resource.get_numpy_data_type.return_value = datatype
+    resource.get_lookup_key.return_value = "1&1&1"
+    resource.get_downsampled_voxel_dims.return_value = [[4, 4, 35], [8, 8, 35], [16, 16, 35]]
+    return resource
+
+
+def create_cube(resource, extent, time_range):
+    cube = MagicMock()
+    cube.data = np.zeros((time_range[1] - time_range[0], extent[2], extent[1], extent[0]),
+                         dtype=resource.get_numpy_data_type())
+    return cube
+
+
+def make_request(resolution, x_range, y_range, z_range):
+    req = MagicMock()
+    req.get_resolution.return_value = resolution
+    req.get_x_span.return_value = x_range[1] - x_range[0]
+    req.get_y_span.return_value = y_range[1] - y_range[0]
+    req.get_z_span.return_value = z_range[1] - z_range[0]
+    req.get_time.return_value = range(0, 1)
+    return req
+
+
+@override_settings(CUTOUT_DOWNSAMPLE_FALLBACK_ENABLED=True, CUTOUT_DOWNSAMPLE_FALLBACK_MAX_SIZE=1048576,
+                   CUTOUT_DOWNSAMPLE_FALLBACK_CACHE_ALIAS='default', CUTOUT_DOWNSAMPLE_FALLBACK_CACHE_TIMEOUT=60,
+                   CUTOUT_DOWNSAMPLE_FALLBACK_MAX_ENTRY_SIZE=1048576, CUTOUT_MAX_SIZE=520 * 1048576,
+                   WRITE_VERSION_CACHE_ALIAS='default')
+class TestDownsampleFallback(SimpleTestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_block_average(self):
+        """Test that image data is averaged over each block"""
+        data = np.arange(32, dtype=np.uint16).reshape(1, 2, 4, 4)
+        result = block_average(data, (2, 2, 1))
+        self.assertEqual(result.dtype, np.uint16)
+        np.testing.assert_array_equal(result[0, 0], [[2, 4], [10, 12]])
+        np.testing.assert_array_equal(result[0, 1], [[18, 20], [26, 28]])
+
+    def test_block_mode(self):
+        """Test that annotation data takes the most common non-zero id of each block"""
+        data = np.zeros((1, 1, 2, 6), dtype=np.uint64)
+        data[0, 0] = [[0, 0, 5, 7, 0, 0],
+                      [0, 3, 7, 5, 0, 0]]
+        result = block_mode(data, (2, 2, 1))
+        np.testing.assert_array_equal(result[0, 0, 0], [3, 5, 0])
+
+    def test_block_mode_planes(self):
+        """Test that each output z plane and time sample is reduced from its own block of input planes"""
+        data = np.zeros((2, 4, 2, 2), dtype=np.uint64)
+        data[0, 0:2] = 1
+        data[0, 2:4] = 2
+        data[1, 0:2] = 3
+        data[1, 3] = 4
+        result = block_mode(data, (2, 2, 2))
+        self.assertEqual(result.shape, (2, 2, 1, 1))
+        np.testing.assert_array_equal(result[:, :, 0, 0], [[1, 2], [3, 4]])
+
+    def test_not_needed(self):
+        """Test that no fallback is used at the base resolution or once the channel is downsampled"""
+        resource = make_resource(True)
+        self.assertIsNone(DownsampleFallback.from_request(resource, make_request(0, (0, 8), (0, 8), (0, 1)), 8))
+
+        resource.get_channel.return_value.downsample_status = "DOWNSAMPLED"
+        self.assertIsNone(DownsampleFallback.from_request(resource, make_request(1, (0, 8), (0, 8), (0, 1)), 8))
+
+    def test_too_large(self):
+        """Test that no fallback is used when the base region is too large"""
+        resource = make_resource(True)
+        self.assertIsNone(DownsampleFallback.from_request(resource, make_request(2, (0, 512), (0, 512), (0, 1)), 8))
+
+    @patch('bossspatialdb.fallback.Cube')
+    def test_cutout(self, mock_cube):
+        """Test that the base region is read, reduced and cached"""
+        mock_cube.create_cube.side_effect = create_cube
+        resource = make_resource(True)
+        fallback = DownsampleFallback.from_request(resource, make_request(2, (2, 6), (0, 4), (3, 5)), 8)
+        self.assertEqual(fallback.factors, (4, 4, 1))
+
+        spatialdb = MockSpatialDB(np.uint8)
+        cube = fallback.cutout(spatialdb, (2, 0, 3), (4, 4, 2), [0, 1])
+        self.assertEqual(spatialdb.reads, [((8, 0, 3), (16, 16, 2), 0)])
+
+        expected = block_average(spatialdb.cutout(None, (8, 0, 3), (16, 16, 2), 0, [0, 1]).data, (4, 4, 1))
+        np.testing.assert_array_equal(cube.data, expected)
+
+        # The second read is served from the cache
+        spatialdb.reads = []
+        cube = fallback.cutout(spatialdb, (2, 0, 3), (4, 4, 2), [0, 1])
+        self.assertEqual(spatialdb.reads, [])
+        np.testing.assert_array_equal(cube.data, expected)
+
+    @patch('bossspatialdb.fallback.Cube')
+    def test_cutout_slabs(self, mock_cube):
+        """Test that the base region is read in z slabs under CUTOUT_MAX_SIZE"""
+        mock_cube.create_cube.side_effect = create_cube
+        resource = make_resource(False, 'uint64')
+        fallback = DownsampleFallback.from_request(resource, make_request(1, (0, 4), (0, 4), (0, 3)), 64)
+        spatialdb = MockSpatialDB(np.uint64)
+        with self.settings(CUTOUT_MAX_SIZE=8 * 8 * 8):
+            cube = fallback.cutout(spatialdb, (0, 0, 0), (4, 4, 3), [0, 1], filter_ids=[2, 4], no_cache=True)
+
+        self.assertEqual(len(spatialdb.reads), 3)
+        self.assertEqual(cube.data.shape, (1, 3, 4, 4))
+        self.assertTrue(np.all(np.in1d(cube.data, [0, 2, 4])))
@@ -0,0 +1,140 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+from bossspatialdb.id_filter import IdFilter, get_cuboid_runs, mask_ids
+from bossspatialdb.write_state import WriteVersions
+
+
+class MockSpatialDB:
+    """Stand in for SpatialDB where every voxel holds the x index of its cuboid plus one"""
+
+    def __init__(self):
+        self.reads = []
+
+    def cutout(self, resource, corner, extent, resolution, time_range, filter_ids=None, iso=False,
+               no_cache=False):
+        self.reads.append((tuple(corner), tuple(extent)))
+        x = np.arange(corner[0], corner[0] + extent[0], dtype=np.uint64) // 512 + 1
+        cube = MagicMock()
+        cube.data = np.tile(x, (time_range[1] - time_range[0], extent[2], extent[1], 1))
+        return cube
+
+
+def make_resource():
+    resource = MagicMock()
+    resource.get_numpy_data_type.return_value = np.uint64
+    resource.get_lookup_key.return_value = "1&1&1"
+    return resource
+
+
+def make_index(cuboids):
+    """Id index that lists cuboids with a simple base 1000 key instead of morton ids"""
+    index = MagicMock()
+    index.get_cuboids.side_effect = lambda resource, resolution, obj_id: [str(x + 1000 * y + 1000000 * z)
+                                                                          for x, y, z in cuboids.get(obj_id, [])]
+    return index
+
+
+def decode(key):
+    return [key % 1000, key // 1000 % 1000, key // 1000000]
+
+
+@override_settings(CUTOUT_FILTER_INDEX_ENABLED=True, CUTOUT_FILTER_INDEX_MAX_IDS=10, CUTOUT_FILTER_INDEX_DELAY=0,
+                   WRITE_VERSION_CACHE_ALIAS='default')
+class TestIdFilter(SimpleTestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        ndlib = MagicMock()
+        ndlib.MortonXYZ.side_effect = lambda morton: decode(morton)
+        patcher = patch('bossspatialdb.id_filter.ndlib', ndlib)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def cutout(self, cuboids, corner, extent, filter_ids):
+        spatialdb = MockSpatialDB()
+        with patch('bossspatialdb.id_filter.get_object_indices', return_value=make_index(cuboids)):
+            id_filter = IdFilter.create(make_resource(), 0, np.array(filter_ids, dtype=np.uint64))
+            cube = id_filter.cutout(spatialdb, corner, extent, [0, 1])
+        return cube.data, spatialdb.reads
+
+    def test_mask_ids(self):
+        """Test that only the requested ids are kept"""
+        data = np.array([[1, 2, 3], [4, 2, 1]], dtype=np.uint64)
+        np.testing.assert_array_equal(mask_ids(data, np.array([1, 2], dtype=np.uint64)), [[1, 2, 0], [0, 2, 1]])
+
+    def test_cuboid_runs(self):
+        """Test that consecutive cuboids along x are grouped"""
+        runs = get_cuboid_runs([(2, 0, 0), (0, 0, 0), (1, 0, 0), (4, 0, 0), (0, 1, 0)])
+        self.assertEqual(runs, [((0, 0, 0), 3), ((4, 0, 0), 1), ((0, 1, 0), 1)])
+
+    def test_create(self):
+        """Test that the index is only used when enabled and for a small number of ids"""
+        resource = make_resource()
+        self.assertIsNone(IdFilter.create(resource, 0, None))
+        self.assertIsNone(IdFilter.create(resource, 0, np.arange(1, 12, dtype=np.uint64)))
+        self.assertIsNone(IdFilter.create(resource, 0, np.array([1], dtype=np.uint64), iso=True))
+        self.assertIsNotNone(IdFilter.create(resource, 0, np.array([1], dtype=np.uint64)))
+        self.assertIsNone(IdFilter.create(resource, 1, np.array([1], dtype=np.uint64)))
+        with self.settings(CUTOUT_FILTER_INDEX_ENABLED=False):
+            self.assertIsNone(IdFilter.create(resource, 0, np.array([1], dtype=np.uint64)))
+
+    def test_only_indexed_cuboids_read(self):
+        """Test that cuboids without the ids are returned as zeros without being read"""
+        data, reads = self.cutout({2: [(1, 0, 0)]}, (100, 0, 0), (1300, 8, 2), [2])
+        self.assertEqual(reads, [((512, 0, 0), (512, 8, 2))])
+
+        expected = np.zeros((1, 2, 8, 1300), dtype=np.uint64)
+        expected[:, :, :, 412:924] = 2
+        np.testing.assert_array_equal(data, expected)
+
+    def test_unindexed_write_read(self):
+        """Test that cuboids written through the API are read even if they are not in the index yet"""
+        WriteVersions("1&1&1", 0).bump_region((1024, 0, 0), (512, 8, 2), [0, 1])
+        data, reads = self.cutout({}, (0, 0, 0), (1536, 8, 2), [3])
+        self.assertEqual(reads, [((1024, 0, 0), (512, 8, 2))])
+        self.assertTrue((data[:, :, :, 1024:] == 3).all())
+        self.assertFalse(data[:, :, :, :1024].any())
+
+    def test_write_state_incomplete(self):
+        """Test that every cuboid is read until the write versions have been kept for CUTOUT_FILTER_INDEX_DELAY"""
+        with self.settings(CUTOUT_FILTER_INDEX_DELAY=3600):
+            data, reads = self.cutout({2: [(1, 0, 0)]}, (0, 0, 0), (1536, 8, 2), [2])
+        self.assertEqual(reads, [((0, 0, 0), (1536, 8, 2))])
+        self.assertTrue((data[:, :, :, 512:1024] == 2).all())
+
+    def test_all_cuboids_needed(self):
+        """Test that the region is read once if every cuboid may contain the ids"""
+        data, reads = self.cutout({1: [(0, 0, 0)], 2: [(1, 0, 0)]}, (0, 0, 0), (1024, 8, 2), [2, 1])
+        self.assertEqual(reads, [((0, 0, 0), (1024, 8, 2))])
+        self.assertTrue((data[:, :, :, :512] == 1).all())
+        self.assertTrue((data[:, :, :, 512:] == 2).all())
+
+    def test_index_error(self):
+        """Test that every cuboid is read if the index cannot be read"""
+        index = MagicMock()
+        index.get_cuboids.side_effect = RuntimeError("Index unavailable")
+        spatialdb = MockSpatialDB()
+        with patch('bossspatialdb.id_filter.get_object_indices', return_value=index):
+            id_filter = IdFilter.create(make_resource(), 0, np.array([2], dtype=np.uint64))
+            data = id_filter.cutout(spatialdb, (0, 0, 0), (1024, 8, 2), [0, 1]).data
+        self.assertEqual(spatialdb.reads, [((0, 0, 0), (1024, 8, 2))])
+        self.assertTrue((data[:, :, :, 512:] == 2).all())
@@ -0,0 +1,69 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.test import SimpleTestCase
+
+from unittest.mock import patch
+
+from bossspatialdb.pool import get_spatialdb, get_write_executor, reset_spatialdb_pool
+
+
+class MockSpatialDB(object):
+    """Stand in for SpatialDB that records how many times it was constructed"""
+    num_created = 0
+
+    def __init__(self, kv_conf, state_conf, object_store_conf):
+        MockSpatialDB.num_created += 1
+
+
+@patch('spdb.spatialdb.SpatialDB', MockSpatialDB)
+class TestSpatialDBPool(SimpleTestCase):
+
+    def setUp(self):
+        reset_spatialdb_pool()
+        MockSpatialDB.num_created = 0
+
+    def tearDown(self):
+        reset_spatialdb_pool()
+
+    def test_instance_reused(self):
+        """Test that the same instance is returned within a process"""
+        first = get_spatialdb()
+        second = get_spatialdb()
+        self.assertIs(first, second)
+        self.assertEqual(MockSpatialDB.num_created, 1)
+
+    def test_reset(self):
+        """Test that a reset creates a new instance"""
+        first = get_spatialdb()
+        reset_spatialdb_pool()
+        second = get_spatialdb()
+        self.assertIsNot(first, second)
+        self.assertEqual(MockSpatialDB.num_created, 2)
+
+    def test_new_instance_after_fork(self):
+        """Test that a process with a different pid never reuses the parent's instance"""
+        first = get_spatialdb()
+        with patch('os.getpid', return_value=-1):
+            second = get_spatialdb()
+        self.assertIsNot(first, second)
+        self.assertIsInstance(second, MockSpatialDB)
+
+    def test_write_executor_reused(self):
+        """Test that the same write thread pool is returned within a process and dropped after a fork"""
+        first = get_write_executor()
+        self.assertIs(first, get_write_executor())
+        with patch('os.getpid', return_value=-1):
+            second = get_write_executor()
+        self.assertIsNot(first, second)
@@ -0,0 +1,132 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from unittest.mock import MagicMock, patch
+
+from bossspatialdb.prefetch import Prefetcher, get_prefetch_stats, predict_next, release_slot
+
+CUBOID_SIZE = (512, 512, 16)
+IMAGE_SIZE = (4096, 4096, 256)
+
+
+def make_resource():
+    resource = MagicMock()
+    resource.get_lookup_key.return_value = "1&1&1"
+    resource.get_bit_depth.return_value = 8
+    resource.get_downsampled_extent_dims.return_value = [list(IMAGE_SIZE)]
+    return resource
+
+
+def make_user(username="user1"):
+    user = MagicMock()
+    user.username = username
+    return user
+
+
+class ImmediateExecutor:
+    """Stand in for the prefetch thread pool that records each prefetch instead of running it"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fcn, *args):
+        self.submitted.append(args[1:3])
+        release_slot()
+
+
+class TestPredictNext(SimpleTestCase):
+
+    def test_z_scroll(self):
+        """Test that scrolling forward in z predicts the next cuboid layer in z"""
+        self.assertEqual(predict_next((0, 0, 3), (0, 0, 4), (512, 512, 1), CUBOID_SIZE, IMAGE_SIZE),
+                         ((0, 0, 16), (512, 512, 16)))
+
+    def test_z_scroll_back(self):
+        """Test that scrolling backward in z predicts the previous cuboid layer in z"""
+        self.assertEqual(predict_next((0, 0, 21), (0, 0, 20), (512, 512, 1), CUBOID_SIZE, IMAGE_SIZE),
+                         ((0, 0, 0), (512, 512, 16)))
+
+    def test_xy_pan(self):
+        """Test that panning in x predicts the next column of cuboids over the same y and z range"""
+        self.assertEqual(predict_next((0, 100, 5), (512, 100, 5), (512, 512, 1), CUBOID_SIZE, IMAGE_SIZE),
+                         ((1024, 100, 5), (512, 512, 1)))
+
+    def test_not_sequential(self):
+        """Test that jumps and repeated reads are not predicted"""
+        self.assertIsNone(predict_next((0, 0, 5), (0, 0, 5), (512, 512, 1), CUBOID_SIZE, IMAGE_SIZE))
+        self.assertIsNone(predict_next((0, 0, 5), (2048, 0, 5), (512, 512, 1), CUBOID_SIZE, IMAGE_SIZE))
+
+    def test_edge(self):
+        """Test that nothing is predicted past the edge of the channel"""
+        self.assertIsNone(predict_next((0, 0, 254), (0, 0, 255), (512, 512, 1), CUBOID_SIZE, IMAGE_SIZE))
+        self.assertIsNone(predict_next((0, 0, 3), (0, 0, 2), (512, 512, 1), CUBOID_SIZE, IMAGE_SIZE))
+
+
+@override_settings(PREFETCH_ENABLED=True, PREFETCH_CACHE_ALIAS='default', PREFETCH_MAX_INFLIGHT=4,
+                   PREFETCH_USER_RATE=100, PREFETCH_MAX_SIZE=64 * 1048576, PREFETCH_HISTORY_TIMEOUT=60)
+class TestPrefetcher(SimpleTestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.executor = ImmediateExecutor()
+        patcher = patch('bossspatialdb.prefetch.get_prefetch_executor', return_value=self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def scroll(self, z_values, user=None):
+        prefetcher = Prefetcher(user or make_user(), make_resource(), 0)
+        return [prefetcher.observe((0, 0, z), (512, 512, 1), [0, 1]) for z in z_values]
+
+    def test_scroll_prefetches_once_per_layer(self):
+        """Test that scrolling through a cuboid layer prefetches the next layer once"""
+        self.scroll(range(0, 20))
+        self.assertEqual(self.executor.submitted, [((0, 0, 16), (512, 512, 16)), ((0, 0, 32), (512, 512, 16))])
+
+    def test_hits_and_misses(self):
+        """Test that predictions are scored once the reads leave the current cuboids"""
+        self.scroll(range(0, 17))
+        self.assertEqual(get_prefetch_stats()["hits"], 1)
+
+        # Reverse direction, leaving the predicted layer unread
+        self.scroll([17, 16, 15])
+        stats = get_prefetch_stats()
+        self.assertEqual(stats["issued"], 3)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 2)
+
+    def test_users_tracked_separately(self):
+        """Test that interleaved reads of two users are not mistaken for a direction"""
+        prefetcher1 = Prefetcher(make_user("user1"), make_resource(), 0)
+        prefetcher2 = Prefetcher(make_user("user2"), make_resource(), 0)
+        prefetcher1.observe((0, 0, 5), (512, 512, 1), [0, 1])
+        prefetcher2.observe((0, 0, 100), (512, 512, 1), [0, 1])
+        self.assertIsNone(prefetcher2.observe((0, 0, 50), (512, 512, 1), [0, 1]))
+        self.assertIsNotNone(prefetcher1.observe((0, 0, 6), (512, 512, 1), [0, 1]))
+
+    def test_rate_limit(self):
+        """Test that prefetches over the user's rate are skipped"""
+        with self.settings(PREFETCH_USER_RATE=1), patch('bossspatialdb.prefetch.time.time', return_value=1000.0):
+            self.scroll([0, 1, 16, 17, 32, 33])
+        self.assertEqual(len(self.executor.submitted), 1)
+        self.assertEqual(get_prefetch_stats()["skipped"], 2)
+
+    def test_max_size(self):
+        """Test that regions over PREFETCH_MAX_SIZE are not prefetched"""
+        with self.settings(PREFETCH_MAX_SIZE=1024):
+            self.scroll([0, 1])
+        self.assertEqual(self.executor.submitted, [])
+        self.assertEqual(get_prefetch_stats()["skipped"], 1)
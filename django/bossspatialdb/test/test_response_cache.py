@@ -0,0 +1,87 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.core.cache import caches
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from rest_framework.response import Response
+from unittest.mock import MagicMock
+
+from bossspatialdb.response_cache import CutoutResponseCache
+from bossspatialdb.write_state import WriteVersions
+
+
+def make_request(x_start=0, x_stop=100, filter_ids=None):
+    """Build a stand in for a validated BossRequest"""
+    req = MagicMock()
+    req.get_x_start.return_value = x_start
+    req.get_y_start.return_value = 0
+    req.get_z_start.return_value = 0
+    req.get_x_span.return_value = x_stop - x_start
+    req.get_y_span.return_value = 100
+    req.get_z_span.return_value = 10
+    req.get_time.return_value = range(0, 1)
+    req.get_resolution.return_value = 0
+    req.get_lookup_key.return_value = "1&1&1"
+    req.get_filter_ids.return_value = filter_ids
+    req.time_request = False
+    return req
+
+
+def make_response(content, media_type='application/blosc'):
+    """Build a rendered DRF response"""
+    response = Response()
+    response.status_code = 200
+    response['Content-Type'] = media_type
+    response.content = content
+    return response
+
+
+@override_settings(CUTOUT_CACHE_ENABLED=True, CUTOUT_CACHE_MAX_ENTRY_SIZE=1024)
+class TestCutoutResponseCache(SimpleTestCase):
+
+    def setUp(self):
+        caches[settings.CUTOUT_CACHE_ALIAS].clear()
+        caches[settings.WRITE_VERSION_CACHE_ALIAS].clear()
+
+    def test_hit_after_store(self):
+        """Test that a stored response is returned for the same region"""
+        CutoutResponseCache(make_request(), 'application/blosc')._store(make_response(b'abc'))
+
+        cached = CutoutResponseCache(make_request(), 'application/blosc').get()
+        self.assertEqual(cached.content, b'abc')
+        self.assertEqual(cached['Content-Type'], 'application/blosc')
+
+    def test_miss_for_other_media_type_or_filter(self):
+        """Test that the media type and filter ids are part of the key"""
+        CutoutResponseCache(make_request(), 'application/blosc')._store(make_response(b'abc'))
+
+        self.assertIsNone(CutoutResponseCache(make_request(), 'application/npygz').get())
+        self.assertIsNone(CutoutResponseCache(make_request(filter_ids=[1, 2]), 'application/blosc').get())
+
+    def test_invalidated_by_overlapping_write(self):
+        """Test that a write to an overlapping region invalidates the entry"""
+        CutoutResponseCache(make_request(), 'application/blosc')._store(make_response(b'abc'))
+        WriteVersions("1&1&1", 0).bump_region((50, 50, 5), (10, 10, 1), [0, 1])
+
+        self.assertIsNone(CutoutResponseCache(make_request(), 'application/blosc').get())
+
+    def test_large_or_error_responses_not_stored(self):
+        """Test that oversized responses and error fallbacks are not stored"""
+        CutoutResponseCache(make_request(), 'application/blosc')._store(make_response(b'a' * 2048))
+        self.assertIsNone(CutoutResponseCache(make_request(), 'application/blosc').get())
+
+        CutoutResponseCache(make_request(), 'application/blosc')._store(make_response(b'{}', 'application/json'))
+        self.assertIsNone(CutoutResponseCache(make_request(), 'application/blosc').get())
@@ -0,0 +1,64 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import numpy as np
+
+from bossspatialdb.segmentation import encode_compressed_segmentation, decode_compressed_segmentation
+from bossspatialdb.segmentation import get_encoded_bits, get_max_encoded_size
+
+
+class TestCompressedSegmentation(unittest.TestCase):
+
+    def test_encoded_bits(self):
+        """Test the number of bits used for different lookup table sizes"""
+        bits = get_encoded_bits(np.array([1, 2, 3, 4, 5, 16, 17, 256, 257, 512]))
+        np.testing.assert_array_equal(bits, [0, 1, 2, 2, 4, 4, 8, 8, 16, 16])
+
+    def test_round_trip(self):
+        """Test encoding and decoding unaligned volumes with different numbers of labels"""
+        for num_labels in [1, 2, 5, 300, 100000]:
+            data = np.random.randint(0, num_labels, (17, 30, 50)).astype(np.uint64) * np.uint64(2 ** 40 + 7)
+            encoded = encode_compressed_segmentation(data)
+            np.testing.assert_array_equal(decode_compressed_segmentation(encoded, data.shape), data)
+
+    def test_round_trip_time(self):
+        """Test that time samples are encoded as channels"""
+        data = np.random.randint(0, 4, (2, 9, 16, 16)).astype(np.uint64)
+        encoded = encode_compressed_segmentation(data)
+        self.assertEqual(np.frombuffer(encoded[:4], dtype='<u4')[0], 2)
+        np.testing.assert_array_equal(decode_compressed_segmentation(encoded, data.shape), data)
+
+    def test_max_encoded_size(self):
+        """Test that no volume encodes to more than the largest valid encoding"""
+        for shape in [(8, 8, 8), (17, 30, 50), (2, 9, 16, 16)]:
+            data = np.arange(np.prod(shape), dtype=np.uint64).reshape(shape)
+            self.assertLessEqual(len(encode_compressed_segmentation(data)), get_max_encoded_size(shape))
+
+    def test_single_label_block(self):
+        """Test the exact encoding of a volume with a single block and label"""
+        data = np.full((8, 8, 8), 2 ** 32 + 5, dtype=np.uint64)
+        words = np.frombuffer(encode_compressed_segmentation(data), dtype='<u4')
+
+        # Channel offset, block header (table at word 2 of the channel, 0 bits, values at word 4), table entry
+        np.testing.assert_array_equal(words, [1, 2, 4, 5, 1])
+
+    def test_malformed(self):
+        """Test that data that does not match the shape is rejected"""
+        encoded = encode_compressed_segmentation(np.ones((8, 8, 8), dtype=np.uint64))
+        with self.assertRaises(ValueError):
+            decode_compressed_segmentation(encoded[:-4], (8, 8, 16))
+        with self.assertRaises(ValueError):
+            decode_compressed_segmentation(encoded[:-2], (8, 8, 8))
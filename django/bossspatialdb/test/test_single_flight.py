@@ -0,0 +1,130 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test import SimpleTestCase, override_settings
+
+from bossspatialdb.single_flight import SingleFlight, SingleFlightMixin
+
+
+class BaseView:
+    """Stand in for APIView"""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        return response
+
+    def handle_exception(self, exc):
+        raise exc
+
+
+class SingleFlightView(SingleFlightMixin, BaseView):
+    pass
+
+
+@override_settings(SINGLE_FLIGHT_ENABLED=True, SINGLE_FLIGHT_CACHE_ALIAS='default', SINGLE_FLIGHT_LOCK_TIMEOUT=60,
+                   SINGLE_FLIGHT_WAIT_TIMEOUT=5, SINGLE_FLIGHT_POLL_INTERVAL=0.01, SINGLE_FLIGHT_RESULT_TIMEOUT=60,
+                   SINGLE_FLIGHT_MAX_RESULT_SIZE=1024, SINGLE_FLIGHT_MAX_WAITERS=2)
+class TestSingleFlight(SimpleTestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_single_leader(self):
+        """Test that only the first request for a tag leads"""
+        self.assertTrue(SingleFlight("tag1").acquire())
+        self.assertFalse(SingleFlight("tag1").acquire())
+        self.assertTrue(SingleFlight("tag2").acquire())
+
+    def test_follower_gets_result(self):
+        """Test that a waiting request returns the leader's rendered response"""
+        leader = SingleFlight("tag1")
+        leader.acquire()
+
+        def finish():
+            leader._publish(HttpResponse(b"cutout", content_type="application/blosc"))
+            leader.release()
+        threading.Timer(0.05, finish).start()
+
+        follower = SingleFlight("tag1")
+        self.assertFalse(follower.acquire())
+        response = follower.wait()
+        self.assertEqual(response.content, b"cutout")
+        self.assertEqual(response['Content-Type'], "application/blosc")
+
+    def test_follower_computes_if_not_published(self):
+        """Test that a waiting request computes the response if the leader finishes without publishing it"""
+        leader = SingleFlight("tag1")
+        leader.acquire()
+        leader._publish(HttpResponse(b"x" * 2048, content_type="application/blosc"))
+        leader._publish(HttpResponse(b"error", status=500))
+        leader.release()
+
+        follower = SingleFlight("tag1")
+        self.assertIsNone(follower.wait())
+        self.assertTrue(follower.acquire())
+
+    def test_wait_timeout(self):
+        """Test that a waiting request gives up after SINGLE_FLIGHT_WAIT_TIMEOUT"""
+        SingleFlight("tag1").acquire()
+        with self.settings(SINGLE_FLIGHT_WAIT_TIMEOUT=0.05):
+            self.assertIsNone(SingleFlight("tag1").wait())
+
+    def test_max_waiters(self):
+        """Test that requests beyond SINGLE_FLIGHT_MAX_WAITERS compute the response instead of waiting"""
+        SingleFlight("tag1").acquire()
+        waiters = [SingleFlight("tag1"), SingleFlight("tag1")]
+        for waiter in waiters:
+            self.assertTrue(waiter.join())
+        self.assertFalse(SingleFlight("tag1").join())
+        with self.settings(SINGLE_FLIGHT_WAIT_TIMEOUT=5):
+            self.assertIsNone(SingleFlight("tag1").wait())
+
+        # A waiting request that gives up frees its place
+        waiters[0].leave()
+        self.assertTrue(SingleFlight("tag1").join())
+
+    def test_release_only_own_lock(self):
+        """Test that a leader whose lock expired does not release the next leader's lock"""
+        leader = SingleFlight("tag1")
+        leader.acquire()
+        caches['default'].delete(leader.lock_key)
+        self.assertTrue(SingleFlight("tag1").acquire())
+        leader.release()
+        self.assertFalse(SingleFlight("tag1").acquire())
+
+    def test_released_on_close(self):
+        """Test that the leader's lock is attached to the response and released when it is closed"""
+        view = SingleFlightView()
+        self.assertIsNone(view.coalesce("tag1"))
+        response = view.finalize_response(None, HttpResponse())
+        self.assertFalse(SingleFlight("tag1").acquire())
+        response.close()
+        self.assertTrue(SingleFlight("tag1").acquire())
+
+    def test_released_on_exception(self):
+        """Test that the leader's lock is released if the view raises"""
+        view = SingleFlightView()
+        view.coalesce("tag1")
+        with self.assertRaises(ValueError):
+            view.handle_exception(ValueError())
+        self.assertTrue(SingleFlight("tag1").acquire())
+
+    def test_disabled(self):
+        """Test that nothing is coalesced when disabled"""
+        with self.settings(SINGLE_FLIGHT_ENABLED=False):
+            self.assertIsNone(SingleFlightView().coalesce("tag1"))
+        self.assertTrue(SingleFlight("tag1").acquire())
@@ -0,0 +1,78 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.test import SimpleTestCase
+
+import numpy as np
+
+from bossspatialdb.write import CuboidWriter, CuboidWriteError, get_cuboid_blocks
+
+
+class MockCache:
+    """Stand in for SpatialDB that records each write and fails writes at the given corners"""
+
+    def __init__(self, fail_corners=()):
+        self.writes = {}
+        self.fail_corners = fail_corners
+        self.contiguous = True
+
+    def write_cuboid(self, resource, corner, resolution, data, time_sample, iso=False):
+        if corner in self.fail_corners:
+            raise Exception("write failed")
+        self.contiguous = self.contiguous and data.flags['C_CONTIGUOUS']
+        self.writes[corner] = (data.copy(), time_sample, iso)
+
+
+class TestCuboidWriter(SimpleTestCase):
+
+    def test_get_cuboid_blocks(self):
+        """Test that a region is split on cuboid boundaries"""
+        blocks = get_cuboid_blocks((500, 0, 10), (30, 10, 10), (512, 512, 16))
+        self.assertEqual(blocks, [((500, 0, 10), (12, 10, 6)), ((512, 0, 10), (18, 10, 6)),
+                                  ((500, 0, 16), (12, 10, 4)), ((512, 0, 16), (18, 10, 4))])
+
+    def test_single_cuboid(self):
+        """Test that a region within a single cuboid is written with one call"""
+        cache = MockCache()
+        data = np.random.randint(1, 255, (1, 4, 20, 20)).astype(np.uint8)
+        CuboidWriter(cache, None, 0, iso=True).write((0, 0, 0), data, 3)
+        self.assertEqual(list(cache.writes), [(0, 0, 0)])
+        np.testing.assert_array_equal(cache.writes[(0, 0, 0)][0], data)
+        self.assertEqual(cache.writes[(0, 0, 0)][1:], (3, True))
+
+    def test_multiple_cuboids(self):
+        """Test that every block of a region spanning several cuboids is written with the matching data"""
+        cache = MockCache()
+        data = np.random.randint(1, 255, (2, 20, 30, 600)).astype(np.uint8)
+        CuboidWriter(cache, None, 0).write((10, 0, 8), data, 0)
+
+        self.assertEqual(len(cache.writes), 4)
+        result = np.zeros(data.shape, dtype=np.uint8)
+        for corner, (block, _, _) in cache.writes.items():
+            x = corner[0] - 10
+            z = corner[2] - 8
+            result[:, z:z + block.shape[1], :, x:x + block.shape[3]] = block
+        np.testing.assert_array_equal(result, data)
+        self.assertTrue(cache.contiguous)
+
+    def test_failures(self):
+        """Test that the failed cuboids are reported and the others are still written"""
+        cache = MockCache(fail_corners=[(512, 0, 0)])
+        data = np.ones((1, 8, 8, 600), dtype=np.uint8)
+        with self.assertRaises(CuboidWriteError) as err:
+            CuboidWriter(cache, None, 0).write((0, 0, 0), data, 0)
+
+        self.assertEqual(err.exception.failures, [((512, 0, 0), (88, 8, 8), "write failed")])
+        self.assertIn("512:600/0:8/0:8", str(err.exception))
+        self.assertEqual(list(cache.writes), [(0, 0, 0)])
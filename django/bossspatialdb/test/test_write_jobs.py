@@ -0,0 +1,141 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from unittest.mock import patch
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from bosscore.error import BossError, ErrorCodes
+from bossspatialdb.write_jobs import WriteJob, clean_spool_dirs, get_worker_key, COMPLETE, FAILED, \
+    QUEUED
+from bossspatialdb.test.test_write import MockCache
+
+
+class TestWriteJob(SimpleTestCase):
+
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(CUTOUT_ASYNC_SPOOL_DIR=self.spool_dir,
+                                                   CUTOUT_ASYNC_SPOOL_MAX_SIZE=1048576,
+                                                   CUTOUT_ASYNC_SPOOL_MIN_FREE=0)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.spool_dir)
+
+    def run_job(self, cache, data, corner):
+        """Create, spill and run a job in the current thread"""
+        extent = (data.shape[3], data.shape[2], data.shape[1])
+        job = WriteJob.create("user", "1&1&1", 0, corner, extent, [0, data.shape[0]])
+        self.assertEqual(job.state["status"], QUEUED)
+        job.spill(data)
+
+        with patch('bossspatialdb.write_jobs.get_spatialdb', return_value=cache), \
+                patch('bossspatialdb.write_jobs.mark_not_downsampled') as mark:
+            job.run(None)
+        mark.assert_called_once_with(None)
+        return WriteJob.get(job.job_id)
+
+    def test_complete(self):
+        """Test that every cuboid is written and progress is reported in cuboids"""
+        cache = MockCache()
+        data = np.random.randint(1, 255, (2, 40, 16, 600)).astype(np.uint8)
+        job = self.run_job(cache, data, (0, 0, 0))
+
+        status = job.to_dict()
+        self.assertEqual(status["status"], COMPLETE)
+        self.assertEqual(status["cuboids_total"], 12)
+        self.assertEqual(status["cuboids_written"], 12)
+        self.assertEqual(status["cuboids_failed"], 0)
+        self.assertFalse(os.path.exists(job.state["spool_path"]))
+
+        result = np.zeros(data.shape, dtype=np.uint8)
+        for corner, (block, _, _) in cache.writes.items():
+            result[:, corner[2]:corner[2] + block.shape[1], :, corner[0]:corner[0] + block.shape[3]] = block
+        np.testing.assert_array_equal(result, data)
+
+    def test_failed_cuboids(self):
+        """Test that failed cuboids are counted and the remaining cuboids are still written"""
+        cache = MockCache(fail_corners=[(512, 0, 16)])
+        data = np.ones((1, 40, 16, 600), dtype=np.uint8)
+        job = self.run_job(cache, data, (0, 0, 0))
+
+        status = job.to_dict()
+        self.assertEqual(status["status"], FAILED)
+        self.assertEqual(status["cuboids_written"], 5)
+        self.assertEqual(status["cuboids_failed"], 1)
+        self.assertEqual(len(status["errors"]), 1)
+        self.assertEqual(len(cache.writes), 5)
+
+    def test_missing(self):
+        """Test that an unknown job is not found"""
+        self.assertIsNone(WriteJob.get("0" * 32))
+
+    def test_stale_worker(self):
+        """Test that a queued job is reported as failed once its worker stops heartbeating"""
+        job = WriteJob.create("user", "1&1&1", 0, (0, 0, 0), (16, 16, 16), [0, 1])
+        job.spill(np.zeros((1, 16, 16, 16), dtype=np.uint8))
+        self.assertEqual(WriteJob.get(job.job_id).to_dict()["status"], QUEUED)
+
+        caches['default'].delete(get_worker_key(job.state["worker"]))
+        status = WriteJob.get(job.job_id).to_dict()
+        self.assertEqual(status["status"], FAILED)
+        self.assertEqual(len(status["errors"]), 1)
+        self.assertFalse(os.path.exists(job.state["spool_path"]))
+
+    def test_stale_worker_run(self):
+        """Test that a job marked as failed by another worker is not written or overwritten by its runner"""
+        cache = MockCache()
+        job = WriteJob.create("user", "1&1&1", 0, (0, 0, 0), (16, 16, 16), [0, 1])
+        job.spill(np.ones((1, 16, 16, 16), dtype=np.uint8))
+        caches['default'].delete(get_worker_key(job.state["worker"]))
+        WriteJob.get(job.job_id)
+
+        with patch('bossspatialdb.write_jobs.get_spatialdb', return_value=cache), \
+                patch('bossspatialdb.write_jobs.mark_not_downsampled') as mark:
+            job.run(None)
+        mark.assert_not_called()
+        self.assertEqual(len(cache.writes), 0)
+
+        status = WriteJob.get(job.job_id).to_dict()
+        self.assertEqual(status["status"], FAILED)
+        self.assertEqual(len(status["errors"]), 1)
+
+    def test_spool_quota(self):
+        """Test that a payload over the spool quota is rejected and its job marked as failed"""
+        data = np.zeros((1, 16, 256, 512), dtype=np.uint8)
+        job = WriteJob.create("user", "1&1&1", 0, (0, 0, 0), (512, 256, 16), [0, 1])
+        with self.assertRaises(BossError) as context:
+            job.spill(data)
+        self.assertEqual(context.exception.error_code, ErrorCodes.TOO_MANY_REQUESTS)
+        self.assertEqual(WriteJob.get(job.job_id).to_dict()["status"], FAILED)
+        self.assertFalse(os.path.exists(job.state["spool_path"]))
+
+    def test_clean_spool_dirs(self):
+        """Test that spool directories of stopped processes are removed"""
+        job = WriteJob.create("user", "1&1&1", 0, (0, 0, 0), (16, 16, 16), [0, 1])
+        job.spill(np.zeros((1, 16, 16, 16), dtype=np.uint8))
+        stopped = os.path.join(self.spool_dir, "999999999")
+        os.makedirs(stopped)
+
+        with patch('bossspatialdb.write_jobs.is_pid_running', return_value=False):
+            clean_spool_dirs()
+        self.assertFalse(os.path.exists(stopped))
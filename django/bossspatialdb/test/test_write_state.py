@@ -0,0 +1,103 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.core.cache import caches
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from unittest.mock import patch
+
+from bossspatialdb import write_state
+from bossspatialdb.write_state import WriteVersions, get_cuboid_indices, EPOCH_KEY
+
+
+class TestWriteVersions(SimpleTestCase):
+
+    def setUp(self):
+        caches[settings.WRITE_VERSION_CACHE_ALIAS].clear()
+        write_state._eviction_check['next'] = 0.0
+
+    def test_get_cuboid_indices_aligned(self):
+        """Test getting the cuboids for a cuboid aligned region"""
+        indices = get_cuboid_indices((0, 0, 0), (512, 512, 16), (512, 512, 16))
+        self.assertEqual(indices, [(0, 0, 0)])
+
+    def test_get_cuboid_indices_unaligned(self):
+        """Test getting the cuboids for a region that straddles cuboid boundaries"""
+        indices = get_cuboid_indices((500, 0, 15), (20, 10, 2), (512, 512, 16))
+        self.assertEqual(indices, [(0, 0, 0), (1, 0, 0), (0, 0, 1), (1, 0, 1)])
+
+    def test_overlapping_write_changes_version(self):
+        """Test that a write to an overlapping region changes the region version"""
+        versions = WriteVersions("1&1&1", 0)
+        before = versions.get_region_version((0, 0, 0), (600, 100, 10), [0, 1])
+        versions.bump_region((520, 0, 0), (10, 10, 10), [0, 1])
+        after = versions.get_region_version((0, 0, 0), (600, 100, 10), [0, 1])
+        self.assertNotEqual(before, after)
+
+    def test_disjoint_write_keeps_version(self):
+        """Test that writes to other cuboids, resolutions or time samples do not change the region version"""
+        versions = WriteVersions("1&1&1", 0)
+        before = versions.get_region_version((0, 0, 0), (100, 100, 10), [0, 1])
+        versions.bump_region((1024, 0, 0), (10, 10, 10), [0, 1])
+        versions.bump_region((0, 0, 0), (10, 10, 10), [1, 2])
+        WriteVersions("1&1&1", 1).bump_region((0, 0, 0), (10, 10, 10), [0, 1])
+        WriteVersions("1&1&2", 0).bump_region((0, 0, 0), (10, 10, 10), [0, 1])
+        after = versions.get_region_version((0, 0, 0), (100, 100, 10), [0, 1])
+        self.assertEqual(before, after)
+
+    def test_channel_bump_changes_version(self):
+        """Test that a channel wide bump changes every region version"""
+        versions = WriteVersions("1&1&1", 3)
+        before = versions.get_region_version((0, 0, 0), (100, 100, 10), [0, 1])
+        WriteVersions("1&1&1").bump_channel()
+        after = versions.get_region_version((0, 0, 0), (100, 100, 10), [0, 1])
+        self.assertNotEqual(before, after)
+
+    def test_evicted_version_not_reverted(self):
+        """Test that a region whose version keys were lost does not return to its state before the write"""
+        versions = WriteVersions("1&1&1", 0)
+        before = versions.get_region_version((0, 0, 0), (100, 100, 10), [0, 1])
+        versions.bump_region((0, 0, 0), (100, 100, 10), [0, 1])
+
+        caches[settings.WRITE_VERSION_CACHE_ALIAS].clear()
+        after = versions.get_region_version((0, 0, 0), (100, 100, 10), [0, 1])
+        self.assertNotEqual(before, after)
+
+    def test_epoch_shared(self):
+        """Test that unwritten regions get the same version from every instance while the epoch is kept"""
+        first = WriteVersions("1&1&1", 0).get_region_version((0, 0, 0), (100, 100, 10), [0, 1])
+        self.assertIsNotNone(caches[settings.WRITE_VERSION_CACHE_ALIAS].get(EPOCH_KEY))
+        second = WriteVersions("1&1&1", 0).get_region_version((0, 0, 0), (100, 100, 10), [0, 1])
+        self.assertEqual(first, second)
+
+    def test_eviction_starts_new_epoch(self):
+        """Test that keys evicted from the version store move every region to a new version"""
+        versions = WriteVersions("1&1&1", 0)
+        with patch('bossspatialdb.write_state.get_evicted_keys', return_value=0):
+            before = versions.get_region_version((0, 0, 0), (100, 100, 10), [0, 1])
+            write_state._eviction_check['next'] = 0.0
+            self.assertEqual(before, versions.get_region_version((0, 0, 0), (100, 100, 10), [0, 1]))
+
+        with patch('bossspatialdb.write_state.get_evicted_keys', return_value=3):
+            # Evictions are only checked every WRITE_VERSION_EVICTION_CHECK_INTERVAL seconds
+            self.assertEqual(before, versions.get_region_version((0, 0, 0), (100, 100, 10), [0, 1]))
+
+            write_state._eviction_check['next'] = 0.0
+            after = versions.get_region_version((0, 0, 0), (100, 100, 10), [0, 1])
+            self.assertNotEqual(before, after)
+
+            # The new epoch is kept until more keys are evicted
+            write_state._eviction_check['next'] = 0.0
+            self.assertEqual(after, versions.get_region_version((0, 0, 0), (100, 100, 10), [0, 1]))
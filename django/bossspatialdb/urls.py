@@ -18,6 +18,12 @@ from . import views
 
 urlpatterns = [
 
+    # Url to get the status of an asynchronous cutout write
+    url(r'^jobs/(?P<job_id>[0-9a-f]{32})/?$', views.CutoutWriteJob.as_view()),
+
+    # Url to handle a batch of cutouts from a single channel
+    url(r'^batch/(?P<collection>[\w_-]+)/(?P<experiment>[\w_-]+)/(?P<channel>[\w_-]+)/?$',
+        views.CutoutBatch.as_view()),
 
     # Url to handle cutout with a collection, experiment, channel/annotation project and  range time
     url(r'^(?P<collection>[\w_-]+)/(?P<experiment>[\w_-]+)/(?P<channel>[\w_-]+)/(?P<resolution>\d)/(?P<x_range>\d+:\d+)/(?P<y_range>\d+:\d+)/(?P<z_range>\d+:\d+)/(?P<t_range>\d+:\d+?)/?$',
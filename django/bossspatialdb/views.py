@@ -17,37 +17,56 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import authentication, permissions
 from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
-
-from .parsers import BloscParser, BloscPythonParser, NpygzParser, is_too_large
-from .renderers import BloscRenderer, BloscPythonRenderer, NpygzRenderer, JpegRenderer
-
-from django.http import HttpResponse
+from rest_framework.parsers import JSONParser
+
+from .parsers import BloscParser, BloscPythonParser, NpygzParser, BloscFramedParser, BloscFramedUpload, is_too_large
+from .parsers import CompressedSegmentationParser, OctetStreamParser, get_request_size
+from .renderers import BloscRenderer, BloscPythonRenderer, JpegRenderer, get_npy_renderers
+from .renderers import CompressedSegmentationRenderer, OctetStreamRenderer
+from .stream import CutoutStream
+from .pool import get_spatialdb
+from .response_cache import CutoutResponseCache
+from .write_state import WriteVersions
+from .compression import BloscOptions, NPY_MEDIA_TYPES, RAW_MEDIA_TYPE, iter_array_buffers, set_raw_headers
+from .batch import BatchCutout
+from .etag import get_cutout_tag, is_not_modified, not_modified, set_etag
+from .write import CuboidWriter, CuboidWriteError, mark_not_downsampled
+from .write_jobs import WriteJob
+from .admission import AdmissionMixin, get_region_bytes
+from .fallback import DownsampleFallback
+from .id_filter import IdFilter, ANNOTATION_INDEX_MAX
+from .prefetch import prefetch_next
+from .single_flight import SingleFlightMixin
+
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.conf import settings
 
 from bosscore.request import BossRequest
 from bosscore.error import BossError, BossHTTPError, BossParserError, ErrorCodes
 from bosscore.models import Channel
 
-from spdb.spatialdb.spatialdb import SpatialDB, CUBOIDSIZE
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
 from spdb import project
 import bossutils
 
 
-class Cutout(APIView):
+class Cutout(AdmissionMixin, SingleFlightMixin, APIView):
     """
     View to handle spatial cutouts by providing all datamodel fields
 
     * Requires authentication.
     """
     # Set Parser and Renderer
-    parser_classes = (BloscParser, BloscPythonParser, NpygzParser, BrowsableAPIRenderer)
-    renderer_classes = (BloscRenderer, BloscPythonRenderer, NpygzRenderer, JpegRenderer,
-                        JSONRenderer, BrowsableAPIRenderer)
+    parser_classes = (BloscParser, BloscPythonParser, NpygzParser, BloscFramedParser, CompressedSegmentationParser,
+                      OctetStreamParser, BrowsableAPIRenderer)
+    renderer_classes = (BloscRenderer, BloscPythonRenderer) + get_npy_renderers() + (
+        OctetStreamRenderer, JpegRenderer, CompressedSegmentationRenderer, JSONRenderer, BrowsableAPIRenderer)
 
     def __init__(self):
         super().__init__()
         self.data_type = None
         self.bit_depth = None
+        self.blosc_options = None
 
     def get(self, request, collection, experiment, channel, resolution, x_range, y_range, z_range, t_range=None):
         """
@@ -86,6 +105,14 @@ class Cutout(APIView):
         else:
             no_cache = False
 
+        if "stream" in request.query_params:
+            if request.query_params["stream"].lower() == "true":
+                stream = True
+            else:
+                stream = False
+        else:
+            stream = False
+
         if isinstance(request.data, BossParserError):
             return request.data.to_http()
 
@@ -107,6 +134,12 @@ class Cutout(APIView):
         except BossError as err:
             return err.to_http()
 
+        # Get the blosc codec settings negotiated through the Accept header or query params
+        try:
+            self.blosc_options = BloscOptions.from_request(request)
+        except BossError as err:
+            return err.to_http()
+
         # Convert to Resource
         resource = project.BossResourceDjango(req)
 
@@ -121,23 +154,105 @@ class Cutout(APIView):
             return BossHTTPError("Cutout request is over 500MB when uncompressed. Reduce cutout dimensions.",
                                  ErrorCodes.REQUEST_TOO_LARGE)
 
-        # Get interface to SPDB cache
-        cache = SpatialDB(settings.KVIO_SETTINGS,
-                          settings.STATEIO_CONFIG,
-                          settings.OBJECTIO_CONFIG)
-
         # Get the params to pull data out of the cache
         corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
         extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
+        time_range = [req.get_time().start, req.get_time().stop]
+
+        # Downsample on the fly if the channel's resolution hierarchy has not been built yet
+        encoding = self.blosc_options.get_key()
+        fallback = DownsampleFallback.from_request(resource, req, self.bit_depth, iso=iso)
+        if fallback:
+            # Streaming reads straight from the spatialdb, so the downsampled region is sent as a single response
+            stream = False
+            encoding = "{}&{}".format(encoding, fallback.get_tag(corner, extent, time_range))
+
+        # Page in the region this user is likely to read next
+        if not fallback:
+            prefetch_next(request, resource, req.get_resolution(), corner, extent, time_range, iso=iso)
+
+        # Tag the response with the write state of the region so clients can revalidate unchanged data for free
+        tag = get_cutout_tag(req, request.accepted_media_type, iso=iso, encoding=encoding, stream=stream)
+        if is_not_modified(request, tag):
+            return not_modified(tag)
+
+        # Get interface to SPDB cache
+        cache = get_spatialdb()
+
+        if stream:
+            # Reserve the uncompressed size of the cutout until the response has been sent
+            admission_error = self.admit(request, get_region_bytes(req, self.bit_depth))
+            if admission_error:
+                return admission_error
+
+            # Stream cuboid aligned z-slabs instead of building the full cube in memory
+            media_type = request.accepted_renderer.media_type
+            cutout_stream = CutoutStream(cache, resource, corner, extent, req.get_resolution(), time_range,
+                                         req.time_request, filter_ids=req.get_filter_ids(), iso=iso,
+                                         no_cache=no_cache)
+            if media_type == BloscRenderer.media_type:
+                frames = cutout_stream.blosc_frames(self.bit_depth, self.blosc_options)
+            elif media_type in NPY_MEDIA_TYPES:
+                frames = cutout_stream.npy_frames(resource.get_numpy_data_type(), NPY_MEDIA_TYPES[media_type])
+            elif media_type == RAW_MEDIA_TYPE:
+                response = StreamingHttpResponse(cutout_stream.raw_frames(), content_type=media_type)
+                set_raw_headers(response, resource.get_numpy_data_type(), cutout_stream.get_shape())
+                return set_etag(response, tag)
+            else:
+                return BossHTTPError("Streaming is only supported for {}, {} and npy cutouts ({})"
+                                     .format(BloscRenderer.media_type, RAW_MEDIA_TYPE,
+                                             ", ".join(sorted(NPY_MEDIA_TYPES))),
+                                     ErrorCodes.INVALID_ARGUMENT)
+            return set_etag(StreamingHttpResponse(frames, content_type=media_type), tag)
+
+        # Serve repeat reads of an unchanged region from the rendered response cache
+        # Uncompressed responses are not cached
+        is_raw = request.accepted_renderer.media_type == RAW_MEDIA_TYPE
+        response_cache = None
+        if CutoutResponseCache.is_enabled() and not no_cache and not is_raw:
+            response_cache = CutoutResponseCache(req, request.accepted_media_type, iso=iso, encoding=encoding,
+                                                 tag=tag)
+            cached_response = response_cache.get()
+            if cached_response is not None:
+                return set_etag(cached_response, tag)
+
+        # Wait for an identical request that is already reading the region instead of reading it again
+        if not no_cache and not is_raw:
+            coalesced_response = self.coalesce(tag)
+            if coalesced_response is not None:
+                return set_etag(coalesced_response, tag)
+
+        # Reserve the uncompressed size of the cutout until the response has been sent
+        admission_error = self.admit(request, get_region_bytes(req, self.bit_depth))
+        if admission_error:
+            return admission_error
 
         # Get a Cube instance with all time samples
-        data = cache.cutout(resource, corner, extent, req.get_resolution(), [req.get_time().start, req.get_time().stop],
-                            filter_ids=req.get_filter_ids(), iso=iso, no_cache=no_cache)
+        id_filter = IdFilter.create(resource, req.get_resolution(), req.get_filter_ids(), iso=iso)
+        if fallback:
+            data = fallback.cutout(cache, corner, extent, time_range, filter_ids=req.get_filter_ids(),
+                                   no_cache=no_cache)
+        elif id_filter:
+            # Only read the cuboids that contain the filtered ids
+            data = id_filter.cutout(cache, corner, extent, time_range, iso=iso, no_cache=no_cache)
+        else:
+            data = cache.cutout(resource, corner, extent, req.get_resolution(), time_range,
+                                filter_ids=req.get_filter_ids(), iso=iso, no_cache=no_cache)
+
+        if is_raw:
+            # Send the cube's own buffer instead of copying it into a rendered response
+            cube = data.data if req.time_request else data.data[0]
+            response = StreamingHttpResponse(iter_array_buffers(cube), content_type=RAW_MEDIA_TYPE)
+            return set_etag(set_raw_headers(response, cube.dtype, cube.shape), tag)
+
         to_renderer = {"time_request": req.time_request,
                        "data": data}
 
         # Send data to renderer
-        return Response(to_renderer)
+        response = set_etag(Response(to_renderer), tag)
+        if response_cache:
+            return response_cache.store_on_render(response)
+        return response
 
     def post(self, request, collection, experiment, channel, resolution, x_range, y_range, z_range, t_range=None):
         """
@@ -169,10 +284,35 @@ class Cutout(APIView):
         else:
             iso = False
 
+        # Check for optional async flag
+        is_async = request.query_params.get("async", "").lower() == "true"
+
         # Get BossRequest and BossResource from parser
         req = request.data[0]
         resource = request.data[1]
 
+        # Framed uploads are decoded and written one slab at a time
+        if isinstance(request.data[2], BloscFramedUpload):
+            if is_async:
+                job = self.create_write_job(request, req, resource, iso)
+                try:
+                    job.spill_frames(request.data[2], request.data[2].dtype)
+                except BossError as err:
+                    request.data[2].consume()
+                    return err.to_http()
+                job.submit(resource)
+                return JsonResponse(job.to_dict(), status=202)
+
+            try:
+                self.write_frames(resource, req, request.data[2], iso)
+            except BossError as err:
+                request.data[2].consume()
+                if request.data[2].frames_read:
+                    mark_not_downsampled(resource)
+                return err.to_http()
+            mark_not_downsampled(resource)
+            return HttpResponse(status=201)
+
         # Get bit depth
         try:
             expected_data_type = resource.get_numpy_data_type()
@@ -193,38 +333,242 @@ class Cutout(APIView):
             return BossHTTPError("Data dimensions in URL do not match POSTed data.",
                                  ErrorCodes.DATA_DIMENSION_MISMATCH)
 
-        # Get interface to SPDB cache
-        cache = SpatialDB(settings.KVIO_SETTINGS,
-                          settings.STATEIO_CONFIG,
-                          settings.OBJECTIO_CONFIG)
-
-        # Write block to cache
+        if len(request.data[2].shape) == 4:
+            data = request.data[2]
+        else:
+            data = np.expand_dims(request.data[2], axis=0)
+
+        # Spill the data and return immediately if the write was requested to be asynchronous
+        if is_async:
+            job = self.create_write_job(request, req, resource, iso)
+            try:
+                job.spill(data)
+            except BossError as err:
+                return err.to_http()
+            job.submit(resource)
+            return JsonResponse(job.to_dict(), status=202)
+
+        # Write block to cache one cuboid at a time
         corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
+        writer = CuboidWriter(get_spatialdb(), resource, req.get_resolution(), iso=iso)
 
         try:
-            if len(request.data[2].shape) == 4:
-                cache.write_cuboid(resource, corner, req.get_resolution(), request.data[2], req.get_time()[0], iso=iso)
-            else:
-                cache.write_cuboid(resource, corner, req.get_resolution(),
-                                   np.expand_dims(request.data[2], axis=0), req.get_time()[0], iso=iso)
-        except Exception as e:
+            writer.write(corner, data, req.get_time()[0])
+            error = None
+        except CuboidWriteError as e:
             # TODO: Eventually remove as this level of detail should not be sent to the user
-            return BossHTTPError('Error during write_cuboid: {}'.format(e), ErrorCodes.BOSS_SYSTEM_ERROR)
+            error = BossHTTPError(str(e), ErrorCodes.BOSS_SYSTEM_ERROR)
 
-        # If the channel status is DOWNSAMPLED change status to NOT_DOWNSAMPLED since you just wrote data
-        channel = resource.get_channel()
-        if channel.downsample_status.upper() == "DOWNSAMPLED":
-            # Get Channel object and update status
-            lookup_key = resource.get_lookup_key()
-            _, exp_id, _ = lookup_key.split("&")
-            channel_obj = Channel.objects.get(name=channel.name, experiment=int(exp_id))
-            channel_obj.downsample_status = "NOT_DOWNSAMPLED"
-            channel_obj.downsample_arn = ""
-            channel_obj.save()
+        # Invalidate anything derived from the region that was just written. Cuboids that succeeded are kept even if
+        # others failed, so this is done either way.
+        extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
+        WriteVersions(resource.get_lookup_key(), req.get_resolution(), iso=iso).bump_region(
+            corner, extent, [req.get_time().start, req.get_time().stop])
+
+        mark_not_downsampled(resource)
+
+        if error:
+            return error
 
         # Send data to renderer
         return HttpResponse(status=201)
 
+    @staticmethod
+    def create_write_job(request, req, resource, iso):
+        """Method to create an asynchronous write job for a cutout POST
+
+        Args:
+            request (rest_framework.request.Request): DRF Request object
+            req (bosscore.request.BossRequest): Validated cutout request
+            resource (spdb.project.BossResource): Resource for the channel being written
+            iso (bool): Flag indicating if the isotropic version of the channel is being written
+
+        Returns:
+            (bossspatialdb.write_jobs.WriteJob)
+        """
+        return WriteJob.create(request.user.username, resource.get_lookup_key(), req.get_resolution(),
+                               (req.get_x_start(), req.get_y_start(), req.get_z_start()),
+                               (req.get_x_span(), req.get_y_span(), req.get_z_span()),
+                               [req.get_time().start, req.get_time().stop], iso=iso)
+
+    @staticmethod
+    def write_frames(resource, req, upload, iso):
+        """Method to write a framed upload to the spatialdb one slab at a time
+
+        Slabs written before an error are kept, and their write versions are updated, so a failed upload can be
+        resumed by POSTing the remaining z range.
+
+        Args:
+            resource (spdb.project.BossResource): Resource for the channel being written
+            req (bosscore.request.BossRequest): Validated cutout request
+            upload (bossspatialdb.parsers.BloscFramedUpload): Lazy reader for the frames in the request body
+            iso (bool): Flag indicating if the isotropic version of the channel is being written
+
+        Returns:
+            None
+
+        Raises:
+            BossError: If a frame is invalid or a write fails
+        """
+        writer = CuboidWriter(get_spatialdb(), resource, req.get_resolution(), iso=iso)
+        versions = WriteVersions(resource.get_lookup_key(), req.get_resolution(), iso=iso)
+
+        for time_sample, z_start, slab in upload.frames():
+            corner = (req.get_x_start(), req.get_y_start(), z_start)
+            extent = (req.get_x_span(), req.get_y_span(), slab.shape[0])
+            try:
+                writer.write(corner, np.expand_dims(slab, axis=0), time_sample)
+            except CuboidWriteError as e:
+                versions.bump_region(corner, extent, [time_sample, time_sample + 1])
+                raise BossError('Error during write of frame {}: {}'.format(upload.frames_read - 1, e),
+                                ErrorCodes.BOSS_SYSTEM_ERROR)
+
+            versions.bump_region(corner, extent, [time_sample, time_sample + 1])
+
+
+class CutoutWriteJob(APIView):
+    """
+    View to report the progress of an asynchronous cutout write
+
+    Only the user that submitted the write (or a superuser) may view its status.
+
+    * Requires authentication.
+    """
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer)
+
+    def get(self, request, job_id):
+        """View to get the status of a write job
+
+        Args:
+            request: DRF Request object
+            job_id (str): Id returned when the write was accepted
+
+        Returns:
+            (Response): Job status and progress in cuboids
+        """
+        job = WriteJob.get(job_id)
+        if job is None:
+            return BossHTTPError("Write job {} not found.".format(job_id), ErrorCodes.RESOURCE_NOT_FOUND)
+
+        if job.state["owner"] != request.user.username and not request.user.is_superuser:
+            return BossHTTPError("Missing permissions on write job {}".format(job_id), ErrorCodes.MISSING_PERMISSION)
+
+        return Response(job.to_dict())
+
+
+class CutoutBatch(AdmissionMixin, APIView):
+    """
+    View to read many regions of a single channel in one request
+
+    The regions are POSTed as JSON and the channel is validated and authorized once. The response is a series of
+    independently blosc compressed, C-ordered matrices, one per region in the order requested. Each blosc chunk
+    carries its compressed size in its header so the response can be split without any additional framing.
+
+    * Requires authentication.
+    """
+    parser_classes = (JSONParser,)
+    renderer_classes = (BloscRenderer, JSONRenderer)
+
+    def post(self, request, collection, experiment, channel):
+        """View to read a batch of regions
+
+        The body is a JSON object with a list of regions:
+
+            {"regions": [{"resolution": 0, "x_range": "0:64", "y_range": "0:64", "z_range": "0:64",
+                          "t_range": "0:1"}, ...]}
+
+        t_range is optional. As with the cutout service a region with a time range is returned as a 4D (t, z, y, x)
+        matrix and a region without one as a 3D (z, y, x) matrix of the default time sample.
+
+        Args:
+            request: DRF Request object
+            collection (str): Unique Collection identifier, indicating which collection you want to access
+            experiment (str): Experiment identifier, indicating which experiment you want to access
+            channel (str): Channel identifier, indicating which channel you want to access
+
+        Returns:
+
+        """
+        if "iso" in request.query_params:
+            if request.query_params["iso"].lower() == "true":
+                iso = True
+            else:
+                iso = False
+        else:
+            iso = False
+
+        if "no-cache" in request.query_params:
+            if request.query_params["no-cache"].lower() == "true":
+                no_cache = True
+            else:
+                no_cache = False
+        else:
+            no_cache = False
+
+        if request.accepted_renderer.media_type != BloscRenderer.media_type:
+            return BossHTTPError("Batch cutouts are only available as {}".format(BloscRenderer.media_type),
+                                 ErrorCodes.INVALID_ARGUMENT)
+
+        # Validate the list of regions
+        regions = request.data.get("regions") if isinstance(request.data, dict) else None
+        if not isinstance(regions, list) or not regions:
+            return BossHTTPError("Provide a non-empty list of regions", ErrorCodes.INVALID_POST_ARGUMENT)
+        if len(regions) > settings.BATCH_CUTOUT_MAX_REGIONS:
+            return BossHTTPError("A batch is limited to {} regions".format(settings.BATCH_CUTOUT_MAX_REGIONS),
+                                 ErrorCodes.REQUEST_TOO_LARGE)
+
+        # Process request and validate the channel and permissions once
+        try:
+            request_args = {
+                "service": "batch",
+                "collection_name": collection,
+                "experiment_name": experiment,
+                "channel_name": channel
+            }
+            req = BossRequest(request, request_args)
+        except BossError as err:
+            return err.to_http()
+
+        # Get the blosc codec settings negotiated through the Accept header or query params
+        try:
+            blosc_options = BloscOptions.from_request(request)
+        except BossError as err:
+            return err.to_http()
+
+        # Convert to Resource
+        resource = project.BossResourceDjango(req)
+
+        # Get bit depth
+        try:
+            bit_depth = resource.get_bit_depth()
+        except ValueError:
+            return BossHTTPError("Unsupported data type: {}".format(resource.get_data_type()), ErrorCodes.TYPE_ERROR)
+
+        # Validate each region
+        region_reqs = []
+        for index, region in enumerate(regions):
+            try:
+                region_reqs.append(req.get_region_request(region["resolution"], region["x_range"],
+                                                          region["y_range"], region["z_range"],
+                                                          region.get("t_range")))
+            except BossError as err:
+                return BossHTTPError("Invalid region {}. {}".format(index, err.message), err.error_code)
+            except (KeyError, TypeError, AttributeError):
+                return BossHTTPError("Region {} must provide resolution, x_range, y_range and z_range".format(index),
+                                     ErrorCodes.INVALID_POST_ARGUMENT)
+
+        # Make sure the batch is under 500MB UNCOMPRESSED
+        if sum(get_request_size(r, bit_depth) for r in region_reqs) > settings.CUTOUT_MAX_SIZE:
+            return BossHTTPError("Batch cutout request is over 500MB when uncompressed. Reduce the number or size "
+                                 "of regions.", ErrorCodes.REQUEST_TOO_LARGE)
+
+        admission_error = self.admit(request, sum(get_region_bytes(r, bit_depth) for r in region_reqs))
+        if admission_error:
+            return admission_error
+
+        batch = BatchCutout(get_spatialdb(), resource, region_reqs, bit_depth, iso=iso, no_cache=no_cache)
+        return HttpResponse(b"".join(batch.blosc_frames(blosc_options)), content_type=BloscRenderer.media_type)
+
 
 class Downsample(APIView):
     """
@@ -291,6 +635,9 @@ class Downsample(APIView):
                 channel_obj.save()
                 to_renderer["status"] = "DOWNSAMPLED"
 
+                # Downsampled resolutions have been rewritten
+                WriteVersions(lookup_key).bump_channel()
+
             elif status == "FAILED" or status == "TIMED_OUT":
                 # Change status to FAILED
                 channel_obj = Channel.objects.get(name=channel.name, experiment=int(exp_id))
@@ -388,8 +735,8 @@ class Downsample(APIView):
             'res_lt_max': int(channel.base_resolution) + 1 < int(experiment.num_hierarchy_levels),
 
             # DP NOTE: hardcode for the moment, users will expect not all resolutions will be indexed
-            'annotation_index_max': 1,  # Set to 1 to avoid resolutions on other downsampling levels other then 0.
-                                        # (Resolution 0 should already exist)
+            'annotation_index_max': ANNOTATION_INDEX_MAX,  # Set to 1 to avoid resolutions on other downsampling
+                                                           # levels other then 0. (Resolution 0 should already exist)
 
             'type': experiment.hierarchy_method,
             'iso_resolution': int(resource.get_isotropic_level()),
@@ -407,6 +754,9 @@ class Downsample(APIView):
         channel_obj.downsample_arn = arn
         channel_obj.save()
 
+        # Downsampled resolutions are about to be rewritten
+        WriteVersions(lookup_key).bump_channel()
+
         return HttpResponse(status=201)
 
     def delete(self, request, collection, experiment, channel):
@@ -0,0 +1,167 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+from bosscore.models import Channel
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+
+from .pool import get_write_executor
+from .stream import get_slab_ranges
+
+
+def get_cuboid_blocks(corner, extent, cuboid_size):
+    """Method to split a region into blocks that each fall within a single cuboid
+
+    Blocks on the edge of the region may be partial cuboids if the region is not cuboid aligned.
+
+    Args:
+        corner ((int, int, int)): x, y, z corner of the region
+        extent ((int, int, int)): x, y, z extent of the region
+        cuboid_size ((int, int, int)): x, y, z size of a cuboid
+
+    Returns:
+        (list(((int, int, int), (int, int, int)))): x, y, z corner and extent of each block
+    """
+    ranges = [get_slab_ranges(corner[d], corner[d] + extent[d], cuboid_size[d]) for d in range(3)]
+    return [((x[0], y[0], z[0]), (x[1] - x[0], y[1] - y[0], z[1] - z[0]))
+            for z in ranges[2] for y in ranges[1] for x in ranges[0]]
+
+
+def mark_not_downsampled(resource):
+    """Method to reset the downsample status of a channel after data has been written
+
+    Args:
+        resource (spdb.project.BossResource): Resource for the channel that was written
+
+    Returns:
+        None
+    """
+    # If the channel status is DOWNSAMPLED change status to NOT_DOWNSAMPLED since you just wrote data
+    channel = resource.get_channel()
+    if channel.downsample_status.upper() == "DOWNSAMPLED":
+        # Get Channel object and update status
+        lookup_key = resource.get_lookup_key()
+        _, exp_id, _ = lookup_key.split("&")
+        channel_obj = Channel.objects.get(name=channel.name, experiment=int(exp_id))
+        channel_obj.downsample_status = "NOT_DOWNSAMPLED"
+        channel_obj.downsample_arn = ""
+        channel_obj.save()
+
+
+class CuboidWriteError(Exception):
+    """
+    Exception raised when one or more cuboids of a write fail
+
+    Args:
+        failures (list(((int, int, int), (int, int, int), str))): Corner, extent and error of each failed block
+        num_blocks (int): Total number of blocks in the write
+    """
+
+    def __init__(self, failures, num_blocks):
+        self.failures = failures
+        self.num_blocks = num_blocks
+        super().__init__(self.get_message())
+
+    def get_message(self):
+        """Method to describe the failed cuboids
+
+        Returns:
+            (str)
+        """
+        details = ["{}:{}/{}:{}/{}:{}: {}".format(corner[0], corner[0] + extent[0], corner[1], corner[1] + extent[1],
+                                                  corner[2], corner[2] + extent[2], error)
+                   for corner, extent, error in self.failures]
+        return "Error during write_cuboid for {} of {} cuboids. {}".format(len(self.failures), self.num_blocks,
+                                                                           "; ".join(details))
+
+
+class CuboidWriter:
+    """
+    Class to write a matrix to the spatialdb one cuboid at a time using the per-worker write thread pool
+
+    Compression and cache writes for each cuboid run in parallel, and every block is attempted even if another block
+    fails so failures can be reported per cuboid.
+    """
+
+    def __init__(self, cache, resource, resolution, iso=False):
+        """
+
+        Args:
+            cache (spdb.spatialdb.SpatialDB): Interface to the spatialdb
+            resource (spdb.project.BossResource): Resource for the channel being written
+            resolution (int): Resolution level
+            iso (bool): Flag indicating if the isotropic version of the channel is being written
+        """
+        self.cache = cache
+        self.resource = resource
+        self.resolution = resolution
+        self.iso = iso
+
+    def write_block(self, corner, data, time_sample):
+        """Method to write a single block
+
+        Args:
+            corner ((int, int, int)): x, y, z corner of the block
+            data (numpy.ndarray): 4D (t, z, y, x) matrix
+            time_sample (int): First time sample of the data
+
+        Returns:
+            None
+        """
+        self.cache.write_cuboid(self.resource, corner, self.resolution, data, time_sample, iso=self.iso)
+
+    def write(self, corner, data, time_sample):
+        """Method to write a matrix
+
+        Args:
+            corner ((int, int, int)): x, y, z corner of the matrix
+            data (numpy.ndarray): 4D (t, z, y, x) matrix
+            time_sample (int): First time sample of the data
+
+        Returns:
+            None
+
+        Raises:
+            CuboidWriteError: If any block failed to write
+        """
+        extent = (data.shape[3], data.shape[2], data.shape[1])
+        blocks = get_cuboid_blocks(corner, extent, CUBOIDSIZE[self.resolution])
+
+        if len(blocks) == 1:
+            # Nothing to parallelize
+            try:
+                self.write_block(corner, np.ascontiguousarray(data), time_sample)
+            except Exception as e:
+                raise CuboidWriteError([(corner, extent, str(e))], 1)
+            return
+
+        executor = get_write_executor()
+        futures = []
+        for block_corner, block_extent in blocks:
+            x = block_corner[0] - corner[0]
+            y = block_corner[1] - corner[1]
+            z = block_corner[2] - corner[2]
+            # spdb hands the block to ndlib and blosc, which need C-contiguous buffers
+            block = np.ascontiguousarray(data[:, z:z + block_extent[2], y:y + block_extent[1], x:x + block_extent[0]])
+            futures.append(executor.submit(self.write_block, block_corner, block, time_sample))
+
+        failures = []
+        for (block_corner, block_extent), future in zip(blocks, futures):
+            error = future.exception()
+            if error is not None:
+                failures.append((block_corner, block_extent, str(error)))
+
+        if failures:
+            raise CuboidWriteError(failures, len(blocks))
@@ -0,0 +1,549 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Asynchronous cutout writes. The decoded payload is spilled to local disk by the request, and a background thread of
+# the same worker process writes it to the spatialdb while the request worker returns to serving reads.
+#
+# Jobs are not durable. They only exist in the worker process that accepted them, so a job is lost if that process
+# exits (uwsgi reload, max-requests recycling or a crash) before the job finishes. Each process keeps a heartbeat key
+# alive while it runs, and a queued or running job whose process has stopped heartbeating is reported as FAILED so
+# the client can retry the write. Spool directories left behind by stopped processes are removed when a process
+# first spools a payload.
+
+import fcntl
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+
+from bosscore.error import BossError, ErrorCodes
+from bossutils.logger import BossLogger
+
+from .pool import get_spatialdb, get_write_job_executor
+from .stream import get_slab_ranges
+from .write import CuboidWriter, CuboidWriteError, mark_not_downsampled
+from .write_state import WriteVersions, get_cuboid_indices
+
+WRITE_JOB_PREFIX = "WRITE-JOB"
+WRITE_JOB_WORKER_PREFIX = "WRITE-JOB-WORKER"
+SPOOL_LOCK_FILE = ".lock"
+
+QUEUED = "QUEUED"
+IN_PROGRESS = "IN_PROGRESS"
+COMPLETE = "COMPLETE"
+FAILED = "FAILED"
+
+_lock = threading.Lock()
+_process_state = {'heartbeat_pid': None, 'spool_pid': None}
+
+
+def get_worker_id():
+    """Method to get the id of the current worker process
+
+    Returns:
+        (str): Host name and pid of the process
+    """
+    return "{}:{}".format(socket.gethostname(), os.getpid())
+
+
+def get_worker_key(worker_id):
+    """Method to get the cache key of a worker's heartbeat
+
+    Args:
+        worker_id (str): Id of the worker process
+
+    Returns:
+        (str)
+    """
+    return "{}&{}".format(WRITE_JOB_WORKER_PREFIX, worker_id)
+
+
+def send_heartbeat():
+    """Method to mark the current worker process as alive for WRITE_JOB_HEARTBEAT_TIMEOUT seconds
+
+    Returns:
+        None
+    """
+    caches[settings.WRITE_JOB_CACHE_ALIAS].set(get_worker_key(get_worker_id()), time.time(),
+                                               timeout=settings.WRITE_JOB_HEARTBEAT_TIMEOUT)
+
+
+def _heartbeat_loop(pid):
+    """Method run by the heartbeat thread of a worker process
+
+    Args:
+        pid (int): Pid of the process that started the thread
+
+    Returns:
+        None
+    """
+    while _process_state['heartbeat_pid'] == pid:
+        time.sleep(settings.WRITE_JOB_HEARTBEAT_INTERVAL)
+        try:
+            send_heartbeat()
+        except Exception:
+            BossLogger().logger.exception("Could not send the write job heartbeat")
+
+
+def start_heartbeat():
+    """Method to start the heartbeat of the current worker process, if it is not running yet
+
+    The heartbeat is sent once before returning, so jobs created afterwards are never reported as stale. Threads do
+    not survive a fork, so a forked child starts its own heartbeat.
+
+    Returns:
+        None
+    """
+    pid = os.getpid()
+    if _process_state['heartbeat_pid'] == pid:
+        return
+    with _lock:
+        if _process_state['heartbeat_pid'] == pid:
+            return
+        send_heartbeat()
+        _process_state['heartbeat_pid'] = pid
+        threading.Thread(target=_heartbeat_loop, args=(pid,), name="write-job-heartbeat", daemon=True).start()
+
+
+def is_pid_running(pid):
+    """Method to check if a process exists on this host
+
+    Args:
+        pid (int): Process id
+
+    Returns:
+        (bool)
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def clean_spool_dirs():
+    """Method to remove the spool directories of stopped worker processes and of the current process
+
+    Called the first time a process spools a payload. A new process has no jobs yet, so its own directory only holds
+    files left by an earlier process with the same pid.
+
+    Returns:
+        None
+    """
+    if not os.path.isdir(settings.CUTOUT_ASYNC_SPOOL_DIR):
+        return
+    for name in os.listdir(settings.CUTOUT_ASYNC_SPOOL_DIR):
+        if not name.isdigit():
+            continue
+        pid = int(name)
+        if pid == os.getpid() or not is_pid_running(pid):
+            shutil.rmtree(os.path.join(settings.CUTOUT_ASYNC_SPOOL_DIR, name), ignore_errors=True)
+
+
+def get_spool_dir():
+    """Method to get the directory holding the payloads spooled by the current worker process
+
+    Returns:
+        (str)
+    """
+    pid = os.getpid()
+    if _process_state['spool_pid'] != pid:
+        with _lock:
+            if _process_state['spool_pid'] != pid:
+                clean_spool_dirs()
+                _process_state['spool_pid'] = pid
+    return os.path.join(settings.CUTOUT_ASYNC_SPOOL_DIR, str(pid))
+
+
+def get_spool_path(job_id):
+    """Method to get the path of the file holding the payload of a write job
+
+    Args:
+        job_id (str): Id of the write job
+
+    Returns:
+        (str)
+    """
+    return os.path.join(get_spool_dir(), "{}.npy".format(job_id))
+
+
+def get_spool_usage():
+    """Method to get the size of all payloads spooled on this host
+
+    Returns:
+        (int): Number of bytes
+    """
+    total = 0
+    for root, _, files in os.walk(settings.CUTOUT_ASYNC_SPOOL_DIR):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                # Removed by a finished job
+                pass
+    return total
+
+
+def check_spool_space(nbytes):
+    """Method to check that a payload fits in the spool quota and on the spool disk
+
+    Args:
+        nbytes (int): Size of the payload
+
+    Returns:
+        None
+
+    Raises:
+        BossError: If the payload does not fit
+    """
+    if get_spool_usage() + nbytes > settings.CUTOUT_ASYNC_SPOOL_MAX_SIZE:
+        raise BossError("Too many asynchronous writes are queued on this server. Retry later or write "
+                        "synchronously.", ErrorCodes.TOO_MANY_REQUESTS)
+    if shutil.disk_usage(settings.CUTOUT_ASYNC_SPOOL_DIR).free - nbytes < settings.CUTOUT_ASYNC_SPOOL_MIN_FREE:
+        raise BossError("Not enough disk space to queue the write. Retry later or write synchronously.",
+                        ErrorCodes.INSUFFICIENT_STORAGE)
+
+
+class WriteJob:
+    """
+    Class to track an asynchronous cutout write
+
+    The job state is stored in the WRITE_JOB_CACHE_ALIAS cache so any worker can report its status. Progress is
+    counted in cuboids, with each time sample of a cuboid counted separately. The job records the worker process that
+    accepted it and the path of its spool file, and is reported as FAILED once that process stops heartbeating.
+    """
+
+    def __init__(self, state):
+        """
+
+        Args:
+            state (dict): Stored state of the job
+        """
+        self.state = state
+        self.cache = caches[settings.WRITE_JOB_CACHE_ALIAS]
+
+    @staticmethod
+    def get_key(job_id):
+        """Method to get the cache key of a job
+
+        Args:
+            job_id (str): Id of the write job
+
+        Returns:
+            (str)
+        """
+        return "{}&{}".format(WRITE_JOB_PREFIX, job_id)
+
+    @classmethod
+    def create(cls, owner, lookup_key, resolution, corner, extent, time_range, iso=False):
+        """Method to create a new queued job
+
+        Args:
+            owner (str): Username of the user that submitted the write
+            lookup_key (str): Lookup key of the channel
+            resolution (int): Resolution level
+            corner ((int, int, int)): x, y, z corner of the region
+            extent ((int, int, int)): x, y, z extent of the region
+            time_range ([int, int]): Start and stop time samples of the region
+            iso (bool): Flag indicating if the isotropic version of the channel is being written
+
+        Returns:
+            (WriteJob)
+        """
+        start_heartbeat()
+        num_cuboids = len(get_cuboid_indices(corner, extent, CUBOIDSIZE[resolution]))
+        job_id = uuid.uuid4().hex
+        job = cls({"job_id": job_id,
+                   "owner": owner,
+                   "worker": get_worker_id(),
+                   "spool_path": get_spool_path(job_id),
+                   "lookup_key": lookup_key,
+                   "resolution": resolution,
+                   "corner": list(corner),
+                   "extent": list(extent),
+                   "time_range": list(time_range),
+                   "iso": iso,
+                   "status": QUEUED,
+                   "cuboids_total": num_cuboids * (time_range[1] - time_range[0]),
+                   "cuboids_written": 0,
+                   "cuboids_failed": 0,
+                   "errors": [],
+                   "created": time.time(),
+                   "updated": time.time()})
+        job.save()
+        return job
+
+    @classmethod
+    def get(cls, job_id):
+        """Method to load a job
+
+        Args:
+            job_id (str): Id of the write job
+
+        A queued or running job whose worker process has stopped is marked as FAILED.
+
+        Returns:
+            (WriteJob|None): None if the job does not exist or has expired
+        """
+        state = caches[settings.WRITE_JOB_CACHE_ALIAS].get(cls.get_key(job_id))
+        if state is None:
+            return None
+
+        job = cls(state)
+        if job.state["status"] in (QUEUED, IN_PROGRESS) and not job.is_worker_alive():
+            job.fail("The worker process applying the write stopped before it finished. Retry the write.")
+        return job
+
+    def is_worker_alive(self):
+        """Method to check if the worker process that accepted the job is still heartbeating
+
+        Returns:
+            (bool)
+        """
+        return self.cache.get(get_worker_key(self.state["worker"])) is not None
+
+    @property
+    def job_id(self):
+        return self.state["job_id"]
+
+    def save(self):
+        """Method to store the current state of the job
+
+        Returns:
+            None
+        """
+        self.state["updated"] = time.time()
+        self.cache.set(self.get_key(self.job_id), self.state, timeout=settings.WRITE_JOB_TIMEOUT)
+
+    def save_progress(self):
+        """Method to store the state of a running job, unless the job has already been marked as FAILED
+
+        A status request served by another worker marks the job as FAILED if this process missed its heartbeat. The
+        stored status is read back first so the runner never overwrites that failure.
+
+        Returns:
+            (bool): False if the job was marked as FAILED and the runner should stop
+        """
+        state = self.cache.get(self.get_key(self.job_id))
+        if state is not None and state["status"] == FAILED:
+            self.state = state
+            return False
+        self.save()
+        return True
+
+    def to_dict(self):
+        """Method to get the status reported to the client
+
+        Returns:
+            (dict)
+        """
+        keys = ("job_id", "status", "cuboids_total", "cuboids_written", "cuboids_failed", "errors", "created",
+                "updated")
+        return {key: self.state[key] for key in keys}
+
+    def get_shape(self):
+        """Method to get the shape of the payload
+
+        Returns:
+            ((int, int, int, int)): t, z, y, x shape
+        """
+        extent = self.state["extent"]
+        time_range = self.state["time_range"]
+        return time_range[1] - time_range[0], extent[2], extent[1], extent[0]
+
+    def open_spool(self, dtype):
+        """Method to create the memory-mapped file that holds the payload
+
+        The file is created at its full size while holding a lock shared by every worker on the host, so concurrent
+        requests cannot all pass the space check before any of them has claimed its space.
+
+        Args:
+            dtype (numpy.dtype): Data type of the channel
+
+        Returns:
+            (numpy.memmap): 4D (t, z, y, x) matrix backed by the spool file
+
+        Raises:
+            BossError: If the payload does not fit in the spool quota or on the spool disk
+        """
+        nbytes = int(np.prod(self.get_shape())) * np.dtype(dtype).itemsize
+        os.makedirs(os.path.dirname(self.state["spool_path"]), exist_ok=True)
+        with open(os.path.join(settings.CUTOUT_ASYNC_SPOOL_DIR, SPOOL_LOCK_FILE), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            check_spool_space(nbytes)
+            return np.lib.format.open_memmap(self.state["spool_path"], mode='w+', dtype=dtype,
+                                             shape=self.get_shape())
+
+    def spill(self, data):
+        """Method to spill a decoded payload to local disk
+
+        The job is marked as FAILED if the payload cannot be spilled.
+
+        Args:
+            data (numpy.ndarray): 4D (t, z, y, x) matrix
+
+        Returns:
+            None
+
+        Raises:
+            BossError: If the payload does not fit in the spool quota or on the spool disk
+        """
+        try:
+            spool = self.open_spool(data.dtype)
+            spool[:] = data
+            spool.flush()
+            del spool
+        except Exception as e:
+            self.fail(e.message if isinstance(e, BossError) else str(e))
+            raise
+
+    def spill_frames(self, upload, dtype):
+        """Method to spill a framed upload to local disk one slab at a time
+
+        The slabs are written into a memory-mapped file so the full payload is never held in memory. The job is
+        marked as FAILED if the payload cannot be spilled.
+
+        Args:
+            upload (bossspatialdb.parsers.BloscFramedUpload): Lazy reader for the frames in the request body
+            dtype (numpy.dtype): Data type of the channel
+
+        Returns:
+            None
+
+        Raises:
+            BossError: If a frame is invalid, or the payload does not fit in the spool quota or on the spool disk
+        """
+        try:
+            data = self.open_spool(dtype)
+            t_start = self.state["time_range"][0]
+            z_start = self.state["corner"][2]
+            for time_sample, z, slab in upload.frames():
+                data[time_sample - t_start, z - z_start:z - z_start + slab.shape[0]] = slab
+            data.flush()
+            del data
+        except Exception as e:
+            self.fail(e.message if isinstance(e, BossError) else str(e))
+            raise
+
+    def fail(self, message):
+        """Method to mark the job as FAILED and drop its payload
+
+        Args:
+            message (str): Error reported to the client
+
+        Returns:
+            None
+        """
+        self.state["status"] = FAILED
+        self.state["errors"].append(message)
+        self.save()
+        self.remove_spool()
+
+    def remove_spool(self):
+        """Method to delete the spilled payload
+
+        The payload is only on the host of the worker that accepted the job. Spool directories of stopped workers on
+        that host are removed by clean_spool_dirs.
+
+        Returns:
+            None
+        """
+        if self.state["worker"].rsplit(":", 1)[0] != socket.gethostname():
+            return
+        try:
+            os.remove(self.state["spool_path"])
+        except FileNotFoundError:
+            pass
+
+    def submit(self, resource):
+        """Method to queue the job on the write job thread pool of this worker
+
+        Args:
+            resource (spdb.project.BossResource): Resource for the channel being written
+
+        Returns:
+            None
+        """
+        get_write_job_executor().submit(self.run, resource)
+
+    def run(self, resource):
+        """Method to write the spilled payload to the spatialdb
+
+        The payload is written one cuboid-aligned z slab at a time from the memory-mapped file, and progress is saved
+        after each slab. Every slab is attempted even if an earlier one failed. The runner stops if the job is marked
+        as FAILED by another worker, since the client has been told to retry the write.
+
+        Args:
+            resource (spdb.project.BossResource): Resource for the channel being written
+
+        Returns:
+            None
+        """
+        log = BossLogger().logger
+        try:
+            self.state["status"] = IN_PROGRESS
+            if not self.save_progress():
+                return
+
+            resolution = self.state["resolution"]
+            corner = self.state["corner"]
+            extent = self.state["extent"]
+            time_range = self.state["time_range"]
+            num_times = time_range[1] - time_range[0]
+
+            data = np.load(self.state["spool_path"], mmap_mode='r')
+            writer = CuboidWriter(get_spatialdb(), resource, resolution, iso=self.state["iso"])
+            versions = WriteVersions(self.state["lookup_key"], resolution, iso=self.state["iso"])
+
+            for z_start, z_stop in get_slab_ranges(corner[2], corner[2] + extent[2], CUBOIDSIZE[resolution][2]):
+                slab_corner = (corner[0], corner[1], z_start)
+                slab_extent = (extent[0], extent[1], z_stop - z_start)
+                num_cuboids = len(get_cuboid_indices(slab_corner, slab_extent, CUBOIDSIZE[resolution])) * num_times
+                try:
+                    writer.write(slab_corner, data[:, z_start - corner[2]:z_stop - corner[2]], time_range[0])
+                    self.state["cuboids_written"] += num_cuboids
+                except CuboidWriteError as e:
+                    failed = len(e.failures) * num_times
+                    self.state["cuboids_written"] += num_cuboids - failed
+                    self.state["cuboids_failed"] += failed
+                    self.state["errors"].append(str(e))
+
+                versions.bump_region(slab_corner, slab_extent, time_range)
+                if not self.save_progress():
+                    break
+
+            del data
+            mark_not_downsampled(resource)
+            if self.state["status"] == IN_PROGRESS:
+                self.state["status"] = FAILED if self.state["cuboids_failed"] else COMPLETE
+        except Exception as e:
+            log.exception("Write job {} failed".format(self.job_id))
+            self.state["status"] = FAILED
+            self.state["errors"].append(str(e))
+        finally:
+            self.save_progress()
+            self.remove_spool()
+            # Jobs run outside of the request cycle, so the thread's database connection is not closed by Django
+            connection.close()
@@ -0,0 +1,303 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Per-cuboid write versions used to invalidate anything derived from a region of a channel
+
+import hashlib
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+
+WRITE_VERSION_PREFIX = "WRITE-VERSION"
+CHANNEL_VERSION_PREFIX = "CHANNEL-VERSION"
+EPOCH_KEY = "WRITE-VERSION-EPOCH"
+EVICTED_KEY = "WRITE-VERSION-EVICTED"
+
+# Version reported for cuboids without a version key if the epoch cannot be stored
+PROCESS_VERSION = uuid.uuid4().hex
+
+# Time of the next eviction check of this worker process
+_eviction_check = {'pid': None, 'next': 0.0}
+
+
+def get_cuboid_indices(corner, extent, cuboid_size):
+    """Method to get the indices of all cuboids touched by a region
+
+    Args:
+        corner ((int, int, int)): x, y, z corner of the region
+        extent ((int, int, int)): x, y, z extent of the region
+        cuboid_size ((int, int, int)): x, y, z size of a cuboid
+
+    Returns:
+        (list((int, int, int))): x, y, z index of each cuboid touched by the region
+    """
+    ranges = []
+    for dim in range(3):
+        first = corner[dim] // cuboid_size[dim]
+        last = (corner[dim] + extent[dim] - 1) // cuboid_size[dim]
+        ranges.append(range(first, last + 1))
+
+    return [(x, y, z) for z in ranges[2] for y in ranges[1] for x in ranges[0]]
+
+
+def new_epoch():
+    """Method to create an epoch token
+
+    The token includes its creation time, so the age of the version store can be read from it.
+
+    Returns:
+        (str)
+    """
+    return "{}&{}".format(uuid.uuid4().hex, int(time.time()))
+
+
+def get_epoch_age(epoch):
+    """Method to get the number of seconds since an epoch was created
+
+    Args:
+        epoch (str): Epoch token
+
+    Returns:
+        (float|None): None if the token does not include its creation time
+    """
+    try:
+        return time.time() - int(epoch.rsplit("&", 1)[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def get_evicted_keys(cache):
+    """Method to get the number of keys the redis server behind a cache has evicted
+
+    Args:
+        cache (django.core.cache.backends.base.BaseCache): Cache to check
+
+    Returns:
+        (int|None): None if the cache is not a django-redis cache or the server could not be queried
+    """
+    client = getattr(cache, 'client', None)
+    if client is None or not hasattr(client, 'get_client'):
+        return None
+    try:
+        return int(client.get_client(write=True).info('stats')['evicted_keys'])
+    except Exception:
+        return None
+
+
+class WriteVersions:
+    """
+    Class to track a version token for every cuboid written through the API
+
+    A new token is stored for each cuboid touched by a write, and a channel wide token is stored when data is changed
+    outside of the cutout service (e.g. downsampling). Anything derived from a region (cached responses, ETags, tiles)
+    embeds the tokens for that region, so a write to an overlapping region changes the derived key.
+
+    Version keys are stored without a timeout so they are not evicted before the entries that depend on them. Cuboids
+    without a version key are reported with the epoch of the version store, a random token created the first time the
+    store is used. If the store is flushed, a new epoch is created, so nothing derived before the flush is reused.
+
+    WRITE_VERSION_CACHE_ALIAS must point at a cache that never evicts keys (a redis noeviction maxmemory policy). A
+    lost version key cannot be told apart from a cuboid that was never written, so on redis the eviction counter of the
+    server is checked every WRITE_VERSION_EVICTION_CHECK_INTERVAL seconds per process and any eviction starts a new
+    epoch, moving every region to a new token.
+    """
+
+    def __init__(self, lookup_key, resolution=None, iso=False):
+        """
+
+        Args:
+            lookup_key (str): Lookup key of the channel
+            resolution (int): Resolution level. Only required for region versions
+            iso (bool): Flag indicating if the isotropic version of the channel is being accessed
+        """
+        self.lookup_key = lookup_key
+        self.resolution = resolution
+        self.iso = iso
+        self.cache = caches[settings.WRITE_VERSION_CACHE_ALIAS]
+
+    def get_cuboid_key(self, time_sample, index):
+        """Method to get the version key of a single cuboid
+
+        Args:
+            time_sample (int): Time sample
+            index ((int, int, int)): x, y, z index of the cuboid
+
+        Returns:
+            (str): Cache key
+        """
+        return "{}&{}&{}&{}&{}&{}&{}&{}".format(WRITE_VERSION_PREFIX, self.lookup_key, self.resolution,
+                                                  "iso" if self.iso else "aniso", time_sample,
+                                                  index[0], index[1], index[2])
+
+    def get_channel_key(self):
+        """Method to get the channel wide version key
+
+        Returns:
+            (str): Cache key
+        """
+        return "{}&{}".format(CHANNEL_VERSION_PREFIX, self.lookup_key)
+
+    def get_epoch(self):
+        """Method to get the version reported for cuboids and channels without a version key
+
+        Returns:
+            (str): Epoch of the version store, or a per-process token if it cannot be stored
+        """
+        self.cache.add(EPOCH_KEY, new_epoch(), timeout=None)
+        return self.cache.get(EPOCH_KEY) or PROCESS_VERSION
+
+    def check_evictions(self, epoch):
+        """Method to start a new epoch if the version store has evicted keys since the last check
+
+        Args:
+            epoch (str): Current epoch
+
+        Returns:
+            (str): Epoch to use
+        """
+        now = time.monotonic()
+        if _eviction_check['pid'] == os.getpid() and now < _eviction_check['next']:
+            return epoch
+        _eviction_check['pid'] = os.getpid()
+        _eviction_check['next'] = now + settings.WRITE_VERSION_EVICTION_CHECK_INTERVAL
+
+        evicted = get_evicted_keys(self.cache)
+        if evicted is None:
+            return epoch
+
+        checked = self.cache.get(EVICTED_KEY)
+        if checked == evicted:
+            return epoch
+        if checked is None and evicted == 0:
+            self.cache.set(EVICTED_KEY, evicted, timeout=None)
+            return epoch
+
+        # Keys were evicted, or the count was lost or reset, so any version key may be missing
+        epoch = new_epoch()
+        self.cache.set_many({EPOCH_KEY: epoch, EVICTED_KEY: evicted}, timeout=None)
+        return epoch
+
+    def get_keys(self, corner, extent, time_range):
+        """Method to get the version keys for every cuboid in a region
+
+        Args:
+            corner ((int, int, int)): x, y, z corner of the region
+            extent ((int, int, int)): x, y, z extent of the region
+            time_range ([int, int]): Start and stop (exclusive) time samples
+
+        Returns:
+            (list(str)): Cache keys
+        """
+        indices = get_cuboid_indices(corner, extent, CUBOIDSIZE[self.resolution])
+        return [self.get_cuboid_key(t, idx) for t in range(time_range[0], time_range[1]) for idx in indices]
+
+    def get_region_version(self, corner, extent, time_range):
+        """Method to get a single token representing the write state of a region
+
+        Args:
+            corner ((int, int, int)): x, y, z corner of the region
+            extent ((int, int, int)): x, y, z extent of the region
+            time_range ([int, int]): Start and stop (exclusive) time samples
+
+        Returns:
+            (str): Hex digest of the channel version and the versions of all cuboids in the region
+        """
+        keys = self.get_keys(corner, extent, time_range)
+        channel_key = self.get_channel_key()
+        versions = self.cache.get_many(keys + [channel_key, EPOCH_KEY])
+        unknown = self.check_evictions(versions.get(EPOCH_KEY) or self.get_epoch())
+
+        digest = hashlib.sha1()
+        digest.update(versions.get(channel_key, unknown).encode())
+        for key in keys:
+            digest.update(versions.get(key, unknown).encode())
+        return digest.hexdigest()
+
+    def get_region_tag(self, corner, extent, time_range, parts):
+        """Method to get a digest identifying something derived from a region in the region's current write state
+
+        Args:
+            corner ((int, int, int)): x, y, z corner of the region
+            extent ((int, int, int)): x, y, z extent of the region
+            time_range ([int, int]): Start and stop (exclusive) time samples
+            parts (list): Any other values that change what is derived from the region (e.g. the media type)
+
+        Returns:
+            (str): Hex digest
+        """
+        region_version = self.get_region_version(corner, extent, time_range)
+        key = [self.lookup_key, self.resolution, self.iso, tuple(corner), tuple(extent), list(time_range),
+               parts, region_version]
+        return hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def is_complete(self, min_age):
+        """Method to check if the version store has kept every write of the last min_age seconds
+
+        The store has been tracking writes without losing any since its epoch was created, so this is true once the
+        epoch is at least min_age seconds old.
+
+        Args:
+            min_age (float): Number of seconds
+
+        Returns:
+            bool
+        """
+        epoch = self.check_evictions(self.get_epoch())
+        age = get_epoch_age(epoch)
+        return age is not None and age >= min_age
+
+    def get_written_indices(self, corner, extent, time_range):
+        """Method to get the cuboids of a region that have been written through the API in any of its time samples
+
+        Only writes made since the epoch was created are known. Use is_complete to check how far back that is.
+
+        Args:
+            corner ((int, int, int)): x, y, z corner of the region
+            extent ((int, int, int)): x, y, z extent of the region
+            time_range ([int, int]): Start and stop (exclusive) time samples
+
+        Returns:
+            (set((int, int, int))): x, y, z index of each written cuboid
+        """
+        indices = get_cuboid_indices(corner, extent, CUBOIDSIZE[self.resolution])
+        keys = {self.get_cuboid_key(t, idx): idx for t in range(time_range[0], time_range[1]) for idx in indices}
+        versions = self.cache.get_many(list(keys))
+        return {keys[key] for key in versions}
+
+    def bump_region(self, corner, extent, time_range):
+        """Method to store a new version token for every cuboid in a region after it has been written
+
+        Args:
+            corner ((int, int, int)): x, y, z corner of the region
+            extent ((int, int, int)): x, y, z extent of the region
+            time_range ([int, int]): Start and stop (exclusive) time samples
+
+        Returns:
+            None
+        """
+        token = uuid.uuid4().hex
+        self.cache.set_many({key: token for key in self.get_keys(corner, extent, time_range)}, timeout=None)
+
+    def bump_channel(self):
+        """Method to store a new channel wide version token, invalidating every region of the channel
+
+        Returns:
+            None
+        """
+        self.cache.set(self.get_channel_key(), uuid.uuid4().hex, timeout=None)
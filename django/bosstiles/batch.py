@@ -0,0 +1,175 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Batches of tiles from a single channel, orientation, tile size and resolution. Tiles that share cuboids are read
+# together, encoded in parallel and returned as a single multipart/mixed response.
+
+import uuid
+
+import numpy as np
+
+from spdb.spatialdb import Cube
+
+from bossspatialdb.batch import BatchCutout
+from bossspatialdb.etag import get_region_image_tag
+from bossspatialdb.pool import get_tile_render_executor
+
+from .prerender import get_image
+from .tile_store import TileStore, get_tile_region
+
+# Header of each part of a batch response holding the x, y, z index of the tile
+TILE_INDEX_HEADER = "X-Boss-Tile-Index"
+
+
+def encode_multipart(parts, boundary):
+    """Method to encode a multipart/mixed body
+
+    Args:
+        parts (list((list((str, str)), bytes))): Headers and content of each part
+        boundary (str): Boundary between the parts
+
+    Returns:
+        (bytes)
+    """
+    chunks = []
+    for headers, content in parts:
+        chunks.append("--{}\r\n".format(boundary).encode())
+        for name, value in headers:
+            chunks.append("{}: {}\r\n".format(name, value).encode())
+        chunks.append(b"\r\n")
+        chunks.append(content)
+        chunks.append(b"\r\n")
+    chunks.append("--{}--\r\n".format(boundary).encode())
+    return b"".join(chunks)
+
+
+def render_tile(resource, data, extent, time_range, orientation, renderer):
+    """Method to encode the data of a tile as an image
+
+    Runs on the tile render thread pool.
+
+    Args:
+        resource (spdb.project.BossResource): Resource for the channel being read
+        data (numpy.ndarray): 4D (t, z, y, x) matrix of the tile
+        extent ((int, int, int)): x, y, z extent of the tile
+        time_range ([int, int]): Start and stop time samples of the tile
+        orientation (str): Image plane
+        renderer (rest_framework.renderers.BaseRenderer): Image renderer
+
+    Returns:
+        (bytes): Rendered tile
+    """
+    cube = Cube.create_cube(resource, list(extent), time_range)
+    cube.data = data
+    return renderer.render(get_image(cube, orientation))
+
+
+class BatchTiles:
+    """
+    Class to read and render a batch of tiles
+
+    Tiles already in the tile store are not read. The rest are read with bossspatialdb.batch.BatchCutout, so tiles
+    that share cuboids are read with a single cutout, and are encoded on the tile render thread pool as soon as they
+    have been read. Rendered tiles are added to the tile store.
+    """
+
+    def __init__(self, resource, orientation, tile_size, indices, regions, renderer, no_cache=False):
+        """
+
+        Args:
+            resource (spdb.project.BossResource): Resource for the channel being read
+            orientation (str): Image plane
+            tile_size (int): Size of a tile in voxels
+            indices (list((int, int, int))): x, y, z index of each tile
+            regions (list(bosscore.request.BossRequest)): Validated cutout request for the region of each tile
+            renderer (rest_framework.renderers.BaseRenderer): Image renderer
+            no_cache (bool): Flag indicating if the tile store and cache should be bypassed
+        """
+        self.resource = resource
+        self.orientation = orientation
+        self.tile_size = tile_size
+        self.indices = indices
+        self.regions = regions
+        self.renderer = renderer
+        self.no_cache = no_cache
+
+    def get_tag(self, index, region):
+        """Method to get the tag of a tile, as computed by the tile service
+
+        Args:
+            index ((int, int, int)): x, y, z index of the tile
+            region (bosscore.request.BossRequest): Validated cutout request for the region of the tile
+
+        Returns:
+            (str)
+        """
+        corner, extent = get_tile_region(self.orientation, self.tile_size, *index)
+        return get_region_image_tag(self.resource.get_lookup_key(), region.get_resolution(), corner, extent,
+                                    [region.get_time().start, region.get_time().stop], self.renderer.media_type,
+                                    self.orientation)
+
+    def render(self, spatialdb, bit_depth):
+        """Method to get the rendered bytes of every tile
+
+        Args:
+            spatialdb (spdb.spatialdb.SpatialDB): Interface to the spatialdb
+            bit_depth (int): Bit depth of the channel
+
+        Returns:
+            (list(bytes)): Rendered tile, in the order the tiles were requested
+        """
+        use_store = TileStore.is_enabled() and not self.no_cache
+        tags = [self.get_tag(index, region) for index, region in zip(self.indices, self.regions)]
+        stored = TileStore.get_many(tags) if use_store else {}
+
+        tiles = [stored.get(tag) for tag in tags]
+        missing = [i for i, tile in enumerate(tiles) if tile is None]
+        if not missing:
+            return tiles
+
+        executor = get_tile_render_executor()
+        batch = BatchCutout(spatialdb, self.resource, [self.regions[i] for i in missing], bit_depth,
+                            no_cache=self.no_cache)
+        futures = {}
+        for i, data in batch.iter_region_data():
+            region = self.regions[missing[i]]
+            if not region.time_request:
+                data = data[np.newaxis]
+            futures[missing[i]] = executor.submit(render_tile, self.resource, data,
+                                                  (region.get_x_span(), region.get_y_span(), region.get_z_span()),
+                                                  [region.get_time().start, region.get_time().stop],
+                                                  self.orientation, self.renderer)
+
+        for i, future in futures.items():
+            tiles[i] = future.result()
+            if use_store:
+                TileStore(tags[i], self.renderer.media_type).put(tiles[i])
+        return tiles
+
+    def to_multipart(self, tiles):
+        """Method to encode rendered tiles as a multipart/mixed body
+
+        Each part carries the media type and index of its tile.
+
+        Args:
+            tiles (list(bytes)): Rendered tile, in the order the tiles were requested
+
+        Returns:
+            ((bytes, str)): Body and its content type, including the boundary
+        """
+        boundary = uuid.uuid4().hex
+        parts = [([("Content-Type", self.renderer.media_type),
+                   (TILE_INDEX_HEADER, ",".join(str(i) for i in index)),
+                   ("Content-Length", len(tile))], tile) for index, tile in zip(self.indices, tiles)]
+        return encode_multipart(parts, boundary), "multipart/mixed; boundary={}".format(boundary)
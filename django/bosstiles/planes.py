@@ -0,0 +1,220 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Slice reads for the tile and image services. Cuboids are decompressed whole, so a single yz or xz slice costs as much
+# as every slice through the same cuboids. The cuboid-aligned slab around a slice is read once per worker process and
+# neighbouring slices are served as views of it. xy slices are always read directly, since the cuboid layer around an
+# xy slice is only a few slices deep.
+
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from spdb.spatialdb import Cube
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+
+from bossspatialdb.write_state import WriteVersions
+
+from .tile_store import PLANE_DIMS
+
+try:
+    # Only available when running under uwsgi
+    import uwsgi
+except ImportError:
+    uwsgi = None
+
+# Orientations read from slabs
+SLAB_ORIENTATIONS = ('yz', 'xz')
+
+_lock = threading.Lock()
+_slabs = {'pid': None, 'entries': OrderedDict(), 'nbytes': 0}
+
+
+def get_max_size():
+    """Method to get the number of bytes of slabs each worker process may keep
+
+    PLANE_CACHE_MAX_SIZE is shared by every worker process of the host.
+
+    Returns:
+        (int)
+    """
+    num_workers = uwsgi.numproc if uwsgi else 1
+    return settings.PLANE_CACHE_MAX_SIZE // max(1, num_workers)
+
+
+def get_slab_region(orientation, corner, extent, cuboid_size, image_size):
+    """Method to get the cuboid-aligned slab around a slice
+
+    The slab covers the cuboids touched by the slice in its slice dimension, clipped to the channel, and the region
+    of the slice in the other dimensions.
+
+    Args:
+        orientation (str): Image plane
+        corner ((int, int, int)): x, y, z corner of the slice
+        extent ((int, int, int)): x, y, z extent of the slice
+        cuboid_size ((int, int, int)): x, y, z size of a cuboid
+        image_size ((int, int, int)): x, y, z size of the channel at the resolution being read
+
+    Returns:
+        ((int, int, int), (int, int, int))|None: x, y, z corner and extent of the slab, or None if the slice is more
+            than one cuboid thick
+    """
+    slice_dim = PLANE_DIMS[orientation][2]
+    start = corner[slice_dim] // cuboid_size[slice_dim] * cuboid_size[slice_dim]
+    stop = max(min(start + cuboid_size[slice_dim], image_size[slice_dim]), corner[slice_dim] + extent[slice_dim])
+    if stop - start > cuboid_size[slice_dim]:
+        return None
+
+    slab_corner = list(corner)
+    slab_extent = list(extent)
+    slab_corner[slice_dim] = start
+    slab_extent[slice_dim] = stop - start
+    return tuple(slab_corner), tuple(slab_extent)
+
+
+def reset_slab_cache():
+    """Method to drop every slab kept by this worker process
+
+    Returns:
+        None
+    """
+    with _lock:
+        _slabs['pid'] = os.getpid()
+        _slabs['entries'] = OrderedDict()
+        _slabs['nbytes'] = 0
+
+
+def get_slab(key):
+    """Method to get a slab read by this worker process
+
+    Args:
+        key (str): Tag of the slab
+
+    Returns:
+        (numpy.ndarray|None): Read only 4D (t, z, y, x) matrix, or None on a miss
+    """
+    with _lock:
+        if _slabs['pid'] != os.getpid():
+            return None
+        data = _slabs['entries'].get(key)
+        if data is not None:
+            _slabs['entries'].move_to_end(key)
+        return data
+
+
+def put_slab(key, data):
+    """Method to keep a slab for later slices, evicting the least recently used slabs over the size of the cache
+
+    Args:
+        key (str): Tag of the slab
+        data (numpy.ndarray): 4D (t, z, y, x) matrix. It is made read only.
+
+    Returns:
+        None
+    """
+    if _slabs['pid'] != os.getpid():
+        # Slabs of a parent process are not shared with a forked child
+        reset_slab_cache()
+
+    data.flags.writeable = False
+    with _lock:
+        if key in _slabs['entries']:
+            return
+        _slabs['entries'][key] = data
+        _slabs['nbytes'] += data.nbytes
+        max_size = get_max_size()
+        while _slabs['nbytes'] > max_size and _slabs['entries']:
+            _, evicted = _slabs['entries'].popitem(last=False)
+            _slabs['nbytes'] -= evicted.nbytes
+
+
+class PlaneReader:
+    """
+    Class to read single slices from the cuboid-aligned slab around them
+
+    Slabs are kept per worker process, keyed by the write versions of their cuboids so writes to the slab are seen
+    immediately. Slices are returned as strided views of the slab without copying.
+    """
+
+    def __init__(self, resource, resolution, slab_corner, slab_extent):
+        """
+
+        Args:
+            resource (spdb.project.BossResource): Resource for the channel being read
+            resolution (int): Resolution level
+            slab_corner ((int, int, int)): x, y, z corner of the slab around the slice
+            slab_extent ((int, int, int)): x, y, z extent of the slab around the slice
+        """
+        self.resource = resource
+        self.resolution = resolution
+        self.slab_corner = slab_corner
+        self.slab_extent = slab_extent
+
+    @classmethod
+    def create(cls, resource, resolution, orientation, corner, extent, bit_depth, no_cache=False):
+        """Method to get the reader for a slice, if it can be read from a slab
+
+        Args:
+            resource (spdb.project.BossResource): Resource for the channel being read
+            resolution (int): Resolution level
+            orientation (str): Image plane
+            corner ((int, int, int)): x, y, z corner of the slice
+            extent ((int, int, int)): x, y, z extent of the slice
+            bit_depth (int): Bit depth of the channel
+            no_cache (bool): Flag indicating the slice must be read from the object store
+
+        Returns:
+            (PlaneReader|None): None if the slice should be read directly
+        """
+        if not settings.PLANE_CACHE_ENABLED or no_cache or orientation not in SLAB_ORIENTATIONS:
+            return None
+
+        image_size = resource.get_downsampled_extent_dims()[resolution]
+        slab = get_slab_region(orientation, corner, extent, CUBOIDSIZE[resolution], image_size)
+        if slab is None:
+            return None
+
+        slab_bytes = slab[1][0] * slab[1][1] * slab[1][2] * bit_depth // 8
+        if slab_bytes > min(settings.PLANE_CACHE_MAX_ENTRY_SIZE, get_max_size()):
+            return None
+        return cls(resource, resolution, slab[0], slab[1])
+
+    def cutout(self, spatialdb, corner, extent, time_range):
+        """Method to read a slice
+
+        Args:
+            spatialdb (spdb.spatialdb.SpatialDB): Interface to the spatialdb
+            corner ((int, int, int)): x, y, z corner of the slice
+            extent ((int, int, int)): x, y, z extent of the slice
+            time_range ([int, int]): Start and stop time samples
+
+        Returns:
+            (spdb.spatialdb.Cube): Cube whose data is a view of the slab
+        """
+        versions = WriteVersions(self.resource.get_lookup_key(), self.resolution)
+        key = versions.get_region_tag(self.slab_corner, self.slab_extent, list(time_range), ["slab"])
+
+        data = get_slab(key)
+        if data is None:
+            data = spatialdb.cutout(self.resource, self.slab_corner, self.slab_extent, self.resolution,
+                                    time_range).data
+            put_slab(key, data)
+
+        offset = [corner[d] - self.slab_corner[d] for d in range(3)]
+        cube = Cube.create_cube(self.resource, list(extent), time_range)
+        cube.data = data[:, offset[2]:offset[2] + extent[2], offset[1]:offset[1] + extent[1],
+                         offset[0]:offset[0] + extent[0]]
+        return cube
@@ -0,0 +1,300 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Background pre-rendering of tiles into the tile store. A region is read in blocks of whole tiles, and every tile of a
+# block is rendered and stored under the same tag the tile service computes for it, so the tile service finds it.
+
+import time
+import uuid
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+from spdb.spatialdb import Cube
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+
+from bossutils.logger import BossLogger
+
+from bossspatialdb.etag import get_region_image_tag
+from bossspatialdb.pool import get_prerender_executor, get_spatialdb
+from bossspatialdb.stream import get_slab_ranges
+
+from .renderers import PNGRenderer, JPEGRenderer
+from .tile_store import PLANE_DIMS, TileStore, count_tile_regions, get_tile_regions
+
+PRERENDER_JOB_PREFIX = "TILE-PRERENDER-JOB"
+
+RENDERERS = {renderer.format: renderer for renderer in (PNGRenderer, JPEGRenderer)}
+
+QUEUED = "QUEUED"
+IN_PROGRESS = "IN_PROGRESS"
+COMPLETE = "COMPLETE"
+FAILED = "FAILED"
+
+
+def get_prerender_blocks(orientation, tile_size, corner, extent, cuboid_size, bytes_per_voxel, max_bytes):
+    """Method to split the tiles of a region into blocks that are read with a single cutout
+
+    Blocks are aligned to cuboids in the slice dimension and hold a single row of tiles, split so no block is larger
+    than max_bytes unless a single tile is. Only tiles that lie entirely inside the region are covered.
+
+    Args:
+        orientation (str): Image plane
+        tile_size (int): Size of a tile in voxels
+        corner ((int, int, int)): x, y, z corner of the region
+        extent ((int, int, int)): x, y, z extent of the region
+        cuboid_size ((int, int, int)): x, y, z size of a cuboid
+        bytes_per_voxel (int): Size of a voxel of the channel
+        max_bytes (int): Maximum size of a block
+
+    Returns:
+        (list(((int, int, int), (int, int, int)))): x, y, z corner and extent of each block
+    """
+    dim_a, dim_b, slice_dim = PLANE_DIMS[orientation]
+    first = [-(-corner[d] // tile_size) for d in range(3)]
+    last = [(corner[d] + extent[d]) // tile_size for d in range(3)]
+
+    blocks = []
+    for s_start, s_stop in get_slab_ranges(corner[slice_dim], corner[slice_dim] + extent[slice_dim],
+                                           cuboid_size[slice_dim]):
+        tiles_per_block = max(1, max_bytes // (tile_size * tile_size * (s_stop - s_start) * bytes_per_voxel))
+        for b in range(first[dim_b], last[dim_b]):
+            for a in range(first[dim_a], last[dim_a], tiles_per_block):
+                block_corner = [0, 0, 0]
+                block_extent = [0, 0, 0]
+                block_corner[dim_a] = a * tile_size
+                block_extent[dim_a] = (min(a + tiles_per_block, last[dim_a]) - a) * tile_size
+                block_corner[dim_b] = b * tile_size
+                block_extent[dim_b] = tile_size
+                block_corner[slice_dim] = s_start
+                block_extent[slice_dim] = s_stop - s_start
+                blocks.append((tuple(block_corner), tuple(block_extent)))
+    return blocks
+
+
+def get_image(cube, orientation):
+    """Method to convert a single tile cutout to an image
+
+    Args:
+        cube (spdb.spatialdb.Cube): Cutout of the tile
+        orientation (str): Image plane
+
+    Returns:
+        (PIL.Image.Image)
+    """
+    if orientation == 'xy':
+        return cube.xy_image()
+    elif orientation == 'yz':
+        return cube.yz_image()
+    else:
+        return cube.xz_image()
+
+
+class PrerenderJob:
+    """
+    Class to track the pre-rendering of the tiles of a region into the tile store
+
+    The job state is stored in the TILE_STORE_CACHE_ALIAS cache so any worker can report its status. Progress is
+    counted in tiles, with each time sample of a tile counted separately.
+    """
+
+    def __init__(self, state):
+        """
+
+        Args:
+            state (dict): Stored state of the job
+        """
+        self.state = state
+        self.cache = caches[settings.TILE_STORE_CACHE_ALIAS]
+
+    @staticmethod
+    def get_key(job_id):
+        """Method to get the cache key of a job
+
+        Args:
+            job_id (str): Id of the pre-render job
+
+        Returns:
+            (str)
+        """
+        return "{}&{}".format(PRERENDER_JOB_PREFIX, job_id)
+
+    @classmethod
+    def create(cls, owner, lookup_key, resolution, orientation, tile_size, image_format, corner, extent, time_range):
+        """Method to create a new queued job
+
+        Args:
+            owner (str): Username of the user that submitted the job
+            lookup_key (str): Lookup key of the channel
+            resolution (int): Resolution level
+            orientation (str): Image plane
+            tile_size (int): Size of a tile in voxels
+            image_format (str): Format of the tiles, one of RENDERERS
+            corner ((int, int, int)): x, y, z corner of the region
+            extent ((int, int, int)): x, y, z extent of the region
+            time_range ([int, int]): Start and stop time samples of the region
+
+        Returns:
+            (PrerenderJob)
+        """
+        num_tiles = count_tile_regions(orientation, tile_size, corner, extent)
+        job = cls({"job_id": uuid.uuid4().hex,
+                   "owner": owner,
+                   "lookup_key": lookup_key,
+                   "resolution": resolution,
+                   "orientation": orientation,
+                   "tile_size": tile_size,
+                   "format": image_format,
+                   "corner": list(corner),
+                   "extent": list(extent),
+                   "time_range": list(time_range),
+                   "status": QUEUED,
+                   "tiles_total": num_tiles * (time_range[1] - time_range[0]),
+                   "tiles_rendered": 0,
+                   "tiles_failed": 0,
+                   "errors": [],
+                   "created": time.time(),
+                   "updated": time.time()})
+        job.save()
+        return job
+
+    @classmethod
+    def get(cls, job_id):
+        """Method to load a job
+
+        Args:
+            job_id (str): Id of the pre-render job
+
+        Returns:
+            (PrerenderJob|None): None if the job does not exist or has expired
+        """
+        state = caches[settings.TILE_STORE_CACHE_ALIAS].get(cls.get_key(job_id))
+        if state is None:
+            return None
+        return cls(state)
+
+    @property
+    def job_id(self):
+        return self.state["job_id"]
+
+    def save(self):
+        """Method to store the current state of the job
+
+        Returns:
+            None
+        """
+        self.state["updated"] = time.time()
+        self.cache.set(self.get_key(self.job_id), self.state, timeout=settings.TILE_PRERENDER_JOB_TIMEOUT)
+
+    def to_dict(self):
+        """Method to get the status reported to the client
+
+        Returns:
+            (dict)
+        """
+        keys = ("job_id", "status", "tiles_total", "tiles_rendered", "tiles_failed", "errors", "created", "updated")
+        return {key: self.state[key] for key in keys}
+
+    def submit(self, resource):
+        """Method to queue the job on the pre-render thread pool of this worker
+
+        Args:
+            resource (spdb.project.BossResource): Resource for the channel being rendered
+
+        Returns:
+            None
+        """
+        get_prerender_executor().submit(self.run, resource)
+
+    def render_block(self, resource, block_corner, block_extent, time_sample):
+        """Method to render and store every tile of a block
+
+        Args:
+            resource (spdb.project.BossResource): Resource for the channel being rendered
+            block_corner ((int, int, int)): x, y, z corner of the block
+            block_extent ((int, int, int)): x, y, z extent of the block
+            time_sample (int): Time sample to render
+
+        Returns:
+            None
+        """
+        resolution = self.state["resolution"]
+        orientation = self.state["orientation"]
+        renderer = RENDERERS[self.state["format"]]()
+        time_range = [time_sample, time_sample + 1]
+
+        # Tag the tiles before reading them, as the tile service does, so a write that lands during the read changes
+        # the tag the tile service looks up instead of storing old pixels under the new tag
+        tiles = []
+        for corner, extent in get_tile_regions(orientation, self.state["tile_size"], block_corner, block_extent):
+            tag = get_region_image_tag(self.state["lookup_key"], resolution, corner, extent, time_range,
+                                       renderer.media_type, orientation)
+            tiles.append((corner, extent, tag))
+
+        block = get_spatialdb().cutout(resource, block_corner, block_extent, resolution, time_range)
+        for corner, extent, tag in tiles:
+            offset = [corner[d] - block_corner[d] for d in range(3)]
+            cube = Cube.create_cube(resource, list(extent), time_range)
+            cube.data = np.ascontiguousarray(block.data[:, offset[2]:offset[2] + extent[2],
+                                                        offset[1]:offset[1] + extent[1],
+                                                        offset[0]:offset[0] + extent[0]])
+            TileStore(tag, renderer.media_type).put(renderer.render(get_image(cube, orientation)))
+
+    def run(self, resource):
+        """Method to render the tiles of the region into the tile store
+
+        The region is read one block at a time (see get_prerender_blocks) and progress is saved after each block.
+        Every block is attempted even if an earlier one failed.
+
+        Args:
+            resource (spdb.project.BossResource): Resource for the channel being rendered
+
+        Returns:
+            None
+        """
+        log = BossLogger().logger
+        try:
+            self.state["status"] = IN_PROGRESS
+            self.save()
+
+            orientation = self.state["orientation"]
+            tile_size = self.state["tile_size"]
+            blocks = get_prerender_blocks(orientation, tile_size, self.state["corner"], self.state["extent"],
+                                          CUBOIDSIZE[self.state["resolution"]], resource.get_bit_depth() // 8,
+                                          settings.TILE_PRERENDER_MAX_BLOCK_SIZE)
+
+            for time_sample in range(*self.state["time_range"]):
+                for block_corner, block_extent in blocks:
+                    num_tiles = count_tile_regions(orientation, tile_size, block_corner, block_extent)
+                    try:
+                        self.render_block(resource, block_corner, block_extent, time_sample)
+                        self.state["tiles_rendered"] += num_tiles
+                    except Exception as e:
+                        log.exception("Pre-render job {} failed to render block {} {}".format(
+                            self.job_id, block_corner, block_extent))
+                        self.state["tiles_failed"] += num_tiles
+                        self.state["errors"].append(str(e))
+                    self.save()
+
+            self.state["status"] = FAILED if self.state["tiles_failed"] else COMPLETE
+        except Exception as e:
+            log.exception("Pre-render job {} failed".format(self.job_id))
+            self.state["status"] = FAILED
+            self.state["errors"].append(str(e))
+        finally:
+            self.save()
+            # Jobs run outside of the request cycle, so the thread's database connection is not closed by Django
+            connection.close()
@@ -48,3 +48,14 @@ class JPEGRenderer(renderers.BaseRenderer):
         file_obj.seek(0)
         return file_obj.read()
 
+
+class MultipartRenderer(renderers.BaseRenderer):
+    """ A DRF renderer for negotiating multipart responses. Views build the multipart body themselves.
+    """
+    media_type = 'multipart/mixed'
+    format = 'multipart'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, media_type=None, renderer_context=None):
+        return data
@@ -0,0 +1,105 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import ThreadPoolExecutor
+from email.parser import BytesParser
+
+import numpy as np
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from unittest.mock import MagicMock, patch
+
+from bosstiles.batch import BatchTiles, TILE_INDEX_HEADER
+from bosstiles.renderers import PNGRenderer
+from bosstiles.tile_store import get_tile_region
+
+
+class FakeImage:
+    """Stand in for a PIL image that saves the raw bytes of the tile"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def save(self, file_obj, image_format):
+        file_obj.write(self.data.tobytes())
+
+
+def make_region(corner, extent):
+    """Get a stand in for the validated cutout request of a tile"""
+    region = MagicMock()
+    region.get_x_start.return_value, region.get_y_start.return_value, region.get_z_start.return_value = corner
+    region.get_x_span.return_value, region.get_y_span.return_value, region.get_z_span.return_value = extent
+    region.get_resolution.return_value = 0
+    region.get_time.return_value = range(0, 1)
+    region.time_request = False
+    return region
+
+
+@override_settings(TILE_STORE_ENABLED=True, TILE_STORE_CACHE_ALIAS='default', TILE_STORE_TIMEOUT=60,
+                   TILE_STORE_MAX_ENTRY_SIZE=1024, BATCH_CUTOUT_MERGE_RATIO=2, CUTOUT_MAX_SIZE=1048576)
+class TestBatchTiles(SimpleTestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.data = np.arange(2 * 16 * 32, dtype=np.uint8).reshape(1, 2, 16, 32)
+
+        def cutout(resource, corner, extent, resolution, time_range, iso=False, no_cache=False):
+            cube = MagicMock()
+            cube.data = self.data[:, corner[2]:corner[2] + extent[2], corner[1]:corner[1] + extent[1],
+                                  corner[0]:corner[0] + extent[0]]
+            return cube
+        self.spatialdb = MagicMock()
+        self.spatialdb.cutout.side_effect = cutout
+
+        executor = ThreadPoolExecutor(2)
+        self.addCleanup(executor.shutdown)
+        for target, kwargs in (('bosstiles.batch.get_tile_render_executor', {'return_value': executor}),
+                               ('bosstiles.batch.get_image',
+                                {'side_effect': lambda cube, orientation: FakeImage(cube.data)}),
+                               ('bosstiles.batch.Cube', {})):
+            patcher = patch(target, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def make_batch(self, indices):
+        resource = MagicMock()
+        resource.get_lookup_key.return_value = "1&1&1"
+        regions = [make_region(*get_tile_region('xy', 8, *index)) for index in indices]
+        return BatchTiles(resource, 'xy', 8, indices, regions, PNGRenderer())
+
+    def test_render(self):
+        """Test that tiles sharing cuboids are read once and returned in the order requested"""
+        tiles = self.make_batch([(1, 0, 1), (0, 0, 1), (3, 1, 0)]).render(self.spatialdb, 8)
+        self.assertEqual(self.spatialdb.cutout.call_count, 1)
+        self.assertEqual(tiles, [self.data[0, 1, 0:8, 8:16].tobytes(), self.data[0, 1, 0:8, 0:8].tobytes(),
+                                 self.data[0, 0, 8:16, 24:32].tobytes()])
+
+    def test_stored_tiles_not_read(self):
+        """Test that tiles in the tile store are not read again"""
+        self.make_batch([(0, 0, 1)]).render(self.spatialdb, 8)
+        tiles = self.make_batch([(0, 0, 1)]).render(self.spatialdb, 8)
+        self.assertEqual(self.spatialdb.cutout.call_count, 1)
+        self.assertEqual(tiles, [self.data[0, 1, 0:8, 0:8].tobytes()])
+
+    def test_multipart(self):
+        """Test that the response body is valid multipart/mixed with the index of each tile"""
+        batch = self.make_batch([(1, 0, 1), (0, 0, 1)])
+        body, content_type = batch.to_multipart([b"tile\r\n1", b"tile2"])
+
+        message = BytesParser().parsebytes("Content-Type: {}\r\n\r\n".format(content_type).encode() + body)
+        parts = message.get_payload()
+        self.assertEqual([part[TILE_INDEX_HEADER] for part in parts], ["1,0,1", "0,0,1"])
+        self.assertEqual([part.get_payload(decode=True) for part in parts], [b"tile\r\n1", b"tile2"])
+        self.assertEqual(parts[0].get_content_type(), "image/png")
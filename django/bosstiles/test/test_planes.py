@@ -0,0 +1,136 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from unittest.mock import MagicMock, patch
+
+from bossspatialdb.write_state import WriteVersions
+from bosstiles.planes import PlaneReader, get_max_size, get_slab_region, reset_slab_cache
+
+CUBOID_SIZE = (512, 512, 16)
+IMAGE_SIZE = (1000, 1024, 64)
+
+
+def make_resource():
+    resource = MagicMock()
+    resource.get_lookup_key.return_value = "1&1&1"
+    resource.get_downsampled_extent_dims.return_value = [list(IMAGE_SIZE)]
+    return resource
+
+
+def make_spatialdb(data):
+    """Get a stand in for the spatialdb that reads from a 4D (t, z, y, x) matrix"""
+    def cutout(resource, corner, extent, resolution, time_range):
+        cube = MagicMock()
+        cube.data = data[time_range[0]:time_range[1], corner[2]:corner[2] + extent[2],
+                         corner[1]:corner[1] + extent[1], corner[0]:corner[0] + extent[0]].copy()
+        return cube
+
+    spatialdb = MagicMock()
+    spatialdb.cutout.side_effect = cutout
+    return spatialdb
+
+
+class TestSlabRegion(SimpleTestCase):
+
+    def test_yz(self):
+        """Test that a yz slice is read with the cuboids around it in x"""
+        self.assertEqual(get_slab_region('yz', (600, 0, 0), (1, 512, 512), CUBOID_SIZE, IMAGE_SIZE),
+                         ((512, 0, 0), (488, 512, 512)))
+
+    def test_xy(self):
+        """Test that an xy slice is read with the cuboid layer around it in z"""
+        self.assertEqual(get_slab_region('xy', (0, 512, 17), (512, 512, 1), CUBOID_SIZE, IMAGE_SIZE),
+                         ((0, 512, 16), (512, 512, 16)))
+
+    def test_thick(self):
+        """Test that regions thicker than a cuboid are not read as slabs"""
+        self.assertIsNone(get_slab_region('xz', (0, 500, 0), (512, 20, 512), CUBOID_SIZE, IMAGE_SIZE))
+
+
+@override_settings(PLANE_CACHE_ENABLED=True, PLANE_CACHE_MAX_SIZE=64 * 1048576,
+                   PLANE_CACHE_MAX_ENTRY_SIZE=64 * 1048576)
+class TestPlaneReader(SimpleTestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        reset_slab_cache()
+        patcher = patch('bosstiles.planes.Cube')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.data = np.random.randint(0, 255, (1, 64, 128, 1000), dtype=np.uint8)
+        self.spatialdb = make_spatialdb(self.data)
+
+    def read(self, corner, extent, orientation='yz'):
+        resource = make_resource()
+        reader = PlaneReader.create(resource, 0, orientation, corner, extent, 8)
+        return reader.cutout(self.spatialdb, corner, extent, [0, 1]).data
+
+    def test_neighbouring_slices(self):
+        """Test that neighbouring slices are views of a single read"""
+        first = self.read((600, 0, 0), (1, 128, 16))
+        second = self.read((601, 0, 0), (1, 128, 16))
+        self.assertEqual(self.spatialdb.cutout.call_count, 1)
+        np.testing.assert_array_equal(first, self.data[:, 0:16, 0:128, 600:601])
+        np.testing.assert_array_equal(second, self.data[:, 0:16, 0:128, 601:602])
+        self.assertFalse(second.flags.writeable)
+
+        # The next cuboid in x is a new slab
+        self.read((100, 0, 0), (1, 128, 16))
+        self.assertEqual(self.spatialdb.cutout.call_count, 2)
+
+    def test_write_invalidates(self):
+        """Test that a write to the slab is read by the next slice"""
+        self.read((600, 0, 0), (1, 128, 16))
+        self.data[0, 0, 0, 900] = 0
+        WriteVersions("1&1&1", 0).bump_region((900, 0, 0), (1, 1, 1), [0, 1])
+
+        self.assertEqual(self.read((900, 0, 0), (1, 128, 16))[0, 0, 0, 0], 0)
+        self.assertEqual(self.spatialdb.cutout.call_count, 2)
+
+    def test_eviction(self):
+        """Test that the least recently used slabs are evicted over PLANE_CACHE_MAX_SIZE"""
+        with self.settings(PLANE_CACHE_MAX_SIZE=512 * 128 * 16 + 1):
+            self.read((0, 0, 0), (1, 128, 16))
+            self.read((0, 0, 16), (1, 128, 16))
+            self.read((1, 0, 0), (1, 128, 16))
+        self.assertEqual(self.spatialdb.cutout.call_count, 3)
+
+    def test_not_created(self):
+        """Test that slices are read directly when disabled, uncached or the slab is too large"""
+        resource = make_resource()
+        with self.settings(PLANE_CACHE_ENABLED=False):
+            self.assertIsNone(PlaneReader.create(resource, 0, 'yz', (0, 0, 0), (1, 128, 16), 8))
+        self.assertIsNone(PlaneReader.create(resource, 0, 'yz', (0, 0, 0), (1, 128, 16), 8, no_cache=True))
+        with self.settings(PLANE_CACHE_MAX_ENTRY_SIZE=1024):
+            self.assertIsNone(PlaneReader.create(resource, 0, 'yz', (0, 0, 0), (1, 128, 16), 8))
+        with self.settings(PLANE_CACHE_MAX_SIZE=1024):
+            self.assertIsNone(PlaneReader.create(resource, 0, 'yz', (0, 0, 0), (1, 128, 16), 8))
+
+    def test_xy_read_directly(self):
+        """Test that xy slices are not read from slabs"""
+        self.assertIsNone(PlaneReader.create(make_resource(), 0, 'xy', (0, 0, 17), (512, 512, 1), 8))
+        self.assertIsNotNone(PlaneReader.create(make_resource(), 0, 'xz', (0, 0, 0), (512, 1, 16), 8))
+
+    def test_max_size_per_worker(self):
+        """Test that the host budget is split between the worker processes"""
+        uwsgi = MagicMock()
+        uwsgi.numproc = 16
+        with patch('bosstiles.planes.uwsgi', uwsgi):
+            self.assertEqual(get_max_size(), 4 * 1048576)
+        with patch('bosstiles.planes.uwsgi', None):
+            self.assertEqual(get_max_size(), 64 * 1048576)
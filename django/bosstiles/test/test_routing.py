@@ -13,7 +13,7 @@
 # limitations under the License.
 
 from django.core.urlresolvers import resolve
-from bosstiles.views import Tile, CutoutTile
+from bosstiles.views import Tile, CutoutTile, TileBatch, TilePrerender, TilePrerenderJob
 
 from rest_framework.test import APITestCase
 
@@ -92,3 +92,31 @@ class TileInterfaceRoutingTests(APITestCase):
 
         view_tiles = resolve('/' + version + '/tile/col1/exp1/ds1/yz/512/2/0/1/1/3/')
         self.assertEqual(view_tiles.func.__name__, Tile.as_view().__name__)
+
+    def test_prerender_resolves(self):
+        """
+        Test to make sure the tile pre-render URLs resolve
+        :return:
+        """
+        view_tiles = resolve('/' + version + '/tile/prerender/col1/exp1/ds1/xy/512/2')
+        self.assertEqual(view_tiles.func.__name__, TilePrerender.as_view().__name__)
+
+        view_tiles = resolve('/' + version + '/tile/prerender/col1/exp1/ds1/xy/512/2/0:1024/0:1024/0:16/')
+        self.assertEqual(view_tiles.func.__name__, TilePrerender.as_view().__name__)
+
+        view_tiles = resolve('/' + version + '/tile/prerender/col1/exp1/ds1/yz/512/2/0:16/0:1024/0:1024/0:2')
+        self.assertEqual(view_tiles.func.__name__, TilePrerender.as_view().__name__)
+
+        view_tiles = resolve('/' + version + '/tile/prerender/jobs/0123456789abcdef0123456789abcdef')
+        self.assertEqual(view_tiles.func.__name__, TilePrerenderJob.as_view().__name__)
+
+    def test_batch_resolves(self):
+        """
+        Test to make sure the batch tile URLs resolve
+        :return:
+        """
+        view_tiles = resolve('/' + version + '/tile/batch/col1/exp1/ds1/xy/512/2')
+        self.assertEqual(view_tiles.func.__name__, TileBatch.as_view().__name__)
+
+        view_tiles = resolve('/' + version + '/tile/batch/col1/exp1/ds1/yz/512/2/3/')
+        self.assertEqual(view_tiles.func.__name__, TileBatch.as_view().__name__)
@@ -0,0 +1,182 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test import SimpleTestCase, override_settings
+
+from unittest.mock import MagicMock, patch
+
+from bossspatialdb.etag import get_image_tag, get_region_image_tag
+from bossspatialdb.write_state import WriteVersions
+from bosstiles.prerender import PrerenderJob, COMPLETE, get_prerender_blocks
+from bosstiles.tile_store import TileStore, count_tile_regions, get_tile_region, get_tile_regions
+
+CUBOID_SIZE = (512, 512, 16)
+
+
+class FakeImage:
+    """Stand in for a PIL image that saves the raw bytes of the tile"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def save(self, file_obj, image_format):
+        file_obj.write(self.data.tobytes())
+
+
+class TestTileRegions(SimpleTestCase):
+
+    def test_tile_region(self):
+        """Test that tile indices are converted to the same regions as the tile service"""
+        self.assertEqual(get_tile_region('xy', 512, 1, 2, 3), ((512, 1024, 3), (512, 512, 1)))
+        self.assertEqual(get_tile_region('yz', 512, 1, 2, 3), ((1, 1024, 1536), (1, 512, 512)))
+        self.assertEqual(get_tile_region('xz', 512, 1, 2, 3), ((512, 2, 1536), (512, 1, 512)))
+
+    def test_only_complete_tiles(self):
+        """Test that only tiles entirely inside a region are included"""
+        regions = get_tile_regions('xy', 512, (100, 0, 5), (1500, 600, 2))
+        self.assertEqual(regions, [((512, 0, 5), (512, 512, 1)), ((1024, 0, 5), (512, 512, 1)),
+                                   ((512, 0, 6), (512, 512, 1)), ((1024, 0, 6), (512, 512, 1))])
+
+    def test_count(self):
+        """Test that tiles are counted without listing them"""
+        for orientation in ('xy', 'yz', 'xz'):
+            for corner, extent in (((100, 0, 5), (1500, 600, 2)), ((0, 0, 0), (1024, 1024, 1024)),
+                                   ((600, 600, 600), (100, 100, 100))):
+                self.assertEqual(count_tile_regions(orientation, 512, corner, extent),
+                                 len(get_tile_regions(orientation, 512, corner, extent)))
+
+    def test_blocks(self):
+        """Test that blocks are cuboid aligned in the slice dimension and no larger than the maximum size"""
+        blocks = get_prerender_blocks('xy', 512, (0, 0, 8), (2048, 1024, 16), CUBOID_SIZE, 1, 512 * 512 * 8 * 2)
+        self.assertEqual(blocks, [((0, 0, 8), (1024, 512, 8)), ((1024, 0, 8), (1024, 512, 8)),
+                                  ((0, 512, 8), (1024, 512, 8)), ((1024, 512, 8), (1024, 512, 8)),
+                                  ((0, 0, 16), (1024, 512, 8)), ((1024, 0, 16), (1024, 512, 8)),
+                                  ((0, 512, 16), (1024, 512, 8)), ((1024, 512, 16), (1024, 512, 8))])
+
+        # Every tile is in exactly one block
+        tiles = [tile for corner, extent in blocks for tile in get_tile_regions('xy', 512, corner, extent)]
+        self.assertEqual(sorted(tiles), sorted(get_tile_regions('xy', 512, (0, 0, 8), (2048, 1024, 16))))
+
+    def test_blocks_yz(self):
+        """Test that yz blocks are split along x in cuboids"""
+        blocks = get_prerender_blocks('yz', 512, (0, 0, 0), (600, 512, 1024), CUBOID_SIZE, 1, 1 << 30)
+        self.assertEqual(blocks, [((0, 0, 0), (512, 512, 512)), ((0, 0, 512), (512, 512, 512)),
+                                  ((512, 0, 0), (88, 512, 512)), ((512, 0, 512), (88, 512, 512))])
+
+
+@override_settings(TILE_STORE_ENABLED=True, TILE_STORE_CACHE_ALIAS='default', TILE_STORE_TIMEOUT=60,
+                   TILE_STORE_MAX_ENTRY_SIZE=1024, TILE_PRERENDER_MAX_BLOCK_SIZE=64 * 1048576,
+                   TILE_PRERENDER_JOB_TIMEOUT=60)
+class TestTileStore(SimpleTestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_put_get(self):
+        """Test that a stored tile is returned with its media type"""
+        self.assertIsNone(TileStore("tag1", "image/png").get())
+        self.assertTrue(TileStore("tag1", "image/png").put(b"tile"))
+
+        response = TileStore("tag1", "image/png").get()
+        self.assertEqual(response.content, b"tile")
+        self.assertEqual(response['Content-Type'], "image/png")
+
+    def test_max_entry_size(self):
+        """Test that tiles over TILE_STORE_MAX_ENTRY_SIZE are not stored"""
+        self.assertFalse(TileStore("tag1", "image/png").put(b"x" * 2048))
+        self.assertIsNone(TileStore("tag1", "image/png").get())
+
+    def test_errors_not_stored(self):
+        """Test that error responses are not stored"""
+        store = TileStore("tag1", "image/png")
+        store._store(HttpResponse(b"error", status=500))
+        store._store(HttpResponse(b'{"error": 1}', content_type="application/json"))
+        self.assertIsNone(store.get())
+
+        store._store(HttpResponse(b"tile", content_type="image/png"))
+        self.assertEqual(store.get().content, b"tile")
+
+    def test_tag_matches_tile_service(self):
+        """Test that the tag of a pre-rendered tile is the tag computed by the tile service"""
+        req = MagicMock()
+        req.get_lookup_key.return_value = "1&1&1"
+        req.get_resolution.return_value = 0
+        req.get_x_start.return_value, req.get_y_start.return_value, req.get_z_start.return_value = 512, 0, 3
+        req.get_x_span.return_value, req.get_y_span.return_value, req.get_z_span.return_value = 512, 512, 1
+        req.get_time.return_value = range(0, 1)
+
+        self.assertEqual(get_image_tag(req, "image/png", "xy"),
+                         get_region_image_tag("1&1&1", 0, (512, 0, 3), (512, 512, 1), [0, 1], "image/png", "xy"))
+
+    @patch('bosstiles.prerender.get_image', side_effect=lambda cube, orientation: FakeImage(cube.data))
+    @patch('bosstiles.prerender.Cube')
+    @patch('bosstiles.prerender.get_spatialdb')
+    def test_prerender(self, get_spatialdb, cube_class, get_image):
+        """Test that a job renders every tile of a region and that writes invalidate them"""
+        data = np.arange(2 * 16 * 16, dtype=np.uint8).reshape(1, 2, 16, 16)
+
+        def cutout(resource, corner, extent, resolution, time_range):
+            block = MagicMock()
+            block.data = data[:, corner[2]:corner[2] + extent[2], corner[1]:corner[1] + extent[1],
+                              corner[0]:corner[0] + extent[0]]
+            return block
+        get_spatialdb.return_value.cutout.side_effect = cutout
+        cube_class.create_cube.side_effect = lambda resource, extent, time_range: MagicMock()
+
+        resource = MagicMock()
+        resource.get_bit_depth.return_value = 8
+
+        job = PrerenderJob.create("user1", "1&1&1", 0, "xy", 8, "png", (0, 0, 0), (16, 16, 2), [0, 1])
+        job.run(resource)
+
+        status = PrerenderJob.get(job.job_id).to_dict()
+        self.assertEqual(status["status"], COMPLETE)
+        self.assertEqual(status["tiles_total"], 8)
+        self.assertEqual(status["tiles_rendered"], 8)
+
+        tag = get_region_image_tag("1&1&1", 0, (8, 8, 1), (8, 8, 1), [0, 1], "image/png", "xy")
+        self.assertEqual(TileStore(tag, "image/png").get().content, data[0, 1, 8:16, 8:16].tobytes())
+
+        # A write to the region changes the tag of the tile
+        WriteVersions("1&1&1", 0).bump_region((8, 8, 1), (1, 1, 1), [0, 1])
+        tag = get_region_image_tag("1&1&1", 0, (8, 8, 1), (8, 8, 1), [0, 1], "image/png", "xy")
+        self.assertIsNone(TileStore(tag, "image/png").get())
+
+    @patch('bosstiles.prerender.get_image', side_effect=lambda cube, orientation: FakeImage(cube.data))
+    @patch('bosstiles.prerender.Cube')
+    @patch('bosstiles.prerender.get_spatialdb')
+    def test_prerender_write_during_read(self, get_spatialdb, cube_class, get_image):
+        """Test that a write landing while a block is read does not store old pixels under the new tag"""
+        data = np.zeros((1, 1, 8, 8), dtype=np.uint8)
+
+        def cutout(resource, corner, extent, resolution, time_range):
+            block = MagicMock()
+            block.data = data
+            WriteVersions("1&1&1", 0).bump_region(corner, extent, time_range)
+            return block
+        get_spatialdb.return_value.cutout.side_effect = cutout
+        cube_class.create_cube.side_effect = lambda resource, extent, time_range: MagicMock()
+
+        resource = MagicMock()
+        resource.get_bit_depth.return_value = 8
+
+        job = PrerenderJob.create("user1", "1&1&1", 0, "xy", 8, "png", (0, 0, 0), (8, 8, 1), [0, 1])
+        job.run(resource)
+        self.assertEqual(PrerenderJob.get(job.job_id).to_dict()["status"], COMPLETE)
+
+        tag = get_region_image_tag("1&1&1", 0, (0, 0, 0), (8, 8, 1), [0, 1], "image/png", "xy")
+        self.assertIsNone(TileStore(tag, "image/png").get())
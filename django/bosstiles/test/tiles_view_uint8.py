@@ -18,13 +18,19 @@ from rest_framework.test import APITestCase, APIRequestFactory
 from rest_framework.test import force_authenticate
 from rest_framework import status
 
-from bosstiles.views import Tile, CutoutTile
+from bosstiles.views import Tile, CutoutTile, TileBatch
+from bosstiles.batch import TILE_INDEX_HEADER
+from bosstiles.planes import reset_slab_cache
 from bossspatialdb.views import Cutout
+from bossspatialdb.pool import reset_spatialdb_pool
 
 from bosscore.test.setup_db import SetupTestDB
 from bosscore.error import BossError
 
 import numpy as np
+import io
+from email.parser import BytesParser
+from PIL import Image
 
 from unittest.mock import patch
 from mockredis import mock_strict_redis_client
@@ -87,6 +93,29 @@ class ImageInterfaceViewTestMixin(object):
 
         np.testing.assert_equal(test_img, self.test_data_8[1, 0:128, 0:128])
 
+    def test_png_uint8_xy_not_modified(self):
+        """ Test that a repeat request with the ETag of the previous response is not resent"""
+        factory = APIRequestFactory()
+
+        # Get an image file
+        request = factory.get('/' + version + '/image/col1/exp1/channel1/xy/0/0:128/0:128/1/',
+                              Accept='image/png')
+        force_authenticate(request, user=self.user)
+        # Make request
+        response = CutoutTile.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                        orientation='xy', resolution='0', x_args='0:128', y_args='0:128', z_args='1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        # Get the same image with the ETag
+        request = factory.get('/' + version + '/image/col1/exp1/channel1/xy/0/0:128/0:128/1/',
+                              Accept='image/png', HTTP_IF_NONE_MATCH=etag)
+        force_authenticate(request, user=self.user)
+        response = CutoutTile.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                        orientation='xy', resolution='0', x_args='0:128', y_args='0:128', z_args='1')
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
     def test_png_uint8_xz(self):
         """ Test a png xz slice"""
         # Post data to the database
@@ -136,6 +165,9 @@ class TestImageInterfaceView(ImageInterfaceViewTestMixin, APITestCase):
         Initialize the database
         :return:
         """
+        # Drop SpatialDB instances bound to the mocks of earlier tests
+        reset_spatialdb_pool()
+
         # Create a user
         dbsetup = SetupTestDB()
         self.user = dbsetup.create_user('testuser')
@@ -267,6 +299,79 @@ class TileInterfaceViewTestMixin(object):
         np.testing.assert_equal(test_img, np.squeeze(self.test_data_8[8:12, 28:32, 0]))
 
 
+    def test_png_uint8_batch(self):
+        """ Test reading several xy tiles with the batch interface"""
+        test_mat = np.random.randint(1, 254, (16, 256, 256)).astype(np.uint8)
+        bb = blosc.compress(test_mat.tobytes(), typesize=8)
+
+        # Post data to the database
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/0:256/0:256/16:32/', bb,
+                               content_type='application/blosc')
+        force_authenticate(request, user=self.user)
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='0:256', y_range='0:256', z_range='16:32', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Get a batch of tiles
+        request = factory.post('/' + version + '/tile/batch/col1/exp1/channel1/xy/128/0/',
+                               {"tiles": [[0, 0, 20], [1, 1, 21]]}, format='json', HTTP_ACCEPT='multipart/mixed')
+        force_authenticate(request, user=self.user)
+        response = TileBatch.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                       orientation='xy', tile_size='128', resolution='0')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Check each part is the png of its tile, in the order requested
+        message = BytesParser().parsebytes("Content-Type: {}\r\n\r\n".format(response['Content-Type']).encode() +
+                                           response.content)
+        parts = message.get_payload()
+        self.assertEqual([part[TILE_INDEX_HEADER] for part in parts], ["0,0,20", "1,1,21"])
+        expected = [test_mat[4, 0:128, 0:128], test_mat[5, 128:256, 128:256]]
+        for part, expected_img in zip(parts, expected):
+            self.assertEqual(part.get_content_type(), "image/png")
+            test_img = np.array(Image.open(io.BytesIO(part.get_payload(decode=True))), dtype="uint8")
+            np.testing.assert_equal(test_img, expected_img)
+
+
+    def test_png_uint8_yz_plane_cache(self):
+        """ Test that neighbouring yz tiles are read from the slab cached for the first one"""
+        test_mat = np.random.randint(1, 254, (16, 32, 32)).astype(np.uint8)
+        bb = blosc.compress(test_mat.tobytes(), typesize=8)
+
+        # Post data to the database
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/0:32/0:32/16:32/', bb,
+                               content_type='application/blosc')
+        force_authenticate(request, user=self.user)
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='0:32', y_range='0:32', z_range='16:32', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        reset_slab_cache()
+        with self.settings(PLANE_CACHE_ENABLED=True):
+            for x_idx in range(5, 8):
+                # Get a yz tile
+                request = factory.get('/' + version + '/tile/col1/exp1/channel1/yz/16/0/{}/1/1/'.format(x_idx),
+                                      Accept='image/png')
+                force_authenticate(request, user=self.user)
+                if x_idx == 5:
+                    response = Tile.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                              orientation='yz', tile_size='16', resolution='0',
+                                              x_idx=str(x_idx), y_idx='1', z_idx='1')
+                else:
+                    # The rest of the slab is not read again
+                    with patch.object(spdb.spatialdb.SpatialDB, 'cutout') as cutout:
+                        response = Tile.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                                  orientation='yz', tile_size='16', resolution='0',
+                                                  x_idx=str(x_idx), y_idx='1', z_idx='1')
+                    cutout.assert_not_called()
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+                # Check data is correct (this is pre-renderer)
+                test_img = np.array(response.data, dtype="uint8")
+                np.testing.assert_equal(test_img, test_mat[:, 16:32, x_idx])
+
+
 class TestTileInterfaceView(TileInterfaceViewTestMixin, APITestCase):
 
     @patch('bossutils.configuration.BossConfig', MockBossConfig)
@@ -277,6 +382,9 @@ class TestTileInterfaceView(TileInterfaceViewTestMixin, APITestCase):
         Initialize the database
         :return:
         """
+        # Drop SpatialDB instances bound to the mocks of earlier tests
+        reset_spatialdb_pool()
+
         # Create a user
         dbsetup = SetupTestDB()
         self.user = dbsetup.create_user('testuser')
@@ -0,0 +1,200 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+TILE_STORE_PREFIX = "TILE"
+
+# Tiled dimensions and the slice dimension (x=0, y=1, z=2) of each image plane
+PLANE_DIMS = {'xy': (0, 1, 2),
+              'yz': (1, 2, 0),
+              'xz': (0, 2, 1)}
+
+
+def get_tile_region(orientation, tile_size, x_idx, y_idx, z_idx):
+    """Method to get the region of a tile from its indices
+
+    Tiled dimensions are indexed in tiles and the slice dimension is indexed in voxels, as in the tile service URL.
+
+    Args:
+        orientation (str): Image plane
+        tile_size (int): Size of the tile in voxels
+        x_idx (int): x index of the tile
+        y_idx (int): y index of the tile
+        z_idx (int): z index of the tile
+
+    Returns:
+        ((int, int, int), (int, int, int)): x, y, z corner and extent of the tile
+    """
+    index = (x_idx, y_idx, z_idx)
+    slice_dim = PLANE_DIMS[orientation][2]
+    corner = tuple(index[d] if d == slice_dim else index[d] * tile_size for d in range(3))
+    extent = tuple(1 if d == slice_dim else tile_size for d in range(3))
+    return corner, extent
+
+
+def get_tile_regions(orientation, tile_size, corner, extent):
+    """Method to get the region of every tile that lies entirely inside a region
+
+    Args:
+        orientation (str): Image plane
+        tile_size (int): Size of a tile in voxels
+        corner ((int, int, int)): x, y, z corner of the region
+        extent ((int, int, int)): x, y, z extent of the region
+
+    Returns:
+        (list(((int, int, int), (int, int, int)))): x, y, z corner and extent of each tile
+    """
+    dim_a, dim_b, slice_dim = PLANE_DIMS[orientation]
+    first = [-(-corner[d] // tile_size) for d in range(3)]
+    last = [(corner[d] + extent[d]) // tile_size for d in range(3)]
+
+    regions = []
+    for s in range(corner[slice_dim], corner[slice_dim] + extent[slice_dim]):
+        for b in range(first[dim_b], last[dim_b]):
+            for a in range(first[dim_a], last[dim_a]):
+                index = [0, 0, 0]
+                index[dim_a] = a
+                index[dim_b] = b
+                index[slice_dim] = s
+                regions.append(get_tile_region(orientation, tile_size, *index))
+    return regions
+
+
+def count_tile_regions(orientation, tile_size, corner, extent):
+    """Method to count the tiles that lie entirely inside a region without listing them
+
+    Args:
+        orientation (str): Image plane
+        tile_size (int): Size of a tile in voxels
+        corner ((int, int, int)): x, y, z corner of the region
+        extent ((int, int, int)): x, y, z extent of the region
+
+    Returns:
+        (int): Number of tiles get_tile_regions would return
+    """
+    dim_a, dim_b, slice_dim = PLANE_DIMS[orientation]
+    first = [-(-corner[d] // tile_size) for d in range(3)]
+    last = [(corner[d] + extent[d]) // tile_size for d in range(3)]
+    return (max(0, extent[slice_dim]) * max(0, last[dim_b] - first[dim_b]) * max(0, last[dim_a] - first[dim_a]))
+
+
+class TileStore:
+    """
+    Class to store the rendered bytes of tiles
+
+    Entries are keyed by the tag of the tile (see bossspatialdb.etag.get_image_tag), which covers the channel,
+    resolution, region, time sample, image format and the write versions of every cuboid in the region. A write to an
+    overlapping region makes existing entries unreachable and they age out through TILE_STORE_TIMEOUT. Point
+    TILE_STORE_CACHE_ALIAS at a redis cache or a file based cache to keep the tiles in redis or on local disk.
+    """
+
+    def __init__(self, tag, media_type):
+        """
+
+        Args:
+            tag (str): Tag identifying the rendered tile in the current write state of its region
+            media_type (str): Media type of the rendered tile
+        """
+        self.media_type = media_type
+        self.cache = caches[settings.TILE_STORE_CACHE_ALIAS]
+        self.key = self.get_key(tag)
+
+    @staticmethod
+    def get_key(tag):
+        """Method to get the cache key of a tile
+
+        Args:
+            tag (str): Tag identifying the rendered tile
+
+        Returns:
+            (str)
+        """
+        return "{}&{}".format(TILE_STORE_PREFIX, tag)
+
+    @classmethod
+    def get_many(cls, tags):
+        """Method to get many stored tiles with a single cache lookup
+
+        Args:
+            tags (list(str)): Tag of each tile
+
+        Returns:
+            (dict): Tag of each stored tile mapped to its rendered bytes
+        """
+        keys = {cls.get_key(tag): tag for tag in tags}
+        stored = caches[settings.TILE_STORE_CACHE_ALIAS].get_many(list(keys))
+        return {keys[key]: content for key, content in stored.items()}
+
+    @staticmethod
+    def is_enabled():
+        """Method to check if the tile store is enabled
+
+        Returns:
+            bool
+        """
+        return settings.TILE_STORE_ENABLED
+
+    def get(self):
+        """Method to get a stored tile
+
+        Returns:
+            (django.http.HttpResponse): The stored tile or None on a miss
+        """
+        content = self.cache.get(self.key)
+        if content is None:
+            return None
+        return HttpResponse(content, content_type=self.media_type)
+
+    def put(self, content):
+        """Method to store the rendered bytes of a tile
+
+        Args:
+            content (bytes): Rendered tile
+
+        Returns:
+            bool: False if the tile is larger than TILE_STORE_MAX_ENTRY_SIZE and was not stored
+        """
+        if len(content) > settings.TILE_STORE_MAX_ENTRY_SIZE:
+            return False
+        self.cache.set(self.key, content, timeout=settings.TILE_STORE_TIMEOUT)
+        return True
+
+    def store_on_render(self, response):
+        """Method to store a DRF response in the tile store once it has been rendered
+
+        Args:
+            response (rest_framework.response.Response): Response returned by the view
+
+        Returns:
+            (rest_framework.response.Response): The same response
+        """
+        response.add_post_render_callback(self._store)
+        return response
+
+    def _store(self, response):
+        """Post render callback that stores a successfully rendered tile
+
+        Args:
+            response (rest_framework.response.Response): Rendered response
+
+        Returns:
+            None
+        """
+        if response.status_code != 200 or not response['Content-Type'].startswith(self.media_type):
+            # Renderer fell back to an error message
+            return
+        self.put(response.content)
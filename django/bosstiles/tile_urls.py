@@ -16,6 +16,21 @@ from django.conf.urls import url
 from bosstiles import views
 
 urlpatterns = [
+    # Url to handle a batch of tiles from a single channel, orientation, tile size and resolution
+    url(r'^batch/(?P<collection>[\w_-]+)/(?P<experiment>[\w_-]+)/(?P<channel>[\w_-]+)/(?P<orientation>(xy|xz|yz))/(?P<tile_size>\d+)/(?P<resolution>\d)/?(?P<t_idx>\d+)?/?$',
+        views.TileBatch.as_view()),
+
+    # Url to get the status of a tile pre-render job
+    url(r'^prerender/jobs/(?P<job_id>[0-9a-f]{32})/?$', views.TilePrerenderJob.as_view()),
+
+    # Url to pre-render the tiles of a region into the tile store
+    url(r'^prerender/(?P<collection>[\w_-]+)/(?P<experiment>[\w_-]+)/(?P<channel>[\w_-]+)/(?P<orientation>(xy|xz|yz))/(?P<tile_size>\d+)/(?P<resolution>\d)/(?P<x_range>\d+:\d+)/(?P<y_range>\d+:\d+)/(?P<z_range>\d+:\d+)/?(?P<t_range>\d+:\d+)?/?$',
+        views.TilePrerender.as_view()),
+
+    # Url to pre-render every tile of a channel into the tile store
+    url(r'^prerender/(?P<collection>[\w_-]+)/(?P<experiment>[\w_-]+)/(?P<channel>[\w_-]+)/(?P<orientation>(xy|xz|yz))/(?P<tile_size>\d+)/(?P<resolution>\d)/?$',
+        views.TilePrerender.as_view()),
+
     # Url to handle cutout with a collection, experiment, channel/annotation project
     url(r'^(?P<collection>[\w_-]+)/(?P<experiment>[\w_-]+)/(?P<channel>[\w_-]+)/(?P<orientation>(xy|xz|yz))/(?P<tile_size>\d+)/(?P<resolution>\d)/(?P<x_idx>\d+)/(?P<y_idx>\d+)/(?P<z_idx>\d+)/?(?P<t_idx>\d+)?/?.*$',
         views.Tile.as_view()),
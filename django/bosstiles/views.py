@@ -14,17 +14,30 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
+from rest_framework.parsers import JSONParser
 from django.conf import settings
+from django.http import HttpResponse, JsonResponse
 
 from bosscore.request import BossRequest
 from bosscore.error import BossError, BossHTTPError, ErrorCodes
+from bossspatialdb.pool import get_spatialdb
+from bossspatialdb.etag import get_image_tag, is_not_modified, not_modified, set_etag
+from bossspatialdb.admission import AdmissionMixin
+from bossspatialdb.fallback import DownsampleFallback, FALLBACK_STATUSES
+from bossspatialdb.prefetch import prefetch_next
+from bossspatialdb.single_flight import SingleFlightMixin
 
 import spdb
 
-from .renderers import PNGRenderer, JPEGRenderer
+from .renderers import PNGRenderer, JPEGRenderer, MultipartRenderer
+from .tile_store import TileStore, count_tile_regions, get_tile_region
+from .planes import PlaneReader
+from .batch import BatchTiles
+from .prerender import PrerenderJob, RENDERERS
 
 
-class CutoutTile(APIView):
+class CutoutTile(AdmissionMixin, SingleFlightMixin, APIView):
     """
     View to handle spatial cutouts by providing all datamodel fields
 
@@ -94,18 +107,48 @@ class CutoutTile(APIView):
             return BossHTTPError("Cutout request is over 1GB when uncompressed. Reduce cutout dimensions.",
                                  ErrorCodes.REQUEST_TOO_LARGE)
 
-        # Get interface to SPDB cache
-        cache = spdb.spatialdb.SpatialDB(settings.KVIO_SETTINGS,
-                                         settings.STATEIO_CONFIG,
-                                         settings.OBJECTIO_CONFIG)
-
         # Get the params to pull data out of the cache
         corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
         extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
+        time_range = [req.get_time().start, req.get_time().stop]
+
+        # Downsample on the fly if the channel's resolution hierarchy has not been built yet
+        fallback = DownsampleFallback.from_request(resource, req, self.bit_depth)
+        encoding = fallback.get_tag(corner, extent, time_range) if fallback else None
+
+        # Page in the region this user is likely to read next
+        if not fallback:
+            prefetch_next(request, resource, req.get_resolution(), corner, extent, time_range)
+
+        # Tag the response with the write state of the region so clients can revalidate unchanged tiles for free
+        tag = get_image_tag(req, request.accepted_media_type, orientation, encoding=encoding)
+        if is_not_modified(request, tag):
+            return not_modified(tag)
+
+        # Wait for an identical request that is already rendering the tile instead of rendering it again
+        if not no_cache:
+            coalesced_response = self.coalesce(tag)
+            if coalesced_response is not None:
+                return set_etag(coalesced_response, tag)
+
+        # Reserve the uncompressed size of the cutout until the response has been sent
+        admission_error = self.admit(request, total_bytes)
+        if admission_error:
+            return admission_error
+
+        # Get interface to SPDB cache
+        cache = get_spatialdb()
 
         # Do a cutout as specified
-        data = cache.cutout(resource, corner, extent, req.get_resolution(),
-                            [req.get_time().start, req.get_time().stop], no_cache=no_cache)
+        plane_reader = PlaneReader.create(resource, req.get_resolution(), orientation, corner, extent, self.bit_depth,
+                                          no_cache=no_cache)
+        if fallback:
+            data = fallback.cutout(cache, corner, extent, time_range, no_cache=no_cache)
+        elif plane_reader:
+            # Share the decompressed cuboids around the slice with neighbouring slices
+            data = plane_reader.cutout(cache, corner, extent, time_range)
+        else:
+            data = cache.cutout(resource, corner, extent, req.get_resolution(), time_range, no_cache=no_cache)
 
         # Covert the cutout back to an image and return it
         if orientation == 'xy':
@@ -118,10 +161,10 @@ class CutoutTile(APIView):
             return BossHTTPError("Invalid orientation: {}".format(orientation),
                                  ErrorCodes.INVALID_CUTOUT_ARGS)
 
-        return Response(img)
+        return set_etag(Response(img), tag)
 
 
-class Tile(APIView):
+class Tile(AdmissionMixin, SingleFlightMixin, APIView):
     """
     View to handle tile interface when accessing via tile indicies
 
@@ -193,18 +236,58 @@ class Tile(APIView):
             return BossHTTPError("Cutout request is over 1GB when uncompressed. Reduce cutout dimensions.",
                                  ErrorCodes.REQUEST_TOO_LARGE)
 
-        # Get interface to SPDB cache
-        cache = spdb.spatialdb.SpatialDB(settings.KVIO_SETTINGS,
-                                         settings.STATEIO_CONFIG,
-                                         settings.OBJECTIO_CONFIG)
-
         # Get the params to pull data out of the cache
         corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
         extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
+        time_range = [req.get_time().start, req.get_time().stop]
+
+        # Downsample on the fly if the channel's resolution hierarchy has not been built yet
+        fallback = DownsampleFallback.from_request(resource, req, self.bit_depth)
+        encoding = fallback.get_tag(corner, extent, time_range) if fallback else None
+
+        # Page in the region this user is likely to read next
+        if not fallback:
+            prefetch_next(request, resource, req.get_resolution(), corner, extent, time_range)
+
+        # Tag the response with the write state of the region so clients can revalidate unchanged tiles for free
+        # The tag also keys the tile store, so it is computed from the renderer's media type as pre-render jobs do
+        media_type = request.accepted_renderer.media_type
+        tag = get_image_tag(req, media_type, orientation, encoding=encoding)
+        if is_not_modified(request, tag):
+            return not_modified(tag)
+
+        # Serve tiles that have already been rendered
+        tile_store = None
+        if TileStore.is_enabled() and not no_cache:
+            tile_store = TileStore(tag, media_type)
+            stored_tile = tile_store.get()
+            if stored_tile is not None:
+                return set_etag(stored_tile, tag)
+
+        # Wait for an identical request that is already rendering the tile instead of rendering it again
+        if not no_cache:
+            coalesced_response = self.coalesce(tag)
+            if coalesced_response is not None:
+                return set_etag(coalesced_response, tag)
+
+        # Reserve the uncompressed size of the cutout until the response has been sent
+        admission_error = self.admit(request, total_bytes)
+        if admission_error:
+            return admission_error
+
+        # Get interface to SPDB cache
+        cache = get_spatialdb()
 
         # Do a cutout as specified
-        data = cache.cutout(resource, corner, extent, req.get_resolution(),
-                            [req.get_time().start, req.get_time().stop], no_cache=no_cache)
+        plane_reader = PlaneReader.create(resource, req.get_resolution(), orientation, corner, extent, self.bit_depth,
+                                          no_cache=no_cache)
+        if fallback:
+            data = fallback.cutout(cache, corner, extent, time_range, no_cache=no_cache)
+        elif plane_reader:
+            # Share the decompressed cuboids around the slice with neighbouring slices
+            data = plane_reader.cutout(cache, corner, extent, time_range)
+        else:
+            data = cache.cutout(resource, corner, extent, req.get_resolution(), time_range, no_cache=no_cache)
 
         # Covert the cutout back to an image and return it
         if orientation == 'xy':
@@ -217,4 +300,248 @@ class Tile(APIView):
             return BossHTTPError("Invalid orientation: {}".format(orientation),
                                  ErrorCodes.INVALID_CUTOUT_ARGS)
 
-        return Response(img)
+        response = set_etag(Response(img), tag)
+        if tile_store:
+            return tile_store.store_on_render(response)
+        return response
+
+
+class TileBatch(AdmissionMixin, APIView):
+    """
+    View to read many tiles of a single channel, orientation, tile size and resolution in one request
+
+    The tile indices are POSTed as JSON and the channel is validated and authorized once. Tiles that share cuboids are
+    read together and the tiles are encoded in parallel. The response is multipart/mixed with one part per tile in the
+    order requested. Each part carries the tile's x, y, z index in its X-Boss-Tile-Index header. The image format is
+    selected with the `image_format` query parameter (png or jpg, png by default).
+
+    * Requires authentication.
+    """
+    parser_classes = (JSONParser,)
+    renderer_classes = (MultipartRenderer, JSONRenderer)
+
+    def post(self, request, collection, experiment, channel, orientation, tile_size, resolution, t_idx=None):
+        """View to read a batch of tiles
+
+        The body is a JSON object with a list of x, y, z tile indices, as used by the tile service:
+
+            {"tiles": [[0, 0, 5], [1, 0, 5], ...]}
+
+        Args:
+            request: DRF Request object
+            collection (str): Unique Collection identifier, indicating which collection you want to access
+            experiment (str): Experiment identifier, indicating which experiment you want to access
+            channel (str): Channel identifier, indicating which channel you want to access
+            orientation (str): Image plane requested. Vaid options include xy,xz or yz
+            tile_size (str): Size of the tiles in voxels
+            resolution (str): Integer indicating the level in the resolution hierarchy (0 = native)
+            t_idx (str): Optional time sample of the tiles
+
+        Returns:
+
+        """
+        if "no-cache" in request.query_params:
+            if request.query_params["no-cache"].lower() == "true":
+                no_cache = True
+            else:
+                no_cache = False
+        else:
+            no_cache = False
+
+        if request.accepted_renderer.media_type != MultipartRenderer.media_type:
+            return BossHTTPError("Batch tiles are only available as {}".format(MultipartRenderer.media_type),
+                                 ErrorCodes.INVALID_ARGUMENT)
+
+        image_format = request.query_params.get("image_format", PNGRenderer.format)
+        if image_format not in RENDERERS:
+            return BossHTTPError("Unsupported tile format {}. Supported formats are {}".format(
+                image_format, ", ".join(sorted(RENDERERS))), ErrorCodes.INVALID_ARGUMENT)
+
+        # Validate the list of tiles
+        indices = request.data.get("tiles") if isinstance(request.data, dict) else None
+        if not isinstance(indices, list) or not indices:
+            return BossHTTPError("Provide a non-empty list of tiles", ErrorCodes.INVALID_POST_ARGUMENT)
+        if len(indices) > settings.TILE_BATCH_MAX_TILES:
+            return BossHTTPError("A batch is limited to {} tiles".format(settings.TILE_BATCH_MAX_TILES),
+                                 ErrorCodes.REQUEST_TOO_LARGE)
+
+        # Process request and validate the channel and permissions once
+        try:
+            request_args = {
+                "service": "batch",
+                "collection_name": collection,
+                "experiment_name": experiment,
+                "channel_name": channel
+            }
+            req = BossRequest(request, request_args)
+        except BossError as err:
+            return err.to_http()
+
+        # Convert to Resource
+        resource = spdb.project.BossResourceDjango(req)
+
+        # Get bit depth
+        try:
+            bit_depth = resource.get_bit_depth()
+        except ValueError:
+            return BossHTTPError("Datatype does not match channel", ErrorCodes.DATATYPE_DOES_NOT_MATCH)
+
+        # Validate the region of each tile
+        tile_size = int(tile_size)
+        time_args = "{}:{}".format(t_idx, int(t_idx) + 1) if t_idx else None
+        regions = []
+        for index, tile in enumerate(indices):
+            try:
+                if len(tile) != 3 or not all(isinstance(i, int) and i >= 0 for i in tile):
+                    raise TypeError()
+                corner, extent = get_tile_region(orientation, tile_size, *tile)
+                regions.append(req.get_region_request(resolution, "{}:{}".format(corner[0], corner[0] + extent[0]),
+                                                      "{}:{}".format(corner[1], corner[1] + extent[1]),
+                                                      "{}:{}".format(corner[2], corner[2] + extent[2]), time_args))
+            except BossError as err:
+                return BossHTTPError("Invalid tile {}. {}".format(index, err.message), err.error_code)
+            except TypeError:
+                return BossHTTPError("Tile {} must be a list of x, y and z indices".format(index),
+                                     ErrorCodes.INVALID_POST_ARGUMENT)
+
+        # Make sure the batch is under 500MB UNCOMPRESSED
+        total_bytes = len(regions) * tile_size * tile_size * bit_depth // 8
+        if total_bytes > settings.CUTOUT_MAX_SIZE:
+            return BossHTTPError("Batch tile request is over 500MB when uncompressed. Reduce the number or size of "
+                                 "tiles.", ErrorCodes.REQUEST_TOO_LARGE)
+
+        admission_error = self.admit(request, total_bytes)
+        if admission_error:
+            return admission_error
+
+        batch = BatchTiles(resource, orientation, tile_size, [tuple(tile) for tile in indices], regions,
+                           RENDERERS[image_format](), no_cache=no_cache)
+        body, content_type = batch.to_multipart(batch.render(get_spatialdb(), bit_depth))
+        return HttpResponse(body, content_type=content_type)
+
+
+class TilePrerender(APIView):
+    """
+    View to pre-render the tiles of a region, or of a whole channel, into the tile store
+
+    Rendering runs in the background and the job status is returned immediately. Only tiles that lie entirely inside
+    the region are rendered. The image format is selected with the `image_format` query parameter (png or jpg, png by
+    default).
+
+    * Requires authentication and permission to write to the channel.
+    """
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer)
+
+    def post(self, request, collection, experiment, channel, orientation, tile_size, resolution, x_range=None,
+             y_range=None, z_range=None, t_range=None):
+        """
+        View to handle POST requests to pre-render tiles
+
+        :param request: DRF Request object
+        :type request: rest_framework.request.Request
+        :param collection: Unique Collection identifier, indicating which collection you want to access
+        :param experiment: Experiment identifier, indicating which experiment you want to access
+        :param channel: Channel identifier, indicating which channel you want to access
+        :param orientation: Image plane requested. Vaid options include xy,xz or yz
+        :param tile_size: Size of the tiles in voxels
+        :param resolution: Integer indicating the level in the resolution hierarchy (0 = native)
+        :param x_range: Optional python style range indicating the X coordinates of the region (eg. 100:200)
+        :param y_range: Optional python style range indicating the Y coordinates of the region (eg. 100:200)
+        :param z_range: Optional python style range indicating the Z coordinates of the region (eg. 100:200)
+        :param t_range: Optional python style range indicating the time samples to render (eg. 0:2)
+        :return:
+        """
+        if not TileStore.is_enabled():
+            return BossHTTPError("The tile store is not enabled.", ErrorCodes.FUTURE)
+
+        image_format = request.query_params.get("image_format", PNGRenderer.format)
+        if image_format not in RENDERERS:
+            return BossHTTPError("Unsupported tile format {}. Supported formats are {}".format(
+                image_format, ", ".join(sorted(RENDERERS))), ErrorCodes.INVALID_ARGUMENT)
+
+        # Process request and validate
+        try:
+            request_args = {
+                "service": "prerender",
+                "collection_name": collection,
+                "experiment_name": experiment,
+                "channel_name": channel,
+                "resolution": resolution,
+                "x_args": x_range,
+                "y_args": y_range,
+                "z_args": z_range,
+                "time_args": t_range
+            }
+            req = BossRequest(request, request_args)
+        except BossError as err:
+            return err.to_http()
+
+        # Convert to Resource
+        resource = spdb.project.BossResourceDjango(req)
+
+        try:
+            bit_depth = resource.get_bit_depth()
+        except ValueError:
+            return BossHTTPError("Datatype does not match channel", ErrorCodes.DATATYPE_DOES_NOT_MATCH)
+
+        tile_size = int(tile_size)
+        if tile_size == 0 or tile_size * tile_size * bit_depth // 8 > settings.CUTOUT_MAX_SIZE:
+            return BossHTTPError("Invalid tile size {}".format(tile_size), ErrorCodes.INVALID_CUTOUT_ARGS)
+
+        # Resolutions that have not been written would be rendered empty
+        channel_obj = resource.get_channel()
+        if req.get_resolution() > channel_obj.base_resolution and \
+                channel_obj.downsample_status.upper() in FALLBACK_STATUSES:
+            return BossHTTPError("The channel must be downsampled before resolution {} can be pre-rendered".format(
+                req.get_resolution()), ErrorCodes.INVALID_CUTOUT_ARGS)
+
+        # Clip the region to the extent of the channel at the requested resolution
+        image_size = resource.get_downsampled_extent_dims()[req.get_resolution()]
+        start = (req.get_x_start(), req.get_y_start(), req.get_z_start())
+        stop = (min(req.get_x_stop(), image_size[0]), min(req.get_y_stop(), image_size[1]),
+                min(req.get_z_stop(), image_size[2]))
+        extent = tuple(max(0, stop[d] - start[d]) for d in range(3))
+        num_tiles = count_tile_regions(orientation, tile_size, start, extent)
+        if not num_tiles:
+            return BossHTTPError("The region does not contain any complete {} tiles".format(orientation),
+                                 ErrorCodes.INVALID_CUTOUT_ARGS)
+        if num_tiles * (req.get_time().stop - req.get_time().start) > settings.TILE_PRERENDER_MAX_TILES:
+            return BossHTTPError("A pre-render job is limited to {} tiles. Split the region into smaller jobs."
+                                 .format(settings.TILE_PRERENDER_MAX_TILES), ErrorCodes.REQUEST_TOO_LARGE)
+
+        job = PrerenderJob.create(request.user.username, resource.get_lookup_key(), req.get_resolution(),
+                                  orientation, tile_size, image_format, start, extent,
+                                  [req.get_time().start, req.get_time().stop])
+        job.submit(resource)
+        return JsonResponse(job.to_dict(), status=202)
+
+
+class TilePrerenderJob(APIView):
+    """
+    View to report the progress of a tile pre-render job
+
+    Only the user that submitted the job (or a superuser) may view its status.
+
+    * Requires authentication.
+    """
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer)
+
+    def get(self, request, job_id):
+        """View to get the status of a pre-render job
+
+        Args:
+            request: DRF Request object
+            job_id (str): Id returned when the job was accepted
+
+        Returns:
+            (Response): Job status and progress in tiles
+        """
+        job = PrerenderJob.get(job_id)
+        if job is None:
+            return BossHTTPError("Pre-render job {} not found.".format(job_id), ErrorCodes.RESOURCE_NOT_FOUND)
+
+        if job.state["owner"] != request.user.username and not request.user.is_superuser:
+            return BossHTTPError("Missing permissions on pre-render job {}".format(job_id),
+                                 ErrorCodes.MISSING_PERMISSION)
+
+        return Response(job.to_dict())